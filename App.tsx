@@ -9,7 +9,7 @@ import {
   LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, AreaChart, Area
 } from 'recharts';
 
-import { Device, Alert, NetworkStats } from './types';
+import { Device, Alert, NetworkStats, ChangeSet } from './types';
 import { api } from './services/api';
 import { Layout } from './components/Layout';
 import { Dashboard } from './components/Dashboard';
@@ -315,30 +315,80 @@ const AboutPage = () => (
   </div>
 );
 
+// --- Change Merging ---
+
+// Alerts kept in memory, newest first; the same as one page of GET /api/alerts
+const MAX_ALERTS = 100;
+
+const applyChanges = (
+  changes: ChangeSet,
+  setDevices: React.Dispatch<React.SetStateAction<Device[]>>,
+  setAlerts: React.Dispatch<React.SetStateAction<Alert[]>>
+) => {
+  if (changes.full) {
+    setDevices(changes.devices);
+    setAlerts(changes.alerts.slice(0, MAX_ALERTS));
+    return;
+  }
+
+  if (changes.devices.length > 0 || changes.removed.length > 0) {
+    setDevices(prev => {
+      const changed = new Map(changes.devices.map(d => [d.id, d]));
+      const removed = new Set(changes.removed);
+      const merged = prev
+        .filter(d => !removed.has(d.id))
+        .map(d => changed.get(d.id) ?? d);
+      const known = new Set(prev.map(d => d.id));
+      return merged.concat(changes.devices.filter(d => !known.has(d.id)));
+    });
+  }
+
+  if (changes.alerts.length > 0) {
+    setAlerts(prev => {
+      const changed = new Map(changes.alerts.map(a => [a.id, a]));
+      const kept = prev.filter(a => !changed.has(a.id));
+      return [...changes.alerts, ...kept]
+        .sort((a, b) => b.timestamp - a.timestamp)
+        .slice(0, MAX_ALERTS);
+    });
+  }
+};
+
 // --- Main App Component ---
 
 const App: React.FC = () => {
   const [devices, setDevices] = useState<Device[]>([]);
   const [alerts, setAlerts] = useState<Alert[]>([]);
 
-  // Fetch Data Loop
+  // Live Data Stream
   useEffect(() => {
+    let version: number | undefined;
+
     const fetchData = async () => {
       try {
-        const [devicesData, alertsData] = await Promise.all([
-          api.getDevices(),
-          api.getAlerts()
-        ]);
-        setDevices(devicesData);
-        setAlerts(alertsData);
+        const changes = await api.getChanges(version);
+        if (version === undefined || changes.full || changes.version > version) {
+          version = changes.version;
+          applyChanges(changes, setDevices, setAlerts);
+        }
       } catch (err) {
         console.error("Failed to fetch data:", err);
       }
     };
 
-    fetchData(); // Initial fetch
-    const interval = setInterval(fetchData, 3000); // Poll every 3s
-    return () => clearInterval(interval);
+    // The server pushes change sets; fetch only on connect or when a gap is detected
+    return api.subscribe({
+      onResync: fetchData,
+      onChanges: (changes) => {
+        if (version === undefined || changes.version <= version) return;
+        if (changes.since !== undefined && changes.since > version) {
+          fetchData(); // missed an update, catch up from our last version
+          return;
+        }
+        version = changes.version;
+        applyChanges(changes, setDevices, setAlerts);
+      }
+    });
   }, []);
 
   const addDevice = async (device: Device) => {
@@ -1,45 +1,90 @@
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
+import os
 import time
 
-from database import init_db
+import metrics
+from baseline import load_baselines, save_baselines
+from database import init_db, close_connections
 from routes import api
-from monitor import monitor_all_devices
+from probe_engine import raise_fd_limit
+from probe_scheduler import PROBE_MODE, probe_scheduler
+from cluster import coordinator
+from jobs import add_follower_jobs, add_maintenance_jobs
+from log import get_logger
+from push import hub
+from registry import registry
+from timeseries import store as timeseries
+from sla import tracker as sla_tracker
+
+log = get_logger('app')
 
 # Initialize Flask app
 app = Flask(__name__)
-CORS(app)  # Enable CORS for frontend
+CORS(app, expose_headers=['X-Next-Cursor', 'Link'])  # Enable CORS for frontend
 
 # Register API routes
 app.register_blueprint(api, url_prefix='/api')
 
 # Initialize database FIRST
-print("[INIT] Initializing database...")
+log.info('Initializing database')
 init_db()
-print("[INIT] Database initialized successfully")
+log.info('Database initialized')
+
+# Load device state into memory; reads are served from here from now on
+registry.load()
+
+# Latency history lives in its own database file (written by the probe service in external mode)
+timeseries.open(writer=PROBE_MODE != 'external')
+if PROBE_MODE == 'external':
+    # Counters come from the probe service's finished rollups
+    sla_tracker.follow(timeseries)
+else:
+    sla_tracker.load(timeseries)
+# Latency baselines learned before the restart
+load_baselines()
 
 # Wait a moment for database to be ready
 time.sleep(0.5)
 
-# Setup background monitoring scheduler
+# Concurrent probes each hold a pipe open, so allow more file descriptors
+raise_fd_limit()
+
+# Maintenance jobs; devices are probed by the adaptive probe scheduler below
 scheduler = BackgroundScheduler()
-scheduler.add_job(
-    func=monitor_all_devices,
-    trigger="interval",
-    seconds=5,  # Monitor every 5 seconds
-    id='network_monitor',
-    name='Network Monitoring Job',
-    replace_existing=True
-)
-
-print("[INIT] Starting background monitoring scheduler...")
+if PROBE_MODE == 'external':
+    # The probe service (backend/probe_service.py) probes and runs maintenance;
+    # this process only follows what it writes
+    add_follower_jobs(scheduler)
+else:
+    add_maintenance_jobs(scheduler)
+
+# Live updates are pushed over Server-Sent Events from a single event-loop thread
+# (with several API processes, each serves its own share of the stream port)
+hub.start(reuse_port=PROBE_MODE == 'external')
+
+log.info('Starting background scheduler')
 scheduler.start()
-print("[INIT] Scheduler started - monitoring every 5 seconds")
+if PROBE_MODE == 'cluster':
+    # Devices are probed by worker processes (backend/worker.py) sharded by device id
+    coordinator.start()
+    log.info('Scheduler started', extra={'probing': 'cluster workers'})
+elif PROBE_MODE == 'external':
+    log.info('Scheduler started', extra={'probing': 'probe service'})
+else:
+    probe_scheduler.start()
+    log.info('Scheduler started', extra={'probing': 'adaptive per-device'})
 
-# Shutdown scheduler when app exits
+# Shutdown scheduler when app exits, then release database connections
+atexit.register(close_connections)
+atexit.register(timeseries.close)
+if PROBE_MODE != 'external':
+    atexit.register(save_baselines)
 atexit.register(lambda: scheduler.shutdown())
+atexit.register(probe_scheduler.stop)
+atexit.register(coordinator.stop)
 
 @app.route('/')
 def index():
@@ -49,15 +94,23 @@ def index():
         'version': '1.0.0'
     }
 
+@app.route('/metrics')
+def prometheus_metrics():
+    """Prometheus scrape endpoint (this process's probe, database, request and job metrics)"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     print("=" * 60)
     print("NetGuard - Real-Time Network Fault Detection System")
     print("=" * 60)
     print("Backend: Python/Flask")
     print("Database: SQLite")
-    print("Monitoring: ICMP Ping (5s interval)")
+    print("Monitoring: ICMP Ping (adaptive per-device interval)")
     print("=" * 60)
-    print("Server starting on http://localhost:5000")
+    port = int(os.environ.get('NETGUARD_PORT', '5000'))
+    print(f"Server starting on http://localhost:{port}")
+    print("For production, run the API under gunicorn (see gunicorn.conf.py)")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=5000, debug=True, use_reloader=False)
+    # The development server; set NETGUARD_DEBUG=1 for the debugger
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('NETGUARD_DEBUG') == '1', use_reloader=False)
@@ -0,0 +1,200 @@
+import math
+import os
+import threading
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from log import get_logger
+from registry import registry
+from timeseries import TimeSeriesStore, store as timeseries
+
+# Weight of each answered probe in a device's moving mean and variance
+# (0.02 follows roughly the last 50-100 probes)
+BASELINE_ALPHA = float(os.environ.get('NETGUARD_BASELINE_ALPHA', '0.02'))
+
+# Answered probes needed before a device is judged against its own baseline;
+# until then the fixed SLOW_THRESHOLD_MS applies
+BASELINE_MIN_SAMPLES = int(os.environ.get('NETGUARD_BASELINE_MIN_SAMPLES', '30'))
+
+# A device is slow above mean + margin, the margin being the largest of
+# BASELINE_DEVIATIONS standard deviations, BASELINE_MIN_MARGIN_MS and
+# BASELINE_MIN_RATIO of the mean (the floors keep a quiet 1 ms LAN switch
+# from turning slow at 3 ms)
+BASELINE_DEVIATIONS = float(os.environ.get('NETGUARD_BASELINE_DEVIATIONS', '4'))
+BASELINE_MIN_MARGIN_MS = float(os.environ.get('NETGUARD_BASELINE_MIN_MARGIN_MS', '20'))
+BASELINE_MIN_RATIO = 0.25
+
+# A slow device is back once below mean + BASELINE_EXIT_SHARE * margin
+BASELINE_EXIT_SHARE = 0.5
+
+# How often the probing process saves the baselines, and a follower reloads them (minutes)
+BASELINE_SAVE_INTERVAL = 1
+
+log = get_logger('baseline')
+
+# (mean ms, variance ms², answered probes)
+Baseline = Tuple[float, float, int]
+
+
+def _margin(mean: float, variance: float) -> float:
+    return max(BASELINE_DEVIATIONS * math.sqrt(variance), BASELINE_MIN_MARGIN_MS, BASELINE_MIN_RATIO * mean)
+
+
+class LatencyBaselines:
+    """
+    Exponentially weighted mean and variance of each device's answered-probe latency
+    Kept in NumPy arrays indexed by device row, so a batch of results updates every
+    device in it with a few vector operations, and reading one device's limits is O(1)
+    """
+
+    def __init__(self, alpha: float = BASELINE_ALPHA):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._mean = np.zeros(0)
+        self._var = np.zeros(0)
+        self._count = np.zeros(0, np.int64)
+
+    def _row_indexes(self, device_ids: Iterable[str]) -> np.ndarray:
+        indexes = []
+        for device_id in device_ids:
+            row = self._rows.get(device_id)
+            if row is None:
+                row = self._rows[device_id] = len(self._rows)
+            indexes.append(row)
+
+        if len(self._rows) > len(self._count):
+            capacity = max(len(self._rows), 2 * len(self._count), 64)
+            for name in ('_mean', '_var', '_count'):
+                old = getattr(self, name)
+                new = np.zeros(capacity, old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+        return np.array(indexes, np.int64)
+
+    def _update(self, device_ids: List[str], latencies: np.ndarray):
+        """One latency per device"""
+        rows = self._row_indexes(device_ids)
+        mean, var, count = self._mean[rows], self._var[rows], self._count[rows]
+
+        # Once learned, samples are clipped at the slow limit: an episode of high latency
+        # only nudges the baseline, while a lasting shift still becomes the new normal
+        margin = np.maximum(np.maximum(BASELINE_DEVIATIONS * np.sqrt(var), BASELINE_MIN_MARGIN_MS),
+                            BASELINE_MIN_RATIO * mean)
+        latencies = np.where(count >= BASELINE_MIN_SAMPLES, np.minimum(latencies, mean + margin), latencies)
+
+        # A plain running mean while warming up, so the first probe does not dominate
+        alpha = np.maximum(self.alpha, 1.0 / (count + 1))
+        diff = latencies - mean
+        self._mean[rows] = mean + alpha * diff
+        self._var[rows] = (1 - alpha) * (var + alpha * diff * diff)
+        self._count[rows] = count + 1
+
+    def record(self, samples: Iterable[Tuple[str, str, float]]):
+        """
+        Learn from a batch of (device_id, status, latency) probe results; lost probes are skipped
+        A device with several results in the batch is updated once per result, in order
+        """
+        rounds: List[Dict[str, float]] = []
+        seen: Counter = Counter()
+        for device_id, status, latency in samples:
+            if status == 'offline':
+                continue
+            occurrence = seen[device_id]
+            seen[device_id] += 1
+            if occurrence == len(rounds):
+                rounds.append({})
+            rounds[occurrence][device_id] = latency
+        if not rounds:
+            return
+
+        with self._lock:
+            for latencies in rounds:
+                self._update(list(latencies), np.fromiter(latencies.values(), np.float64, len(latencies)))
+
+    def limits(self, device_id: str) -> Optional[Tuple[float, float]]:
+        """(slow above, back below) in ms, or None while the device's baseline is still warming up"""
+        with self._lock:
+            row = self._rows.get(device_id)
+            if row is None or self._count[row] < BASELINE_MIN_SAMPLES:
+                return None
+            mean, variance = float(self._mean[row]), float(self._var[row])
+        margin = _margin(mean, variance)
+        return mean + margin, mean + BASELINE_EXIT_SHARE * margin
+
+    def export(self, device_ids: Optional[Sequence[str]] = None) -> Dict[str, Baseline]:
+        """{device_id: (mean, variance, samples)} for devices with at least one answered probe"""
+        with self._lock:
+            if device_ids is None:
+                device_ids = list(self._rows)
+            known = [device_id for device_id in device_ids if device_id in self._rows]
+            rows = np.array([self._rows[device_id] for device_id in known], np.int64)
+            values = zip(known, self._mean[rows].tolist(), self._var[rows].tolist(), self._count[rows].tolist())
+        return {device_id: (mean, var, count) for device_id, mean, var, count in values if count}
+
+    def seed(self, baselines: Dict[str, Sequence], overwrite: bool = False):
+        """
+        Take baselines learned elsewhere (the database, or the coordinator for a worker)
+        Without `overwrite`, devices that have already learned something here keep their own
+        """
+        if not baselines:
+            return
+        with self._lock:
+            rows = self._row_indexes(baselines)
+            values = np.array([tuple(baseline) for baseline in baselines.values()], np.float64).reshape(-1, 3)
+            if not overwrite:
+                fresh = self._count[rows] == 0
+                rows, values = rows[fresh], values[fresh]
+            self._mean[rows] = values[:, 0]
+            self._var[rows] = values[:, 1]
+            self._count[rows] = values[:, 2].astype(np.int64)
+
+    def describe(self, device_ids: Sequence[str]) -> Dict[str, Dict]:
+        """API view: mean / standard deviation and the limits the device is judged by (null while learning)"""
+        learned = self.export(device_ids)
+        result = {}
+        for device_id in device_ids:
+            mean, variance, count = learned.get(device_id, (None, 0.0, 0))
+            limits = self.limits(device_id)
+            result[device_id] = {
+                'meanMs': round(mean, 2) if mean is not None else None,
+                'stddevMs': round(math.sqrt(variance), 2) if count else None,
+                'samples': count,
+                'learned': limits is not None,
+                'slowAboveMs': round(limits[0], 1) if limits else None,
+                'recoverBelowMs': round(limits[1], 1) if limits else None,
+            }
+        return result
+
+    def save(self, store: TimeSeriesStore, keep: Optional[Callable[[str], bool]] = None):
+        """Replace the stored baselines with the current ones (devices failing `keep` are dropped)"""
+        rows = [(device_id, mean, var, count) for device_id, (mean, var, count) in self.export().items()
+                if keep is None or keep(device_id)]
+        store.save_baselines(rows)
+
+    def load(self, store: TimeSeriesStore):
+        """Restore baselines saved by save() (used at startup, and by API processes that do not probe)"""
+        self.seed({device_id: (mean, var, count) for device_id, mean, var, count in store.load_baselines()},
+                  overwrite=True)
+
+
+# Process-wide baselines: learned from recorded results, read by the device state machines
+baselines = LatencyBaselines()
+
+
+def save_baselines():
+    """Persist the baselines of devices that still exist (run periodically and at shutdown)"""
+    try:
+        baselines.save(timeseries, keep=lambda device_id: registry.get(device_id) is not None)
+    except Exception as e:
+        log.error('Baseline save failed', extra={'error': str(e)})
+
+
+def load_baselines():
+    """Reload baselines saved by the probing process"""
+    try:
+        baselines.load(timeseries)
+    except Exception as e:
+        log.error('Baseline load failed', extra={'error': str(e)})
@@ -0,0 +1,175 @@
+import csv
+import io
+import json
+from typing import Dict, IO, Iterable, Iterator, Optional, Tuple
+
+# Device import / export formats and their media types
+FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Media types accepted for each upload format
+UPLOAD_TYPES = {
+    'application/json': 'json',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonlines': 'ndjson',
+    'text/csv': 'csv',
+}
+
+# CSV columns of alert and fault log exports
+ALERT_CSV_FIELDS = ('id', 'deviceId', 'deviceName', 'deviceIp', 'type', 'message', 'timestamp', 'status',
+                    'resolvedAt', 'rootCauseId')
+FAULT_LOG_CSV_FIELDS = ('id', 'deviceId', 'deviceName', 'deviceIp', 'faultType', 'description', 'timestamp')
+
+# Device CSV columns, in export order; runtime columns are exported but ignored on import
+CSV_FIELDS = ('id', 'name', 'ip', 'type', 'isMonitored', 'probeInterval', 'probeType', 'probePort',
+              'probeTarget', 'tags', 'parentId')
+CSV_STATUS_FIELDS = ('status', 'latency', 'lastChecked', 'uptime')
+
+# Tags share one CSV cell
+TAG_SEPARATOR = ';'
+
+CSV_INTEGERS = ('probeInterval', 'probePort')
+CSV_TRUE = ('1', 'true', 'yes', 'on')
+CSV_FALSE = ('0', 'false', 'no', 'off')
+
+# Rows buffered into one chunk of a streamed export
+EXPORT_CHUNK_ROWS = 500
+
+
+def upload_format(name: Optional[str], mimetype: str) -> Optional[str]:
+    """Format from ?format=, else from the Content-Type; None when unsupported"""
+    if name:
+        return name if name in FORMATS else None
+    return UPLOAD_TYPES.get(mimetype)
+
+
+def csv_to_device(row: Dict[str, str]) -> Dict:
+    """
+    Device dict from a CSV row; empty cells are left out so an update keeps the
+    stored value. Raises ValueError on malformed cells
+    """
+    device = {}
+    for field in CSV_FIELDS:
+        value = (row.get(field) or '').strip()
+        if not value:
+            continue
+        if field in CSV_INTEGERS:
+            try:
+                device[field] = int(value)
+            except ValueError:
+                raise ValueError(f'{field} must be an integer')
+        elif field == 'isMonitored':
+            if value.lower() not in CSV_TRUE + CSV_FALSE:
+                raise ValueError('isMonitored must be true or false')
+            device[field] = value.lower() in CSV_TRUE
+        elif field == 'tags':
+            device[field] = [tag.strip() for tag in value.split(TAG_SEPARATOR) if tag.strip()]
+        else:
+            device[field] = value
+    return device
+
+
+def device_to_csv(device: Dict) -> Dict:
+    row = {field: device.get(field) for field in CSV_FIELDS + CSV_STATUS_FIELDS}
+    row['isMonitored'] = 'true' if device['isMonitored'] else 'false'
+    row['tags'] = TAG_SEPARATOR.join(device.get('tags') or [])
+    return row
+
+
+def read_devices(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    (row number, device, error) for each record of an upload; exactly one of
+    device / error is set. NDJSON and CSV are read incrementally; a JSON body
+    (an array, or {"devices": [...]}) is parsed whole. Raises ValueError when
+    the document itself is unreadable
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        if fmt == 'json':
+            try:
+                document = json.load(text)
+            except ValueError as e:
+                raise ValueError(f'Invalid JSON: {e}')
+            if isinstance(document, dict):
+                document = document.get('devices')
+            if not isinstance(document, list):
+                raise ValueError('Expected a JSON array of devices')
+            for number, item in enumerate(document, start=1):
+                if isinstance(item, dict):
+                    yield number, item, None
+                else:
+                    yield number, None, 'Expected an object'
+
+        elif fmt == 'ndjson':
+            for number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    yield number, None, 'Invalid JSON'
+                    continue
+                if isinstance(item, dict):
+                    yield number, item, None
+                else:
+                    yield number, None, 'Expected an object'
+
+        else:
+            reader = csv.DictReader(text)
+            if not reader.fieldnames or 'id' not in reader.fieldnames:
+                raise ValueError('CSV header must include an id column')
+            for row in reader:
+                try:
+                    yield reader.line_num, csv_to_device(row), None
+                except ValueError as e:
+                    yield reader.line_num, None, str(e)
+    except UnicodeDecodeError:
+        raise ValueError('Upload must be UTF-8 encoded')
+    finally:
+        text.detach()
+
+
+def write_records(records: Iterable[Dict], fmt: str, csv_fields: Tuple[str, ...]) -> Iterator[str]:
+    """
+    Export body in chunks of EXPORT_CHUNK_ROWS records, for a streamed response
+    Only one chunk is held at a time, so memory does not grow with the export
+    """
+    chunk = []
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, csv_fields, lineterminator='\n', extrasaction='ignore')
+        writer.writeheader()
+        for count, record in enumerate(records, start=1):
+            writer.writerow(record)
+            if count % EXPORT_CHUNK_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    if fmt == 'json':
+        yield '['
+    for count, record in enumerate(records):
+        encoded = json.dumps(record, separators=(',', ':'))
+        if fmt == 'json':
+            chunk.append(f',{encoded}' if count else encoded)
+        else:
+            chunk.append(f'{encoded}\n')
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if fmt == 'json':
+        chunk.append(']')
+    yield ''.join(chunk)
+
+
+def write_devices(devices: Iterable[Dict], fmt: str) -> Iterator[str]:
+    """Device export body in chunks"""
+    if fmt == 'csv':
+        devices = (device_to_csv(device) for device in devices)
+    return write_records(devices, fmt, CSV_FIELDS + CSV_STATUS_FIELDS)
@@ -0,0 +1,325 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from baseline import baselines
+from device_state import Verdict
+from log import get_logger
+from monitor import record_results
+from registry import registry
+
+# Port workers connect to in cluster mode
+CLUSTER_PORT = int(os.environ.get('NETGUARD_CLUSTER_PORT', '5002'))
+
+# Points per worker on the hash ring; more points spread devices more evenly
+VIRTUAL_NODES = 64
+
+# Workers send a heartbeat this often; one silent for HEARTBEAT_TIMEOUT is dropped (seconds)
+HEARTBEAT_INTERVAL = 2.0
+HEARTBEAT_TIMEOUT = 3 * HEARTBEAT_INTERVAL
+
+# Largest protocol message (an assignment carries every device of a shard)
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+
+# How often the coordinator checks the registry for reconfigured devices, and
+# pulls changes made by other processes (seconds)
+WATCH_INTERVAL = 0.25
+SYNC_INTERVAL = 5.0
+
+# Device fields a worker needs to schedule and probe a device
+PROBE_FIELDS = ('id', 'name', 'ip', 'type', 'status', 'latency', 'isMonitored',
+                'probeInterval', 'probeType', 'probePort', 'probeTarget')
+
+# Fields that change an assignment; status and latency only seed a worker's state machines
+CONFIG_FIELDS = tuple(field for field in PROBE_FIELDS if field not in ('status', 'latency'))
+
+log = get_logger('cluster')
+
+
+def ring_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of device ids onto workers
+    Adding or removing a worker only moves the devices on its own arcs of the
+    ring (about 1/N of them); every other device keeps its owner
+    """
+
+    def __init__(self, members: Iterable[str] = (), virtual_nodes: int = VIRTUAL_NODES):
+        self._virtual_nodes = virtual_nodes
+        self._members = set(members)
+        self._hashes: List[int] = []
+        self._owners: List[str] = []
+        self._rebuild()
+
+    @property
+    def members(self) -> List[str]:
+        return sorted(self._members)
+
+    def _rebuild(self):
+        points = sorted(
+            (ring_hash(f'{member}#{index}'), member)
+            for member in self._members
+            for index in range(self._virtual_nodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def add(self, member: str):
+        if member not in self._members:
+            self._members.add(member)
+            self._rebuild()
+
+    def remove(self, member: str):
+        if member in self._members:
+            self._members.discard(member)
+            self._rebuild()
+
+    def owner(self, key: str) -> Optional[str]:
+        """Member owning `key`: the first point clockwise from its hash"""
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, ring_hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+def encode_message(message: Dict) -> bytes:
+    """Protocol messages are single-line JSON objects"""
+    return json.dumps(message, separators=(',', ':')).encode() + b'\n'
+
+
+async def read_message(reader: asyncio.StreamReader) -> Optional[Dict]:
+    """Next message, or None once the peer has closed the connection"""
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+class WorkerConnection:
+    """Coordinator-side state for one connected worker"""
+
+    def __init__(self, worker_id: str, writer: asyncio.StreamWriter):
+        self.worker_id = worker_id
+        self.writer = writer
+        # Digest of the last assignment sent, so unchanged shards are not resent
+        self.assigned: Optional[str] = None
+        # Digest of the last topology sent
+        self.topology: Optional[str] = None
+        self.device_count = 0
+        self.results = 0
+
+
+class Coordinator:
+    """
+    Splits monitored devices across worker processes and records their results
+    Runs in the API process on one asyncio loop thread. Workers connect over
+    TCP and say hello; every join, leave or device reconfiguration rebalances
+    the hash ring and sends each worker whose shard changed its full device
+    list. Workers probe their shard with their own ProbeScheduler and stream
+    (device id, result, verdict) batches back, which are written through
+    record_results exactly as local probing would (alerts are folded into their
+    root cause here). Every worker also gets the parent links and which devices
+    sit behind an offline parent, resent when either changes, so it slows down
+    probes of unreachable devices whichever worker probes their parent
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._started = threading.Event()
+        self._stopping: Optional[asyncio.Event] = None
+        self._workers: Dict[str, WorkerConnection] = {}
+        self._ring = HashRing()
+        self._revision = -1
+        self._rebalancing: Optional[asyncio.Lock] = None
+        # One writer thread: batches from different workers are committed in turn
+        self._writer = ThreadPoolExecutor(1, thread_name_prefix='cluster-writer')
+        # Results discarded because the sender no longer owned the device
+        self.dropped_results = 0
+        self.port: Optional[int] = None
+
+    @property
+    def members(self) -> List[str]:
+        return self._ring.members
+
+    def worker_stats(self) -> Dict[str, Dict]:
+        """{worker_id: {devices, results}} for connected workers"""
+        return {
+            worker_id: {'devices': worker.device_count, 'results': worker.results}
+            for worker_id, worker in list(self._workers.items())
+        }
+
+    def start(self, host: str = '0.0.0.0', port: int = CLUSTER_PORT):
+        """Accept workers on a daemon thread"""
+        thread = threading.Thread(target=self._run, args=(host, port), name='cluster-coordinator', daemon=True)
+        thread.start()
+        self._started.wait(5)
+
+    def stop(self):
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def _run(self, host: str, port: int):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main(host, port))
+        finally:
+            self._loop.close()
+            self._writer.shutdown(wait=True)
+
+    async def _main(self, host: str, port: int):
+        self._stopping = asyncio.Event()
+        self._rebalancing = asyncio.Lock()
+        server = await asyncio.start_server(self._handle, host, port, limit=MAX_MESSAGE_BYTES)
+        self.port = server.sockets[0].getsockname()[1]
+        log.info('Waiting for probe workers', extra={'address': f'{host}:{self.port}'})
+        self._started.set()
+
+        last_sync = time.monotonic()
+        try:
+            while not self._stopping.is_set():
+                if registry.revision != self._revision:
+                    await self._rebalance()
+                if time.monotonic() - last_sync >= SYNC_INTERVAL:
+                    last_sync = time.monotonic()
+                    try:
+                        await self._loop.run_in_executor(None, registry.sync)
+                    except Exception as e:
+                        log.error('Registry sync failed', extra={'error': str(e)})
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), WATCH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            server.close()
+            for worker in list(self._workers.values()):
+                worker.writer.close()
+
+    def _shards(self) -> Dict[str, List[Dict]]:
+        shards: Dict[str, List[Dict]] = {worker_id: [] for worker_id in self._workers}
+        for device in registry.monitored_devices():
+            owner = self._ring.owner(device['id'])
+            if owner in shards:
+                shards[owner].append({field: device.get(field) for field in PROBE_FIELDS})
+        return shards
+
+    async def _rebalance(self):
+        """Send every worker whose shard changed its new device list"""
+        async with self._rebalancing:
+            self._revision = registry.revision
+            shards = await self._loop.run_in_executor(None, self._shards)
+            for worker_id, devices in shards.items():
+                worker = self._workers.get(worker_id)
+                if worker is None:
+                    continue
+                digest = hashlib.blake2b(json.dumps(
+                    [[device[field] for field in CONFIG_FIELDS] for device in devices]
+                ).encode(), digest_size=16).hexdigest()
+                if digest == worker.assigned:
+                    continue
+                worker.assigned = digest
+                worker.device_count = len(devices)
+                try:
+                    # Learned latency baselines travel with the shard, so a worker taking
+                    # over devices judges them like their previous worker did
+                    learned = baselines.export([device['id'] for device in devices])
+                    worker.writer.write(encode_message({'type': 'assign', 'devices': devices, 'baselines': learned}))
+                    await asyncio.wait_for(worker.writer.drain(), HEARTBEAT_TIMEOUT)
+                except (asyncio.TimeoutError, ConnectionError, OSError):
+                    worker.writer.close()
+            await self._send_topology()
+
+    @staticmethod
+    def _topology() -> Dict:
+        return {'parents': registry.parents(), 'unreachable': registry.unreachable()}
+
+    async def _send_topology(self):
+        """Send every worker the parent links and unreachable devices, when they changed; hold _rebalancing"""
+        topology = await self._loop.run_in_executor(None, self._topology)
+        digest = hashlib.blake2b(json.dumps(topology, sort_keys=True).encode(), digest_size=16).hexdigest()
+        for worker in list(self._workers.values()):
+            if digest == worker.topology:
+                continue
+            worker.topology = digest
+            try:
+                worker.writer.write(encode_message({'type': 'topology', **topology}))
+                await asyncio.wait_for(worker.writer.drain(), HEARTBEAT_TIMEOUT)
+            except (asyncio.TimeoutError, ConnectionError, OSError):
+                worker.writer.close()
+
+    def _collect(self, worker_id: str, results: List) -> List[Tuple[Dict, Dict, Verdict]]:
+        """(device, result, verdict) triples for the devices this worker still owns"""
+        triples = []
+        for device_id, result, verdict in results:
+            device = registry.get(device_id)
+            if self._ring.owner(device_id) != worker_id or device is None or not device['isMonitored']:
+                # Probed before a rebalance moved the device away (or it was removed)
+                self.dropped_results += 1
+                continue
+            triples.append((device, result, Verdict(*verdict)))
+        return triples
+
+    async def _record(self, worker: WorkerConnection, results: List):
+        triples = self._collect(worker.worker_id, results)
+        worker.results += len(triples)
+        if not triples:
+            return
+        try:
+            await self._loop.run_in_executor(self._writer, record_results, triples)
+        except Exception as e:
+            log.error('Failed to record results', extra={'worker': worker.worker_id, 'error': str(e)})
+            return
+        if any(verdict.status != verdict.previous and 'offline' in (verdict.status, verdict.previous)
+               for _, _, verdict in triples):
+            # A device went down or came back, so the set of unreachable devices may have moved
+            async with self._rebalancing:
+                await self._send_topology()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            hello = await asyncio.wait_for(read_message(reader), HEARTBEAT_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            hello = None
+        if not hello or hello.get('type') != 'hello' or not hello.get('worker'):
+            writer.close()
+            return
+
+        worker = WorkerConnection(str(hello['worker']), writer)
+        previous = self._workers.get(worker.worker_id)
+        if previous is not None:
+            # Same worker reconnecting before its old connection timed out
+            previous.writer.close()
+        self._workers[worker.worker_id] = worker
+        self._ring.add(worker.worker_id)
+        log.info('Worker joined', extra={'worker': worker.worker_id, 'connected': len(self._workers)})
+        await self._rebalance()
+
+        try:
+            while True:
+                message = await asyncio.wait_for(read_message(reader), HEARTBEAT_TIMEOUT)
+                if message is None:
+                    break
+                if message.get('type') == 'results':
+                    await self._record(worker, message['results'])
+        except (asyncio.TimeoutError, ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            writer.close()
+            if self._workers.get(worker.worker_id) is worker:
+                del self._workers[worker.worker_id]
+                self._ring.remove(worker.worker_id)
+                log.info('Worker left', extra={'worker': worker.worker_id, 'connected': len(self._workers)})
+                await self._rebalance()
+
+
+# Process-wide coordinator, started by app.py in cluster mode
+coordinator = Coordinator()
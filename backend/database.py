@@ -1,235 +1,1221 @@
 import sqlite3
+import base64
+import ipaddress
 import json
+import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
+
+from log import get_logger
+from metrics import DB_SECONDS, timed
+from serializers import device_to_json, normalize_device
 
 DB_PATH = 'netguard.db'
 
-def init_db():
-    """Initialize SQLite database with required tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Devices table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS devices (
+# Number of read connections shared by request threads
+READ_POOL_SIZE = int(os.environ.get('NETGUARD_DB_POOL_SIZE', '8'))
+
+# Per-connection tuning; WAL lets readers run while the monitor is writing
+CONNECTION_PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',       # 16 MB page cache
+    'PRAGMA mmap_size=268435456',     # 256 MB memory-mapped I/O
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA busy_timeout=5000',
+)
+
+# Statements cached per connection; connections are long-lived so they are reused
+CACHED_STATEMENTS = 256
+
+# Full-text indexes (FTS5, external content): (table, index, rowid column, type column, text column)
+SEARCH_INDEXES = (
+    ('alerts', 'alerts_search', 'rowid', 'type', 'message'),
+    ('fault_logs', 'fault_logs_search', 'id', 'fault_type', 'description'),
+)
+
+# '.' is part of a token, so an IP address or dotted host name is one token: an exact
+# or prefix match on it is a single index lookup rather than a phrase over "10", "0", ...
+SEARCH_TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '.'"
+
+log = get_logger('database')
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Open a tuned connection that may be handed between threads"""
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    # Must precede journal_mode=WAL: a new file's vacuum mode is fixed once its header is written.
+    # Setting it takes the write lock, so connections to an existing file (readers opened
+    # while a write is in progress) leave it alone
+    if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    conn.execute('PRAGMA journal_mode=WAL')
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """
+    One serialized write connection plus a pool of read connections
+    In WAL mode readers see the last committed state and never wait on the writer
+    """
+
+    def __init__(self, path: str, size: int = READ_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._write_depth = 0
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return _connect(self.path)
+                except Exception:
+                    self._created -= 1
+                    raise
+
+        return self._idle.get()
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Borrow the write connection; commits on success, rolls back on error"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = _connect(self.path)
+            # Nested use (e.g. a helper called inside a transaction) joins the outer one
+            if self._write_depth:
+                yield self._writer
+                return
+            self._write_depth += 1
+            try:
+                with self._writer:
+                    yield self._writer
+            finally:
+                self._write_depth -= 1
+
+    def close(self):
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Shared pool for DB_PATH, reopened if DB_PATH has been changed"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+
+def read_connection():
+    """Context manager yielding a pooled read connection"""
+    return get_pool().reader()
+
+
+def write_transaction():
+    """Context manager yielding the write connection inside one transaction"""
+    return get_pool().writer()
+
+
+def close_connections():
+    """Close every pooled connection (used on shutdown and by tests/benchmarks)"""
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def _migration_add_indexes(conn: sqlite3.Connection):
+    """Indexes for newest-first listing and per-device lookups"""
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts (timestamp, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alerts_device_status ON alerts (device_id, status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fault_logs_timestamp ON fault_logs (timestamp)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_fault_logs_device_timestamp ON fault_logs (device_id, timestamp)')
+
+
+def _migration_add_change_versions(conn: sqlite3.Connection):
+    """Change versions for incremental sync"""
+    conn.execute('ALTER TABLE devices ADD COLUMN version INTEGER DEFAULT 0')
+    conn.execute('ALTER TABLE alerts ADD COLUMN version INTEGER DEFAULT 0')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_devices_version ON devices (version)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_alerts_version ON alerts (version)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO sync_state (key, value) VALUES ('version', 0)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS deleted_devices (
             id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            ip TEXT NOT NULL,
-            type TEXT NOT NULL,
-            status TEXT DEFAULT 'offline',
-            latency INTEGER DEFAULT 0,
-            last_checked INTEGER,
-            is_monitored INTEGER DEFAULT 1,
-            uptime REAL DEFAULT 0.0
+            version INTEGER NOT NULL
         )
     ''')
-    
-    # Alerts table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS alerts (
+
+
+def _migration_add_probe_interval(conn: sqlite3.Connection):
+    """Per-device probe interval override"""
+    conn.execute('ALTER TABLE devices ADD COLUMN probe_interval INTEGER')
+
+
+def _migration_add_alert_resolution(conn: sqlite3.Connection):
+    """Alert resolution time"""
+    conn.execute('ALTER TABLE alerts ADD COLUMN resolved_at INTEGER')
+
+
+def _migration_add_probe_type(conn: sqlite3.Connection):
+    """Per-device probe type (icmp, tcp, http, dns) and its port / target"""
+    conn.execute("ALTER TABLE devices ADD COLUMN probe_type TEXT DEFAULT 'icmp'")
+    conn.execute('ALTER TABLE devices ADD COLUMN probe_port INTEGER')
+    conn.execute('ALTER TABLE devices ADD COLUMN probe_target TEXT')
+    # The seeded public resolvers are DNS servers
+    conn.execute("UPDATE devices SET probe_type = 'dns' WHERE id IN ('1', '2') AND ip IN ('8.8.8.8', '1.1.1.1')")
+
+
+def _migration_add_tags(conn: sqlite3.Connection):
+    """Device tags (JSON array of strings)"""
+    conn.execute('ALTER TABLE devices ADD COLUMN tags TEXT')
+
+
+def _migration_add_discovery_jobs(conn: sqlite3.Connection):
+    """Subnet discovery jobs and their progress"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS discovery_jobs (
             id TEXT PRIMARY KEY,
-            device_id TEXT,
-            device_name TEXT,
-            device_ip TEXT,
-            type TEXT,
-            message TEXT,
-            timestamp INTEGER,
-            status TEXT DEFAULT 'active',
-            FOREIGN KEY (device_id) REFERENCES devices (id)
+            cidr TEXT NOT NULL,
+            options TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            total INTEGER NOT NULL DEFAULT 0,
+            probed INTEGER NOT NULL DEFAULT 0,
+            found INTEGER NOT NULL DEFAULT 0,
+            added INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            started_at INTEGER,
+            finished_at INTEGER
         )
     ''')
-    
-    # Fault logs table (for historical tracking)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS fault_logs (
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_discovery_jobs_status ON discovery_jobs (status, created_at)')
+
+
+def _migration_add_retention_runs(conn: sqlite3.Connection):
+    """Reports of the retention job's runs"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS retention_runs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            device_id TEXT,
-            device_name TEXT,
-            device_ip TEXT,
-            fault_type TEXT,
-            description TEXT,
-            timestamp INTEGER,
-            FOREIGN KEY (device_id) REFERENCES devices (id)
+            started_at INTEGER NOT NULL,
+            finished_at INTEGER NOT NULL,
+            report TEXT NOT NULL
         )
     ''')
-    
-    # Seed initial devices if table is empty
-    cursor.execute('SELECT COUNT(*) FROM devices')
-    count = cursor.fetchone()[0]
-    
-    if count == 0:
-        print("[DB] Seeding initial devices...")
-        timestamp = int(datetime.now().timestamp() * 1000)
-        
-        initial_devices = [
-            ('1', 'Google DNS', '8.8.8.8', 'server', 'offline', 0, timestamp, 1, 0.0),
-            ('2', 'Cloudflare DNS', '1.1.1.1', 'server', 'offline', 0, timestamp, 1, 0.0),
-            ('3', 'Local Router', '192.168.1.1', 'router', 'offline', 0, timestamp, 1, 0.0),
-        ]
-        
-        cursor.executemany('''
-            INSERT INTO devices (id, name, ip, type, status, latency, last_checked, is_monitored, uptime)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', initial_devices)
-        print(f"[DB] Seeded {len(initial_devices)} devices")
-    
-    conn.commit()
-    conn.close()
 
+
+def _migration_add_topology(conn: sqlite3.Connection):
+    """Device parents (upstream router / switch) and root-cause links between alerts"""
+    conn.execute('ALTER TABLE devices ADD COLUMN parent_id TEXT')
+    conn.execute('ALTER TABLE alerts ADD COLUMN root_cause_id TEXT')
+
+
+def _migration_add_search_index(conn: sqlite3.Connection):
+    """Full-text search over alert messages, fault descriptions, device names and IPs"""
+    for table, index, rowid, _, text in SEARCH_INDEXES:
+        columns = f'{text}, device_name, device_ip'
+        new = f'new.{text}, new.device_name, new.device_ip'
+        old = f'old.{text}, old.device_name, old.device_ip'
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+                {columns}, content='{table}', content_rowid='{rowid}', tokenize="{SEARCH_TOKENIZER}"
+            )
+        ''')
+        # The index holds no copy of the text; triggers keep it in step with the table
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO {index} (rowid, {columns}) VALUES (new.{rowid}, {new});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO {index} ({index}, rowid, {columns}) VALUES ('delete', old.{rowid}, {old});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF {columns} ON {table} BEGIN
+                INSERT INTO {index} ({index}, rowid, {columns}) VALUES ('delete', old.{rowid}, {old});
+                INSERT INTO {index} (rowid, {columns}) VALUES (new.{rowid}, {new});
+            END
+        ''')
+        conn.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+
+# Schema migrations, applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    _migration_add_indexes,
+    _migration_add_change_versions,
+    _migration_add_probe_interval,
+    _migration_add_alert_resolution,
+    _migration_add_probe_type,
+    _migration_add_tags,
+    _migration_add_discovery_jobs,
+    _migration_add_retention_runs,
+    _migration_add_topology,
+    _migration_add_search_index,
+]
+
+
+def migrate(conn: sqlite3.Connection):
+    """Apply any migrations newer than the database's user_version"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return
+
+    # DDL does not open a transaction implicitly; run all pending steps in one
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        log.info('Applying migration', extra={'migration': number, 'description': migration.__doc__})
+        migration(conn)
+        conn.execute(f'PRAGMA user_version = {number}')
+
+
+@timed(DB_SECONDS)
+def init_db():
+    """Initialize SQLite database with required tables"""
+    with write_transaction() as conn:
+        cursor = conn.cursor()
+
+        # Devices table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS devices (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                type TEXT NOT NULL,
+                status TEXT DEFAULT 'offline',
+                latency INTEGER DEFAULT 0,
+                last_checked INTEGER,
+                is_monitored INTEGER DEFAULT 1,
+                uptime REAL DEFAULT 0.0
+            )
+        ''')
+
+        # Alerts table
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS alerts (
+                id TEXT PRIMARY KEY,
+                device_id TEXT,
+                device_name TEXT,
+                device_ip TEXT,
+                type TEXT,
+                message TEXT,
+                timestamp INTEGER,
+                status TEXT DEFAULT 'active',
+                FOREIGN KEY (device_id) REFERENCES devices (id)
+            )
+        ''')
+
+        # Fault logs table (for historical tracking)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fault_logs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_id TEXT,
+                device_name TEXT,
+                device_ip TEXT,
+                fault_type TEXT,
+                description TEXT,
+                timestamp INTEGER,
+                FOREIGN KEY (device_id) REFERENCES devices (id)
+            )
+        ''')
+
+        # Seed initial devices if table is empty
+        cursor.execute('SELECT COUNT(*) FROM devices')
+        count = cursor.fetchone()[0]
+
+        if count == 0:
+            timestamp = int(datetime.now().timestamp() * 1000)
+
+            initial_devices = [
+                ('1', 'Google DNS', '8.8.8.8', 'server', 'offline', 0, timestamp, 1, 0.0),
+                ('2', 'Cloudflare DNS', '1.1.1.1', 'server', 'offline', 0, timestamp, 1, 0.0),
+                ('3', 'Local Router', '192.168.1.1', 'router', 'offline', 0, timestamp, 1, 0.0),
+            ]
+
+            cursor.executemany('''
+                INSERT INTO devices (id, name, ip, type, status, latency, last_checked, is_monitored, uptime)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', initial_devices)
+            log.info('Seeded initial devices', extra={'devices': len(initial_devices)})
+
+        migrate(conn)
+
+def _next_version(conn: sqlite3.Connection) -> int:
+    """Reserve the next change version; must run inside a write transaction"""
+    conn.execute("UPDATE sync_state SET value = value + 1 WHERE key = 'version'")
+    return conn.execute("SELECT value FROM sync_state WHERE key = 'version'").fetchone()[0]
+
+@timed(DB_SECONDS)
+def get_data_version() -> int:
+    """Version of the most recent committed change to devices or alerts"""
+    with read_connection() as conn:
+        row = conn.execute("SELECT value FROM sync_state WHERE key = 'version'").fetchone()
+
+    return row[0] if row else 0
+
+@timed(DB_SECONDS)
+def get_changes_since(since: int, alert_limit: int = 1000) -> Dict:
+    """
+    Devices and alerts changed after version `since`, read from one snapshot
+    'truncated' is set when more alerts changed than alert_limit
+    """
+    with read_connection() as conn:
+        conn.execute('BEGIN')
+        version = conn.execute("SELECT value FROM sync_state WHERE key = 'version'").fetchone()[0]
+
+        if version <= since:
+            return {'version': version, 'devices': [], 'alerts': [], 'removed': [], 'truncated': False}
+
+        devices = conn.execute('SELECT * FROM devices WHERE version > ?', (since,)).fetchall()
+        alerts = conn.execute(
+            'SELECT * FROM alerts WHERE version > ? ORDER BY version DESC LIMIT ?', (since, alert_limit + 1)
+        ).fetchall()
+        removed = conn.execute('SELECT id FROM deleted_devices WHERE version > ?', (since,)).fetchall()
+
+    return {
+        'version': version,
+        'devices': [dict(row) for row in devices],
+        'alerts': [dict(row) for row in alerts[:alert_limit]],
+        'removed': [row[0] for row in removed],
+        'truncated': len(alerts) > alert_limit,
+    }
+
+@timed(DB_SECONDS)
 def get_all_devices() -> List[Dict]:
     """Get all devices from database"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM devices')
-    rows = cursor.fetchall()
-    conn.close()
-    
+    with read_connection() as conn:
+        rows = conn.execute('SELECT * FROM devices').fetchall()
+
     return [dict(row) for row in rows]
 
+def _device_params(device: Dict, version: int) -> Tuple:
+    """Parameters for DEVICE_INSERT from a normalized device"""
+    return (
+        device['id'],
+        device['name'],
+        device['ip'],
+        device['type'],
+        device['status'],
+        device['latency'],
+        device['lastChecked'],
+        1 if device['isMonitored'] else 0,
+        device['uptime'],
+        device['probeInterval'],
+        device['probeType'],
+        device['probePort'],
+        device['probeTarget'],
+        json.dumps(device['tags']) if device['tags'] else None,
+        device['parentId'],
+        version
+    )
+
+DEVICE_INSERT = '''
+    INSERT INTO devices (id, name, ip, type, status, latency, last_checked, is_monitored, uptime,
+                         probe_interval, probe_type, probe_port, probe_target, tags, parent_id, version)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+@timed(DB_SECONDS)
 def add_device(device: Dict) -> bool:
     """Add a new device to database"""
+    device = normalize_device(device)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO devices (id, name, ip, type, status, latency, last_checked, is_monitored, uptime)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            device['id'],
-            device['name'],
-            device['ip'],
-            device['type'],
-            device.get('status', 'offline'),
-            device.get('latency', 0),
-            device.get('lastChecked', int(datetime.now().timestamp() * 1000)),
-            1 if device.get('isMonitored', True) else 0,
-            device.get('uptime', 0.0)
-        ))
-        
-        conn.commit()
-        conn.close()
+        with write_transaction() as conn:
+            version = _next_version(conn)
+            conn.execute(DEVICE_INSERT, _device_params(device, version))
+            conn.execute('DELETE FROM deleted_devices WHERE id = ?', (device['id'],))
         return True
     except Exception as e:
-        print(f"Error adding device: {e}")
+        log.error('Error adding device', extra={'error': str(e)})
+        return False
+
+def _in_network(ip: str, network) -> bool:
+    try:
+        return ipaddress.ip_address(ip) in network
+    except ValueError:
         return False
 
+def _filtered_devices(conn: sqlite3.Connection, filters: Dict, columns: str = '*') -> List[sqlite3.Row]:
+    """
+    Devices matching every given filter, ordered by id
+    filters: ids (list), type, tag, subnet (an ipaddress network; matched in Python)
+    """
+    clauses = []
+    params: List[object] = []
+    if filters.get('ids') is not None:
+        clauses.append('id IN (SELECT value FROM json_each(?))')
+        params.append(json.dumps(filters['ids']))
+    if filters.get('type'):
+        clauses.append('type = ?')
+        params.append(filters['type'])
+    if filters.get('tag'):
+        clauses.append('EXISTS (SELECT 1 FROM json_each(devices.tags) WHERE value = ?)')
+        params.append(filters['tag'])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = conn.execute(f'SELECT {columns} FROM devices {where} ORDER BY id', params).fetchall()
+
+    network = filters.get('subnet')
+    if network is not None:
+        rows = [row for row in rows if _in_network(row['ip'], network)]
+    return rows
+
+@timed(DB_SECONDS)
+def get_devices(filters: Dict) -> List[Dict]:
+    """Devices matching filters (see _filtered_devices)"""
+    with read_connection() as conn:
+        rows = _filtered_devices(conn, filters)
+
+    return [dict(row) for row in rows]
+
+@timed(DB_SECONDS)
+def upsert_devices(devices: List[Dict]) -> Optional[List[Tuple[Dict, bool]]]:
+    """
+    Create or update a batch of devices in one transaction
+    Existing devices keep their status, latency and uptime, and any field the
+    given dict leaves out. Returns (normalized device, created) per distinct id,
+    or None when the batch was rolled back
+    """
+    try:
+        with write_transaction() as conn:
+            ids = [device['id'] for device in devices]
+            existing = {
+                row['id']: device_to_json(dict(row)) for row in conn.execute(
+                    'SELECT * FROM devices WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(ids),)
+                )
+            }
+
+            saved: Dict[str, Tuple[Dict, bool]] = {}
+            for given in devices:
+                base = existing.get(given['id'])
+                device = normalize_device({**base, **given} if base else given)
+                existing[device['id']] = device
+                created = saved[device['id']][1] if device['id'] in saved else base is None
+                saved[device['id']] = (device, created)
+
+            version = _next_version(conn)
+            conn.executemany(DEVICE_INSERT + '''
+                ON CONFLICT (id) DO UPDATE SET
+                    name = excluded.name, ip = excluded.ip, type = excluded.type,
+                    is_monitored = excluded.is_monitored, probe_interval = excluded.probe_interval,
+                    probe_type = excluded.probe_type, probe_port = excluded.probe_port,
+                    probe_target = excluded.probe_target, tags = excluded.tags, parent_id = excluded.parent_id,
+                    version = excluded.version
+            ''', [_device_params(device, version) for device, _ in saved.values()])
+            conn.execute('DELETE FROM deleted_devices WHERE id IN (SELECT value FROM json_each(?))',
+                         (json.dumps(list(saved)),))
+        return list(saved.values())
+    except Exception as e:
+        log.error('Error importing devices', extra={'error': str(e)})
+        return None
+
+@timed(DB_SECONDS)
+def delete_devices(filters: Dict) -> Optional[List[str]]:
+    """Delete every device matching filters in one transaction; returns the deleted ids"""
+    try:
+        with write_transaction() as conn:
+            ids = [row['id'] for row in _filtered_devices(conn, filters, 'id, ip')]
+            if ids:
+                version = _next_version(conn)
+                conn.executemany('DELETE FROM devices WHERE id = ?', [(device_id,) for device_id in ids])
+                conn.executemany('INSERT OR REPLACE INTO deleted_devices (id, version) VALUES (?, ?)',
+                                 [(device_id, version) for device_id in ids])
+        return ids
+    except Exception as e:
+        log.error('Error deleting devices', extra={'error': str(e)})
+        return None
+
+@timed(DB_SECONDS)
+def set_monitoring(filters: Dict, monitored: Optional[bool]) -> Optional[List[Tuple[str, bool]]]:
+    """
+    Enable or disable monitoring for every device matching filters (None flips each one)
+    Returns (device_id, is_monitored) for the devices that changed
+    """
+    try:
+        with write_transaction() as conn:
+            rows = _filtered_devices(conn, filters, 'id, ip, is_monitored')
+            changed = [
+                (row['id'], not row['is_monitored'] if monitored is None else monitored)
+                for row in rows
+                if monitored is None or bool(row['is_monitored']) != monitored
+            ]
+            if changed:
+                version = _next_version(conn)
+                conn.executemany('UPDATE devices SET is_monitored = ?, version = ? WHERE id = ?',
+                                 [(1 if flag else 0, version, device_id) for device_id, flag in changed])
+        return changed
+    except Exception as e:
+        log.error('Error setting monitoring', extra={'error': str(e)})
+        return None
+
+@timed(DB_SECONDS)
 def update_device_status(device_id: str, status: str, latency: int):
     """Update device status and latency"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     timestamp = int(datetime.now().timestamp() * 1000)
-    
-    cursor.execute('''
-        UPDATE devices 
-        SET status = ?, latency = ?, last_checked = ?
-        WHERE id = ?
-    ''', (status, latency, timestamp, device_id))
-    
-    conn.commit()
-    conn.close()
 
+    with write_transaction() as conn:
+        version = _next_version(conn)
+        conn.execute('''
+            UPDATE devices
+            SET status = ?, latency = ?, last_checked = ?, version = ?
+            WHERE id = ?
+        ''', (status, latency, timestamp, version, device_id))
+
+@timed(DB_SECONDS)
+def save_sweep_results(status_updates: List[Tuple[str, str, int]], alerts: List[Dict],
+                       fault_logs: List[Tuple[str, str, str, str, str]], timestamp: Optional[int] = None,
+                       resolutions: Optional[List[Tuple[str, Tuple[str, ...]]]] = None,
+                       folds: Optional[List[Tuple[str, List[str]]]] = None) -> Optional[int]:
+    """
+    Persist one monitoring sweep in a single transaction
+    Returns the change version it was saved under, or None when nothing a client can see changed
+
+    status_updates: (device_id, status, latency) for devices whose row should be written
+    alerts: alert dicts in the same shape add_alert accepts
+    fault_logs: (device_id, device_name, device_ip, fault_type, description)
+    timestamp: last_checked / fault log / resolution time in ms, defaults to now
+    resolutions: (device_id, alert types) whose active alerts are now resolved
+    folds: (root cause device_id, downstream device ids) whose active connectivity
+           alerts are linked to the root cause's own
+    """
+    if timestamp is None:
+        timestamp = int(datetime.now().timestamp() * 1000)
+
+    with write_transaction() as conn:
+        # Only rows whose status or latency actually moved are stamped with the
+        # new version, so a sweep that changed nothing leaves /api/changes empty
+        version = _next_version(conn)
+        conn.executemany('''
+            UPDATE devices
+            SET version = CASE WHEN status IS NOT ? OR latency IS NOT ? THEN ? ELSE version END,
+                status = ?, latency = ?, last_checked = ?
+            WHERE id = ?
+        ''', [(status, latency, version, status, latency, timestamp, device_id)
+              for device_id, status, latency in status_updates])
+        changed = conn.execute('SELECT EXISTS (SELECT 1 FROM devices WHERE version = ?)', (version,)).fetchone()[0]
+
+        conn.executemany('''
+            INSERT INTO alerts (id, device_id, device_name, device_ip, type, message, timestamp, status, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            alert['id'],
+            alert['deviceId'],
+            alert['deviceName'],
+            alert['deviceIp'],
+            alert['type'],
+            alert['message'],
+            alert['timestamp'],
+            alert.get('status', 'active'),
+            version
+        ) for alert in alerts])
+
+        conn.executemany('''
+            INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [log + (timestamp,) for log in fault_logs])
+
+        resolved = 0
+        for device_id, alert_types in resolutions or []:
+            placeholders = ', '.join('?' * len(alert_types))
+            resolved += conn.execute(f'''
+                UPDATE alerts SET status = 'resolved', resolved_at = ?, version = ?
+                WHERE device_id = ? AND status = 'active' AND type IN ({placeholders})
+            ''', (timestamp, version, device_id, *alert_types)).rowcount
+
+        for root_id, device_ids in folds or []:
+            # Looked up after this sweep's inserts, so a root cause confirmed in the same sweep is found
+            root = conn.execute('''
+                SELECT id FROM alerts WHERE device_id = ? AND status = 'active' AND type = 'connectivity'
+                ORDER BY timestamp DESC LIMIT 1
+            ''', (root_id,)).fetchone()
+            if root is None:
+                continue
+            resolved += conn.execute('''
+                UPDATE alerts SET root_cause_id = ?, version = ?
+                WHERE device_id IN (SELECT value FROM json_each(?)) AND status = 'active'
+                  AND type = 'connectivity' AND root_cause_id IS NULL
+            ''', (root[0], version, json.dumps(device_ids))).rowcount
+
+        if not changed and not alerts and not resolved:
+            # Nothing a client can see changed, so hand the version back
+            conn.execute("UPDATE sync_state SET value = value - 1 WHERE key = 'version'")
+            return None
+
+    return version
+
+@timed(DB_SECONDS)
 def delete_device(device_id: str) -> bool:
     """Delete a device from database"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('DELETE FROM devices WHERE id = ?', (device_id,))
-        
-        conn.commit()
-        conn.close()
+        with write_transaction() as conn:
+            version = _next_version(conn)
+            conn.execute('DELETE FROM devices WHERE id = ?', (device_id,))
+            conn.execute('INSERT OR REPLACE INTO deleted_devices (id, version) VALUES (?, ?)', (device_id, version))
         return True
     except Exception as e:
-        print(f"Error deleting device: {e}")
+        log.error('Error deleting device', extra={'error': str(e)})
         return False
 
+@timed(DB_SECONDS)
+def set_probe_interval(device_id: str, interval: Optional[int]) -> bool:
+    """Set a device's probe interval in seconds (None restores the type default)"""
+    try:
+        with write_transaction() as conn:
+            version = _next_version(conn)
+            conn.execute('UPDATE devices SET probe_interval = ?, version = ? WHERE id = ?',
+                         (interval, version, device_id))
+        return True
+    except Exception as e:
+        log.error('Error setting probe interval', extra={'error': str(e)})
+        return False
+
+@timed(DB_SECONDS)
+def set_probe_settings(device_id: str, probe_type: str, port: Optional[int], target: Optional[str]) -> bool:
+    """Set how a device is probed: probe type plus optional port and target (path, URL or DNS name)"""
+    try:
+        with write_transaction() as conn:
+            version = _next_version(conn)
+            conn.execute('''
+                UPDATE devices SET probe_type = ?, probe_port = ?, probe_target = ?, version = ? WHERE id = ?
+            ''', (probe_type, port, target, version, device_id))
+        return True
+    except Exception as e:
+        log.error('Error setting probe settings', extra={'error': str(e)})
+        return False
+
+@timed(DB_SECONDS)
+def set_parent(device_id: str, parent_id: Optional[str]) -> bool:
+    """Set the device a device depends on (None detaches it)"""
+    try:
+        with write_transaction() as conn:
+            version = _next_version(conn)
+            conn.execute('UPDATE devices SET parent_id = ?, version = ? WHERE id = ?', (parent_id, version, device_id))
+        return True
+    except Exception as e:
+        log.error('Error setting parent', extra={'error': str(e)})
+        return False
+
+@timed(DB_SECONDS)
 def toggle_monitoring(device_id: str) -> bool:
     """Toggle monitoring status for a device"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT is_monitored FROM devices WHERE id = ?', (device_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            new_status = 0 if row[0] else 1
-            cursor.execute('UPDATE devices SET is_monitored = ? WHERE id = ?', (new_status, device_id))
-            conn.commit()
-        
-        conn.close()
+        with write_transaction() as conn:
+            version = _next_version(conn)
+            conn.execute('''
+                UPDATE devices
+                SET is_monitored = CASE WHEN is_monitored THEN 0 ELSE 1 END, version = ?
+                WHERE id = ?
+            ''', (version, device_id))
         return True
     except Exception as e:
-        print(f"Error toggling monitoring: {e}")
+        log.error('Error toggling monitoring', extra={'error': str(e)})
         return False
 
+@timed(DB_SECONDS)
 def add_alert(alert: Dict) -> bool:
     """Add a new alert to database"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO alerts (id, device_id, device_name, device_ip, type, message, timestamp, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            alert['id'],
-            alert['deviceId'],
-            alert['deviceName'],
-            alert['deviceIp'],
-            alert['type'],
-            alert['message'],
-            alert['timestamp'],
-            alert.get('status', 'active')
-        ))
-        
-        conn.commit()
-        conn.close()
+        with write_transaction() as conn:
+            version = _next_version(conn)
+            conn.execute('''
+                INSERT INTO alerts (id, device_id, device_name, device_ip, type, message, timestamp, status, version)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                alert['id'],
+                alert['deviceId'],
+                alert['deviceName'],
+                alert['deviceIp'],
+                alert['type'],
+                alert['message'],
+                alert['timestamp'],
+                alert.get('status', 'active'),
+                version
+            ))
         return True
     except Exception as e:
-        print(f"Error adding alert: {e}")
+        log.error('Error adding alert', extra={'error': str(e)})
         return False
 
-def get_all_alerts() -> List[Dict]:
-    """Get all alerts from database"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM alerts ORDER BY timestamp DESC')
-    rows = cursor.fetchall()
-    conn.close()
-    
-    return [dict(row) for row in rows]
+def encode_cursor(timestamp: int, row_id) -> str:
+    """Opaque keyset cursor pointing just past (timestamp, id)"""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, row_id]).encode()).decode()
 
+def decode_cursor(cursor: str) -> Tuple[int, object]:
+    """Inverse of encode_cursor; raises ValueError on malformed input"""
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(timestamp), row_id
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def _fetch_page(table: str, filters: Dict[str, object], limit: int, cursor: Optional[str],
+                since: Optional[int], until: Optional[int]) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Newest-first keyset page over alerts or fault_logs
+    Walks the (timestamp, id) order, so deep pages cost the same as the first one
+    """
+    clauses = []
+    params: List[object] = []
+
+    for column, value in filters.items():
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+
+    if since is not None:
+        clauses.append('timestamp >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('timestamp < ?')
+        params.append(until)
+
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        # Row-value comparison lets SQLite seek the (timestamp, id) index instead of scanning it
+        clauses.append('(timestamp, id) < (?, ?)')
+        params.extend([timestamp, row_id])
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    params.append(limit + 1)
+
+    with read_connection() as conn:
+        rows = conn.execute(
+            f'SELECT * FROM {table} {where} ORDER BY timestamp DESC, id DESC LIMIT ?', params
+        ).fetchall()
+
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last['timestamp'], last['id'])
+
+    return items, next_cursor
+
+@timed(DB_SECONDS)
+def get_alerts_page(limit: int = 100, cursor: Optional[str] = None, status: Optional[str] = None,
+                    alert_type: Optional[str] = None, device_id: Optional[str] = None,
+                    since: Optional[int] = None, until: Optional[int] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get one page of alerts, newest first, plus the cursor for the next page"""
+    filters = {'status': status, 'type': alert_type, 'device_id': device_id}
+    return _fetch_page('alerts', filters, limit, cursor, since, until)
+
+def _iter_pages(table: str, filters: Dict[str, object], page_size: int,
+                since: Optional[int], until: Optional[int]) -> Iterator[Dict]:
+    """
+    Every matching row, newest first, fetched page_size rows per query
+    Each page is a separate short read, so a slow consumer holds no connection
+    or snapshot between pages and memory stays bounded by one page
+    """
+    cursor = None
+    while True:
+        rows, cursor = _fetch_page(table, filters, page_size, cursor, since, until)
+        yield from rows
+        if cursor is None:
+            return
+
+def iter_alerts(status: Optional[str] = None, alert_type: Optional[str] = None, device_id: Optional[str] = None,
+                since: Optional[int] = None, until: Optional[int] = None, page_size: int = 1000) -> Iterator[Dict]:
+    """Stream alerts, newest first (same filters as get_alerts_page)"""
+    filters = {'status': status, 'type': alert_type, 'device_id': device_id}
+    return _iter_pages('alerts', filters, page_size, since, until)
+
+@timed(DB_SECONDS)
 def add_fault_log(device_id: str, device_name: str, device_ip: str, fault_type: str, description: str):
     """Add a fault log entry"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     timestamp = int(datetime.now().timestamp() * 1000)
-    
-    cursor.execute('''
-        INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (device_id, device_name, device_ip, fault_type, description, timestamp))
-    
-    conn.commit()
-    conn.close()
+
+    with write_transaction() as conn:
+        conn.execute('''
+            INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (device_id, device_name, device_ip, fault_type, description, timestamp))
 
 def get_fault_logs(limit: int = 100) -> List[Dict]:
     """Get recent fault logs"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM fault_logs ORDER BY timestamp DESC LIMIT ?', (limit,))
-    rows = cursor.fetchall()
-    conn.close()
-    
+    return get_fault_logs_page(limit)[0]
+
+@timed(DB_SECONDS)
+def get_fault_logs_page(limit: int = 100, cursor: Optional[str] = None, fault_type: Optional[str] = None,
+                        device_id: Optional[str] = None, since: Optional[int] = None,
+                        until: Optional[int] = None) -> Tuple[List[Dict], Optional[str]]:
+    """Get one page of fault logs, newest first, plus the cursor for the next page"""
+    filters = {'fault_type': fault_type, 'device_id': device_id}
+    return _fetch_page('fault_logs', filters, limit, cursor, since, until)
+
+def iter_fault_logs(fault_type: Optional[str] = None, device_id: Optional[str] = None,
+                    since: Optional[int] = None, until: Optional[int] = None,
+                    page_size: int = 1000) -> Iterator[Dict]:
+    """Stream fault logs, newest first (same filters as get_fault_logs_page)"""
+    filters = {'fault_type': fault_type, 'device_id': device_id}
+    return _iter_pages('fault_logs', filters, page_size, since, until)
+
+def rebuild_search_index(conn: sqlite3.Connection):
+    """
+    Re-read every row into the full-text indexes; needed after a full VACUUM, which
+    may renumber the implicit rowids of alerts that alerts_search points at
+    """
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for _, index, _, _, _ in SEARCH_INDEXES:
+        if index in existing:
+            conn.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+def _search_span(conn: sqlite3.Connection, table: str, rowid: str, since: Optional[int],
+                 until: Optional[int]) -> Tuple[int, int]:
+    """
+    Lowest and highest rowid of the rows in [since, until), read from the timestamp index
+    Rows written out of time order (imports, cluster workers) only widen the span
+    """
+    clauses, params = [], []
+    if since is not None:
+        clauses.append('timestamp >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('timestamp < ?')
+        params.append(until)
+    low, high = conn.execute(
+        f'SELECT min({rowid}), max({rowid}) FROM {table} WHERE {" AND ".join(clauses)}', params
+    ).fetchone()
+    return (low, high) if low is not None else (1, 0)
+
+@timed(DB_SECONDS)
+def search_table(table: str, match: str, result_type: Optional[str] = None, device_id: Optional[str] = None,
+                 since: Optional[int] = None, until: Optional[int] = None, window: int = 5000,
+                 count_limit: int = 100000, limit: int = 50, newest: bool = False,
+                 facets: bool = True) -> Dict:
+    """
+    Full-text search of alerts or fault_logs (`match` is an FTS5 query)
+    Ranking and facets cover the `window` most recently written matches, so their cost does
+    not grow with the table; the total is counted up to `count_limit`. Returns {total, exact,
+    complete, rows, facets}: complete means the window held every match, rows are (row dict,
+    bm25 score, snippet) best first (newest timestamp first with `newest`) and facets are (type,
+    device_id, device_name, day number, count) groups over the window
+    All of it is read from one snapshot, so a concurrent retention delete cannot remove a
+    ranked row before it is fetched
+    """
+    _, index, rowid, type_column, _ = next(entry for entry in SEARCH_INDEXES if entry[0] == table)
+    clauses = [f'{index} MATCH ?']
+    params: List[object] = [match]
+    if result_type is not None:
+        clauses.append(f't.{type_column} = ?')
+        params.append(result_type)
+    if device_id is not None:
+        clauses.append('t.device_id = ?')
+        params.append(device_id)
+    if since is not None:
+        clauses.append('t.timestamp >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('t.timestamp < ?')
+        params.append(until)
+
+    if device_id is not None:
+        # One device's rows are few: walk them by the device index and look each up in
+        # the full-text index, rather than filter every match of a common word
+        source = f'{table} t CROSS JOIN {index} s ON s.rowid = t.{rowid}'
+        rowid_range = f't.{rowid} BETWEEN ? AND ?'
+    else:
+        source = f'{index} s JOIN {table} t ON t.{rowid} = s.rowid'
+        rowid_range = 's.rowid BETWEEN ? AND ?'
+    with read_connection() as conn:
+        conn.execute('BEGIN')
+        # The rowids spanned by the time range bound the scan, so FTS5 skips the rest of each
+        # doclist; the timestamp clauses still decide which rows match
+        low, high = 0, 2 ** 63 - 1
+        if since is not None or until is not None:
+            low, high = _search_span(conn, table, rowid, since, until)
+        where = ' AND '.join(clauses + [rowid_range])
+        params.extend([low, high])
+
+        counted = conn.execute(
+            f'SELECT count(*) FROM (SELECT 1 FROM {source} WHERE {where} LIMIT ?)', params + [count_limit + 1]
+        ).fetchone()[0]
+        total = min(counted, count_limit)
+        complete = counted <= window
+        if not complete:
+            low = conn.execute(
+                f'SELECT s.rowid FROM {source} WHERE {where} ORDER BY s.rowid DESC LIMIT 1 OFFSET ?',
+                params + [window - 1]
+            ).fetchone()[0]
+            params[-2] = low
+
+        # bm25() rather than the rank column: ORDER BY rank makes FTS5 rank every match of
+        # the query itself, which ignores a selective device / type filter on the table
+        order = 't.timestamp DESC, s.rowid DESC' if newest else 'score'
+        ranked = conn.execute(
+            f'SELECT s.rowid, bm25({index}) AS score FROM {source} WHERE {where} ORDER BY {order} LIMIT ?',
+            params + [limit]
+        ).fetchall()
+        ranks = {row[0]: row[1] for row in ranked}
+
+        rows = []
+        if ranks:
+            # One scan over the rowid range of the chosen rows, which lie within the window
+            # (looking each up by rowid would re-expand a prefix term once per row); one
+            # device's rows are spread over the whole table, so those are looked up one by one
+            if device_id is None:
+                span, span_params = 's.rowid BETWEEN ? AND ?', [min(ranks), max(ranks)]
+            else:
+                span, span_params = '1', []
+            found = conn.execute(f'''
+                SELECT t.*, s.rowid AS search_rowid, snippet({index}, -1, char(2), char(3), '…', 12) AS snippet
+                FROM {source} WHERE {index} MATCH ? AND {span} AND t.{rowid} IN (SELECT value FROM json_each(?))
+            ''', [match] + span_params + [json.dumps(list(ranks))]).fetchall()
+            by_rowid = {row['search_rowid']: row for row in found}
+            for key, rank in ranks.items():
+                row = dict(by_rowid[key])
+                del row['search_rowid']
+                snippet = row.pop('snippet')
+                rows.append((row, rank, snippet))
+
+        groups = []
+        if facets and total:
+            groups = [tuple(row) for row in conn.execute(f'''
+                SELECT t.{type_column}, t.device_id, t.device_name, t.timestamp / 86400000 AS day, count(*)
+                FROM {source} WHERE {where} GROUP BY t.{type_column}, t.device_id, day
+            ''', params)]
+
+    return {'total': total, 'exact': counted <= count_limit, 'complete': complete, 'rows': rows, 'facets': groups}
+
+@timed(DB_SECONDS)
+def get_outage_events(since: int) -> List[Tuple[str, str, int]]:
+    """
+    Connectivity transitions from fault_logs as (device_id, fault_type, timestamp), oldest first
+    Includes each device's last transition before `since` so outages already open at that time are seen
+    """
+    with read_connection() as conn:
+        before = conn.execute('''
+            SELECT device_id, fault_type, MAX(timestamp) FROM fault_logs
+            WHERE timestamp < ? AND fault_type IN ('connectivity', 'latency', 'recovery')
+            GROUP BY device_id
+        ''', (since,)).fetchall()
+        after = conn.execute('''
+            SELECT device_id, fault_type, timestamp FROM fault_logs
+            WHERE timestamp >= ? AND fault_type IN ('connectivity', 'latency', 'recovery')
+            ORDER BY timestamp, id
+        ''', (since,)).fetchall()
+    return [tuple(row) for row in before] + [tuple(row) for row in after]
+
+@timed(DB_SECONDS)
+def save_uptimes(uptimes: List[Tuple[str, float]]):
+    """Store computed uptime percentages; only rows whose value moved get a new version"""
+    with write_transaction() as conn:
+        version = _next_version(conn)
+        conn.executemany('''
+            UPDATE devices SET uptime = ?, version = ? WHERE id = ? AND uptime IS NOT ?
+        ''', [(uptime, version, device_id, uptime) for device_id, uptime in uptimes])
+        if not conn.execute('SELECT EXISTS (SELECT 1 FROM devices WHERE version = ?)', (version,)).fetchone()[0]:
+            conn.execute("UPDATE sync_state SET value = value - 1 WHERE key = 'version'")
+
+@timed(DB_SECONDS)
+def create_discovery_job(job_id: str, cidr: str, options: Dict, total: int):
+    """Queue a discovery job for the process that probes"""
+    with write_transaction() as conn:
+        conn.execute('''
+            INSERT INTO discovery_jobs (id, cidr, options, total, created_at) VALUES (?, ?, ?, ?, ?)
+        ''', (job_id, cidr, json.dumps(options), total, int(datetime.now().timestamp() * 1000)))
+
+@timed(DB_SECONDS)
+def get_discovery_job(job_id: str) -> Optional[Dict]:
+    with read_connection() as conn:
+        row = conn.execute('SELECT * FROM discovery_jobs WHERE id = ?', (job_id,)).fetchone()
+
+    return dict(row) if row else None
+
+@timed(DB_SECONDS)
+def get_discovery_jobs(limit: int = 20) -> List[Dict]:
+    """Most recent discovery jobs, newest first"""
+    with read_connection() as conn:
+        rows = conn.execute('SELECT * FROM discovery_jobs ORDER BY created_at DESC, id LIMIT ?', (limit,)).fetchall()
+
+    return [dict(row) for row in rows]
+
+@timed(DB_SECONDS)
+def claim_discovery_job() -> Optional[Dict]:
+    """Mark the oldest queued job running and return it (None when the queue is empty)"""
+    with write_transaction() as conn:
+        row = conn.execute(
+            "SELECT * FROM discovery_jobs WHERE status = 'queued' ORDER BY created_at, id LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        started = int(datetime.now().timestamp() * 1000)
+        conn.execute("UPDATE discovery_jobs SET status = 'running', started_at = ? WHERE id = ?", (started, row['id']))
+
+    job = dict(row)
+    job.update(status='running', started_at=started)
+    return job
+
+@timed(DB_SECONDS)
+def update_discovery_job(job_id: str, probed: int, found: int, added: int, skipped: int,
+                         status: Optional[str] = None, error: Optional[str] = None) -> bool:
+    """
+    Record a running job's counters (and its final status when given)
+    Returns whether cancellation has been requested
+    """
+    finished = int(datetime.now().timestamp() * 1000) if status else None
+    with write_transaction() as conn:
+        conn.execute('''
+            UPDATE discovery_jobs
+            SET probed = ?, found = ?, added = ?, skipped = ?, status = COALESCE(?, status),
+                error = COALESCE(?, error), finished_at = COALESCE(?, finished_at)
+            WHERE id = ?
+        ''', (probed, found, added, skipped, status, error, finished, job_id))
+        row = conn.execute('SELECT cancel_requested FROM discovery_jobs WHERE id = ?', (job_id,)).fetchone()
+
+    return bool(row and row[0])
+
+@timed(DB_SECONDS)
+def cancel_discovery_job(job_id: str) -> Optional[str]:
+    """
+    Ask a job to stop; a queued job is cancelled at once, a running one at its next progress update
+    Returns the job's status afterwards, or None when there is no such job
+    """
+    with write_transaction() as conn:
+        row = conn.execute('SELECT status FROM discovery_jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        if row['status'] == 'queued':
+            conn.execute('''
+                UPDATE discovery_jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ?
+            ''', (int(datetime.now().timestamp() * 1000), job_id))
+            return 'cancelled'
+        if row['status'] == 'running':
+            conn.execute('UPDATE discovery_jobs SET cancel_requested = 1 WHERE id = ?', (job_id,))
+        return row['status']
+
+@timed(DB_SECONDS)
+def fail_interrupted_discovery_jobs() -> int:
+    """Jobs left running by a process that exited; called once by the process that probes"""
+    with write_transaction() as conn:
+        return conn.execute('''
+            UPDATE discovery_jobs SET status = 'failed', error = 'Interrupted by a restart', finished_at = ?
+            WHERE status = 'running'
+        ''', (int(datetime.now().timestamp() * 1000),)).rowcount
+
+@timed(DB_SECONDS)
+def get_expired_alerts(cutoff: int, after: Optional[Tuple[int, str]], limit: int) -> List[Dict]:
+    """
+    Resolved alerts whose resolution is older than `cutoff`, oldest first, starting past
+    the (timestamp, id) key `after`; active alerts never expire
+    """
+    after = after or (-1, '')
+    with read_connection() as conn:
+        rows = conn.execute('''
+            SELECT * FROM alerts
+            WHERE timestamp < ? AND (timestamp, id) > (?, ?)
+              AND status = 'resolved' AND COALESCE(resolved_at, timestamp) < ?
+            ORDER BY timestamp, id LIMIT ?
+        ''', (cutoff, after[0], after[1], cutoff, limit)).fetchall()
+
+    return [dict(row) for row in rows]
+
+@timed(DB_SECONDS)
+def get_expired_fault_logs(cutoff: int, after: Optional[Tuple[int, int]], limit: int) -> List[Dict]:
+    """Fault logs older than `cutoff`, oldest first, starting past the (timestamp, id) key `after`"""
+    after = after or (-1, -1)
+    with read_connection() as conn:
+        rows = conn.execute('''
+            SELECT * FROM fault_logs WHERE timestamp < ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp, id LIMIT ?
+        ''', (cutoff, after[0], after[1], limit)).fetchall()
+
+    return [dict(row) for row in rows]
+
+@timed(DB_SECONDS)
+def get_last_transition_ids(before: int) -> List[int]:
+    """Id of each device's newest connectivity transition older than `before` (see get_outage_events)"""
+    with read_connection() as conn:
+        rows = conn.execute('''
+            SELECT id, MAX(timestamp) FROM fault_logs
+            WHERE timestamp < ? AND fault_type IN ('connectivity', 'latency', 'recovery')
+            GROUP BY device_id
+        ''', (before,)).fetchall()
+
+    return [row[0] for row in rows]
+
+@timed(DB_SECONDS)
+def delete_rows(table: str, ids: List) -> int:
+    """
+    Delete rows of alerts or fault_logs by id in one short transaction; returns rows removed
+    Moves the data version, so cached pages validated by it (ETags) are not served again
+    """
+    with write_transaction() as conn:
+        deleted = conn.execute(
+            f'DELETE FROM {table} WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(ids),)
+        ).rowcount
+        if deleted:
+            _next_version(conn)
+    return deleted
+
+@timed(DB_SECONDS)
+def add_retention_run(started_at: int, finished_at: int, report: Dict, keep: int = 100):
+    """Record a retention run, keeping only the `keep` most recent"""
+    with write_transaction() as conn:
+        conn.execute('''
+            INSERT INTO retention_runs (started_at, finished_at, report) VALUES (?, ?, ?)
+        ''', (started_at, finished_at, json.dumps(report)))
+        conn.execute('''
+            DELETE FROM retention_runs WHERE id NOT IN (SELECT id FROM retention_runs ORDER BY id DESC LIMIT ?)
+        ''', (keep,))
+
+@timed(DB_SECONDS)
+def get_retention_runs(limit: int = 20) -> List[Dict]:
+    """Most recent retention runs, newest first"""
+    with read_connection() as conn:
+        rows = conn.execute('SELECT * FROM retention_runs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+
     return [dict(row) for row in rows]
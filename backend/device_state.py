@@ -0,0 +1,158 @@
+import threading
+from collections import deque
+from typing import Dict, NamedTuple, Tuple
+
+from baseline import baselines
+from probe_engine import SLOW_THRESHOLD_MS
+
+# Offline is confirmed when OFFLINE_CONFIRM of the last CONFIRM_WINDOW probes were lost
+CONFIRM_WINDOW = 5
+OFFLINE_CONFIRM = 3
+
+# An offline device is back after this many answered probes in a row
+RECOVER_CONFIRM = 2
+
+# Slow hysteresis: enter above SLOW_THRESHOLD_MS, leave only below SLOW_EXIT_MS,
+# each confirmed by SLOW_CONFIRM of the last CONFIRM_WINDOW answered probes.
+# These fixed limits apply until the device has a latency baseline (baseline.py),
+# which then supplies its own pair
+SLOW_EXIT_MS = int(SLOW_THRESHOLD_MS * 0.8)
+SLOW_CONFIRM = 3
+FIXED_LIMITS = (SLOW_THRESHOLD_MS, SLOW_EXIT_MS)
+
+# Flap detection over the last FLAP_HISTORY raw results: a device starts
+# flapping when at least FLAP_HIGH of consecutive results differ, and stops
+# once that share drops to FLAP_LOW
+FLAP_HISTORY = 20
+FLAP_HIGH = 0.4
+FLAP_LOW = 0.2
+
+# Latency is only written back when it moves at least this much (ms or fraction)
+LATENCY_WRITE_MIN_MS = 5
+LATENCY_WRITE_RATIO = 0.2
+
+
+class Verdict(NamedTuple):
+    """Outcome of feeding one probe result to a device's state machine"""
+    status: str           # confirmed status to report
+    latency: int          # latency to report (last answered probe, 0 when offline)
+    previous: str         # confirmed status before this result
+    pending: bool         # raw result disagrees with the confirmed status; more samples needed
+    persist: bool         # status or latency moved enough to write the device row
+    flapping: bool
+    flap_started: bool
+    flap_ended: bool
+    raw: str              # this result alone, judged against the device's latency limits
+
+
+def raw_status(result: Dict, slow_above: float = SLOW_THRESHOLD_MS) -> str:
+    if result['status'] == 'offline':
+        return 'offline'
+    return 'slow' if result['latency'] > slow_above else 'online'
+
+
+class DeviceStateMachine:
+    """Confirmed status of one device, built from a sliding window of probe results"""
+
+    __slots__ = ('status', 'latency', 'persisted_latency', 'outcomes', 'latencies', 'history', 'flapping')
+
+    def __init__(self, status: str, latency: int):
+        self.status = status
+        self.latency = latency
+        self.persisted_latency = latency
+        self.outcomes: deque = deque(maxlen=CONFIRM_WINDOW)      # True = lost
+        self.latencies: deque = deque(maxlen=CONFIRM_WINDOW)     # answered probes only
+        self.history: deque = deque(maxlen=FLAP_HISTORY)         # raw statuses
+        self.flapping = False
+
+    def _confirmed_latency_status(self, current: str, slow_above: float, fast_below: float) -> str:
+        slow = sum(1 for latency in self.latencies if latency > slow_above)
+        fast = sum(1 for latency in self.latencies if latency < fast_below)
+        if current != 'slow' and slow >= SLOW_CONFIRM:
+            return 'slow'
+        if current == 'slow' and fast >= SLOW_CONFIRM:
+            return 'online'
+        return current
+
+    def _recovered(self) -> bool:
+        recent = list(self.outcomes)[-RECOVER_CONFIRM:]
+        return len(recent) == RECOVER_CONFIRM and not any(recent)
+
+    def _flap_ratio(self) -> float:
+        history = self.history
+        if len(history) < FLAP_HISTORY:
+            return 0.0
+        changes = sum(1 for before, after in zip(history, list(history)[1:]) if before != after)
+        return changes / (len(history) - 1)
+
+    def observe(self, result: Dict, limits: Tuple[float, float] = FIXED_LIMITS) -> Verdict:
+        """`limits`: (slow above, back below) in ms for this device"""
+        slow_above, fast_below = limits
+        previous = self.status
+        lost = result['status'] == 'offline'
+        raw = raw_status(result, slow_above)
+        self.outcomes.append(lost)
+        self.history.append(raw)
+        if not lost:
+            self.latencies.append(result['latency'])
+            self.latency = result['latency']
+
+        if previous == 'offline':
+            if self._recovered():
+                # Judge latency only on probes since the recovery
+                recent = list(self.latencies)[-RECOVER_CONFIRM:]
+                self.latencies.clear()
+                self.latencies.extend(recent)
+                self.status = 'slow' if sum(latency > slow_above for latency in recent) == len(recent) else 'online'
+        elif sum(self.outcomes) >= OFFLINE_CONFIRM:
+            self.status = 'offline'
+        elif not lost:
+            self.status = self._confirmed_latency_status(previous, slow_above, fast_below)
+
+        if self.status != previous and (self.status == 'offline' or previous == 'offline'):
+            # Start the next confirmation from a clean window
+            self.outcomes.clear()
+            self.outcomes.append(lost)
+
+        latency = 0 if self.status == 'offline' else self.latency
+        persist = self.status != previous or abs(latency - self.persisted_latency) >= max(
+            LATENCY_WRITE_MIN_MS, self.persisted_latency * LATENCY_WRITE_RATIO
+        )
+        if persist:
+            self.persisted_latency = latency
+
+        ratio = self._flap_ratio()
+        flap_started = not self.flapping and ratio >= FLAP_HIGH
+        flap_ended = self.flapping and ratio <= FLAP_LOW
+        if flap_started or flap_ended:
+            self.flapping = flap_started
+
+        pending = lost != (self.status == 'offline')
+        return Verdict(self.status, latency, previous, pending, persist, self.flapping, flap_started, flap_ended, raw)
+
+
+class DeviceStates:
+    """
+    State machines for every probed device, created from the registry's last known status
+    Each result is judged against the device's learned latency baseline once it has one
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._machines: Dict[str, DeviceStateMachine] = {}
+
+    def observe(self, device: Dict, result: Dict) -> Verdict:
+        limits = baselines.limits(device['id']) or FIXED_LIMITS
+        with self._lock:
+            machine = self._machines.get(device['id'])
+            if machine is None:
+                machine = self._machines[device['id']] = DeviceStateMachine(device['status'], device['latency'])
+            return machine.observe(result, limits)
+
+    def forget(self, device_id: str):
+        with self._lock:
+            self._machines.pop(device_id, None)
+
+
+# Process-wide state shared by the probe scheduler and full sweeps
+device_states = DeviceStates()
@@ -0,0 +1,262 @@
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from database import claim_discovery_job, fail_interrupted_discovery_jobs, update_discovery_job, upsert_devices
+from log import get_logger
+from probe_engine import MAX_IN_FLIGHT_PROBES, OFFLINE, Probe, probe_all_async
+from probers import ProberSet
+from push import hub
+from registry import registry
+
+# Largest range one job may sweep (a /16)
+MAX_ADDRESSES = 65536
+
+# Probe start rate (probes per second): default and upper bound
+DEFAULT_RATE = int(os.environ.get('NETGUARD_DISCOVERY_RATE', '1000'))
+MAX_RATE = 10000
+
+# Upper bound on a job's concurrent probes (the default is the monitor's limit)
+MAX_IN_FLIGHT = 4096
+
+# Responsive hosts are registered in batches of this size (one transaction each)
+BATCH_SIZE = 200
+
+# How often a running job writes its progress and checks for cancellation (seconds)
+PROGRESS_INTERVAL = 1.0
+
+# Time allowed for the reverse DNS lookup that names a found host (seconds)
+NAME_TIMEOUT = 1.0
+
+# Tag added to every device a discovery job registers
+DISCOVERED_TAG = 'discovered'
+
+log = get_logger('discovery')
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_range(cidr) -> Network:
+    """Network to sweep; raises ValueError when malformed or larger than MAX_ADDRESSES"""
+    if not isinstance(cidr, str) or not cidr:
+        raise ValueError('cidr is required')
+    try:
+        network = ipaddress.ip_network(cidr, strict=False)
+    except ValueError:
+        raise ValueError(f'Invalid cidr: {cidr}')
+    if network.num_addresses > MAX_ADDRESSES:
+        raise ValueError(f'cidr covers {network.num_addresses} addresses; at most {MAX_ADDRESSES} per job')
+    return network
+
+
+def host_count(network: Network) -> int:
+    return sum(1 for _ in network.hosts())
+
+
+def discovered_id(ip: str) -> str:
+    """Device id for a discovered host, stable so re-running a job cannot duplicate it"""
+    return f'discovered-{ip}'
+
+
+def default_options(data: Dict) -> Dict:
+    """Job options from a request body, with defaults filled in (validated by the route)"""
+    return {
+        'probeType': data.get('probeType') or 'icmp',
+        'probePort': data.get('probePort'),
+        'probeTarget': data.get('probeTarget'),
+        'rate': data.get('rate') or DEFAULT_RATE,
+        'maxInFlight': data.get('maxInFlight') or MAX_IN_FLIGHT_PROBES,
+        'deviceType': data.get('deviceType') or 'server',
+        'tags': data.get('tags') or [],
+        'isMonitored': data.get('isMonitored', True),
+        'resolveNames': data.get('resolveNames', True),
+    }
+
+
+class RateLimiter:
+    """Spaces acquire() calls at most `rate` per second, first come first served"""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate
+        self._next = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._next)
+        self._next = start + self._interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class Sweep:
+    """
+    One discovery job in progress
+    Addresses go through probe_all_async and the job's ProberSet exactly as a
+    monitor sweep would, behind a rate limiter; responsive hosts are buffered
+    and registered BATCH_SIZE at a time
+    """
+
+    def __init__(self, job: Dict, probe: Optional[Probe] = None):
+        self.job_id = job['id']
+        self.network = ipaddress.ip_network(job['cidr'])
+        self.options = json.loads(job['options'])
+        self._probe = probe
+        self._found: List[Dict] = []
+        self.probed = self.found = self.added = self.skipped = 0
+        self.cancelled = False
+
+    def counters(self) -> Tuple[int, int, int, int]:
+        return self.probed, self.found, self.added, self.skipped
+
+    def _candidates(self, known: Set[str]) -> List[Dict]:
+        candidates = []
+        for address in self.network.hosts():
+            ip = str(address)
+            if ip in known:
+                # Already a device: nothing to discover
+                self.skipped += 1
+                continue
+            candidates.append({
+                'id': discovered_id(ip),
+                'ip': ip,
+                'probeType': self.options['probeType'],
+                'probePort': self.options.get('probePort'),
+                'probeTarget': self.options.get('probeTarget'),
+            })
+        return candidates
+
+    async def _name(self, ip: str) -> str:
+        if not self.options.get('resolveNames', True):
+            return ip
+        loop = asyncio.get_running_loop()
+        try:
+            host, _ = await asyncio.wait_for(loop.getnameinfo((ip, 0), socket.NI_NAMEREQD), NAME_TIMEOUT)
+            return host
+        except (asyncio.TimeoutError, OSError):
+            return ip
+
+    async def _on_found(self, candidate: Dict, result: Dict):
+        self._found.append({
+            **candidate,
+            'name': await self._name(candidate['ip']),
+            'type': self.options['deviceType'],
+            'status': result['status'],
+            'latency': result['latency'],
+            'lastChecked': int(time.time() * 1000),
+            'isMonitored': self.options['isMonitored'],
+            'tags': list(dict.fromkeys(self.options['tags'] + [DISCOVERED_TAG])),
+        })
+        if len(self._found) >= BATCH_SIZE:
+            await self._flush()
+
+    async def _flush(self):
+        batch, self._found = self._found, []
+        if not batch:
+            return
+        saved = await asyncio.get_running_loop().run_in_executor(None, upsert_devices, batch)
+        if saved is None:
+            raise RuntimeError('Failed to register discovered devices')
+        registry.upsert_many(device for device, _ in saved)
+        hub.publish_changes()
+        self.added += sum(1 for _, created in saved if created)
+
+    async def _report(self):
+        """Write progress every PROGRESS_INTERVAL and pick up cancellation requests"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            try:
+                if await loop.run_in_executor(None, update_discovery_job, self.job_id, *self.counters()):
+                    self.cancelled = True
+            except Exception as e:
+                log.error('Failed to record discovery progress', extra={'job': self.job_id, 'error': str(e)})
+
+    async def run(self) -> str:
+        """Sweep every address; returns the final status ('completed' or 'cancelled')"""
+        candidates = self._candidates(registry.known_ips())
+        limiter = RateLimiter(self.options['rate'])
+        probers = ProberSet(icmp=self._probe)
+
+        async def probe(candidate: Dict) -> Dict:
+            if not self.cancelled:
+                await limiter.acquire()
+            if self.cancelled:
+                # Remaining addresses drain without being probed
+                return dict(OFFLINE)
+            result = await probers.probe(candidate)
+            self.probed += 1
+            if result['status'] != 'offline':
+                self.found += 1
+                await self._on_found(candidate, result)
+            return result
+
+        reporter = asyncio.ensure_future(self._report())
+        try:
+            await probe_all_async(candidates, probe, self.options['maxInFlight'])
+            await self._flush()
+        finally:
+            reporter.cancel()
+            await asyncio.gather(reporter, return_exceptions=True)
+            probers.close()
+        return 'cancelled' if self.cancelled else 'completed'
+
+
+class DiscoveryRunner:
+    """
+    Runs queued discovery jobs one at a time in the process that probes (the
+    API in local / cluster mode, or the probe service). poll() is called by a
+    scheduler job; each claimed job gets its own thread and event loop
+    """
+
+    def __init__(self, probe: Optional[Probe] = None):
+        self._probe = probe
+        self._thread: Optional[threading.Thread] = None
+        self._recovered = False
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def poll(self):
+        """Start the oldest queued job unless one is already running"""
+        if not self._recovered:
+            self._recovered = True
+            interrupted = fail_interrupted_discovery_jobs()
+            if interrupted:
+                log.warning('Marked interrupted jobs failed', extra={'jobs': interrupted})
+        if self.busy:
+            return
+
+        job = claim_discovery_job()
+        if job is None:
+            return
+        self._thread = threading.Thread(target=self.run, args=(job,), name=f"discovery-{job['id']}", daemon=True)
+        self._thread.start()
+
+    def run(self, job: Dict):
+        """Sweep one claimed job to completion (blocking)"""
+        log.info('Sweep started', extra={'job': job['id'], 'cidr': job['cidr'], 'addresses': job['total']})
+        started = time.monotonic()
+        sweep = Sweep(job, self._probe)
+        status, error = 'failed', None
+        try:
+            registry.sync()
+            status = asyncio.run(sweep.run())
+        except Exception as e:
+            error = str(e)
+            log.error('Sweep failed', extra={'job': job['id'], 'error': str(e)})
+        update_discovery_job(job['id'], *sweep.counters(), status=status, error=error)
+        log.info('Sweep finished', extra={
+            'job': job['id'], 'status': status, 'probed': sweep.probed, 'found': sweep.found,
+            'added': sweep.added, 'seconds': round(time.monotonic() - started, 1),
+        })
+
+
+# Process-wide runner, polled by the maintenance jobs
+runner = DiscoveryRunner()
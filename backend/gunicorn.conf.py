@@ -0,0 +1,18 @@
+# Production API server: several worker processes, none of them probing
+# Run the probe service next to it: python probe_service.py
+import multiprocessing
+import os
+
+bind = os.environ.get('NETGUARD_BIND', '0.0.0.0:5000')
+
+# Each worker loads the app (and its device registry) separately
+workers = int(os.environ.get('NETGUARD_API_WORKERS', str(min(2 * multiprocessing.cpu_count() + 1, 8))))
+worker_class = 'gthread'
+threads = int(os.environ.get('NETGUARD_API_THREADS', '4'))
+
+# Probing runs in the probe service; the API processes follow the database
+# (set here so every forked worker inherits it)
+os.environ['NETGUARD_PROBE_MODE'] = 'external'
+
+accesslog = None
+errorlog = '-'
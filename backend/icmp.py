@@ -0,0 +1,177 @@
+import asyncio
+import ipaddress
+import os
+import socket
+import struct
+import time
+from typing import Dict, Optional, Tuple
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+# Payload sent with every echo request (same size as the default ping payload)
+PAYLOAD = b'NetGuard' * 7
+
+# Replies to a whole sweep can arrive in a burst, so ask for a large receive buffer
+RECEIVE_BUFFER = 4 * 1024 * 1024
+
+
+def checksum(data: bytes) -> int:
+    """RFC 1071 internet checksum"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def build_echo_request(ident: int, seq: int, payload: bytes = PAYLOAD) -> bytes:
+    """Build an ICMP echo request packet"""
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+def parse_echo_reply(packet: bytes, raw: bool) -> Optional[Tuple[int, int]]:
+    """
+    Extract (identifier, sequence) from an echo reply
+    Raw sockets deliver the IP header too, datagram sockets do not
+    """
+    if raw:
+        if len(packet) < 20:
+            return None
+        packet = packet[(packet[0] & 0x0F) * 4:]
+
+    if len(packet) < 8:
+        return None
+
+    icmp_type, _, _, ident, seq = struct.unpack('!BBHHH', packet[:8])
+    if icmp_type != ICMP_ECHO_REPLY:
+        return None
+    return ident, seq
+
+
+def open_icmp_socket() -> Optional[Tuple[socket.socket, bool]]:
+    """
+    Open an ICMP socket, preferring unprivileged datagram sockets
+    Returns (socket, is_raw) or None when neither kind is permitted
+    """
+    for kind, raw in ((socket.SOCK_DGRAM, False), (socket.SOCK_RAW, True)):
+        try:
+            sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+        except (PermissionError, OSError):
+            continue
+        sock.setblocking(False)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        except OSError:
+            pass
+        return sock, raw
+    return None
+
+
+def is_ipv4(address: str) -> bool:
+    try:
+        ipaddress.IPv4Address(address)
+        return True
+    except ValueError:
+        return False
+
+
+class IcmpProber:
+    """
+    Sends echo requests to many hosts over a single ICMP socket
+    Replies are matched to waiting probes by (source, identifier, sequence)
+    """
+
+    def __init__(self, sock: socket.socket, raw: bool):
+        self.sock = sock
+        self.raw = raw
+        # Datagram sockets get their identifier rewritten by the kernel,
+        # which also filters replies per socket, so only raw sockets check it
+        self.ident = os.getpid() & 0xFFFF
+        self._seq = 0
+        self._pending: Dict[Tuple[str, int], Tuple[float, asyncio.Future]] = {}
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(sock.fileno(), self._on_readable)
+
+    @classmethod
+    def open(cls) -> Optional['IcmpProber']:
+        """Create a prober bound to the running event loop, or None if ICMP sockets are unavailable"""
+        opened = open_icmp_socket()
+        if opened is None:
+            return None
+        try:
+            return cls(*opened)
+        except NotImplementedError:
+            # The loop cannot watch sockets (the default Proactor loop on Windows)
+            opened[0].close()
+            return None
+
+    def close(self):
+        self._loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        for _, future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+    def _next_seq(self, ip: str) -> int:
+        for _ in range(0x10000):
+            self._seq = (self._seq + 1) & 0xFFFF
+            if (ip, self._seq) not in self._pending:
+                return self._seq
+        raise RuntimeError('No free ICMP sequence numbers')
+
+    def _on_readable(self):
+        while True:
+            try:
+                packet, address = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+
+            received = time.perf_counter()
+            parsed = parse_echo_reply(packet, self.raw)
+            if parsed is None:
+                continue
+
+            ident, seq = parsed
+            if self.raw and ident != self.ident:
+                continue
+
+            waiter = self._pending.pop((address[0], seq), None)
+            if waiter is None:
+                continue
+
+            sent, future = waiter
+            if not future.done():
+                future.set_result((received - sent) * 1000)
+
+    async def _send(self, packet: bytes, ip: str):
+        while True:
+            try:
+                self.sock.sendto(packet, (ip, 0))
+                return
+            except (BlockingIOError, InterruptedError):
+                # Socket buffer is full, give the kernel a moment to drain it
+                await asyncio.sleep(0.001)
+
+    async def echo(self, ip: str, timeout: float) -> Optional[float]:
+        """Send one echo request and return the round-trip time in ms, or None on timeout"""
+        seq = self._next_seq(ip)
+        future = self._loop.create_future()
+        packet = build_echo_request(self.ident, seq)
+
+        self._pending[(ip, seq)] = (time.perf_counter(), future)
+        try:
+            await self._send(packet, ip)
+            # The send time is taken after the packet actually left
+            self._pending[(ip, seq)] = (time.perf_counter(), future)
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self._pending.pop((ip, seq), None)
@@ -0,0 +1,174 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+from apscheduler.events import (
+    EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED, JobExecutionEvent, JobSubmissionEvent,
+)
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from baseline import BASELINE_SAVE_INTERVAL, load_baselines, save_baselines
+from discovery import runner as discovery_runner
+from log import get_logger
+from metrics import JOB_LAG_SECONDS, JOB_RUNS, JOB_SECONDS
+from push import hub
+from registry import registry
+from retention import run as run_retention
+from sla import refresh_device_uptime, tracker as sla_tracker
+from timeseries import store as timeseries
+
+# How often an API process that does not probe pulls device changes and pushes them (seconds)
+FOLLOW_INTERVAL = 1
+
+# How often the probing process looks for queued discovery jobs (seconds)
+DISCOVERY_POLL_INTERVAL = 2
+
+# How often expired alerts and fault logs are removed (minutes)
+RETENTION_INTERVAL = 60
+
+log = get_logger('jobs')
+
+
+class JobWatcher:
+    """Scheduler listener recording each job's start lag, run time and outcome"""
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def attach(self, scheduler: BackgroundScheduler):
+        if not getattr(scheduler, '_job_watcher', None):
+            scheduler._job_watcher = self
+            scheduler.add_listener(self._submitted, EVENT_JOB_SUBMITTED)
+            scheduler.add_listener(self._finished, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED)
+
+    def _submitted(self, event: JobSubmissionEvent):
+        scheduled = max(event.scheduled_run_times)
+        JOB_LAG_SECONDS.labels(event.job_id).observe(
+            max(0.0, (datetime.now(timezone.utc) - scheduled).total_seconds()))
+        with self._lock:
+            self._started[event.job_id] = time.perf_counter()
+
+    def _finished(self, event: JobExecutionEvent):
+        if event.code == EVENT_JOB_MISSED:
+            JOB_RUNS.labels(event.job_id, 'missed').inc()
+            log.warning('Job run missed', extra={'job': event.job_id, 'scheduled': str(event.scheduled_run_time)})
+            return
+        with self._lock:
+            started = self._started.pop(event.job_id, None)
+        if started is not None:
+            JOB_SECONDS.labels(event.job_id).observe(time.perf_counter() - started)
+        if event.exception is not None:
+            JOB_RUNS.labels(event.job_id, 'error').inc()
+            log.error('Job failed', extra={'job': event.job_id, 'error': str(event.exception)})
+        else:
+            JOB_RUNS.labels(event.job_id, 'ok').inc()
+
+
+watcher = JobWatcher()
+
+
+def add_maintenance_jobs(scheduler: BackgroundScheduler):
+    """Jobs for the process that probes (the API in local / cluster mode, or the probe service)"""
+    watcher.attach(scheduler)
+
+    # Time-series maintenance: close finished rollup buckets, then enforce retention
+    scheduler.add_job(
+        func=timeseries.flush,
+        trigger="interval",
+        minutes=1,
+        id='timeseries_flush',
+        name='Time-series Rollup Flush',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=timeseries.prune,
+        trigger="interval",
+        minutes=10,
+        id='timeseries_prune',
+        name='Time-series Retention',
+        replace_existing=True
+    )
+
+    # Alert / fault log expiry, archiving and incremental vacuum
+    scheduler.add_job(
+        func=run_retention,
+        trigger="interval",
+        minutes=RETENTION_INTERVAL,
+        id='retention',
+        name='Alert and Fault Log Retention',
+        replace_existing=True
+    )
+
+    # Subnet discovery jobs queued through the API
+    scheduler.add_job(
+        func=discovery_runner.poll,
+        trigger="interval",
+        seconds=DISCOVERY_POLL_INTERVAL,
+        id='discovery_poll',
+        name='Discovery Job Poll',
+        replace_existing=True
+    )
+
+    # Rolling uptime shown on the dashboard
+    scheduler.add_job(
+        func=refresh_device_uptime,
+        trigger="interval",
+        minutes=1,
+        id='uptime_refresh',
+        name='Device Uptime Refresh',
+        replace_existing=True
+    )
+
+    # Learned latency baselines, so a restart does not start them over
+    scheduler.add_job(
+        func=save_baselines,
+        trigger="interval",
+        minutes=BASELINE_SAVE_INTERVAL,
+        id='baseline_save',
+        name='Latency Baseline Save',
+        replace_existing=True
+    )
+
+
+def follow_database():
+    """Fold in results written by the probe service and push them to this process's stream clients"""
+    try:
+        registry.sync()
+        hub.publish_changes()
+    except Exception as e:
+        log.error('Database follow failed', extra={'error': str(e)})
+
+
+def add_follower_jobs(scheduler: BackgroundScheduler):
+    """Jobs for API processes in external mode, which only read what the probe service writes"""
+    watcher.attach(scheduler)
+
+    scheduler.add_job(
+        func=follow_database,
+        trigger="interval",
+        seconds=FOLLOW_INTERVAL,
+        id='database_follow',
+        name='Device Changes Follow',
+        replace_existing=True
+    )
+
+    # SLA counters are rebuilt from the probe service's finished minute rollups
+    scheduler.add_job(
+        func=lambda: sla_tracker.follow(timeseries),
+        trigger="interval",
+        minutes=1,
+        id='sla_follow',
+        name='SLA Rollup Follow',
+        replace_existing=True
+    )
+
+    # Latency baselines as last saved by the probe service
+    scheduler.add_job(
+        func=load_baselines,
+        trigger="interval",
+        minutes=BASELINE_SAVE_INTERVAL,
+        id='baseline_follow',
+        name='Latency Baseline Follow',
+        replace_existing=True
+    )
@@ -0,0 +1,72 @@
+import json
+import logging
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+# 'text' for people, 'json' (one object per line) for log shippers
+LOG_FORMAT = os.environ.get('NETGUARD_LOG_FORMAT', 'text')
+LOG_LEVEL = os.environ.get('NETGUARD_LOG_LEVEL', 'INFO').upper()
+
+# Attributes every LogRecord has; anything else came in through `extra` and is a field
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_configured = False
+_lock = threading.Lock()
+
+
+def _fields(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """`2026-01-01 12:00:00 WARNING monitor: Device offline device=Router ip=10.0.0.1`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = ' '.join(f'{key}={value}' for key, value in _fields(record).items())
+        line = (f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.levelname} "
+                f"{record.name.rpartition('.')[2]}: {record.getMessage()}")
+        if fields:
+            line += ' ' + fields
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg, then the record's fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name.rpartition('.')[2],
+            'msg': record.getMessage(),
+            **_fields(record),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure():
+    """Send the netguard loggers to stdout in LOG_FORMAT (once per process)"""
+    global _configured
+
+    with _lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter())
+        root = logging.getLogger('netguard')
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+        _configured = True
+
+
+def get_logger(component: str) -> logging.Logger:
+    """Logger for one backend module; pass structured fields with extra={...}"""
+    configure()
+    return logging.getLogger(f'netguard.{component}')
@@ -0,0 +1,272 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Port a process without the Flask app (probe service, worker) serves /metrics on; 0 disables it
+METRICS_PORT = int(os.environ.get('NETGUARD_METRICS_PORT', '0'))
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Value:
+    """One counter or gauge series"""
+
+    __slots__ = ('_lock', 'value')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _Buckets:
+    """One histogram series: per-bucket counts (not cumulative), sum and count"""
+
+    __slots__ = ('_lock', '_bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self._bounds = bounds
+        # The last slot counts observations above the largest bound (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        with self._lock:
+            return list(self.counts), self.sum
+
+
+class Metric:
+    """
+    A named metric family; with label names, labels(...) returns one series per
+    label combination (created on first use and kept for the process lifetime)
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self.labels()
+        REGISTRY.register(self)
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        series = self._series.get(key)
+        if series is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}')
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, series in sorted(self._series.items()):
+            lines.extend(self._render_series(key, series))
+        return lines
+
+    def _render_series(self, key: Tuple[str, ...], series) -> List[str]:
+        return [f'{self.name}{_label_text(self.labelnames, key)} {_format_value(series.value)}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def _new_series(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def _new_series(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._default.dec(amount)
+
+    def set(self, value: float):
+        self._default.set(value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_series(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_series(self, key: Tuple[str, ...], series) -> List[str]:
+        counts, total = series.snapshot()
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}')
+        labels = _label_text(self.labelnames, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    """Every metric defined in this process"""
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def render() -> str:
+    """Current values of every metric in the Prometheus text format"""
+    return REGISTRY.render()
+
+
+def timed(histogram: Histogram) -> Callable:
+    """Decorator observing each call's duration in `histogram`, labelled with the function's name"""
+    def decorate(func: Callable) -> Callable:
+        observe = histogram.labels(func.__name__).observe
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = METRICS_PORT, host: str = '0.0.0.0') -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread (for processes without the Flask app); port 0 does nothing"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    return server
+
+
+# Buckets (seconds) for network round trips and for short database operations
+RTT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.15, 0.25, 0.5, 1, 2)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Probing (probers.ProberSet covers the scheduler, sweeps, workers and discovery)
+PROBES_IN_FLIGHT = Gauge('netguard_probes_in_flight', 'Probes started and not yet finished')
+PROBE_SECONDS = Histogram('netguard_probe_duration_seconds', 'Wall time of one probe, timeouts included',
+                          ['probe_type'], RTT_BUCKETS + (3, 5))
+PROBE_RTT_SECONDS = Histogram('netguard_probe_rtt_seconds', 'Round-trip time reported by answered probes',
+                              ['probe_type'], RTT_BUCKETS)
+PROBE_RESULTS = Counter('netguard_probe_results_total', 'Probe results by outcome', ['probe_type', 'status'])
+
+# Adaptive scheduler (probe_scheduler.py)
+PROBE_LAG_SECONDS = Histogram('netguard_probe_dispatch_lag_seconds', 'How late due probes were dispatched',
+                              buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+PROBE_OVERRUNS = Counter('netguard_probe_overruns_total',
+                         'Probes dispatched more than one probe interval after they were due')
+
+# Full sweeps (monitor.monitor_all_devices)
+SWEEP_SECONDS = Histogram('netguard_sweep_duration_seconds', 'Duration of a full monitor sweep',
+                          buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120))
+SWEEP_OVERRUNS = Counter('netguard_sweep_overruns_total', 'Sweeps that took longer than the probe interval')
+
+# Database (database.py, one series per operation)
+DB_SECONDS = Histogram('netguard_db_operation_seconds', 'Time spent in a database operation, lock waits included',
+                       ['operation'], DB_BUCKETS)
+
+# API (routes.py)
+REQUEST_SECONDS = Histogram('netguard_http_request_duration_seconds',
+                            'API request latency until the response is handed to the server',
+                            ['method', 'route', 'status'])
+
+# Background jobs (jobs.py)
+JOB_LAG_SECONDS = Histogram('netguard_job_lag_seconds', 'Delay between a job\'s scheduled and actual start',
+                            ['job'], (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60))
+JOB_SECONDS = Histogram('netguard_job_duration_seconds', 'Background job run time', ['job'],
+                        (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300))
+JOB_RUNS = Counter('netguard_job_runs_total', 'Background job runs by outcome', ['job', 'outcome'])
@@ -1,14 +1,32 @@
+import os
 import subprocess
-import platform
-import re
 import time
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 import uuid
 
-from database import (
-    get_all_devices, update_device_status, add_alert, add_fault_log
-)
+from baseline import baselines
+from database import save_sweep_results
+from device_state import Verdict, device_states
+from log import get_logger
+from metrics import SWEEP_OVERRUNS, SWEEP_SECONDS
+from push import hub
+from registry import registry
+from sla import tracker as sla_tracker
+from timeseries import store as timeseries
+from probe_engine import BURST_STATS, PING_COMMAND, PING_TIMEOUT, Probe, parse_ping_output
+from probers import PROBE_DETAILS, probe_all
+
+# Result fields kept on the device as probeStats
+PROBE_STATS = BURST_STATS + PROBE_DETAILS
+
+# A full sweep that takes longer than this (seconds) counts as an overrun
+SWEEP_INTERVAL = float(os.environ.get('NETGUARD_PROBE_INTERVAL', '5'))
+
+# Devices behind an offline parent are probed at most this often (seconds) until it recovers
+UNREACHABLE_PROBE_INTERVAL = float(os.environ.get('NETGUARD_UNREACHABLE_PROBE_INTERVAL', '30'))
+
+log = get_logger('monitor')
 
 def generate_id() -> str:
     """Generate a random ID"""
@@ -25,43 +43,18 @@ def ping_device(ip: str) -> Dict[str, any]:
             'latency': int (ms)
         }
     """
-    # Determine ping command based on OS
-    param = '-n' if platform.system().lower() == 'windows' else '-c'
-    
     try:
         # Execute ping command (1 packet, 2 second timeout)
-        command = ['ping', param, '1', '-w', '2000', ip] if platform.system().lower() == 'windows' else ['ping', param, '1', '-W', '2', ip]
-        
         result = subprocess.run(
-            command,
+            PING_COMMAND + [ip],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            timeout=3,
+            timeout=PING_TIMEOUT,
             text=True
         )
         
         if result.returncode == 0:
-            # Parse latency from ping output
-            output = result.stdout
-            
-            # Windows: "Average = Xms" or "time=Xms"
-            # Linux: "time=X.X ms"
-            if platform.system().lower() == 'windows':
-                match = re.search(r'Average = (\d+)ms', output) or re.search(r'time[=<](\d+)ms', output)
-            else:
-                match = re.search(r'time=([\d.]+)\s*ms', output)
-            
-            if match:
-                latency = int(float(match.group(1)))
-                
-                # Determine status based on latency
-                if latency > 150:
-                    return {'status': 'slow', 'latency': latency}
-                else:
-                    return {'status': 'online', 'latency': latency}
-            else:
-                # Ping successful but couldn't parse latency
-                return {'status': 'online', 'latency': 1}
+            return parse_ping_output(result.stdout)
         else:
             # Ping failed
             return {'status': 'offline', 'latency': 0}
@@ -69,87 +62,220 @@ def ping_device(ip: str) -> Dict[str, any]:
     except subprocess.TimeoutExpired:
         return {'status': 'offline', 'latency': 0}
     except Exception as e:
-        print(f"Error pinging {ip}: {e}")
+        log.error('Ping failed', extra={'ip': ip, 'error': str(e)})
         return {'status': 'offline', 'latency': 0}
 
-def monitor_all_devices():
+class SweepBatch:
     """
-    Monitor all devices that have monitoring enabled
-    This function is called periodically by the scheduler
+    Collects the writes produced by one sweep so they can be committed together
     """
-    try:
-        devices = get_all_devices()
+    
+    def __init__(self):
+        self.status_updates: List[Tuple[str, str, int]] = []
+        self.persisted: List[Tuple[str, str, int]] = []
+        self.samples: List[Tuple[str, str, int]] = []
+        self.alerts: List[Dict] = []
+        self.fault_logs: List[Tuple[str, str, str, str, str]] = []
+        self.resolutions: List[Tuple[str, Tuple[str, ...]]] = []
+        self.folds: List[Tuple[str, List[str]]] = []
+        self.probe_stats: List[Tuple[str, Dict]] = []
+    
+    def update_device_status(self, device_id: str, status: str, latency: int, persist: bool = True):
+        """Report a device's status; rows with persist=False only update the in-memory registry"""
+        self.status_updates.append((device_id, status, latency))
+        if persist:
+            self.persisted.append((device_id, status, latency))
+    
+    def add_sample(self, device_id: str, status: str, latency: int):
+        """Raw probe outcome for the latency history and SLA counters"""
+        self.samples.append((device_id, status, latency))
+    
+    def add_probe_stats(self, device_id: str, stats: Dict):
+        """Burst loss / jitter / percentiles and HTTP or DNS response codes (kept in memory only)"""
+        self.probe_stats.append((device_id, stats))
+    
+    def add_alert(self, alert: Dict):
+        self.alerts.append(alert)
+    
+    def add_fault_log(self, device_id: str, device_name: str, device_ip: str, fault_type: str, description: str):
+        self.fault_logs.append((device_id, device_name, device_ip, fault_type, description))
+    
+    def resolve_alerts(self, device_id: str, alert_types: Tuple[str, ...]):
+        """Mark the device's active alerts of these types resolved"""
+        self.resolutions.append((device_id, alert_types))
+    
+    def fold_alerts(self, root_id: str, device_ids: List[str]):
+        """Link these devices' active connectivity alerts to the root cause device's alert"""
+        self.folds.append((root_id, device_ids))
+    
+    def _record_samples(self, timestamp: int):
+        """
+        Append this sweep's results to the latency history, SLA counters and latency
+        baselines (a failure here never loses the sweep)
+        """
+        samples = self.samples or self.status_updates
+        try:
+            baselines.record(samples)
+            sla_tracker.record(timestamp, ((device_id, status) for device_id, status, _ in samples))
+            timeseries.append(
+                (device_id, timestamp, status, latency) for device_id, status, latency in samples
+            )
+        except Exception as e:
+            log.error('Failed to record latency samples', extra={'error': str(e)})
+    
+    def commit(self):
+        """Write everything collected so far in one transaction, then update the registry"""
+        if self.status_updates or self.alerts or self.fault_logs or self.resolutions:
+            timestamp = int(datetime.now().timestamp() * 1000)
+            version = None
+            if self.persisted or self.alerts or self.fault_logs or self.resolutions:
+                version = save_sweep_results(self.persisted, self.alerts, self.fault_logs, timestamp,
+                                             self.resolutions, self.folds)
+            registry.apply_status(self.status_updates, timestamp, version)
+            if self.probe_stats:
+                registry.apply_probe_stats(self.probe_stats)
+            self._record_samples(timestamp)
+        self.__init__()
+
+def make_alert(device: Dict, alert_type: str, message: str) -> Dict:
+    """New active alert for a device"""
+    return {
+        'id': generate_id(),
+        'deviceId': device['id'],
+        'deviceName': device['name'],
+        'deviceIp': device['ip'],
+        'type': alert_type,
+        'message': message,
+        'timestamp': int(datetime.now().timestamp() * 1000),
+        'status': 'active'
+    }
+
+def handle_probe_result(device: Dict, result: Dict, verdict: Verdict, batch: SweepBatch,
+                        transitions: Optional[Dict[str, str]] = None):
+    """
+    Record one probe result and act on confirmed status transitions
+    The verdict comes from the device's state machine, so a single lost or slow
+    probe does not flip the device; writes are queued on the batch
+    Connectivity alerts of devices that go offline behind an offline parent are
+    linked to the root cause's alert, so the outage reads as one incident.
+    `transitions` holds the statuses confirmed in the same batch (parents included)
+    """
+    device_id = device['id']
+    device_name = device['name']
+    device_ip = device['ip']
+    previous_status = verdict.previous
+    new_status = verdict.status
+    new_latency = verdict.latency
+    
+    batch.add_sample(device_id, verdict.raw, result['latency'])
+    stats = {key: result[key] for key in PROBE_STATS if key in result}
+    if stats:
+        batch.add_probe_stats(device_id, stats)
+    batch.update_device_status(device_id, new_status, new_latency, persist=verdict.persist)
+    
+    if verdict.flap_started:
+        batch.add_alert(make_alert(device, 'flapping', 'Device is flapping: status alerts suppressed until it stabilizes'))
+        batch.add_fault_log(device_id, device_name, device_ip, 'flapping', 'Device started flapping')
+        log.warning('Device flapping', extra={'device_id': device_id, 'device': device_name, 'ip': device_ip})
+    
+    # Fault logs are always written (they are the outage record); alerts are not raised while flapping
+    if new_status != previous_status:
+        if new_status == 'offline':
+            root = registry.root_cause(device_id, transitions)
+            if root is not None:
+                # Part of the upstream outage: its alert hangs off the root cause's
+                if not verdict.flapping:
+                    batch.add_alert(make_alert(device, 'connectivity',
+                                               f"Connection lost: unreachable behind {root['name']}"))
+                batch.fold_alerts(root['id'], [device_id])
+                batch.add_fault_log(device_id, device_name, device_ip, 'connectivity',
+                                    f"Device went offline (unreachable behind {root['name']})")
+                log.info('Device unreachable', extra={'device_id': device_id, 'device': device_name, 'ip': device_ip,
+                                                      'root_cause': root['name']})
+            else:
+                downstream = registry.descendants(device_id)
+                if not verdict.flapping:
+                    batch.add_alert(make_alert(device, 'connectivity', 'Connection lost: Device is unreachable'))
+                    log.warning('Device offline', extra={'device_id': device_id, 'device': device_name,
+                                                         'ip': device_ip, 'downstream': len(downstream)})
+                if downstream:
+                    # Devices behind it that were confirmed offline first join its incident
+                    batch.fold_alerts(device_id, downstream)
+                batch.add_fault_log(device_id, device_name, device_ip, 'connectivity', 'Device went offline')
         
-        # Debug: print first device structure
-        if devices and len(devices) > 0:
-            print(f"[DEBUG] First device keys: {devices[0].keys()}")
+        elif new_status == 'slow':
+            if not verdict.flapping:
+                batch.add_alert(make_alert(device, 'latency', f'High latency detected: {new_latency}ms'))
+                log.warning('Device slow', extra={'device_id': device_id, 'device': device_name, 'ip': device_ip,
+                                                  'latency_ms': new_latency})
+            batch.add_fault_log(device_id, device_name, device_ip, 'latency', f'High latency: {new_latency}ms')
         
-        for device in devices:
-            # Skip if monitoring is disabled (database returns is_monitored as int)
-            if not device.get('is_monitored', 0):
-                continue
-            
-            device_id = device['id']
-            device_name = device['name']
-            device_ip = device['ip']
-            previous_status = device['status']
-            
-            # Ping the device
-            result = ping_device(device_ip)
-            new_status = result['status']
-            new_latency = result['latency']
-            
-            # Update device status in database
-            update_device_status(device_id, new_status, new_latency)
-            
-            # Generate alerts if status changed
-            if new_status != previous_status:
-                alert_id = generate_id()
-                timestamp = int(datetime.now().timestamp() * 1000)
-                
-                if new_status == 'offline':
-                    # Device went offline
-                    alert = {
-                        'id': alert_id,
-                        'deviceId': device_id,
-                        'deviceName': device_name,
-                        'deviceIp': device_ip,
-                        'type': 'connectivity',
-                        'message': 'Connection lost: Device is unreachable',
-                        'timestamp': timestamp,
-                        'status': 'active'
-                    }
-                    add_alert(alert)
-                    add_fault_log(device_id, device_name, device_ip, 'connectivity', 'Device went offline')
-                    
-                    print(f"[ALERT] {device_name} ({device_ip}) is OFFLINE")
-                    
-                elif new_status == 'slow' and previous_status != 'slow':
-                    # High latency detected
-                    alert = {
-                        'id': alert_id,
-                        'deviceId': device_id,
-                        'deviceName': device_name,
-                        'deviceIp': device_ip,
-                        'type': 'latency',
-                        'message': f'High latency detected: {new_latency}ms',
-                        'timestamp': timestamp,
-                        'status': 'active'
-                    }
-                    add_alert(alert)
-                    add_fault_log(device_id, device_name, device_ip, 'latency', f'High latency: {new_latency}ms')
-                    
-                    print(f"[ALERT] {device_name} ({device_ip}) has HIGH LATENCY: {new_latency}ms")
-                    
-                elif new_status == 'online' and previous_status == 'offline':
-                    # Device recovered
-                    print(f"[RECOVERY] {device_name} ({device_ip}) is back ONLINE")
-            
-            # Small delay between pings to avoid network flooding
-            time.sleep(0.1)
+        elif new_status == 'online':
+            batch.resolve_alerts(device_id, ('latency',))
         
-        print(f"[MONITOR] Scan completed at {datetime.now().strftime('%H:%M:%S')}")
-    except Exception as e:
-        print(f"[ERROR] Monitor failed: {e}")
-        import traceback
-        traceback.print_exc()
+        if previous_status == 'offline':
+            # Device recovered; closes the outage interval opened by the connectivity log
+            batch.resolve_alerts(device_id, ('connectivity',))
+            batch.add_fault_log(device_id, device_name, device_ip, 'recovery', 'Device back online')
+            log.info('Device recovered', extra={'device_id': device_id, 'device': device_name, 'ip': device_ip,
+                                                'status': new_status})
+    
+    if verdict.flap_ended:
+        batch.resolve_alerts(device_id, ('flapping',))
+        batch.add_fault_log(device_id, device_name, device_ip, 'flapping', 'Device stopped flapping')
+        # Alerts were held back while flapping; raise one now if the device settled in a bad state
+        # (a transition on this same result has already raised its own)
+        if new_status == previous_status == 'offline':
+            batch.add_alert(make_alert(device, 'connectivity', 'Connection lost: Device is unreachable'))
+        elif new_status == previous_status == 'slow':
+            batch.add_alert(make_alert(device, 'latency', f'High latency detected: {new_latency}ms'))
+        log.info('Device stopped flapping', extra={'device_id': device_id, 'device': device_name, 'ip': device_ip})
+
+def record_results(results: List[Tuple[Dict, Dict, Verdict]]):
+    """Persist (device, result, verdict) triples in one transaction and push the changes to dashboards"""
+    batch = SweepBatch()
+    transitions = {device['id']: verdict.status for device, _, verdict in results if verdict.status != verdict.previous}
+    for device, result, verdict in results:
+        handle_probe_result(device, result, verdict, batch, transitions)
+    batch.commit()
+    hub.publish_changes()
+
+def monitor_all_devices(max_in_flight: Optional[int] = None, probe: Optional[Probe] = None):
+    """
+    Monitor all devices that have monitoring enabled in one full sweep
+    The backend probes through the adaptive ProbeScheduler; full sweeps remain for
+    benchmarks, tests and one-off runs
+    
+    Devices are probed concurrently (bounded by max_in_flight) so a sweep
+    takes roughly one probe timeout instead of the sum of all of them
+    `probe` replaces the ICMP probe (benchmarks pass a simulated one)
+    Each sweep opens and closes its own probers (see probers.probe_all)
+    """
+    start = time.perf_counter()
+    try:
+        # Pick up devices changed by other writers, then probe from memory
+        registry.sync()
+        monitored = registry.monitored_devices()
+        behind = registry.unreachable()
+        if behind:
+            # Skip devices behind an offline parent unless their occasional re-check is due
+            due = int(time.time() * 1000) - UNREACHABLE_PROBE_INTERVAL * 1000
+            monitored = [device for device in monitored
+                         if device['id'] not in behind or (device['lastChecked'] or 0) <= due]
+        
+        record_results([
+            (device, result, device_states.observe(device, result))
+            for device, result in probe_all(monitored, probe, max_in_flight=max_in_flight)
+        ])
+    except Exception:
+        log.exception('Monitor sweep failed')
+        return
+    
+    elapsed = time.perf_counter() - start
+    SWEEP_SECONDS.observe(elapsed)
+    if elapsed > SWEEP_INTERVAL:
+        SWEEP_OVERRUNS.inc()
+        log.warning('Sweep overran the probe interval', extra={
+            'devices': len(monitored), 'seconds': round(elapsed, 3), 'interval': SWEEP_INTERVAL})
+    else:
+        log.debug('Sweep completed', extra={'devices': len(monitored), 'seconds': round(elapsed, 3)})
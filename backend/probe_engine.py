@@ -0,0 +1,235 @@
+import asyncio
+import math
+import os
+import platform
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from icmp import IcmpProber, is_ipv4
+from log import get_logger
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = get_logger('probe_engine')
+
+# Upper bound on probes running at the same time during a sweep
+MAX_IN_FLIGHT_PROBES = int(os.environ.get('NETGUARD_MAX_IN_FLIGHT_PROBES', '1024'))
+
+# Latency (ms) above which a reachable device is reported as slow (devices with a
+# learned latency baseline are judged against that instead, see baseline.py)
+SLOW_THRESHOLD_MS = 150
+
+IS_WINDOWS = platform.system().lower() == 'windows'
+
+if IS_WINDOWS:
+    PING_COMMAND = ['ping', '-n', '1', '-w', '2000']
+    LATENCY_PATTERNS = [re.compile(r'Average = (\d+)ms'), re.compile(r'time[=<](\d+)ms')]
+else:
+    PING_COMMAND = ['ping', '-c', '1', '-W', '2']
+    LATENCY_PATTERNS = [re.compile(r'time=([\d.]+)\s*ms')]
+
+# Per-packet round-trip time in ping output (the last pattern above on both platforms)
+PACKET_TIME_PATTERN = LATENCY_PATTERNS[-1]
+
+# Hard limit for a single ping process, slightly above ping's own timeout
+PING_TIMEOUT = 3
+
+# How long the native prober waits for an echo reply (matches ping -W 2)
+ICMP_TIMEOUT = 2
+
+# Set NETGUARD_NATIVE_ICMP=0 to always fork the system ping command
+NATIVE_ICMP = os.environ.get('NETGUARD_NATIVE_ICMP', '1') != '0'
+
+# Packets per probe; with more than one, results carry loss, jitter and percentiles
+BURST_SIZE = max(1, int(os.environ.get('NETGUARD_BURST_SIZE', '1')))
+
+# Gap between packets of a burst in seconds (ping without root allows 0.2 at least)
+BURST_INTERVAL = float(os.environ.get('NETGUARD_BURST_INTERVAL', '0.2'))
+
+# Burst statistic reported as latency and compared with SLOW_THRESHOLD_MS
+SLOW_STATISTICS = ('min', 'avg', 'max', 'p95')
+SLOW_STATISTIC = os.environ.get('NETGUARD_SLOW_STATISTIC', 'avg')
+if SLOW_STATISTIC not in SLOW_STATISTICS:
+    raise ValueError(f'NETGUARD_SLOW_STATISTIC must be one of {", ".join(SLOW_STATISTICS)}')
+
+# Extra fields a burst probe adds to its result
+BURST_STATS = ('loss', 'min', 'avg', 'max', 'mdev', 'p95')
+
+OFFLINE = {'status': 'offline', 'latency': 0}
+
+Probe = Callable[[str], Awaitable[Dict]]
+
+# Probe that gets the whole device, so it can pick a probe type and read its settings (see probers.py)
+DeviceProbe = Callable[[Dict], Awaitable[Dict]]
+
+
+def classify_latency(latency: int, slow_above: float = SLOW_THRESHOLD_MS) -> Dict:
+    """
+    Build a probe result for a device that answered
+    slow_above: the device's limit in ms (ProberSet passes its learned baseline once it has one)
+    """
+    if latency > slow_above:
+        return {'status': 'slow', 'latency': latency}
+    return {'status': 'online', 'latency': latency}
+
+
+def parse_ping_output(output: str) -> Dict:
+    """Turn the stdout of a successful ping into a probe result"""
+    for pattern in LATENCY_PATTERNS:
+        match = pattern.search(output)
+        if match:
+            return classify_latency(int(float(match.group(1))))
+
+    # Ping successful but couldn't parse latency
+    return {'status': 'online', 'latency': 1}
+
+
+def summarize_burst(rtts: List[Optional[float]]) -> Dict:
+    """
+    Probe result for a burst of echo requests (None = no reply)
+    Adds loss %, min/avg/max, mdev (jitter, as reported by ping) and p95 in ms
+    """
+    answered = sorted(rtt for rtt in rtts if rtt is not None)
+    loss = round(100.0 * (len(rtts) - len(answered)) / len(rtts), 1)
+    if not answered:
+        return dict(OFFLINE, loss=loss)
+
+    avg = sum(answered) / len(answered)
+    stats = {
+        'loss': loss,
+        'min': answered[0],
+        'avg': avg,
+        'max': answered[-1],
+        'mdev': math.sqrt(max(0.0, sum(rtt * rtt for rtt in answered) / len(answered) - avg * avg)),
+        'p95': answered[max(0, math.ceil(0.95 * len(answered)) - 1)],
+    }
+    result = classify_latency(int(round(stats[SLOW_STATISTIC])))
+    result.update({key: round(value, 3) for key, value in stats.items()})
+    return result
+
+
+def burst_command(count: int) -> List[str]:
+    """ping arguments for a burst of `count` packets"""
+    if IS_WINDOWS:
+        return ['ping', '-n', str(count), '-w', '2000']
+    return ['ping', '-c', str(count), '-i', str(BURST_INTERVAL), '-W', '2']
+
+
+def parse_burst_output(output: str, count: int) -> Dict:
+    """Turn the stdout of a burst ping into a probe result"""
+    rtts: List[Optional[float]] = [float(match) for match in PACKET_TIME_PATTERN.findall(output)][:count]
+    return summarize_burst(rtts + [None] * (count - len(rtts)))
+
+
+async def ping_device_async(ip: str, burst: Optional[int] = None) -> Dict:
+    """
+    Ping a device without blocking the event loop
+    Same semantics as monitor.ping_device, but many can run at once
+    With a burst of more than one packet, ping paces the packets itself
+    """
+    burst = burst or BURST_SIZE
+    command = PING_COMMAND if burst == 1 else burst_command(burst)
+    # Windows ping waits about a second between packets
+    timeout = PING_TIMEOUT + (burst - 1) * (1.0 if IS_WINDOWS else BURST_INTERVAL)
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *command, ip,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+    except Exception as e:
+        log.error('Ping failed', extra={'ip': ip, 'error': str(e)})
+        return dict(OFFLINE)
+
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        return dict(OFFLINE)
+
+    if burst > 1:
+        return parse_burst_output(stdout.decode(errors='replace'), burst)
+
+    if process.returncode != 0:
+        return dict(OFFLINE)
+
+    return parse_ping_output(stdout.decode(errors='replace'))
+
+
+async def echo_burst(prober: IcmpProber, ip: str, count: int, interval: float) -> List[Optional[float]]:
+    """
+    Send `count` echo requests `interval` seconds apart without waiting for replies
+    Takes about (count - 1) * interval plus one round trip, not count round trips
+    """
+    async def one(index: int) -> Optional[float]:
+        if index:
+            await asyncio.sleep(index * interval)
+        return await prober.echo(ip, ICMP_TIMEOUT)
+
+    return await asyncio.gather(*(one(index) for index in range(count)))
+
+
+def make_native_probe(prober: IcmpProber, burst: Optional[int] = None) -> Probe:
+    """Wrap an IcmpProber as a probe, falling back to ping for non-IPv4 targets"""
+    burst = burst or BURST_SIZE
+
+    async def probe(ip: str) -> Dict:
+        if not is_ipv4(ip):
+            return await ping_device_async(ip, burst)
+
+        if burst > 1:
+            return summarize_burst(await echo_burst(prober, ip, burst, BURST_INTERVAL))
+
+        rtt = await prober.echo(ip, ICMP_TIMEOUT)
+        if rtt is None:
+            return dict(OFFLINE)
+        return classify_latency(int(rtt))
+
+    return probe
+
+
+def open_default_probe() -> Tuple[Probe, Optional[IcmpProber]]:
+    """
+    Native ICMP probe on a new socket, or forked ping when ICMP sockets are not permitted
+    Must run inside an event loop; the caller closes the returned prober (if any) when done
+    """
+    prober = IcmpProber.open() if NATIVE_ICMP else None
+    if prober is None:
+        return ping_device_async, None
+    return make_native_probe(prober), prober
+
+
+def raise_fd_limit():
+    """Lift the soft open-file limit so hundreds of probes can be in flight"""
+    if resource is None:
+        return
+
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or hard > soft:
+            target = hard if hard != resource.RLIM_INFINITY else max(soft, 65536)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError):
+        pass
+
+
+async def probe_all_async(devices: List[Dict], probe: DeviceProbe,
+                          max_in_flight: int) -> List[Tuple[Dict, Dict]]:
+    """Probe every device with at most max_in_flight probes outstanding"""
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run_one(device: Dict) -> Tuple[Dict, Dict]:
+        async with semaphore:
+            try:
+                result = await probe(device)
+            except Exception as e:
+                log.error('Probe failed', extra={'ip': device['ip'], 'error': str(e)})
+                result = dict(OFFLINE)
+        return device, result
+
+    return await asyncio.gather(*(run_one(device) for device in devices))
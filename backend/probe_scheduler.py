@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from device_state import Verdict, device_states
+from log import get_logger
+from metrics import PROBE_LAG_SECONDS, PROBE_OVERRUNS
+from monitor import UNREACHABLE_PROBE_INTERVAL, record_results
+from probe_engine import MAX_IN_FLIGHT_PROBES, OFFLINE, Probe
+from probers import ProberSet
+from registry import registry
+
+# Where the API process gets its results from: 'local' probes in the API process,
+# 'cluster' hands devices to worker processes (backend/worker.py) and 'external'
+# leaves probing to a separate probe service (backend/probe_service.py)
+PROBE_MODES = ('local', 'cluster', 'external')
+PROBE_MODE = os.environ.get('NETGUARD_PROBE_MODE', 'local')
+if PROBE_MODE not in PROBE_MODES:
+    raise ValueError(f'NETGUARD_PROBE_MODE must be one of {", ".join(PROBE_MODES)}')
+
+# Probe interval (seconds) per device type, used unless a device sets probeInterval
+DEFAULT_INTERVAL = float(os.environ.get('NETGUARD_PROBE_INTERVAL', '5'))
+TYPE_INTERVALS = {
+    'router': DEFAULT_INTERVAL,
+    'switch': DEFAULT_INTERVAL,
+    'server': DEFAULT_INTERVAL,
+    'workstation': 3 * DEFAULT_INTERVAL,
+}
+
+# Devices that stay online are probed less often: after BACKOFF_AFTER unchanged
+# results the interval doubles per result, up to MAX_INTERVAL seconds
+BACKOFF_AFTER = 3
+BACKOFF_FACTOR = 2.0
+MAX_INTERVAL = float(os.environ.get('NETGUARD_MAX_PROBE_INTERVAL', '30'))
+
+# While a result disagrees with a device's confirmed status, the device is
+# re-probed RETRY_DELAY seconds later (up to FAST_RETRIES times in a row) so the
+# state machine can confirm or dismiss the change quickly
+FAST_RETRIES = 4
+RETRY_DELAY = 1.0
+
+# Every delay is randomized by +/- this fraction so probes do not fire in lockstep
+JITTER = 0.1
+
+# Results are written to the database in batches at most this often (seconds)
+FLUSH_INTERVAL = 0.5
+
+# How often devices changed by other processes are pulled from the database (seconds)
+SYNC_INTERVAL = 5.0
+
+# Longest the loop sleeps before re-checking for registry changes (seconds)
+TICK = 0.25
+
+log = get_logger('probe_scheduler')
+
+
+class DeviceState:
+    """Scheduling state for one device"""
+
+    __slots__ = ('generation', 'healthy_streak', 'retries')
+
+    def __init__(self):
+        # Heap entry currently in charge of this device
+        self.generation = -1
+        self.healthy_streak = 0
+        self.retries = 0
+
+
+def base_interval(device: Dict) -> float:
+    """Configured interval for a device: its own probeInterval, else its type's default"""
+    return float(device.get('probeInterval') or TYPE_INTERVALS.get(device['type'], DEFAULT_INTERVAL))
+
+
+def jittered(delay: float) -> float:
+    return delay * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+class ProbeScheduler:
+    """
+    Probes each monitored device on its own timer instead of sweeping the whole fleet
+    Due times live in a heap; one asyncio loop on a background thread pops due
+    devices, probes them concurrently and writes results in small batches
+    Devices come from `source` (the registry, or a worker's assignment) and
+    batches of (device, result, verdict) go to `sink` (record_results by default)
+    """
+
+    def __init__(self, probe: Optional[Probe] = None, max_in_flight: Optional[int] = None,
+                 source=None, sink: Optional[Callable[[List[Tuple[Dict, Dict, Verdict]]], None]] = None):
+        self._probe = probe
+        self._source = source if source is not None else registry
+        self._sink = sink or record_results
+        self._max_in_flight = max_in_flight or MAX_IN_FLIGHT_PROBES
+        # (due time, entry number, device_id); entries superseded by a later _schedule are skipped
+        self._heap: List[Tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._states: Dict[str, DeviceState] = {}
+        self._pending: List[Tuple[Dict, Dict, Verdict]] = []
+        self._revision = -1
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        # Probes sent since start, for load reporting
+        self.probes_sent = 0
+
+    @property
+    def scheduled_count(self) -> int:
+        return len(self._states)
+
+    def start(self):
+        """Run the scheduler on a daemon thread"""
+        self._thread = threading.Thread(target=self._run, name='probe-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    def _schedule(self, device_id: str, delay: float):
+        entry = next(self._counter)
+        self._states[device_id].generation = entry
+        heapq.heappush(self._heap, (time.monotonic() + delay, entry, device_id))
+
+    def _reconcile(self):
+        """Start timers for newly monitored devices and forget removed ones"""
+        self._revision = self._source.revision
+        monitored = {device['id']: device for device in self._source.monitored_devices()}
+
+        for device_id in list(self._states):
+            if device_id not in monitored:
+                del self._states[device_id]
+                device_states.forget(device_id)
+
+        for device_id, device in monitored.items():
+            if device_id not in self._states:
+                self._states[device_id] = DeviceState()
+                # Spread first probes over one interval instead of firing them together
+                self._schedule(device_id, random.uniform(0, base_interval(device)))
+
+    def _next_delay(self, device: Dict, verdict: Verdict, state: DeviceState) -> float:
+        interval = base_interval(device)
+        if verdict.status == verdict.previous == 'online':
+            state.healthy_streak += 1
+        else:
+            state.healthy_streak = 0
+
+        backoff = max(0, state.healthy_streak - BACKOFF_AFTER)
+        interval = min(interval * BACKOFF_FACTOR ** min(backoff, 16), max(MAX_INTERVAL, interval))
+        return jittered(interval)
+
+    def _on_result(self, device: Dict, result: Dict):
+        state = self._states.get(device['id'])
+        if state is None:
+            # Removed while the probe was in flight
+            return
+
+        verdict = device_states.observe(device, result)
+        self._pending.append((device, result, verdict))
+
+        if verdict.status != verdict.previous and 'offline' in (verdict.status, verdict.previous):
+            self._reschedule_downstream(device['id'], verdict.status == 'offline')
+        if self._source.root_cause(device['id']) is not None:
+            # Behind an offline parent: its probes would only time out, so no fast
+            # retries and just an occasional check until the parent recovers
+            state.retries = 0
+            state.healthy_streak = 0
+            self._schedule(device['id'], jittered(max(UNREACHABLE_PROBE_INTERVAL, base_interval(device))))
+            return
+
+        if verdict.pending and state.retries < FAST_RETRIES:
+            # Suspected change: confirm or dismiss it with quick retries
+            state.retries += 1
+            state.healthy_streak = 0
+            self._schedule(device['id'], jittered(RETRY_DELAY))
+            return
+
+        state.retries = 0
+        self._schedule(device['id'], self._next_delay(device, verdict, state))
+
+    def _reschedule_downstream(self, device_id: str, went_offline: bool):
+        """
+        A parent went offline: hold back the devices behind it (their probes would only
+        time out). It came back: probe them now rather than at their slowed-down time
+        """
+        for child_id in self._source.descendants(device_id):
+            state = self._states.get(child_id)
+            if state is None:
+                continue
+            state.retries = 0
+            if went_offline:
+                self._schedule(child_id, jittered(UNREACHABLE_PROBE_INTERVAL))
+            else:
+                self._schedule(child_id, random.uniform(0, RETRY_DELAY))
+
+    async def _probe_one(self, semaphore: asyncio.Semaphore, probers: ProberSet, device: Dict):
+        async with semaphore:
+            self.probes_sent += 1
+            try:
+                result = await probers.probe(device)
+            except Exception as e:
+                log.error('Probe failed', extra={'ip': device['ip'], 'error': str(e)})
+                result = dict(OFFLINE)
+        self._on_result(device, result)
+
+    def _dispatch(self, semaphore: asyncio.Semaphore, probers: ProberSet, tasks: set):
+        """Start a probe for every device whose time has come"""
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now:
+            due, entry, device_id = heapq.heappop(self._heap)
+            state = self._states.get(device_id)
+            if state is None or state.generation != entry:
+                continue
+
+            device = self._source.get(device_id)
+            if device is None or not device['isMonitored']:
+                del self._states[device_id]
+                device_states.forget(device_id)
+                continue
+
+            lag = now - due
+            PROBE_LAG_SECONDS.observe(lag)
+            if lag > base_interval(device):
+                PROBE_OVERRUNS.inc()
+
+            task = asyncio.ensure_future(self._probe_one(semaphore, probers, device))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+    async def _flush(self):
+        if not self._pending:
+            return
+        results, self._pending = self._pending, []
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._sink, results)
+        except Exception as e:
+            log.error('Failed to record probe results', extra={'error': str(e)})
+
+    async def _sync(self):
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._source.sync)
+        except Exception as e:
+            log.error('Registry sync failed', extra={'error': str(e)})
+
+    async def _main(self):
+        self._stopping = asyncio.Event()
+        # One set of probers (sockets, keep-alive connections) for the scheduler's lifetime
+        probers = ProberSet(icmp=self._probe)
+        semaphore = asyncio.Semaphore(self._max_in_flight)
+        tasks: set = set()
+        writer: Optional[asyncio.Future] = None
+        last_flush = last_sync = time.monotonic()
+
+        await self._sync()
+        try:
+            while not self._stopping.is_set():
+                if self._source.revision != self._revision:
+                    self._reconcile()
+
+                self._dispatch(semaphore, probers, tasks)
+
+                now = time.monotonic()
+                # Writes run in the background so due probes keep being dispatched
+                if now - last_flush >= FLUSH_INTERVAL and (writer is None or writer.done()):
+                    last_flush = now
+                    writer = asyncio.ensure_future(self._flush())
+                if now - last_sync >= SYNC_INTERVAL:
+                    last_sync = now
+                    await self._sync()
+
+                delay = TICK
+                if self._heap:
+                    delay = min(delay, max(0.0, self._heap[0][0] - time.monotonic()))
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if writer is not None:
+                await writer
+            await self._flush()
+            probers.close()
+
+
+# Process-wide scheduler started by app.py
+probe_scheduler = ProbeScheduler()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+NetGuard probe service
+Probes devices and runs the time-series / uptime maintenance in a process of
+its own, so API processes (NETGUARD_PROBE_MODE=external) only serve requests.
+Both sides share state through the SQLite databases.
+
+Usage:
+    python backend/probe_service.py [--cluster]
+"""
+
+import argparse
+import os
+import signal
+import threading
+
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from baseline import load_baselines, save_baselines
+from cluster import coordinator
+from database import close_connections, init_db
+from jobs import add_maintenance_jobs
+from log import get_logger
+from metrics import serve as serve_metrics
+from probe_engine import raise_fd_limit
+from probe_scheduler import probe_scheduler
+from registry import registry
+from sla import tracker as sla_tracker
+from timeseries import store as timeseries
+
+# /metrics port of this process (NETGUARD_METRICS_PORT; 0 disables it)
+METRICS_PORT = int(os.environ.get('NETGUARD_METRICS_PORT', '9101'))
+
+log = get_logger('probe_service')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cluster', action='store_true',
+                        help='hand devices to worker processes (backend/worker.py) instead of probing here')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, help='serve /metrics on this port (0: off)')
+    args = parser.parse_args()
+
+    init_db()
+    registry.load()
+    timeseries.open()
+    sla_tracker.load(timeseries)
+    load_baselines()
+    raise_fd_limit()
+    serve_metrics(args.metrics_port)
+
+    scheduler = BackgroundScheduler()
+    add_maintenance_jobs(scheduler)
+    scheduler.start()
+
+    if args.cluster:
+        coordinator.start()
+    else:
+        probe_scheduler.start()
+    log.info('Probe service started', extra={'probing': 'cluster workers' if args.cluster else 'locally',
+                                             'metrics_port': args.metrics_port})
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+    try:
+        stopping.wait()
+    finally:
+        probe_scheduler.stop()
+        coordinator.stop()
+        scheduler.shutdown()
+        save_baselines()
+        timeseries.close()
+        close_connections()
+        log.info('Probe service stopped')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,476 @@
+import abc
+import asyncio
+import ipaddress
+import os
+import socket
+import ssl
+import struct
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from baseline import baselines
+from icmp import IcmpProber
+from metrics import PROBE_RESULTS, PROBE_RTT_SECONDS, PROBE_SECONDS, PROBES_IN_FLIGHT
+from probe_engine import (
+    ICMP_TIMEOUT, MAX_IN_FLIGHT_PROBES, OFFLINE, Probe, classify_latency, open_default_probe, probe_all_async
+)
+
+# How long a TCP, HTTP or DNS probe may take before the device counts as offline (seconds)
+PROBE_TIMEOUT = float(os.environ.get('NETGUARD_PROBE_TIMEOUT', str(ICMP_TIMEOUT)))
+
+# Port used when a device does not set probePort
+DEFAULT_PORTS = {'tcp': 80, 'http': 80, 'https': 443, 'dns': 53}
+
+# HTTP responses with a status at or above this count as failed probes
+HTTP_FAILURE_STATUS = 500
+
+# Idle keep-alive connections kept per HTTP target
+HTTP_MAX_IDLE = 2
+
+# Response bodies up to this size are read so the connection can be reused; larger ones close it
+HTTP_MAX_DRAIN = 64 * 1024
+
+# Set NETGUARD_HTTP_VERIFY_TLS=1 to fail HTTPS probes on invalid certificates
+HTTP_VERIFY_TLS = os.environ.get('NETGUARD_HTTP_VERIFY_TLS', '0') == '1'
+
+# Name queried by DNS probes when a device does not set probeTarget
+DNS_QUERY_NAME = os.environ.get('NETGUARD_DNS_QUERY_NAME', 'example.com')
+
+# DNS response codes that mean the server is answering (NOERROR, NXDOMAIN)
+DNS_HEALTHY_RCODES = (0, 3)
+
+DNS_TYPE_A = 1
+DNS_CLASS_IN = 1
+
+# Extra fields TCP/HTTP/DNS probes add to their result
+PROBE_DETAILS = ('httpStatus', 'dnsRcode')
+
+DEFAULT_PROBE_TYPE = 'icmp'
+
+# Errors that mean a target did not answer properly; the probe reports the device offline
+PROBE_ERRORS = (OSError, EOFError, ValueError, asyncio.TimeoutError)
+
+
+def elapsed_ms(start: float) -> int:
+    return int((time.perf_counter() - start) * 1000)
+
+
+class Prober(abc.ABC):
+    """
+    One kind of health check
+    probe() gets the whole device so it can read probePort / probeTarget; a prober
+    lives as long as its event loop and may keep sockets or connections open
+    """
+
+    @abc.abstractmethod
+    async def probe(self, device: Dict) -> Dict:
+        """Probe result for the device: status, latency and any PROBE_DETAILS"""
+
+    def close(self):
+        pass
+
+
+class PingProber(Prober):
+    """ICMP echo, through the shared native socket or forked ping (see probe_engine)"""
+
+    def __init__(self, probe: Optional[Probe] = None):
+        self._probe = probe
+        self._icmp: Optional[IcmpProber] = None
+
+    async def probe(self, device: Dict) -> Dict:
+        if self._probe is None:
+            # Opened lazily: the ICMP socket must be bound to the running loop
+            self._probe, self._icmp = open_default_probe()
+        return await self._probe(device['ip'])
+
+    def close(self):
+        if self._icmp is not None:
+            self._icmp.close()
+            self._icmp = None
+
+
+class TcpProber(Prober):
+    """Time to complete a TCP handshake with probePort"""
+
+    async def probe(self, device: Dict) -> Dict:
+        port = device.get('probePort') or DEFAULT_PORTS['tcp']
+        start = time.perf_counter()
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(device['ip'], port), PROBE_TIMEOUT)
+        except PROBE_ERRORS:
+            return dict(OFFLINE)
+        latency = elapsed_ms(start)
+        # Reset instead of a graceful close so probes do not leave sockets in TIME_WAIT
+        writer.transport.abort()
+        return classify_latency(latency)
+
+
+def http_target(device: Dict) -> Tuple[bool, str, int, str]:
+    """
+    (tls, host header, port, path) for a device's HTTP probe
+    probeTarget is a path ('/health') or a full URL whose host is sent as the
+    Host header; the connection always goes to the device's ip
+    """
+    target = device.get('probeTarget') or '/'
+    if '://' in target:
+        parts = urlsplit(target)
+        tls = parts.scheme == 'https'
+        port = device.get('probePort') or parts.port or DEFAULT_PORTS['https' if tls else 'http']
+        host = parts.hostname or device['ip']
+        path = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    else:
+        port = device.get('probePort') or DEFAULT_PORTS['http']
+        tls = port == DEFAULT_PORTS['https']
+        host = device['ip']
+        path = target if target.startswith('/') else f'/{target}'
+
+    if ':' in host:
+        host = f'[{host}]'
+    if port != DEFAULT_PORTS['https' if tls else 'http']:
+        host = f'{host}:{port}'
+    return tls, host, port, path
+
+
+async def read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise EOFError('Connection closed in response headers')
+        line = line.strip()
+        if not line:
+            return headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+async def drain_body(reader: asyncio.StreamReader, status: int, headers: Dict[str, str]) -> bool:
+    """Read a response body so the connection can carry the next request; False when it cannot be reused"""
+    if status < 200 or status in (204, 304):
+        return True
+
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        total = 0
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            total += size
+            if total > HTTP_MAX_DRAIN:
+                return False
+            await reader.readexactly(size + 2)
+            if size == 0:
+                return True
+
+    if 'content-length' in headers:
+        length = int(headers['content-length'])
+        if length > HTTP_MAX_DRAIN:
+            return False
+        await reader.readexactly(length)
+        return True
+
+    # Body runs until the server closes the connection
+    return False
+
+
+class HttpProber(Prober):
+    """
+    GET probeTarget and time the first byte of the response
+    Connections are kept alive and reused by later probes of the same target, so
+    steady-state probes cost one request instead of a TCP (and TLS) handshake
+    """
+
+    def __init__(self):
+        self._idle: Dict[Tuple[str, int, bool, str], List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._tls = ssl.create_default_context()
+        if not HTTP_VERIFY_TLS:
+            self._tls.check_hostname = False
+            self._tls.verify_mode = ssl.CERT_NONE
+
+    async def probe(self, device: Dict) -> Dict:
+        tls, host, port, path = http_target(device)
+        key = (device['ip'], port, tls, host)
+        try:
+            status, latency = await asyncio.wait_for(self._get(key, path), PROBE_TIMEOUT)
+        except PROBE_ERRORS:
+            return dict(OFFLINE)
+
+        result = classify_latency(latency) if status < HTTP_FAILURE_STATUS else dict(OFFLINE)
+        result['httpStatus'] = status
+        return result
+
+    def _checkout(self, key) -> Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+        idle = self._idle.get(key)
+        while idle:
+            reader, writer = idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _checkin(self, key, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter]):
+        idle = self._idle.setdefault(key, [])
+        if len(idle) < HTTP_MAX_IDLE:
+            idle.append(connection)
+        else:
+            connection[1].close()
+
+    async def _connect(self, key) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        ip, port, tls, host = key
+        if not tls:
+            return await asyncio.open_connection(ip, port)
+        server_name = host.rsplit(':', 1)[0] if not host.startswith('[') else None
+        return await asyncio.open_connection(ip, port, ssl=self._tls, server_hostname=server_name)
+
+    async def _get(self, key, path: str) -> Tuple[int, int]:
+        connection = self._checkout(key)
+        if connection is not None:
+            try:
+                return await self._request(key, connection, path)
+            except PROBE_ERRORS:
+                # The server may have dropped the idle connection; retry once on a fresh one
+                pass
+        return await self._request(key, await self._connect(key), path)
+
+    async def _request(self, key, connection: Tuple[asyncio.StreamReader, asyncio.StreamWriter],
+                       path: str) -> Tuple[int, int]:
+        """(status, time to first byte in ms); TTFB is timed from sending the request"""
+        reader, writer = connection
+        try:
+            start = time.perf_counter()
+            writer.write(
+                f'GET {path} HTTP/1.1\r\nHost: {key[3]}\r\nUser-Agent: NetGuard\r\n'
+                f'Accept: */*\r\nConnection: keep-alive\r\n\r\n'.encode('latin-1')
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            latency = elapsed_ms(start)
+            if not status_line:
+                raise EOFError('Connection closed before the response')
+
+            version, status = status_line.split(None, 2)[:2]
+            status = int(status)
+            headers = await read_headers(reader)
+            keep_alive = headers.get('connection', '').lower() != 'close' and (
+                version != b'HTTP/1.0' or headers.get('connection', '').lower() == 'keep-alive'
+            )
+            reusable = await drain_body(reader, status, headers) and keep_alive
+        except BaseException:
+            writer.close()
+            raise
+
+        if reusable:
+            self._checkin(key, connection)
+        else:
+            writer.close()
+        return status, latency
+
+    def close(self):
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+
+
+def build_dns_query(query_id: int, name: str, record_type: int = DNS_TYPE_A) -> bytes:
+    """Recursive query for one name"""
+    labels = name.rstrip('.').encode('idna').split(b'.')
+    if any(not label or len(label) > 63 for label in labels):
+        raise ValueError(f'Invalid DNS name: {name}')
+    question = b''.join(bytes([len(label)]) + label for label in labels) + b'\x00'
+    header = struct.pack('!HHHHHH', query_id, 0x0100, 1, 0, 0, 0)
+    return header + question + struct.pack('!HH', record_type, DNS_CLASS_IN)
+
+
+def parse_dns_reply(packet: bytes) -> Optional[Tuple[int, int]]:
+    """Extract (query id, response code) from a DNS response"""
+    if len(packet) < 12:
+        return None
+    query_id, flags = struct.unpack('!HH', packet[:4])
+    if not flags & 0x8000:
+        return None
+    return query_id, flags & 0x000F
+
+
+def socket_address(host: str, port: int) -> Tuple[int, Tuple[str, int]]:
+    """(address family, sockaddr) for an IP literal, in the form recvfrom reports it"""
+    address = ipaddress.ip_address(host)
+    family = socket.AF_INET6 if address.version == 6 else socket.AF_INET
+    return family, (str(address), port)
+
+
+class DnsProber(Prober):
+    """
+    Query probeTarget (or DNS_QUERY_NAME) and time the answer
+    All queries share one UDP socket per address family; replies are matched
+    to waiting probes by (server, port, query id)
+    """
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._sockets: Dict[int, socket.socket] = {}
+        self._pending: Dict[Tuple[str, int, int], asyncio.Future] = {}
+        self._query_id = int.from_bytes(os.urandom(2), 'big')
+
+    def _socket(self, family: int) -> socket.socket:
+        sock = self._sockets.get(family)
+        if sock is None:
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            self._loop.add_reader(sock.fileno(), self._on_readable, sock)
+            self._sockets[family] = sock
+        return sock
+
+    def _next_id(self, server: Tuple[str, int]) -> int:
+        for _ in range(0x10000):
+            self._query_id = (self._query_id + 1) & 0xFFFF
+            if (*server, self._query_id) not in self._pending:
+                return self._query_id
+        raise RuntimeError('No free DNS query ids')
+
+    def _on_readable(self, sock: socket.socket):
+        while True:
+            try:
+                packet, address = sock.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+
+            parsed = parse_dns_reply(packet)
+            if parsed is None:
+                continue
+            query_id, rcode = parsed
+            future = self._pending.pop((address[0], address[1], query_id), None)
+            if future is not None and not future.done():
+                future.set_result(rcode)
+
+    async def probe(self, device: Dict) -> Dict:
+        port = device.get('probePort') or DEFAULT_PORTS['dns']
+        name = device.get('probeTarget') or DNS_QUERY_NAME
+        try:
+            family, server = socket_address(device['ip'], port)
+            sock = self._socket(family)
+            query_id = self._next_id(server)
+            packet = build_dns_query(query_id, name)
+        except PROBE_ERRORS:
+            return dict(OFFLINE)
+
+        key = (*server, query_id)
+        future = self._loop.create_future()
+        self._pending[key] = future
+        try:
+            start = time.perf_counter()
+            sock.sendto(packet, server)
+            rcode = await asyncio.wait_for(future, PROBE_TIMEOUT)
+        except PROBE_ERRORS:
+            return dict(OFFLINE)
+        finally:
+            self._pending.pop(key, None)
+
+        result = classify_latency(elapsed_ms(start)) if rcode in DNS_HEALTHY_RCODES else dict(OFFLINE)
+        result['dnsRcode'] = rcode
+        return result
+
+    def close(self):
+        for sock in self._sockets.values():
+            self._loop.remove_reader(sock.fileno())
+            sock.close()
+        self._sockets.clear()
+        for future in self._pending.values():
+            if not future.done():
+                future.cancel()
+        self._pending.clear()
+
+
+# Probe types a device can select with probeType; register_prober adds more
+PROBERS: Dict[str, Callable[[], Prober]] = {
+    'icmp': PingProber,
+    'tcp': TcpProber,
+    'http': HttpProber,
+    'dns': DnsProber,
+}
+
+
+def register_prober(probe_type: str, factory: Callable[[], Prober]):
+    """Make a new probe type available to devices (the factory runs inside the event loop)"""
+    PROBERS[probe_type] = factory
+
+
+class ProberSet:
+    """
+    The probers used on one event loop, created on first use of each probe type
+    and shared by every probe (one ICMP socket, one DNS socket, pooled HTTP connections)
+    `icmp` replaces the ICMP probe; `probers` replaces whole probe types
+    Results are slow or online by the device's latency baseline once it has one
+    """
+
+    def __init__(self, icmp: Optional[Probe] = None, probers: Optional[Dict[str, Prober]] = None):
+        self._probers: Dict[str, Prober] = dict(probers or {})
+        if icmp is not None:
+            self._probers.setdefault('icmp', PingProber(icmp))
+
+    def _prober(self, probe_type: str) -> Prober:
+        prober = self._probers.get(probe_type)
+        if prober is None:
+            factory = PROBERS.get(probe_type)
+            if factory is None:
+                raise ValueError(f'Unknown probe type: {probe_type}')
+            prober = self._probers[probe_type] = factory()
+        return prober
+
+    async def probe(self, device: Dict) -> Dict:
+        probe_type = device.get('probeType') or DEFAULT_PROBE_TYPE
+        prober = self._prober(probe_type)
+        PROBES_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            result = await prober.probe(device)
+        finally:
+            PROBES_IN_FLIGHT.dec()
+            PROBE_SECONDS.labels(probe_type).observe(time.perf_counter() - start)
+        if result['status'] != 'offline':
+            limits = baselines.limits(device.get('id'))
+            if limits is not None:
+                # Probers only know the fixed threshold; judge the answer against the device's baseline
+                result.update(classify_latency(result['latency'], limits[0]))
+        PROBE_RESULTS.labels(probe_type, result['status']).inc()
+        if result['status'] != 'offline':
+            PROBE_RTT_SECONDS.labels(probe_type).observe(result['latency'] / 1000)
+        return result
+
+    def close(self):
+        for prober in self._probers.values():
+            prober.close()
+        self._probers.clear()
+
+
+async def sweep_async(devices: List[Dict], probe: Optional[Probe],
+                      max_in_flight: int) -> List[Tuple[Dict, Dict]]:
+    """
+    Run one sweep, probing each device with its own probe type
+    `probe` replaces the default ICMP probe (native socket, or forked ping
+    when ICMP sockets are not permitted)
+    """
+    probers = ProberSet(icmp=probe)
+    try:
+        return await probe_all_async(devices, probers.probe, max_in_flight)
+    finally:
+        probers.close()
+
+
+def probe_all(devices: List[Dict], probe: Optional[Probe] = None,
+              max_in_flight: Optional[int] = None) -> List[Tuple[Dict, Dict]]:
+    """
+    Probe a batch of devices concurrently and return (device, result) pairs
+    Runs its own event loop for the one sweep, so sockets and HTTP keep-alive
+    connections are not carried over to the next call: reuse across probes
+    only applies to ProbeScheduler, which keeps one ProberSet for its lifetime
+    """
+    if not devices:
+        return []
+
+    return asyncio.run(sweep_async(
+        devices,
+        probe,
+        max_in_flight or MAX_IN_FLIGHT_PROBES
+    ))
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, Optional, Set
+
+from database import get_changes_since, get_data_version
+from log import get_logger
+from serializers import changes_to_json
+
+# Port for the Server-Sent Events stream (proxied as /api/stream by the frontend)
+STREAM_PORT = int(os.environ.get('NETGUARD_STREAM_PORT', '5001'))
+STREAM_PATH = '/api/stream'
+
+# Events buffered per client before it is considered too slow and told to resync
+CLIENT_QUEUE_SIZE = 64
+
+# A client that cannot take a write within this many seconds is disconnected
+WRITE_TIMEOUT = 10
+
+# Comment line sent when idle so proxies keep the connection open
+KEEPALIVE_SECONDS = 15
+
+# Largest alert batch pushed inline; beyond that clients are asked to resync
+MAX_PUSHED_ALERTS = 1000
+
+log = get_logger('push')
+
+RESPONSE_HEADERS = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-Type: text/event-stream\r\n'
+    b'Cache-Control: no-cache\r\n'
+    b'Connection: keep-alive\r\n'
+    b'Access-Control-Allow-Origin: *\r\n'
+    b'X-Accel-Buffering: no\r\n'
+    b'\r\n'
+)
+
+
+def encode_event(event: str, data: Dict) -> bytes:
+    """Serialize one SSE message"""
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'.encode()
+
+
+class Client:
+    """One connected stream; events wait in a bounded queue until written"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(CLIENT_QUEUE_SIZE)
+        self.lagging = False
+
+    def offer(self, payload: bytes):
+        if self.lagging:
+            return
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Backpressure: drop what the client has not read and ask it to
+            # refetch state once, instead of buffering without bound
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(encode_event('resync', {}))
+            self.lagging = True
+
+
+class BroadcastHub:
+    """
+    Fans out monitor events to every SSE client
+    All connections are served by one asyncio loop on a single background thread
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._clients: Set[Client] = set()
+        self._started = threading.Event()
+        self._publish_lock = threading.Lock()
+        self._published_version: Optional[int] = None
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def start(self, host: str = '0.0.0.0', port: int = STREAM_PORT, reuse_port: bool = False):
+        """
+        Start serving the stream on a daemon thread
+        With reuse_port, several API processes can listen on the same port and
+        the kernel spreads stream connections across them
+        """
+        thread = threading.Thread(target=self._run, args=(host, port, reuse_port), name='sse-hub', daemon=True)
+        thread.start()
+        self._started.wait(5)
+
+    def _run(self, host: str, port: int, reuse_port: bool):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle, host, port, reuse_port=reuse_port or None)
+        )
+        log.info('Streaming events', extra={'url': f'http://{host}:{port}{STREAM_PATH}'})
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            self._loop.close()
+
+    def publish(self, event: str, data: Dict):
+        """Queue an event for every client; safe to call from any thread"""
+        if self._loop is None or not self._clients:
+            return
+        payload = encode_event(event, data)
+        self._loop.call_soon_threadsafe(self._broadcast, payload)
+
+    def _broadcast(self, payload: bytes):
+        for client in list(self._clients):
+            client.offer(payload)
+
+    def publish_changes(self):
+        """
+        Push everything committed since the last published version
+        Called after monitor sweeps and API writes; one query serves all clients
+        """
+        with self._publish_lock:
+            if not self._clients:
+                self._published_version = None
+                return
+
+            since = self._published_version
+            if since is None:
+                # A client is still connecting; it will read a snapshot itself
+                return
+
+            changes = get_changes_since(since, MAX_PUSHED_ALERTS)
+            if changes['version'] <= since:
+                return
+
+            self._published_version = changes['version']
+            if changes['truncated']:
+                self.publish('resync', {'version': changes['version']})
+                return
+
+            payload = changes_to_json(changes)
+            payload['since'] = since
+            self.publish('changes', payload)
+
+    def _set_baseline(self):
+        with self._publish_lock:
+            if self._published_version is None:
+                self._published_version = get_data_version()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), WRITE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+
+        request_line = request.split(b'\r\n', 1)[0].decode('latin-1').split()
+        if len(request_line) < 2 or request_line[0] != 'GET' or request_line[1].split('?')[0] != STREAM_PATH:
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+            await self._close(writer)
+            return
+
+        client = Client()
+        self._clients.add(client)
+        try:
+            if self._published_version is None:
+                await asyncio.get_running_loop().run_in_executor(None, self._set_baseline)
+
+            writer.write(RESPONSE_HEADERS)
+            # Clients fetch a snapshot on hello, then apply pushed changes on top
+            writer.write(encode_event('hello', {'version': self._published_version}))
+            await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+
+            while True:
+                try:
+                    payload = await asyncio.wait_for(client.queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    payload = b': keepalive\n\n'
+
+                writer.write(payload)
+                await asyncio.wait_for(writer.drain(), WRITE_TIMEOUT)
+
+                if client.lagging and client.queue.empty():
+                    client.lagging = False
+        except (asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            self._clients.discard(client)
+            await self._close(writer)
+
+    async def _close(self, writer: asyncio.StreamWriter):
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+# Process-wide hub used by the monitor and routes
+hub = BroadcastHub()
@@ -0,0 +1,316 @@
+import hashlib
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from database import get_all_devices, get_changes_since, get_data_version
+from serializers import device_to_json
+
+# Device fields set by configuration (as opposed to probe results)
+CONFIG_FIELDS = ('name', 'ip', 'type', 'isMonitored', 'probeInterval', 'probeType', 'probePort', 'probeTarget', 'tags',
+                 'parentId')
+
+# Longest parent chain followed; anything deeper (or a cycle written outside the API) is cut off there
+MAX_TOPOLOGY_DEPTH = 32
+
+class DeviceRegistry:
+    """
+    Authoritative in-memory view of every device
+    The monitor and the CRUD routes write through to it after writing SQLite,
+    and GET /api/devices is served from a pre-serialized JSON snapshot
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._devices: Dict[str, Dict] = {}
+        self._loaded = False
+        self._snapshot: Optional[bytes] = None
+        self._etag: Optional[str] = None
+        # parent id -> child ids, rebuilt after the next reconfiguration
+        self._children: Optional[Dict[str, List[str]]] = None
+        # Last database change version folded into the registry
+        self.db_version = 0
+        # Bumped when devices are added, removed or reconfigured (not on status updates)
+        self.revision = 0
+
+    def load(self):
+        """(Re)load every device from the database"""
+        version = get_data_version()
+        devices = get_all_devices()
+        with self._lock:
+            self._devices = {device['id']: device_to_json(device) for device in devices}
+            self.db_version = version
+            self._loaded = True
+            self._invalidate()
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def sync(self):
+        """
+        Fold in changes committed by other writers (another process, or SQL run by hand)
+        One indexed query when nothing has changed. Changed rows are merged into the
+        existing entries like upsert_many, so probe stats survive, and the registry
+        only counts as reconfigured when devices were added, removed or reconfigured
+        """
+        self.ensure_loaded()
+        changes = get_changes_since(self.db_version)
+        if changes['version'] <= self.db_version:
+            return
+        if changes['truncated']:
+            self.load()
+            return
+
+        with self._lock:
+            reconfigured = False
+            for row in changes['devices']:
+                device = device_to_json(row)
+                current = self._devices.get(device['id'])
+                if current is None:
+                    self._devices[device['id']] = device
+                    reconfigured = True
+                    continue
+                if any(current.get(field) != device[field] for field in CONFIG_FIELDS):
+                    reconfigured = True
+                    if current.get('probeType') != device['probeType']:
+                        current.pop('probeStats', None)
+                current.update(device)
+            for device_id in changes['removed']:
+                if self._devices.pop(device_id, None) is not None:
+                    reconfigured = True
+            self.db_version = changes['version']
+            self._invalidate(reconfigured)
+
+    def _invalidate(self, reconfigured: bool = True):
+        if reconfigured:
+            self.revision += 1
+            self._children = None
+        self._snapshot = None
+        self._etag = None
+
+    def _rebuild(self):
+        self._snapshot = json.dumps(list(self._devices.values()), separators=(',', ':')).encode()
+        # Content hash, so every API worker produces the same tag for the same state
+        self._etag = hashlib.blake2b(self._snapshot, digest_size=12).hexdigest()
+
+    def snapshot(self) -> Tuple[bytes, str]:
+        """JSON array of all devices and its ETag; rebuilt only after a change"""
+        self.ensure_loaded()
+        with self._lock:
+            if self._snapshot is None:
+                self._rebuild()
+            return self._snapshot, self._etag
+
+    def get(self, device_id: str) -> Optional[Dict]:
+        with self._lock:
+            device = self._devices.get(device_id)
+            return dict(device) if device else None
+
+    def monitored_devices(self) -> List[Dict]:
+        """Copies of every device with monitoring enabled"""
+        self.ensure_loaded()
+        with self._lock:
+            return [dict(device) for device in self._devices.values() if device['isMonitored']]
+
+    def _children_index(self) -> Dict[str, List[str]]:
+        if self._children is None:
+            children: Dict[str, List[str]] = {}
+            for device in self._devices.values():
+                if device.get('parentId'):
+                    children.setdefault(device['parentId'], []).append(device['id'])
+            self._children = children
+        return self._children
+
+    def ancestors(self, device_id: str) -> List[str]:
+        """Ids up the device's parent chain, nearest first; a parent that no longer exists ends it"""
+        with self._lock:
+            chain: List[str] = []
+            device = self._devices.get(device_id)
+            while device is not None and device.get('parentId') and len(chain) < MAX_TOPOLOGY_DEPTH:
+                parent_id = device['parentId']
+                if parent_id == device_id or parent_id in chain or parent_id not in self._devices:
+                    break
+                chain.append(parent_id)
+                device = self._devices[parent_id]
+            return chain
+
+    def parents(self) -> Dict[str, str]:
+        """Device id -> parent id for every device that has a parent"""
+        with self._lock:
+            return {device_id: device['parentId'] for device_id, device in self._devices.items()
+                    if device.get('parentId')}
+
+    def descendants(self, device_id: str) -> List[str]:
+        """Ids of every device downstream of this one"""
+        with self._lock:
+            children = self._children_index()
+            found: List[str] = []
+            seen = {device_id}
+            stack = list(children.get(device_id, ()))
+            while stack:
+                child_id = stack.pop()
+                if child_id in seen:
+                    continue
+                seen.add(child_id)
+                found.append(child_id)
+                stack.extend(children.get(child_id, ()))
+            return found
+
+    def root_cause(self, device_id: str, statuses: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+        """
+        The topmost monitored device up the parent chain that is offline (the one
+        to blame when this device is unreachable), or None when the path is up
+        `statuses` overrides registry statuses decided but not applied yet
+        """
+        with self._lock:
+            root = None
+            for ancestor_id in self.ancestors(device_id):
+                ancestor = self._devices[ancestor_id]
+                status = (statuses or {}).get(ancestor_id, ancestor['status'])
+                if ancestor['isMonitored'] and status == 'offline':
+                    root = ancestor
+            return dict(root) if root is not None else None
+
+    def unreachable(self) -> Dict[str, str]:
+        """Every device behind an offline device, mapped to the id of its root cause"""
+        with self._lock:
+            behind: Dict[str, str] = {}
+            for parent_id in self._children_index():
+                parent = self._devices.get(parent_id)
+                if parent is None or parent['status'] != 'offline' or not parent['isMonitored'] or parent_id in behind:
+                    continue
+                root = self.root_cause(parent_id)
+                root_id = root['id'] if root is not None else parent_id
+                for device_id in self.descendants(parent_id):
+                    behind[device_id] = root_id
+            return behind
+
+    def incidents(self) -> List[Tuple[Dict, List[Dict]]]:
+        """(root cause, devices unreachable behind it) for every offline device not itself behind an offline one"""
+        with self._lock:
+            behind = self.unreachable()
+            grouped: Dict[str, List[Dict]] = {}
+            for device_id, root_id in behind.items():
+                grouped.setdefault(root_id, []).append(dict(self._devices[device_id]))
+            return [
+                (dict(device), grouped.get(device['id'], [])) for device in self._devices.values()
+                if device['isMonitored'] and device['status'] == 'offline' and device['id'] not in behind
+            ]
+
+    def known_ips(self) -> Set[str]:
+        self.ensure_loaded()
+        with self._lock:
+            return {device['ip'] for device in self._devices.values()}
+
+    def upsert(self, device: Dict):
+        """Add or replace a device given in the frontend's Device shape"""
+        with self._lock:
+            self._devices[device['id']] = device
+            self._invalidate()
+
+    def upsert_many(self, devices: Iterable[Dict]):
+        """Add devices, or update the configuration of existing ones (status and probe stats are kept)"""
+        with self._lock:
+            for device in devices:
+                current = self._devices.get(device['id'])
+                if current is None:
+                    self._devices[device['id']] = device
+                    continue
+                if current.get('probeType') != device['probeType']:
+                    current.pop('probeStats', None)
+                current.update({field: device[field] for field in CONFIG_FIELDS})
+            self._invalidate()
+
+    def remove(self, device_id: str):
+        with self._lock:
+            if self._devices.pop(device_id, None) is not None:
+                self._invalidate()
+
+    def remove_many(self, device_ids: Iterable[str]):
+        with self._lock:
+            for device_id in device_ids:
+                self._devices.pop(device_id, None)
+            self._invalidate()
+
+    def toggle_monitoring(self, device_id: str):
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is not None:
+                device['isMonitored'] = not device['isMonitored']
+                self._invalidate()
+
+    def set_monitoring(self, flags: Iterable[Tuple[str, bool]]):
+        """Record (device_id, is_monitored) changes"""
+        with self._lock:
+            for device_id, monitored in flags:
+                device = self._devices.get(device_id)
+                if device is not None:
+                    device['isMonitored'] = monitored
+            self._invalidate()
+
+    def set_probe_interval(self, device_id: str, interval: Optional[int]):
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is not None:
+                device['probeInterval'] = interval
+                self._invalidate()
+
+    def set_parent(self, device_id: str, parent_id: Optional[str]):
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is not None:
+                device['parentId'] = parent_id
+                self._invalidate()
+
+    def set_probe_settings(self, device_id: str, probe_type: str, port: Optional[int], target: Optional[str]):
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is not None:
+                device['probeType'] = probe_type
+                device['probePort'] = port
+                device['probeTarget'] = target
+                # Results of the old probe type say nothing about the new one
+                device.pop('probeStats', None)
+                self._invalidate()
+
+    def apply_status(self, status_updates: Iterable[Tuple[str, str, int]], timestamp: int,
+                     version: Optional[int] = None):
+        """
+        Record a sweep's (device_id, status, latency) results
+        version: the change version the sweep was saved under; when it directly follows
+        db_version nothing else was committed in between, so sync skips it rather than
+        reading this process's own write back
+        """
+        with self._lock:
+            if version is not None and version == self.db_version + 1:
+                self.db_version = version
+            for device_id, status, latency in status_updates:
+                device = self._devices.get(device_id)
+                if device is not None:
+                    device['status'] = status
+                    device['latency'] = latency
+                    device['lastChecked'] = timestamp
+            self._invalidate(reconfigured=False)
+
+    def apply_probe_stats(self, stats: Iterable[Tuple[str, Dict]]):
+        """Record the latest probe details (burst loss, min/avg/max, mdev, p95; HTTP / DNS codes) per device"""
+        with self._lock:
+            for device_id, values in stats:
+                device = self._devices.get(device_id)
+                if device is not None:
+                    device['probeStats'] = values
+            self._invalidate(reconfigured=False)
+
+    def apply_uptime(self, uptimes: Iterable[Tuple[str, float]]):
+        """Record computed (device_id, uptime %) values"""
+        with self._lock:
+            for device_id, uptime in uptimes:
+                device = self._devices.get(device_id)
+                if device is not None and device['uptime'] != uptime:
+                    device['uptime'] = uptime
+                    self._invalidate(reconfigured=False)
+
+
+# Process-wide registry shared by the monitor and routes
+registry = DeviceRegistry()
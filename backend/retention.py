@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+NetGuard retention
+Expires old alerts and fault logs in small batches, archives what it deletes
+to gzip-compressed NDJSON files and gives the freed pages back to the
+filesystem with incremental vacuum. Runs hourly as a maintenance job; run
+this file to do one pass by hand.
+
+Usage:
+    python backend/retention.py [--vacuum]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from database import (
+    ConnectionPool, add_retention_run, close_connections, delete_rows, get_expired_alerts,
+    get_expired_fault_logs, get_last_transition_ids, get_pool, init_db, rebuild_search_index,
+)
+from log import get_logger
+from sla import WINDOWS
+from timeseries import DAY, store as timeseries
+
+# How long rows are kept (days); 0 keeps them forever. Alerts expire once
+# resolved for this long, active alerts are never removed
+ALERT_RETENTION_DAYS = int(os.environ.get('NETGUARD_ALERT_RETENTION_DAYS', '180'))
+FAULT_LOG_RETENTION_DAYS = int(os.environ.get('NETGUARD_FAULT_LOG_RETENTION_DAYS', '90'))
+
+# Fault logs are the source of SLA outage history, so they outlive the longest SLA window
+MIN_FAULT_LOG_RETENTION = max(span for _, span in WINDOWS) + DAY
+
+# Where deleted rows are archived; empty disables archiving
+ARCHIVE_DIR = os.environ.get('NETGUARD_ARCHIVE_DIR', 'archive')
+
+# Rows deleted per transaction, and the pause between batches that lets other writers in (seconds)
+BATCH_SIZE = 2000
+BATCH_PAUSE = 0.05
+
+# Pages released per incremental vacuum step (each step is one short write)
+VACUUM_STEP_PAGES = 1000
+
+# Databases created before incremental vacuum was enabled are converted with a
+# full VACUUM when no larger than this; bigger files need `retention.py --vacuum`
+CONVERT_MAX_BYTES = 32 * 1024 * 1024
+
+# Retention run reports kept in the database
+RUNS_KEPT = 100
+
+log = get_logger('retention')
+
+
+def policy() -> Dict:
+    return {
+        'alertRetentionDays': ALERT_RETENTION_DAYS,
+        'faultLogRetentionDays': FAULT_LOG_RETENTION_DAYS,
+        'archiveDir': ARCHIVE_DIR or None,
+        'batchSize': BATCH_SIZE,
+    }
+
+
+def cutoffs(now: int) -> Dict[str, Optional[int]]:
+    """Per table, the timestamp (ms) before which rows expire, or None when retention is off"""
+    result: Dict[str, Optional[int]] = {'alerts': None, 'fault_logs': None}
+    if ALERT_RETENTION_DAYS > 0:
+        result['alerts'] = now - ALERT_RETENTION_DAYS * DAY
+    if FAULT_LOG_RETENTION_DAYS > 0:
+        result['fault_logs'] = now - max(FAULT_LOG_RETENTION_DAYS * DAY, MIN_FAULT_LOG_RETENTION)
+    return result
+
+
+class Archive:
+    """Gzip NDJSON file for one table's expired rows, created on the first write"""
+
+    def __init__(self, directory: str, table: str, started: datetime):
+        self.path = os.path.join(directory, f"{table}-{started.strftime('%Y%m%d-%H%M%S')}.ndjson.gz")
+        self._file: Optional[gzip.GzipFile] = None
+
+    def write(self, rows: List[Dict]):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._file = gzip.open(self.path, 'ab')
+        self._file.write(''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows).encode())
+        # Sync-flush before the rows are deleted, so a crash cannot lose archived data
+        self._file.flush()
+
+    def close(self) -> Optional[str]:
+        """Path of the archive written, or None if nothing was"""
+        if self._file is None:
+            return None
+        self._file.close()
+        return self.path
+
+
+def expire(table: str, fetch: Callable, cutoff: int, archive: Optional[Archive], keep=frozenset()) -> int:
+    """
+    Delete a table's expired rows BATCH_SIZE at a time; returns rows deleted
+    Each batch is read, archived, then deleted in its own short transaction,
+    so the write lock is never held for longer than one batch
+    """
+    deleted = 0
+    after = None
+    while True:
+        batch = fetch(cutoff, after, BATCH_SIZE)
+        if not batch:
+            return deleted
+        after = (batch[-1]['timestamp'], batch[-1]['id'])
+        rows = [row for row in batch if row['id'] not in keep]
+        if rows:
+            if archive is not None:
+                archive.write(rows)
+            deleted += delete_rows(table, [row['id'] for row in rows])
+        if len(batch) < BATCH_SIZE:
+            return deleted
+        time.sleep(BATCH_PAUSE)
+
+
+def page_stats(pool: ConnectionPool) -> Dict:
+    with pool.reader() as conn:
+        return {name: conn.execute(f'PRAGMA {name}').fetchone()[0]
+                for name in ('page_size', 'page_count', 'freelist_count', 'auto_vacuum')}
+
+
+def convert(pool: ConnectionPool):
+    """Switch a database to incremental vacuum; rewrites the whole file and blocks writers meanwhile"""
+    with pool.writer() as conn:
+        conn.executescript('PRAGMA auto_vacuum=INCREMENTAL; VACUUM;')
+        rebuild_search_index(conn)
+
+
+def reclaim(pool: ConnectionPool, name: str, force_convert: bool = False) -> Dict:
+    """Return free pages to the filesystem VACUUM_STEP_PAGES at a time; reports the space reclaimed"""
+    before = page_stats(pool)
+    size = before['page_size'] * before['page_count']
+    if before['auto_vacuum'] != 2:
+        if force_convert or size <= CONVERT_MAX_BYTES:
+            log.info('Converting to incremental vacuum', extra={'database': name, 'kb': size // 1024})
+            convert(pool)
+        else:
+            log.warning("Cannot release free pages; run 'retention.py --vacuum' during a quiet period",
+                        extra={'database': name, 'mb': size // (1024 * 1024)})
+    else:
+        free = before['freelist_count']
+        while free > 0:
+            with pool.writer() as conn:
+                # executescript steps the pragma to completion; execute() would free a single page
+                conn.executescript(f'PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});')
+                remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if remaining >= free:
+                break
+            free = remaining
+            time.sleep(BATCH_PAUSE)
+        with pool.writer() as conn:
+            # Lets the file shrink now rather than at the next automatic checkpoint
+            conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    after = page_stats(pool)
+    return {
+        'pagesBefore': before['page_count'],
+        'pagesAfter': after['page_count'],
+        'freePages': after['freelist_count'],
+        'reclaimedBytes': max(0, before['page_count'] - after['page_count']) * before['page_size'],
+    }
+
+
+def run(now: Optional[int] = None, force_convert: bool = False) -> Dict:
+    """One retention pass over both databases; returns (and records) its report"""
+    started = datetime.now()
+    now = now if now is not None else int(started.timestamp() * 1000)
+    report: Dict = {'tables': {}, 'databases': {}, 'error': None}
+
+    try:
+        limits = cutoffs(now)
+        tables = (('alerts', get_expired_alerts, frozenset()), ('fault_logs', get_expired_fault_logs, None))
+        for table, fetch, keep in tables:
+            cutoff = limits[table]
+            if cutoff is None:
+                continue
+            if keep is None:
+                # Each device's last transition before the cutoff tells the SLA its state at the cutoff
+                keep = frozenset(get_last_transition_ids(cutoff))
+            archive = Archive(ARCHIVE_DIR, table, started) if ARCHIVE_DIR else None
+            try:
+                deleted = expire(table, fetch, cutoff, archive, keep)
+            finally:
+                path = archive.close() if archive is not None else None
+            report['tables'][table] = {'cutoff': cutoff, 'deleted': deleted, 'archive': path}
+
+        report['databases']['main'] = reclaim(get_pool(), 'main', force_convert)
+        report['databases']['metrics'] = reclaim(timeseries.pool, 'metrics', force_convert)
+    except Exception as e:
+        report['error'] = str(e)
+        log.exception('Retention run failed')
+
+    finished = int(datetime.now().timestamp() * 1000)
+    try:
+        add_retention_run(int(started.timestamp() * 1000), finished, report, RUNS_KEPT)
+    except Exception as e:
+        log.error('Failed to record retention run', extra={'error': str(e)})
+
+    deleted = {table: result['deleted'] for table, result in report['tables'].items()}
+    reclaimed = sum(result['reclaimedBytes'] for result in report['databases'].values())
+    log.info('Retention run finished', extra={
+        'deleted': deleted, 'reclaimed_kb': reclaimed // 1024,
+        'seconds': round((finished - started.timestamp() * 1000) / 1000, 1),
+    })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vacuum', action='store_true',
+                        help='convert databases to incremental vacuum whatever their size (blocks writers while it runs)')
+    args = parser.parse_args()
+
+    init_db()
+    timeseries.open(writer=False)
+    try:
+        print(json.dumps(run(force_convert=args.vacuum), indent=2))
+    finally:
+        timeseries.close()
+        close_connections()
+
+
+if __name__ == '__main__':
+    main()
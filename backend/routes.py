@@ -1,44 +1,353 @@
-from flask import Blueprint, request, jsonify
+import ipaddress
+import json
+import time
+import zlib
+from urllib.parse import urlencode
+
+from flask import Blueprint, current_app, g, request, jsonify
+import bulk
+import discovery
+import retention
+import search
+from baseline import baselines
 from database import (
-    get_all_devices, add_device, delete_device, toggle_monitoring,
-    get_all_alerts, get_fault_logs
+    add_device, delete_device, toggle_monitoring, set_probe_interval, set_probe_settings, set_parent,
+    get_alerts_page, get_fault_logs_page, get_data_version, get_changes_since, iter_alerts, iter_fault_logs,
+    get_devices as get_filtered_devices, upsert_devices, delete_devices, set_monitoring,
+    create_discovery_job, get_discovery_job, get_discovery_jobs, cancel_discovery_job, get_retention_runs
+)
+from metrics import REQUEST_SECONDS
+from monitor import generate_id
+from serializers import (
+    alert_to_json, changes_to_json, device_to_json, discovery_job_to_json, fault_log_to_json, normalize_device,
+    retention_run_to_json
 )
+from probers import PROBERS
+from push import hub
+from registry import registry
+from sla import WINDOWS, tracker as sla_tracker
+from timeseries import store
 
 api = Blueprint('api', __name__)
 
+# Page size bounds for /alerts and /logs
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Accepted per-device probe intervals (seconds)
+MIN_PROBE_INTERVAL = 1
+MAX_PROBE_INTERVAL = 3600
+
+# Longest probeTarget (HTTP path / URL or DNS name) accepted
+MAX_PROBE_TARGET_LENGTH = 2048
+
+# Devices accepted by one /timeseries request
+MAX_SERIES_PER_QUERY = 100
+
+# Tag limits per device
+MAX_TAGS = 32
+MAX_TAG_LENGTH = 64
+
+# Rows read per query while streaming an alert / fault log export
+EXPORT_PAGE_SIZE = 1000
+
+# Rows written per transaction by /devices/import, and row errors listed in its response
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+
+def _page_args():
+    """Common keyset pagination and time-range arguments"""
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return {
+        'limit': max(1, min(limit, MAX_PAGE_SIZE)),
+        'cursor': request.args.get('cursor') or None,
+        'device_id': request.args.get('device') or None,
+        'since': request.args.get('since', type=int),
+        'until': request.args.get('until', type=int),
+    }
+
+def _paged_response(items, next_cursor):
+    """JSON array body; the next page is advertised in headers so existing clients keep working"""
+    response = jsonify(items)
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    return response
+
+def _probe_settings_error(data):
+    """Validation message for probeType / probePort / probeTarget, or None when they are valid"""
+    probe_type = data.get('probeType')
+    if probe_type is not None and probe_type not in PROBERS:
+        return f'probeType must be one of {", ".join(PROBERS)}'
+    port = data.get('probePort')
+    if port is not None and (not isinstance(port, int) or not 1 <= port <= 65535):
+        return 'probePort must be between 1 and 65535'
+    target = data.get('probeTarget')
+    if target is not None and (not isinstance(target, str) or len(target) > MAX_PROBE_TARGET_LENGTH):
+        return f'probeTarget must be a string of at most {MAX_PROBE_TARGET_LENGTH} characters'
+    return None
+
+def _interval_error(interval):
+    if interval is not None and (not isinstance(interval, int) or not MIN_PROBE_INTERVAL <= interval <= MAX_PROBE_INTERVAL):
+        return f'probeInterval must be between {MIN_PROBE_INTERVAL} and {MAX_PROBE_INTERVAL} seconds'
+    return None
+
+def _tags_error(tags):
+    if tags is None:
+        return None
+    if not isinstance(tags, list) or len(tags) > MAX_TAGS:
+        return f'tags must be a list of at most {MAX_TAGS} strings'
+    for tag in tags:
+        if not isinstance(tag, str) or not tag or len(tag) > MAX_TAG_LENGTH or bulk.TAG_SEPARATOR in tag:
+            return f'tags must be non-empty strings of at most {MAX_TAG_LENGTH} characters without "{bulk.TAG_SEPARATOR}"'
+    return None
+
+def _parent_error(device_id, parent_id, known=True):
+    """
+    Validation message for a parentId, or None when it is valid; with known=True the
+    parent must be a registered device and the link must not close a loop
+    """
+    if parent_id is None:
+        return None
+    if not isinstance(parent_id, str) or not parent_id:
+        return 'parentId must be a device id or null'
+    if parent_id == device_id:
+        return 'A device cannot be its own parent'
+    if known:
+        if registry.get(parent_id) is None:
+            return f'Parent device {parent_id} not found'
+        if device_id in registry.ancestors(parent_id):
+            return f'Device {device_id} is upstream of {parent_id}'
+    return None
+
+def _import_error(data):
+    """Validation message for one imported device, or None when it is valid"""
+    for field in ('id', 'name', 'ip', 'type'):
+        if not isinstance(data.get(field), str) or not data[field]:
+            return f'{field} is required'
+    if 'isMonitored' in data and not isinstance(data['isMonitored'], bool):
+        return 'isMonitored must be true or false'
+    # The parent may come later in the same upload, so only its shape is checked
+    return (_probe_settings_error(data) or _interval_error(data.get('probeInterval')) or _tags_error(data.get('tags'))
+            or _parent_error(data['id'], data.get('parentId'), known=False))
+
+def _device_filters():
+    """
+    Bulk operation filters from the query string: id (repeatable or comma separated),
+    type, subnet (CIDR) and tag; raises ValueError on a malformed subnet
+    """
+    filters = {
+        'type': request.args.get('type') or None,
+        'tag': request.args.get('tag') or None,
+    }
+    ids = [part for value in request.args.getlist('id') for part in value.split(',') if part]
+    if ids:
+        filters['ids'] = ids
+    subnet = request.args.get('subnet')
+    if subnet:
+        try:
+            filters['subnet'] = ipaddress.ip_network(subnet, strict=False)
+        except ValueError:
+            raise ValueError(f'Invalid subnet: {subnet}')
+    return filters
+
+def _bulk_filters():
+    """Filters for bulk writes, which must name at least one (or pass all=1 to match every device)"""
+    filters = _device_filters()
+    if not any(filters.values()) and request.args.get('all') != '1':
+        raise ValueError('At least one filter (id, type, subnet, tag) or all=1 is required')
+    return filters
+
+def _export_format():
+    """?format= of an export; raises ValueError when unsupported"""
+    fmt = request.args.get('format', 'json')
+    if fmt not in bulk.FORMATS:
+        raise ValueError(f'format must be one of {", ".join(bulk.FORMATS)}')
+    return fmt
+
+def _export_response(chunks, fmt, name):
+    """Streamed download; the body is produced chunk by chunk as the client reads it"""
+    response = current_app.response_class(chunks, mimetype=bulk.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+    return response
+
+@api.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+# Registered before publish_writes so it runs after it (after_request handlers run in reverse)
+@api.after_request
+def observe_latency(response):
+    """Request latency per route template (not per URL, which would be a series per device)"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(time.perf_counter() - started)
+    return response
+
+@api.after_request
+def publish_writes(response):
+    """Push successful writes to stream subscribers"""
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+        hub.publish_changes()
+    return response
+
+def _etag_for(name):
+    """
+    Weak validator built from the data version (and query string)
+    Returns (etag, not_modified) so unchanged polls can skip the query entirely
+    """
+    query = zlib.crc32(request.query_string)
+    etag = f'{name}-{get_data_version()}-{query:08x}'
+    return etag, request.if_none_match.contains(etag)
+
 @api.route('/devices', methods=['GET'])
 def get_devices():
-    """Get all devices"""
-    devices = get_all_devices()
-    
-    # Convert is_monitored from int to boolean
-    for device in devices:
-        device['isMonitored'] = bool(device.pop('is_monitored'))
-        device['lastChecked'] = device.pop('last_checked')
+    """Get all devices (served from the in-memory registry snapshot)"""
+    snapshot, etag = registry.snapshot()
+    if request.if_none_match.contains(etag):
+        return '', 304, {'ETag': f'"{etag}"'}
     
-    return jsonify(devices)
+    response = current_app.response_class(snapshot, mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 @api.route('/devices', methods=['POST'])
 def create_device():
     """Add a new device"""
     data = request.get_json()
     
-    if not data or 'id' not in data or 'name' not in data or 'ip' not in data:
+    if not data or 'id' not in data or 'name' not in data or 'ip' not in data or 'type' not in data:
         return jsonify({'error': 'Missing required fields'}), 400
     
-    success = add_device(data)
+    error = (_probe_settings_error(data) or _tags_error(data.get('tags'))
+             or _parent_error(data['id'], data.get('parentId')))
+    if error:
+        return jsonify({'error': error}), 400
+    
+    device = normalize_device(data)
+    success = add_device(device)
     
     if success:
+        registry.upsert(device)
         return jsonify({'message': 'Device added successfully'}), 201
     else:
         return jsonify({'error': 'Failed to add device'}), 500
 
+@api.route('/devices', methods=['DELETE'])
+def remove_devices():
+    """Delete every device matching the filters (id, type, subnet, tag) in one transaction"""
+    try:
+        filters = _bulk_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    deleted = delete_devices(filters)
+    
+    if deleted is not None:
+        registry.remove_many(deleted)
+        return jsonify({'deleted': len(deleted)})
+    else:
+        return jsonify({'error': 'Failed to delete devices'}), 500
+
+@api.route('/devices/monitoring', methods=['PATCH'])
+def set_devices_monitoring():
+    """
+    Enable or disable monitoring for every device matching the filters in one transaction
+    Body: {"isMonitored": true | false}; omit it to toggle each device
+    """
+    try:
+        filters = _bulk_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    monitored = (request.get_json(silent=True) or {}).get('isMonitored')
+    if monitored is not None and not isinstance(monitored, bool):
+        return jsonify({'error': 'isMonitored must be true or false'}), 400
+    
+    changed = set_monitoring(filters, monitored)
+    
+    if changed is not None:
+        registry.set_monitoring(changed)
+        return jsonify({'updated': len(changed)})
+    else:
+        return jsonify({'error': 'Failed to update monitoring'}), 500
+
+@api.route('/devices/import', methods=['POST'])
+def import_devices():
+    """
+    Create or update devices from a JSON array, NDJSON or CSV upload (?format= or Content-Type)
+    The body is read as a stream and written IMPORT_BATCH_SIZE rows per transaction.
+    Existing devices keep their status and any field a row leaves out; invalid rows are skipped and reported
+    """
+    fmt = bulk.upload_format(request.args.get('format'), request.mimetype)
+    if fmt is None:
+        return jsonify({'error': f'Upload must be one of {", ".join(bulk.FORMATS)}'}), 415
+    
+    summary = {'created': 0, 'updated': 0, 'failed': 0, 'errors': []}
+    
+    def reject(row, error):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'row': row, 'error': error})
+    
+    def commit(batch):
+        saved = upsert_devices(batch)
+        if saved is None:
+            return False
+        registry.upsert_many(device for device, _ in saved)
+        created = sum(1 for _, is_new in saved if is_new)
+        summary['created'] += created
+        summary['updated'] += len(saved) - created
+        return True
+    
+    batch = []
+    try:
+        for row, device, error in bulk.read_devices(request.stream, fmt):
+            error = error or _import_error(device)
+            if error:
+                reject(row, error)
+                continue
+            batch.append(device)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                if not commit(batch):
+                    return jsonify({'error': 'Failed to import devices', **summary}), 500
+                batch = []
+    except ValueError as e:
+        # Rows before the unreadable part are already saved
+        status = 400
+        if batch and not commit(batch):
+            status = 500
+        return jsonify({'error': str(e), **summary}), status
+    
+    if batch and not commit(batch):
+        return jsonify({'error': 'Failed to import devices', **summary}), 500
+    return jsonify(summary)
+
+@api.route('/devices/export', methods=['GET'])
+def export_devices():
+    """
+    Download devices as JSON, NDJSON or CSV (?format=, default json)
+    Query: the same id, type, subnet and tag filters as the bulk endpoints
+    """
+    try:
+        fmt = _export_format()
+        filters = _device_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    devices = (device_to_json(device) for device in get_filtered_devices(filters))
+    return _export_response(bulk.write_devices(devices, fmt), fmt, 'devices')
+
 @api.route('/devices/<device_id>', methods=['DELETE'])
 def remove_device(device_id):
     """Delete a device"""
     success = delete_device(device_id)
     
     if success:
+        registry.remove(device_id)
         return jsonify({'message': 'Device deleted successfully'})
     else:
         return jsonify({'error': 'Failed to delete device'}), 500
@@ -49,34 +358,373 @@ def toggle_device_monitoring(device_id):
     success = toggle_monitoring(device_id)
     
     if success:
+        registry.toggle_monitoring(device_id)
         return jsonify({'message': 'Monitoring toggled successfully'})
     else:
         return jsonify({'error': 'Failed to toggle monitoring'}), 500
 
+@api.route('/devices/<device_id>/interval', methods=['PATCH'])
+def update_probe_interval(device_id):
+    """Set a device's probe interval in seconds; null restores the default for its type"""
+    data = request.get_json()
+    
+    if not data or 'probeInterval' not in data:
+        return jsonify({'error': 'Missing required fields'}), 400
+    
+    interval = data['probeInterval']
+    error = _interval_error(interval)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    success = set_probe_interval(device_id, interval)
+    
+    if success:
+        registry.set_probe_interval(device_id, interval)
+        return jsonify({'message': 'Probe interval updated successfully'})
+    else:
+        return jsonify({'error': 'Failed to update probe interval'}), 500
+
+@api.route('/devices/<device_id>/parent', methods=['PATCH'])
+def update_parent(device_id):
+    """
+    Set the router / switch a device sits behind; null detaches it
+    While the parent is offline the device is probed only occasionally and its
+    outage is folded into the parent's alert
+    """
+    data = request.get_json()
+    
+    if not data or 'parentId' not in data:
+        return jsonify({'error': 'Missing required fields'}), 400
+    
+    parent_id = data['parentId'] or None
+    error = _parent_error(device_id, parent_id)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    success = set_parent(device_id, parent_id)
+    
+    if success:
+        registry.set_parent(device_id, parent_id)
+        return jsonify({'message': 'Parent updated successfully'})
+    else:
+        return jsonify({'error': 'Failed to update parent'}), 500
+
+@api.route('/devices/<device_id>/probe', methods=['PATCH'])
+def update_probe_settings(device_id):
+    """Set how a device is probed (probeType, plus optional probePort and probeTarget)"""
+    data = request.get_json()
+    
+    if not data or 'probeType' not in data:
+        return jsonify({'error': 'Missing required fields'}), 400
+    
+    error = _probe_settings_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    probe_type = data['probeType'] or 'icmp'
+    port = data.get('probePort')
+    target = data.get('probeTarget')
+    success = set_probe_settings(device_id, probe_type, port, target)
+    
+    if success:
+        registry.set_probe_settings(device_id, probe_type, port, target)
+        return jsonify({'message': 'Probe settings updated successfully'})
+    else:
+        return jsonify({'error': 'Failed to update probe settings'}), 500
+
 @api.route('/alerts', methods=['GET'])
 def get_alerts():
-    """Get all alerts"""
-    alerts = get_all_alerts()
+    """
+    Get alerts, newest first, one page at a time
+    Query: limit, cursor, status, type, device, since, until (ms timestamps)
+    """
+    etag, not_modified = _etag_for('alerts')
+    if not_modified:
+        return '', 304, {'ETag': f'"{etag}"'}
+    
+    try:
+        alerts, next_cursor = get_alerts_page(
+            status=request.args.get('status') or None,
+            alert_type=request.args.get('type') or None,
+            **_page_args()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Convert snake_case to camelCase for frontend
-    for alert in alerts:
-        alert['deviceId'] = alert.pop('device_id')
-        alert['deviceName'] = alert.pop('device_name')
-        alert['deviceIp'] = alert.pop('device_ip')
+    alerts = [alert_to_json(alert) for alert in alerts]
+    
+    response = _paged_response(alerts, next_cursor)
+    response.set_etag(etag)
+    return response
+
+@api.route('/incidents', methods=['GET'])
+def get_incidents():
+    """
+    Current outages grouped by root cause: every offline device that is not behind an
+    offline parent, with its active connectivity alert and the devices unreachable behind it
+    Largest outages first
+    """
+    alerts = {}
+    for alert in iter_alerts(status='active', alert_type='connectivity', page_size=EXPORT_PAGE_SIZE):
+        # Newest first, so the first alert seen per device is its current one
+        alerts.setdefault(alert['device_id'], alert)
+    
+    incidents = []
+    for root, affected in registry.incidents():
+        alert = alerts.get(root['id'])
+        incidents.append({
+            'deviceId': root['id'],
+            'deviceName': root['name'],
+            'deviceIp': root['ip'],
+            'alert': alert_to_json(alert) if alert else None,
+            'affected': [
+                {'id': device['id'], 'name': device['name'], 'ip': device['ip'], 'status': device['status']}
+                for device in affected
+            ],
+        })
+    incidents.sort(key=lambda incident: (-len(incident['affected']), incident['deviceName']))
+    return jsonify(incidents)
+
+@api.route('/alerts/export', methods=['GET'])
+def export_alerts():
+    """
+    Download every matching alert, newest first, as JSON, NDJSON or CSV (?format=, default json)
+    Query: status, type, device, since, until; rows are streamed, so exports of any size use constant memory
+    """
+    try:
+        fmt = _export_format()
+        args = _page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify(alerts)
+    alerts = iter_alerts(
+        status=request.args.get('status') or None,
+        alert_type=request.args.get('type') or None,
+        device_id=args['device_id'],
+        since=args['since'],
+        until=args['until'],
+        page_size=EXPORT_PAGE_SIZE
+    )
+    records = (alert_to_json(alert) for alert in alerts)
+    return _export_response(bulk.write_records(records, fmt, bulk.ALERT_CSV_FIELDS), fmt, 'alerts')
 
 @api.route('/logs', methods=['GET'])
 def get_logs():
-    """Get fault logs"""
-    limit = request.args.get('limit', 100, type=int)
-    logs = get_fault_logs(limit)
+    """
+    Get fault logs, newest first, one page at a time
+    Query: limit, cursor, type, device, since, until (ms timestamps)
+    """
+    try:
+        logs, next_cursor = get_fault_logs_page(
+            fault_type=request.args.get('type') or None,
+            **_page_args()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Convert snake_case to camelCase
-    for log in logs:
-        log['deviceId'] = log.pop('device_id')
-        log['deviceName'] = log.pop('device_name')
-        log['deviceIp'] = log.pop('device_ip')
-        log['faultType'] = log.pop('fault_type')
+    logs = [fault_log_to_json(log) for log in logs]
     
-    return jsonify(logs)
+    return _paged_response(logs, next_cursor)
+
+@api.route('/logs/export', methods=['GET'])
+def export_logs():
+    """
+    Download every matching fault log, newest first, as JSON, NDJSON or CSV (?format=, default json)
+    Query: type, device, since, until; rows are streamed, so exports of any size use constant memory
+    """
+    try:
+        fmt = _export_format()
+        args = _page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    logs = iter_fault_logs(
+        fault_type=request.args.get('type') or None,
+        device_id=args['device_id'],
+        since=args['since'],
+        until=args['until'],
+        page_size=EXPORT_PAGE_SIZE
+    )
+    records = (fault_log_to_json(log) for log in logs)
+    return _export_response(bulk.write_records(records, fmt, bulk.FAULT_LOG_CSV_FIELDS), fmt, 'logs')
+
+@api.route('/search', methods=['GET'])
+def search_history():
+    """
+    Ranked full-text search over alert messages, fault descriptions, device names and IPs
+    Query: q (words, "phrases", prefix*, -excluded), source (alerts / logs, repeatable or comma
+    separated; default both), type, device, since, until (ms timestamps), sort = relevance | newest,
+    limit, offset, facets (default true)
+    """
+    sources = [part for value in request.args.getlist('source') for part in value.split(',') if part]
+    limit = request.args.get('limit', search.DEFAULT_RESULTS, type=int)
+    try:
+        result = search.search(
+            request.args.get('q', ''),
+            sources=sources or tuple(search.SOURCES),
+            result_type=request.args.get('type') or None,
+            device_id=request.args.get('device') or None,
+            since=request.args.get('since', type=int),
+            until=request.args.get('until', type=int),
+            sort=request.args.get('sort', 'relevance'),
+            limit=max(1, min(limit, search.MAX_RESULTS)),
+            offset=max(0, request.args.get('offset', 0, type=int)),
+            facets=request.args.get('facets', 'true').lower() not in ('0', 'false', 'no'),
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(result)
+
+@api.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Devices and alerts changed since a data version
+    Without ?since= (or when too much changed) a full snapshot is returned with full=true
+    """
+    since = request.args.get('since', type=int)
+    
+    if since is not None:
+        changes = get_changes_since(since, MAX_PAGE_SIZE)
+        if not changes['truncated']:
+            return jsonify(changes_to_json(changes))
+    
+    # Devices come from the registry's pre-serialized snapshot. Its version is read first, so
+    # anything folded in after it (or committed but not yet synced) is resent next time
+    registry.ensure_loaded()
+    version = registry.db_version
+    devices, _ = registry.snapshot()
+    alerts, _ = get_alerts_page(limit=DEFAULT_PAGE_SIZE)
+    body = json.dumps({
+        'version': version,
+        'full': True,
+        'alerts': [alert_to_json(alert) for alert in alerts],
+        'removed': [],
+    }, separators=(',', ':')).encode()
+    return current_app.response_class(body[:-1] + b',"devices":' + devices + b'}', mimetype='application/json')
+
+@api.route('/timeseries', methods=['GET'])
+def get_timeseries():
+    """
+    Probe history for one or more devices
+    Query: device (repeatable or comma separated), from, to (ms timestamps),
+    resolution = raw | 1m | 1h | 1d | auto (default: finest that covers the range)
+    """
+    device_ids = [part for value in request.args.getlist('device') for part in value.split(',') if part]
+    if not device_ids:
+        return jsonify({'error': 'At least one device is required'}), 400
+    if len(device_ids) > MAX_SERIES_PER_QUERY:
+        return jsonify({'error': f'At most {MAX_SERIES_PER_QUERY} devices per request'}), 400
+    
+    end = request.args.get('to', int(time.time() * 1000), type=int)
+    start = request.args.get('from', end - 3600 * 1000, type=int)
+    if start >= end:
+        return jsonify({'error': 'from must be before to'}), 400
+    
+    try:
+        result = store.query(device_ids, start, end, request.args.get('resolution', 'auto'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    result.update({'from': start, 'to': end})
+    return jsonify(result)
+
+@api.route('/sla', methods=['GET'])
+def get_sla():
+    """
+    Rolling uptime and availability per device
+    Query: device (repeatable or comma separated; default all devices), window (repeatable; default all)
+    """
+    device_ids = [part for value in request.args.getlist('device') for part in value.split(',') if part]
+    if not device_ids:
+        device_ids = [device['id'] for device in registry.monitored_devices()]
+    
+    windows = request.args.getlist('window') or [name for name, _ in WINDOWS]
+    unknown = [name for name in windows if name not in dict(WINDOWS)]
+    if unknown:
+        return jsonify({'error': f'Unknown window: {unknown[0]}'}), 400
+    
+    now = int(time.time() * 1000)
+    return jsonify({
+        'generatedAt': now,
+        'devices': sla_tracker.compute(device_ids, now, windows),
+    })
+
+@api.route('/baselines', methods=['GET'])
+def get_baselines():
+    """
+    Learned latency baseline per device and the limits its latency is judged by
+    Query: device (repeatable or comma separated; default all devices)
+    """
+    device_ids = [part for value in request.args.getlist('device') for part in value.split(',') if part]
+    if not device_ids:
+        device_ids = [device['id'] for device in registry.monitored_devices()]
+    
+    return jsonify({
+        'generatedAt': int(time.time() * 1000),
+        'devices': baselines.describe(device_ids),
+    })
+
+@api.route('/discovery', methods=['POST'])
+def start_discovery():
+    """
+    Queue a job that probes every address of a CIDR range and registers the hosts that answer
+    Body: cidr (required), probeType / probePort / probeTarget (default icmp), rate (probes/s),
+    maxInFlight, deviceType, tags, isMonitored and resolveNames for the devices it creates
+    """
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        network = discovery.parse_range(data.get('cidr'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    error = _probe_settings_error(data) or _tags_error(data.get('tags'))
+    if error:
+        return jsonify({'error': error}), 400
+    rate = data.get('rate')
+    if rate is not None and (not isinstance(rate, int) or not 1 <= rate <= discovery.MAX_RATE):
+        return jsonify({'error': f'rate must be between 1 and {discovery.MAX_RATE} probes per second'}), 400
+    max_in_flight = data.get('maxInFlight')
+    if max_in_flight is not None and (not isinstance(max_in_flight, int) or not 1 <= max_in_flight <= discovery.MAX_IN_FLIGHT):
+        return jsonify({'error': f'maxInFlight must be between 1 and {discovery.MAX_IN_FLIGHT}'}), 400
+    for flag in ('isMonitored', 'resolveNames'):
+        if flag in data and not isinstance(data[flag], bool):
+            return jsonify({'error': f'{flag} must be true or false'}), 400
+    
+    job_id = generate_id()
+    create_discovery_job(job_id, str(network), discovery.default_options(data), discovery.host_count(network))
+    return jsonify(discovery_job_to_json(get_discovery_job(job_id))), 202
+
+@api.route('/discovery', methods=['GET'])
+def list_discovery_jobs():
+    """Recent discovery jobs, newest first"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), MAX_PAGE_SIZE))
+    return jsonify([discovery_job_to_json(job) for job in get_discovery_jobs(limit)])
+
+@api.route('/discovery/<job_id>', methods=['GET'])
+def get_discovery(job_id):
+    """Progress of one discovery job"""
+    job = get_discovery_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Discovery job not found'}), 404
+    return jsonify(discovery_job_to_json(job))
+
+@api.route('/discovery/<job_id>/cancel', methods=['POST'])
+def cancel_discovery(job_id):
+    """Stop a queued or running discovery job; hosts already found stay registered"""
+    status = cancel_discovery_job(job_id)
+    if status is None:
+        return jsonify({'error': 'Discovery job not found'}), 404
+    return jsonify(discovery_job_to_json(get_discovery_job(job_id))), 202
+
+@api.route('/retention', methods=['GET'])
+def get_retention():
+    """Retention policy and the reports of recent retention runs (rows deleted, archives, space reclaimed)"""
+    limit = max(1, min(request.args.get('limit', 20, type=int), retention.RUNS_KEPT))
+    return jsonify({
+        'policy': retention.policy(),
+        'runs': [retention_run_to_json(run) for run in get_retention_runs(limit)],
+    })
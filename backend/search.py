@@ -0,0 +1,155 @@
+import html
+import os
+import re
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+from database import search_table
+from serializers import alert_to_json, fault_log_to_json
+
+# Ranking and facets cover this many of the most recently written matches per source, so a query
+# for a word in every row costs the same on a million rows as on fifty thousand
+SEARCH_WINDOW = int(os.environ.get('NETGUARD_SEARCH_WINDOW', '5000'))
+
+# Matches are counted up to this many per source; beyond it the total is a lower bound
+SEARCH_COUNT_LIMIT = 100000
+
+# Results per request, and devices listed in the device facet
+DEFAULT_RESULTS = 50
+MAX_RESULTS = 200
+FACET_DEVICES = 20
+
+# API source name -> (table, row serializer)
+SOURCES = {
+    'alerts': ('alerts', alert_to_json),
+    'logs': ('fault_logs', fault_log_to_json),
+}
+
+SORTS = ('relevance', 'newest')
+
+DAY_SECONDS = 24 * 3600
+
+# A term: optional '-' (exclude), then a "quoted phrase" or a bare word (a trailing '*' makes it a prefix)
+_TERM = re.compile(r'(-?)(?:"([^"]*)"?|(\S+))')
+
+
+def match_expression(query: str) -> str:
+    """
+    FTS5 query for a search box string: every term must match, "quoted phrases"
+    match as written, `word*` matches a prefix and `-word` excludes rows containing it
+    Terms are passed as FTS5 strings, so operators and punctuation in them are literal
+    """
+    include: List[str] = []
+    exclude: List[str] = []
+    for negate, phrase, word in _TERM.findall(query):
+        text = phrase or word
+        prefix = not phrase and text.endswith('*')
+        text = text.rstrip('*')
+        if not re.search(r'\w', text):
+            # Nothing the tokenizer would index (an empty phrase never matches)
+            continue
+        term = '"' + text.replace('"', '""') + '"' + ('*' if prefix else '')
+        (exclude if negate else include).append(term)
+
+    if not include:
+        raise ValueError('Search for at least one word')
+    expression = ' AND '.join(include)
+    if exclude:
+        expression = f'({expression}) NOT ({" OR ".join(exclude)})'
+    return expression
+
+
+def _snippet(text: Optional[str]) -> Optional[str]:
+    """HTML-escaped snippet with the matched terms in <mark>"""
+    if text is None:
+        return None
+    return html.escape(text).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+
+def _day(number: int) -> str:
+    return datetime.fromtimestamp(number * DAY_SECONDS, timezone.utc).date().isoformat()
+
+
+def search(query: str, sources: Sequence[str] = tuple(SOURCES), result_type: Optional[str] = None,
+           device_id: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None,
+           sort: str = 'relevance', limit: int = DEFAULT_RESULTS, offset: int = 0, facets: bool = True) -> Dict:
+    """
+    Ranked full-text search over alerts and fault logs with facet counts by source,
+    type, device and (UTC) day; raises ValueError on a bad query or argument
+    """
+    started = time.perf_counter()
+    match = match_expression(query)
+    if sort not in SORTS:
+        raise ValueError(f'sort must be one of {", ".join(SORTS)}')
+    unknown = [source for source in sources if source not in SOURCES]
+    if unknown:
+        raise ValueError(f'Unknown source: {unknown[0]}')
+    if offset + limit > SEARCH_WINDOW:
+        raise ValueError(f'offset + limit must not exceed {SEARCH_WINDOW}')
+
+    found = {}
+    for source in sources:
+        table, _ = SOURCES[source]
+        found[source] = search_table(
+            table, match, result_type, device_id, since, until, window=SEARCH_WINDOW,
+            count_limit=SEARCH_COUNT_LIMIT, limit=offset + limit, newest=sort == 'newest', facets=facets
+        )
+
+    hits = [(source, row, rank, snippet) for source, result in found.items() for row, rank, snippet in result['rows']]
+    if sort == 'newest':
+        hits.sort(key=lambda hit: -hit[1]['timestamp'])
+    else:
+        # bm25: lower is a better match
+        hits.sort(key=lambda hit: hit[2])
+
+    results = []
+    for source, row, rank, snippet in hits[offset:offset + limit]:
+        results.append({
+            'source': source,
+            'score': round(-rank, 4),
+            'snippet': _snippet(snippet),
+            'item': SOURCES[source][1](row),
+        })
+
+    response = {
+        'query': query,
+        'sort': sort,
+        'total': sum(result['total'] for result in found.values()),
+        'totalExact': all(result['exact'] for result in found.values()),
+        # Relevance order and every facet cover the SEARCH_WINDOW most recently written matches of each source
+        'window': SEARCH_WINDOW,
+        'complete': all(result['complete'] for result in found.values()),
+        'results': results,
+    }
+    if facets:
+        response['facets'] = _facets(found)
+    response['tookMs'] = round((time.perf_counter() - started) * 1000, 2)
+    return response
+
+
+def _facets(found: Dict[str, Dict]) -> Dict:
+    types: Counter = Counter()
+    days: Counter = Counter()
+    devices: Counter = Counter()
+    names: Dict[str, str] = {}
+    sources = {}
+    for source, result in found.items():
+        # Counted over the same window as the other facets (the total is in 'total')
+        sources[source] = sum(group[-1] for group in result['facets'])
+        for result_type, device_id, device_name, day, count in result['facets']:
+            types[result_type] += count
+            days[day] += count
+            devices[device_id] += count
+            names.setdefault(device_id, device_name)
+
+    return {
+        'source': sources,
+        'type': dict(types.most_common()),
+        'device': [
+            {'deviceId': device_id, 'deviceName': names[device_id], 'count': count}
+            for device_id, count in devices.most_common(FACET_DEVICES)
+        ],
+        'day': {_day(day): days[day] for day in sorted(days, reverse=True)},
+    }
@@ -0,0 +1,104 @@
+import json
+from datetime import datetime
+from typing import Dict
+
+# Conversions from database rows (snake_case) to the frontend's types.ts shapes
+
+def normalize_device(data: Dict) -> Dict:
+    """Fill defaults for a Device posted by the frontend (id, name, ip and type required)"""
+    return {
+        'id': data['id'],
+        'name': data['name'],
+        'ip': data['ip'],
+        'type': data['type'],
+        'status': data.get('status', 'offline'),
+        'latency': data.get('latency', 0),
+        'lastChecked': data.get('lastChecked', int(datetime.now().timestamp() * 1000)),
+        'isMonitored': bool(data.get('isMonitored', True)),
+        'uptime': data.get('uptime', 0.0),
+        'probeInterval': data.get('probeInterval'),
+        'probeType': data.get('probeType') or 'icmp',
+        'probePort': data.get('probePort'),
+        'probeTarget': data.get('probeTarget'),
+        'tags': list(dict.fromkeys(data.get('tags') or [])),
+        'parentId': data.get('parentId') or None,
+    }
+
+def device_to_json(device: Dict) -> Dict:
+    """Convert a devices row to the frontend's Device shape"""
+    device.pop('version', None)
+    device['isMonitored'] = bool(device.pop('is_monitored'))
+    device['lastChecked'] = device.pop('last_checked')
+    device['probeInterval'] = device.pop('probe_interval', None)
+    device['probeType'] = device.pop('probe_type', None) or 'icmp'
+    device['probePort'] = device.pop('probe_port', None)
+    device['probeTarget'] = device.pop('probe_target', None)
+    tags = device.pop('tags', None)
+    device['tags'] = json.loads(tags) if tags else []
+    device['parentId'] = device.pop('parent_id', None)
+    return device
+
+def alert_to_json(alert: Dict) -> Dict:
+    """Convert an alerts row to the frontend's Alert shape"""
+    alert.pop('version', None)
+    alert['deviceId'] = alert.pop('device_id')
+    alert['deviceName'] = alert.pop('device_name')
+    alert['deviceIp'] = alert.pop('device_ip')
+    resolved_at = alert.pop('resolved_at', None)
+    if resolved_at is not None:
+        alert['resolvedAt'] = resolved_at
+    root_cause_id = alert.pop('root_cause_id', None)
+    if root_cause_id is not None:
+        alert['rootCauseId'] = root_cause_id
+    return alert
+
+def fault_log_to_json(log: Dict) -> Dict:
+    """Convert a fault_logs row to camelCase"""
+    log['deviceId'] = log.pop('device_id')
+    log['deviceName'] = log.pop('device_name')
+    log['deviceIp'] = log.pop('device_ip')
+    log['faultType'] = log.pop('fault_type')
+    return log
+
+def changes_to_json(changes: Dict) -> Dict:
+    """Convert a database.get_changes_since result to the /api/changes payload"""
+    return {
+        'version': changes['version'],
+        'full': False,
+        'devices': [device_to_json(device) for device in changes['devices']],
+        'alerts': [alert_to_json(alert) for alert in changes['alerts']],
+        'removed': changes['removed'],
+    }
+
+def discovery_job_to_json(job: Dict) -> Dict:
+    """Convert a discovery_jobs row to camelCase, with progress (%) and probe rate"""
+    done = job['probed'] + job['skipped']
+    end = job['finished_at'] or int(datetime.now().timestamp() * 1000)
+    elapsed = (end - job['started_at']) / 1000 if job['started_at'] else 0
+    return {
+        'id': job['id'],
+        'cidr': job['cidr'],
+        'status': job['status'],
+        'options': json.loads(job['options']),
+        'total': job['total'],
+        'probed': job['probed'],
+        'found': job['found'],
+        'added': job['added'],
+        'skipped': job['skipped'],
+        'progress': round(100.0 * done / job['total'], 1) if job['total'] else 100.0,
+        'probesPerSecond': round(job['probed'] / elapsed, 1) if elapsed else 0.0,
+        'cancelRequested': bool(job['cancel_requested']),
+        'error': job['error'],
+        'createdAt': job['created_at'],
+        'startedAt': job['started_at'],
+        'finishedAt': job['finished_at'],
+    }
+
+def retention_run_to_json(run: Dict) -> Dict:
+    """Convert a retention_runs row to camelCase, with its report inlined"""
+    return {
+        'id': run['id'],
+        'startedAt': run['started_at'],
+        'finishedAt': run['finished_at'],
+        **json.loads(run['report']),
+    }
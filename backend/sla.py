@@ -0,0 +1,285 @@
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from database import get_outage_events, save_uptimes
+from log import get_logger
+from push import hub
+from registry import registry
+from timeseries import DAY, HOUR, MINUTE, TimeSeriesStore
+
+# Rolling windows reported by /api/sla
+WINDOWS = (('1h', HOUR), ('24h', DAY), ('7d', 7 * DAY), ('30d', 30 * DAY))
+
+# Window whose probe uptime is written to devices.uptime
+DEVICE_UPTIME_WINDOW = '24h'
+
+# Outcomes that count as a lost probe
+LOST_STATUSES = ('offline',)
+
+# Window values reported for a device without probes or outages
+UNMEASURED = {'uptime': None, 'availability': None, 'probes': 0, 'lost': 0, 'downtimeSeconds': 0.0, 'outages': 0}
+
+log = get_logger('sla')
+
+
+def _to_list(values: np.ndarray) -> list:
+    """NaN becomes None so the result serializes as JSON null"""
+    return [None if value != value else value for value in values.tolist()]
+
+
+class CounterRing:
+    """
+    Probe and loss counters per device in fixed time slots (rows x slots)
+    Slots are reused once they fall out of the ring, so memory stays fixed
+    """
+
+    def __init__(self, slot_ms: int, slots: int):
+        self.slot_ms = slot_ms
+        self.slots = slots
+        self.total = np.zeros((0, slots), np.uint16)
+        self.lost = np.zeros((0, slots), np.uint16)
+        # Absolute slot number (timestamp // slot_ms) of the newest slot
+        self.head: Optional[int] = None
+
+    def resize(self, rows: int):
+        for name in ('total', 'lost'):
+            old = getattr(self, name)
+            new = np.zeros((rows, self.slots), np.uint16)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def advance(self, slot: int):
+        """Move the head to `slot`, clearing the slots it reuses"""
+        if self.head is None:
+            self.head = slot
+            return
+        if slot <= self.head:
+            return
+        stale = min(slot - self.head, self.slots)
+        columns = (self.head + 1 + np.arange(stale)) % self.slots
+        self.total[:, columns] = 0
+        self.lost[:, columns] = 0
+        self.head = slot
+
+    def add(self, timestamps: np.ndarray, rows: np.ndarray, counts: np.ndarray, lost: np.ndarray):
+        """Add counts at the given times; anything older than the ring is ignored"""
+        if not len(rows):
+            return
+        slots = timestamps // self.slot_ms
+        self.advance(int(slots.max()))
+        keep = self.head - slots < self.slots
+        columns = slots[keep] % self.slots
+        np.add.at(self.total, (rows[keep], columns), counts[keep].astype(np.uint16))
+        np.add.at(self.lost, (rows[keep], columns), lost[keep].astype(np.uint16))
+
+    def window(self, now: int, span: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Per-row (probes, lost) over the last `span` ms, including the current slot"""
+        self.advance(now // self.slot_ms)
+        count = min(max(span // self.slot_ms, 1), self.slots)
+        if count == self.slots:
+            return self.total.sum(axis=1, dtype=np.int64), self.lost.sum(axis=1, dtype=np.int64)
+        columns = (self.head - np.arange(count)) % self.slots
+        return (self.total[:, columns].sum(axis=1, dtype=np.int64),
+                self.lost[:, columns].sum(axis=1, dtype=np.int64))
+
+
+class SlaTracker:
+    """
+    Rolling uptime (share of probes answered) and availability (share of time
+    outside an outage) per device
+    Probe counts are kept per minute for the last hour and per hour for 30 days,
+    so every window is a NumPy sum over fixed arrays; outages come from the
+    connectivity transitions recorded in fault_logs
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: Dict[str, int] = {}
+        self._first_seen = np.zeros(0, np.int64)
+        self._minutes = CounterRing(MINUTE, 60)
+        self._hours = CounterRing(HOUR, 30 * 24)
+        # End of the minute rollups counted so far by follow()
+        self._followed: Optional[int] = None
+
+    def _row_indexes(self, device_ids: Iterable[str]) -> np.ndarray:
+        indexes = []
+        for device_id in device_ids:
+            row = self._rows.get(device_id)
+            if row is None:
+                row = self._rows[device_id] = len(self._rows)
+            indexes.append(row)
+
+        if len(self._rows) > len(self._first_seen):
+            capacity = max(len(self._rows), 2 * len(self._first_seen), 64)
+            first_seen = np.zeros(capacity, np.int64)
+            first_seen[:len(self._first_seen)] = self._first_seen
+            self._first_seen = first_seen
+            self._minutes.resize(capacity)
+            self._hours.resize(capacity)
+        return np.array(indexes, np.int64)
+
+    def _add(self, ring: CounterRing, device_ids: List[str], timestamps: np.ndarray,
+             counts: np.ndarray, lost: np.ndarray):
+        rows = self._row_indexes(device_ids)
+        ring.add(timestamps, rows, counts, lost)
+        seen = self._first_seen[rows]
+        self._first_seen[rows] = np.where((seen == 0) | (seen > timestamps), timestamps, seen)
+
+    def record(self, timestamp: int, outcomes: Iterable[Tuple[str, str]]):
+        """Count one sweep's (device_id, status) results"""
+        outcomes = list(outcomes)
+        if not outcomes:
+            return
+        device_ids = [device_id for device_id, _ in outcomes]
+        lost = np.array([status in LOST_STATUSES for _, status in outcomes], np.int64)
+        timestamps = np.full(len(outcomes), timestamp, np.int64)
+        ones = np.ones(len(outcomes), np.int64)
+        with self._lock:
+            self._add(self._minutes, device_ids, timestamps, ones, lost)
+            self._add(self._hours, device_ids, timestamps, ones, lost)
+
+    def load(self, store: TimeSeriesStore, now: Optional[int] = None):
+        """Rebuild the counters from stored rollups (used at startup)"""
+        now = now if now is not None else int(datetime.now().timestamp() * 1000)
+        for ring, resolution in ((self._minutes, '1m'), (self._hours, '1h')):
+            self._add_rows(ring, store.rollup_counts(resolution, now - ring.slots * ring.slot_ms))
+
+    def follow(self, store: TimeSeriesStore, now: Optional[int] = None):
+        """
+        Count minute rollups finished since the last call, for API processes
+        that do not probe (a separate probe service writes the rollups)
+        The first call also loads the hourly history, like load()
+        """
+        now = now if now is not None else int(datetime.now().timestamp() * 1000)
+        # The writer flushes once a minute, so a minute bucket is final a minute after it ends
+        until = now - now % MINUTE - MINUTE
+        hour = until - until % HOUR
+        first = self._followed is None
+        if first:
+            rows = store.rollup_counts('1h', now - self._hours.slots * HOUR, hour)
+            self._add_rows(self._hours, rows)
+            since = min(hour, now - self._minutes.slots * MINUTE)
+        else:
+            since = self._followed
+        if until <= since:
+            return
+
+        rows = store.rollup_counts('1m', since, until)
+        self._add_rows(self._minutes, rows)
+        # On the first call, hours before `hour` came from the hourly rollups above
+        self._add_rows(self._hours, [row for row in rows if row[1] >= hour] if first else rows)
+        self._followed = until
+
+    def _add_rows(self, ring: CounterRing, rows: List[Tuple[str, int, int, int]]):
+        if not rows:
+            return
+        device_ids, buckets, counts, lost = zip(*rows)
+        with self._lock:
+            self._add(ring, list(device_ids), np.array(buckets, np.int64),
+                      np.array(counts, np.int64), np.array(lost, np.int64))
+
+    def _outages(self, events: List[Tuple[str, str, int]], now: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Outage intervals as (rows, starts, ends); an outage still open ends at `now`"""
+        open_since: Dict[str, int] = {}
+        device_ids, starts, ends = [], [], []
+        for device_id, fault_type, timestamp in events:
+            if fault_type == 'connectivity':
+                open_since.setdefault(device_id, timestamp)
+            elif device_id in open_since:
+                device_ids.append(device_id)
+                starts.append(open_since.pop(device_id))
+                ends.append(timestamp)
+        for device_id, start in open_since.items():
+            device_ids.append(device_id)
+            starts.append(start)
+            ends.append(now)
+        return self._row_indexes(device_ids), np.array(starts, np.int64), np.array(ends, np.int64)
+
+    def compute(self, device_ids: Optional[List[str]] = None, now: Optional[int] = None,
+                windows: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """
+        {device_id: {window: {uptime, availability, probes, lost, downtimeSeconds, outages}}}
+        uptime / availability are percentages, or None when nothing was measured
+        (including devices the tracker has never seen)
+        """
+        now = now if now is not None else int(datetime.now().timestamp() * 1000)
+        selected = [(name, span) for name, span in WINDOWS if windows is None or name in windows]
+        events = get_outage_events(now - max(span for _, span in selected))
+
+        with self._lock:
+            outage_rows, starts, ends = self._outages(events, now)
+            if device_ids is None:
+                device_ids = list(self._rows)
+            # Look up only: ids come from the query string and must not grow the counters
+            known = [device_id for device_id in device_ids if device_id in self._rows]
+            rows = np.array([self._rows[device_id] for device_id in known], np.int64)
+            size = len(self._first_seen)
+            first_seen = self._first_seen[rows]
+
+            columns = {}
+            for name, span in selected:
+                ring = self._minutes if span <= HOUR else self._hours
+                probes, lost = ring.window(now, span)
+
+                # Devices first seen inside the window are measured from then on
+                low = np.maximum(self._first_seen, now - span)
+                overlap = np.clip(ends, low[outage_rows], now) - np.clip(starts, low[outage_rows], now)
+                downtime = np.bincount(outage_rows, weights=overlap, minlength=size)
+                outages = np.bincount(outage_rows, weights=overlap > 0, minlength=size)
+
+                measured = (now - low[rows]).astype(np.float64)
+                probes, lost, downtime, outages = probes[rows], lost[rows], downtime[rows], outages[rows]
+
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    uptime = np.where(probes > 0, 100.0 * (probes - lost) / probes, np.nan)
+                    availability = np.where(measured > 0, 100.0 * (1 - downtime / measured), np.nan)
+                availability = np.clip(availability, 0.0, 100.0)
+                availability[(first_seen == 0) & (downtime == 0)] = np.nan
+
+                # Plain Python lists: building the response from NumPy scalars is far slower
+                columns[name] = (
+                    _to_list(uptime.round(3)),
+                    _to_list(availability.round(3)),
+                    probes.tolist(),
+                    lost.tolist(),
+                    (downtime / 1000).round(1).tolist(),
+                    outages.astype(np.int64).tolist(),
+                )
+
+        result = {device_id: {name: dict(UNMEASURED) for name, _ in selected} for device_id in device_ids}
+        for name, (uptime, availability, probes, lost, downtime, outages) in columns.items():
+            for i, device_id in enumerate(known):
+                result[device_id][name] = {
+                    'uptime': uptime[i],
+                    'availability': availability[i],
+                    'probes': probes[i],
+                    'lost': lost[i],
+                    'downtimeSeconds': downtime[i],
+                    'outages': outages[i],
+                }
+        return result
+
+
+# Process-wide tracker fed by the monitor
+tracker = SlaTracker()
+
+
+def refresh_device_uptime():
+    """Write each device's rolling uptime to devices.uptime (run periodically)"""
+    try:
+        device_ids = [device['id'] for device in registry.monitored_devices()]
+        sla = tracker.compute(device_ids, windows=[DEVICE_UPTIME_WINDOW])
+        uptimes = [
+            (device_id, round(windows[DEVICE_UPTIME_WINDOW]['uptime'], 2))
+            for device_id, windows in sla.items()
+            if windows[DEVICE_UPTIME_WINDOW]['uptime'] is not None
+        ]
+        if uptimes:
+            save_uptimes(uptimes)
+            registry.apply_uptime(uptimes)
+            hub.publish_changes()
+    except Exception as e:
+        log.error('Uptime refresh failed', extra={'error': str(e)})
@@ -0,0 +1,382 @@
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from database import ConnectionPool
+
+# Probe history lives in its own SQLite file so the sample stream never
+# contends with the devices/alerts tables
+METRICS_DB_PATH = os.environ.get('NETGUARD_METRICS_DB', 'netguard_metrics.db')
+
+MINUTE = 60_000
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Rollup levels, finest first; each level is built from the closed buckets of the one before
+LEVELS = (('1m', MINUTE), ('1h', HOUR), ('1d', DAY))
+RESOLUTIONS = {name: size for name, size in LEVELS}
+
+# How long each resolution is kept (hours). At 10k devices probed every 5 s the
+# defaults need roughly 0.2 GB raw + 0.2 GB 1m + 0.4 GB 1h + 0.2 GB 1d on disk
+RETENTION = {
+    'raw': int(os.environ.get('NETGUARD_TS_RAW_HOURS', '1')) * HOUR,
+    '1m': int(os.environ.get('NETGUARD_TS_1M_HOURS', '6')) * HOUR,
+    '1h': int(os.environ.get('NETGUARD_TS_1H_HOURS', str(35 * 24))) * HOUR,
+    '1d': int(os.environ.get('NETGUARD_TS_1D_HOURS', str(400 * 24))) * HOUR,
+}
+
+STATUS_CODES = {'online': 0, 'slow': 1, 'offline': 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+LOST = STATUS_CODES['offline']
+
+# Upper bound on points returned per device by a range query
+MAX_POINTS = 5000
+
+SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS series (
+        id INTEGER PRIMARY KEY,
+        device_id TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS samples (
+        series_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        status INTEGER NOT NULL,
+        rtt REAL,
+        PRIMARY KEY (series_id, ts)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS rollups (
+        series_id INTEGER NOT NULL,
+        resolution INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        lost INTEGER NOT NULL,
+        rtt_min REAL,
+        rtt_avg REAL,
+        rtt_max REAL,
+        rtt_p95 REAL,
+        PRIMARY KEY (series_id, resolution, bucket)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS baselines (
+        series_id INTEGER PRIMARY KEY,
+        mean REAL NOT NULL,
+        variance REAL NOT NULL,
+        samples INTEGER NOT NULL
+    )
+    ''',
+)
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Bucket:
+    """
+    Running aggregate for one device and one time bucket
+    Raw samples keep their RTTs for an exact p95; coarser buckets keep the
+    p95 of each child bucket and report the p95 of those
+    """
+
+    __slots__ = ('start', 'count', 'lost', 'rtt_min', 'rtt_max', 'rtt_total', 'values')
+
+    def __init__(self, start: int):
+        self.start = start
+        self.count = 0
+        self.lost = 0
+        self.rtt_min: Optional[float] = None
+        self.rtt_max: Optional[float] = None
+        self.rtt_total = 0.0
+        self.values: List[float] = []
+
+    def add_sample(self, rtt: Optional[float]):
+        self.count += 1
+        if rtt is None:
+            self.lost += 1
+            return
+        self.rtt_total += rtt
+        self.values.append(rtt)
+        self.rtt_min = rtt if self.rtt_min is None else min(self.rtt_min, rtt)
+        self.rtt_max = rtt if self.rtt_max is None else max(self.rtt_max, rtt)
+
+    def add_summary(self, count: int, lost: int, rtt_min, rtt_avg, rtt_max, rtt_p95):
+        self.count += count
+        self.lost += lost
+        if rtt_avg is None:
+            return
+        self.rtt_total += rtt_avg * (count - lost)
+        self.values.append(rtt_p95)
+        self.rtt_min = rtt_min if self.rtt_min is None else min(self.rtt_min, rtt_min)
+        self.rtt_max = rtt_max if self.rtt_max is None else max(self.rtt_max, rtt_max)
+
+    def summary(self) -> Tuple[int, int, Optional[float], Optional[float], Optional[float], Optional[float]]:
+        """(count, lost, min, avg, max, p95)"""
+        answered = self.count - self.lost
+        avg = self.rtt_total / answered if answered else None
+        return self.count, self.lost, self.rtt_min, avg, self.rtt_max, percentile(self.values, 0.95)
+
+
+class TimeSeriesStore:
+    """
+    Probe history: raw samples plus 1 minute / 1 hour / 1 day rollups
+    Rollups are aggregated in memory as samples arrive, so building them never
+    rescans raw data; retention pruning deletes per-series key ranges
+    """
+
+    def __init__(self, path: str = METRICS_DB_PATH):
+        self.path = path
+        self._pool: Optional[ConnectionPool] = None
+        self._lock = threading.RLock()
+        self._series: Dict[str, int] = {}
+        # Open (not yet finished) bucket per level per series
+        self._open: List[Dict[int, Bucket]] = [{} for _ in LEVELS]
+
+    @property
+    def pool(self) -> ConnectionPool:
+        if self._pool is None:
+            self.open()
+        return self._pool
+
+    def open(self, writer: bool = True):
+        """
+        Create the schema and restore series ids and open buckets
+        Processes that only query (writer=False) skip the open buckets, so
+        flush() never overwrites the writing process's partial rollups
+        """
+        with self._lock:
+            if self._pool is not None:
+                return
+            pool = ConnectionPool(self.path)
+            with pool.writer() as conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            with pool.reader() as conn:
+                self._series = {device_id: series_id for series_id, device_id in
+                                conn.execute('SELECT id, device_id FROM series')}
+            self._pool = pool
+            if writer:
+                self._recover(int(datetime.now().timestamp() * 1000))
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self.flush()
+                self._pool.close()
+                self._pool = None
+
+    def _recover(self, now: int):
+        """
+        Restore the current buckets so a restart does not drop them
+        The 1 minute bucket is rebuilt from its raw samples (its p95 is over RTTs);
+        coarser ones from their saved partial rows, whose p95 is one more child p95
+        """
+        with self.pool.reader() as conn:
+            start = now - now % LEVELS[0][1]
+            for series_id in self._series.values():
+                rows = conn.execute(
+                    'SELECT rtt FROM samples WHERE series_id = ? AND ts >= ?', (series_id, start)
+                ).fetchall()
+                if rows:
+                    bucket = self._open[0][series_id] = Bucket(start)
+                    for rtt, in rows:
+                        bucket.add_sample(rtt)
+
+            for level, (_, size) in enumerate(LEVELS[1:], start=1):
+                start = now - now % size
+                for series_id in self._series.values():
+                    row = conn.execute('''
+                        SELECT count, lost, rtt_min, rtt_avg, rtt_max, rtt_p95 FROM rollups
+                        WHERE series_id = ? AND resolution = ? AND bucket = ?
+                    ''', (series_id, size, start)).fetchone()
+                    if row:
+                        bucket = Bucket(start)
+                        bucket.add_summary(*row)
+                        self._open[level][series_id] = bucket
+
+    def _series_id(self, conn, device_id: str) -> int:
+        series_id = self._series.get(device_id)
+        if series_id is None:
+            conn.execute('INSERT OR IGNORE INTO series (device_id) VALUES (?)', (device_id,))
+            series_id = conn.execute('SELECT id FROM series WHERE device_id = ?', (device_id,)).fetchone()[0]
+            self._series[device_id] = series_id
+        return series_id
+
+    def _feed(self, level: int, series_id: int, ts: int, finished: list,
+              rtt: Optional[float] = None, summary: Optional[tuple] = None):
+        size = LEVELS[level][1]
+        start = ts - ts % size
+        bucket = self._open[level].get(series_id)
+
+        if bucket is not None and bucket.start != start:
+            self._finish(level, series_id, bucket, finished)
+            bucket = None
+        if bucket is None:
+            bucket = self._open[level][series_id] = Bucket(start)
+
+        if summary is None:
+            bucket.add_sample(rtt)
+        else:
+            bucket.add_summary(*summary)
+
+    def _finish(self, level: int, series_id: int, bucket: Bucket, finished: list):
+        summary = bucket.summary()
+        finished.append((series_id, LEVELS[level][1], bucket.start) + summary)
+        if level + 1 < len(LEVELS):
+            self._feed(level + 1, series_id, bucket.start, finished, summary=summary)
+
+    def append(self, samples: Iterable[Tuple[str, int, str, Optional[float]]]):
+        """
+        Record a batch of probe results in one transaction
+        samples: (device_id, timestamp ms, status, rtt ms or None when lost)
+        """
+        with self._lock, self.pool.writer() as conn:
+            rows = []
+            finished: list = []
+            for device_id, ts, status, rtt in samples:
+                code = STATUS_CODES.get(status, LOST)
+                if code == LOST:
+                    rtt = None
+                series_id = self._series_id(conn, device_id)
+                rows.append((series_id, ts, code, rtt))
+                self._feed(0, series_id, ts, finished, rtt=rtt)
+
+            conn.executemany('INSERT OR REPLACE INTO samples (series_id, ts, status, rtt) VALUES (?, ?, ?, ?)', rows)
+            self._write_rollups(conn, finished)
+
+    def _write_rollups(self, conn, rows: list):
+        conn.executemany('''
+            INSERT OR REPLACE INTO rollups (series_id, resolution, bucket, count, lost, rtt_min, rtt_avg, rtt_max, rtt_p95)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+
+    def flush(self, now: Optional[int] = None):
+        """
+        Close buckets whose time has passed and save partial rows for the rest
+        Run periodically so devices that stopped reporting still get their last bucket
+        """
+        now = now if now is not None else int(datetime.now().timestamp() * 1000)
+        with self._lock, self.pool.writer() as conn:
+            finished: list = []
+            for level, (_, size) in enumerate(LEVELS):
+                for series_id, bucket in list(self._open[level].items()):
+                    if bucket.start + size <= now:
+                        del self._open[level][series_id]
+                        self._finish(level, series_id, bucket, finished)
+            partial = [(series_id, LEVELS[level][1], bucket.start) + bucket.summary()
+                       for level in range(len(LEVELS))
+                       for series_id, bucket in self._open[level].items()]
+            self._write_rollups(conn, finished + partial)
+
+    def prune(self, now: Optional[int] = None) -> int:
+        """Delete data older than each resolution's retention; returns rows removed"""
+        now = now if now is not None else int(datetime.now().timestamp() * 1000)
+        series_ids = list(self._series.values())
+        removed = 0
+
+        with self.pool.writer() as conn:
+            before = conn.total_changes
+            conn.executemany('DELETE FROM samples WHERE series_id = ? AND ts < ?',
+                             [(series_id, now - RETENTION['raw']) for series_id in series_ids])
+            for name, size in LEVELS:
+                conn.executemany('DELETE FROM rollups WHERE series_id = ? AND resolution = ? AND bucket < ?',
+                                 [(series_id, size, now - RETENTION[name]) for series_id in series_ids])
+            removed = conn.total_changes - before
+
+        return removed
+
+    def rollup_counts(self, resolution: str, since: int, until: Optional[int] = None) -> List[Tuple[str, int, int, int]]:
+        """(device_id, bucket, count, lost) for every rollup row in [since, until); a full scan, meant for startup"""
+        until = until if until is not None else 2 ** 62
+        with self.pool.reader() as conn:
+            return [tuple(row) for row in conn.execute('''
+                SELECT s.device_id, r.bucket, r.count, r.lost FROM rollups r
+                JOIN series s ON s.id = r.series_id
+                WHERE r.resolution = ? AND r.bucket >= ? AND r.bucket < ?
+            ''', (RESOLUTIONS[resolution], since, until))]
+
+    def save_baselines(self, rows: Iterable[Tuple[str, float, float, int]]):
+        """Replace every stored latency baseline with rows of (device_id, mean, variance, samples)"""
+        with self._lock, self.pool.writer() as conn:
+            values = [(self._series_id(conn, device_id), mean, variance, samples)
+                      for device_id, mean, variance, samples in rows]
+            conn.execute('DELETE FROM baselines')
+            conn.executemany('INSERT INTO baselines (series_id, mean, variance, samples) VALUES (?, ?, ?, ?)', values)
+
+    def load_baselines(self) -> List[Tuple[str, float, float, int]]:
+        """(device_id, mean, variance, samples) for every stored latency baseline"""
+        with self.pool.reader() as conn:
+            return [tuple(row) for row in conn.execute('''
+                SELECT s.device_id, b.mean, b.variance, b.samples FROM baselines b
+                JOIN series s ON s.id = b.series_id
+            ''')]
+
+    def pick_resolution(self, start: int, end: int, now: Optional[int] = None) -> str:
+        """Finest resolution that still holds data back to `start` and fits MAX_POINTS"""
+        now = now if now is not None else int(datetime.now().timestamp() * 1000)
+        candidates = [('raw', 5000)] + list(LEVELS)
+        for name, size in candidates:
+            if now - RETENTION[name] <= start and (end - start) / size <= MAX_POINTS:
+                return name
+        return LEVELS[-1][0]
+
+    def query(self, device_ids: List[str], start: int, end: int, resolution: str = 'auto') -> Dict:
+        """Range query over one or many devices; returns {resolution, series: {device_id: [points]}}"""
+        if resolution == 'auto':
+            resolution = self.pick_resolution(start, end)
+        if resolution != 'raw' and resolution not in RESOLUTIONS:
+            raise ValueError(f'Unknown resolution: {resolution}')
+
+        series = {}
+        with self.pool.reader() as conn:
+            for device_id in device_ids:
+                series_id = self._series.get(device_id)
+                if series_id is None:
+                    # The series may have been created by another process (a separate probe service)
+                    row = conn.execute('SELECT id FROM series WHERE device_id = ?', (device_id,)).fetchone()
+                    if row is None:
+                        series[device_id] = []
+                        continue
+                    series_id = self._series[device_id] = row[0]
+
+                if resolution == 'raw':
+                    rows = conn.execute('''
+                        SELECT ts, status, rtt FROM samples
+                        WHERE series_id = ? AND ts >= ? AND ts < ?
+                        ORDER BY ts LIMIT ?
+                    ''', (series_id, start, end, MAX_POINTS)).fetchall()
+                    series[device_id] = [
+                        {'t': ts, 'status': STATUS_NAMES[status], 'rtt': rtt} for ts, status, rtt in rows
+                    ]
+                else:
+                    rows = conn.execute('''
+                        SELECT bucket, count, lost, rtt_min, rtt_avg, rtt_max, rtt_p95 FROM rollups
+                        WHERE series_id = ? AND resolution = ? AND bucket >= ? AND bucket < ?
+                        ORDER BY bucket LIMIT ?
+                    ''', (series_id, RESOLUTIONS[resolution], start, end, MAX_POINTS)).fetchall()
+                    series[device_id] = [{
+                        't': bucket,
+                        'count': count,
+                        'lossPct': round(100.0 * lost / count, 2) if count else 0.0,
+                        'min': rtt_min,
+                        'avg': rtt_avg,
+                        'max': rtt_max,
+                        'p95': rtt_p95,
+                    } for bucket, count, lost, rtt_min, rtt_avg, rtt_max, rtt_p95 in rows]
+
+        return {'resolution': resolution, 'series': series}
+
+
+# Process-wide store written by the monitor and read by the API
+store = TimeSeriesStore()
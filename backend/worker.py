@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+NetGuard probe worker
+Probes the shard of devices a coordinator assigns to it and streams the
+results back; run one or more next to an API started with NETGUARD_PROBE_MODE=cluster
+
+Usage:
+    python backend/worker.py [--id NAME] [--coordinator HOST:PORT] [--max-in-flight N]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from cluster import CLUSTER_PORT, HEARTBEAT_INTERVAL, MAX_MESSAGE_BYTES, encode_message, read_message
+from baseline import baselines
+from device_state import Verdict
+from log import get_logger
+from metrics import METRICS_PORT, serve as serve_metrics
+from probe_engine import Probe, raise_fd_limit
+from probe_scheduler import ProbeScheduler
+
+# Coordinator address used when --coordinator is not given
+COORDINATOR = os.environ.get('NETGUARD_COORDINATOR', f'127.0.0.1:{CLUSTER_PORT}')
+
+# Wait between attempts to reach the coordinator (seconds)
+RECONNECT_DELAY = 2.0
+
+# Longest a result batch waits to be written to the coordinator before it is dropped (seconds)
+SEND_TIMEOUT = 10.0
+
+log = get_logger('worker')
+
+
+class Assignment:
+    """
+    The devices the coordinator gave this worker, read by ProbeScheduler in
+    place of the registry, plus the topology of the whole fleet: parents may
+    sit on other workers, so which devices are unreachable comes from the
+    coordinator
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._devices: Dict[str, Dict] = {}
+        # device id -> parent id, and device id -> root cause id for devices behind an offline parent
+        self._parents: Dict[str, str] = {}
+        self._unreachable: Dict[str, str] = {}
+        self._children: Optional[Dict[str, List[str]]] = None
+        self.revision = 0
+
+    def replace(self, devices: List[Dict]):
+        with self._lock:
+            self._devices = {device['id']: device for device in devices}
+            self.revision += 1
+
+    def monitored_devices(self) -> List[Dict]:
+        with self._lock:
+            return [dict(device) for device in self._devices.values() if device['isMonitored']]
+
+    def get(self, device_id: str) -> Optional[Dict]:
+        with self._lock:
+            device = self._devices.get(device_id)
+            return dict(device) if device is not None else None
+
+    def set_topology(self, parents: Dict[str, str], unreachable: Dict[str, str]):
+        with self._lock:
+            self._parents = parents
+            self._unreachable = unreachable
+            self._children = None
+
+    def root_cause(self, device_id: str) -> Optional[Dict]:
+        """The offline device this one is unreachable behind (only its id is known here), or None"""
+        with self._lock:
+            root_id = self._unreachable.get(device_id)
+            return {'id': root_id} if root_id is not None else None
+
+    def descendants(self, device_id: str) -> List[str]:
+        """Ids of every device downstream of this one, including those on other workers"""
+        with self._lock:
+            if self._children is None:
+                self._children = {}
+                for child_id, parent_id in self._parents.items():
+                    self._children.setdefault(parent_id, []).append(child_id)
+            found: List[str] = []
+            seen = {device_id}
+            stack = list(self._children.get(device_id, ()))
+            while stack:
+                child_id = stack.pop()
+                if child_id in seen:
+                    continue
+                seen.add(child_id)
+                found.append(child_id)
+                stack.extend(self._children.get(child_id, ()))
+            return found
+
+    def sync(self):
+        """Assignments are pushed by the coordinator; nothing to pull"""
+
+
+class Worker:
+    """Connection to the coordinator plus a ProbeScheduler over the assigned shard"""
+
+    def __init__(self, worker_id: str, host: str, port: int, probe: Optional[Probe] = None,
+                 max_in_flight: Optional[int] = None):
+        self.worker_id = worker_id
+        self.host = host
+        self.port = port
+        self.assignment = Assignment()
+        self.scheduler = ProbeScheduler(probe, max_in_flight, source=self.assignment, sink=self._send_results)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def _send_results(self, results: List[Tuple[Dict, Dict, Verdict]]):
+        """
+        Scheduler sink (runs on an executor thread): forward a batch to the coordinator
+        The coordinator learns latency baselines from the same results; this worker keeps
+        its own copy up to date for judging the next probes
+        """
+        baselines.record((device['id'], verdict.raw, result['latency']) for device, result, verdict in results)
+        message = encode_message({
+            'type': 'results',
+            'results': [[device['id'], result, list(verdict)] for device, result, verdict in results],
+        })
+        future = asyncio.run_coroutine_threadsafe(self._send(message), self._loop)
+        future.result(SEND_TIMEOUT)
+
+    async def _send(self, message: bytes):
+        writer = self._writer
+        if writer is None:
+            # Disconnected: the coordinator has already handed these devices to other workers
+            return
+        writer.write(message)
+        await writer.drain()
+
+    async def _heartbeat(self, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                await asyncio.sleep(HEARTBEAT_INTERVAL)
+                writer.write(encode_message({'type': 'ping'}))
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+
+    async def _session(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=MAX_MESSAGE_BYTES)
+        writer.write(encode_message({'type': 'hello', 'worker': self.worker_id}))
+        await writer.drain()
+        self._writer = writer
+        log.info('Connected to coordinator', extra={'worker': self.worker_id, 'coordinator': f'{self.host}:{self.port}'})
+
+        heartbeat = asyncio.ensure_future(self._heartbeat(writer))
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                if message.get('type') == 'assign':
+                    baselines.seed(message.get('baselines', {}))
+                    self.assignment.replace(message['devices'])
+                    log.info('Shard assigned', extra={'worker': self.worker_id, 'devices': len(message['devices'])})
+                elif message.get('type') == 'topology':
+                    self.assignment.set_topology(message['parents'], message['unreachable'])
+        finally:
+            heartbeat.cancel()
+            self._writer = None
+            writer.close()
+            # Stop probing: the coordinator rebalances these devices once it notices
+            self.assignment.replace([])
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self.scheduler.start()
+        try:
+            while not self._stopping.is_set():
+                session = asyncio.ensure_future(self._session())
+                stopping = asyncio.ensure_future(self._stopping.wait())
+                await asyncio.wait((session, stopping), return_when=asyncio.FIRST_COMPLETED)
+                stopping.cancel()
+                if not session.done():
+                    session.cancel()
+                    await asyncio.gather(session, return_exceptions=True)
+                    break
+                error = session.exception()
+                if error is not None:
+                    log.warning('Lost the coordinator', extra={'worker': self.worker_id, 'error': str(error)})
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), RECONNECT_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.scheduler.stop()
+
+    def run(self):
+        """Run until stop() (or SIGTERM / Ctrl+C when run as a script)"""
+        asyncio.run(self._main())
+
+    def stop(self):
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--id', default=f'{socket.gethostname()}-{os.getpid()}', help='worker name on the hash ring')
+    parser.add_argument('--coordinator', default=COORDINATOR, help='API node address (HOST:PORT)')
+    parser.add_argument('--max-in-flight', type=int, default=None, help='concurrent probes')
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT, help='serve /metrics on this port (0: off)')
+    args = parser.parse_args()
+
+    host, _, port = args.coordinator.rpartition(':')
+    raise_fd_limit()
+    serve_metrics(args.metrics_port)
+    worker = Worker(args.id, host or '127.0.0.1', int(port), max_in_flight=args.max_in_flight)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+NetGuard API Load Test
+Measures API latency while idle and while a large sweep runs, for two deployments:
+  single - probing inside the API process (python backend/app.py)
+  split  - gunicorn API workers plus a separate probe service (probe_service.py)
+Devices are TCP-probed against a local listener, so no network access is needed
+
+Usage:
+    python benchmarks/bench_api_load.py [--devices 5000] [--seconds 10] [--clients 8]
+                                        [--api-workers 2] [--modes single split] [--json]
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND = os.path.join(ROOT, 'backend')
+sys.path.insert(0, BACKEND)
+
+import database
+
+# Requests each client cycles through (the dashboard's polling mix)
+PATHS = ('/api/devices', '/api/alerts?limit=20', '/api/logs?limit=20', '/api/changes?since={version}', '/')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def accept_forever(listener: socket.socket):
+    """Stand-in for the devices: complete the handshake and hang up"""
+    while True:
+        connection, _ = listener.accept()
+        connection.close()
+
+
+def make_db(workdir: str, devices: int, port: int):
+    """Database with `devices` unmonitored TCP devices; monitoring is switched on mid-run"""
+    database.DB_PATH = os.path.join(workdir, 'netguard.db')
+    database.init_db()
+    database.close_connections()
+
+    conn = sqlite3.connect(database.DB_PATH)
+    with conn:
+        conn.execute('DELETE FROM devices')
+        conn.executemany('''
+            INSERT INTO devices (id, name, ip, type, status, latency, last_checked, is_monitored, uptime,
+                                 probe_type, probe_port)
+            VALUES (?, ?, '127.0.0.1', 'server', 'offline', 0, 0, 0, 0.0, 'tcp', ?)
+        ''', [(f'dev-{i}', f'Device {i}', port) for i in range(devices)])
+    conn.close()
+
+
+def enable_monitoring(workdir: str):
+    """Monitor every device, bumping the change version so running processes pick it up"""
+    conn = sqlite3.connect(os.path.join(workdir, 'netguard.db'))
+    with conn:
+        conn.execute("UPDATE sync_state SET value = value + 1 WHERE key = 'version'")
+        version = conn.execute("SELECT value FROM sync_state WHERE key = 'version'").fetchone()[0]
+        conn.execute('UPDATE devices SET is_monitored = 1, version = ?', (version,))
+    conn.close()
+
+
+def count_samples(workdir: str, start_ms: int, end_ms: int) -> int:
+    conn = sqlite3.connect(os.path.join(workdir, 'netguard_metrics.db'))
+    try:
+        return conn.execute('SELECT COUNT(*) FROM samples WHERE ts >= ? AND ts < ?', (start_ms, end_ms)).fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+
+def start_servers(mode: str, workdir: str, port: int, api_workers: int) -> list:
+    env = dict(
+        os.environ,
+        NETGUARD_PORT=str(port),
+        NETGUARD_BIND=f'127.0.0.1:{port}',
+        NETGUARD_API_WORKERS=str(api_workers),
+        NETGUARD_STREAM_PORT=str(free_port()),
+        NETGUARD_CLUSTER_PORT=str(free_port()),
+        NETGUARD_PROBE_INTERVAL='1',
+        NETGUARD_MAX_PROBE_INTERVAL='2',
+        PYTHONUNBUFFERED='1',
+    )
+    quiet = {'cwd': workdir, 'env': env, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    if mode == 'single':
+        return [subprocess.Popen([sys.executable, os.path.join(BACKEND, 'app.py')], **quiet)]
+    return [
+        subprocess.Popen([sys.executable, os.path.join(BACKEND, 'probe_service.py')], **quiet),
+        subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND, 'gunicorn.conf.py'),
+                          '--pythonpath', BACKEND, 'wsgi:app'], **quiet),
+    ]
+
+
+def wait_ready(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/api/devices')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'API did not start on port {port}')
+
+
+def wait_probing(workdir: str, devices: int, timeout: float = 60):
+    """Until most devices have been probed at least once"""
+    conn = sqlite3.connect(os.path.join(workdir, 'netguard.db'))
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            if conn.execute("SELECT COUNT(*) FROM devices WHERE status != 'offline'").fetchone()[0] >= devices // 2:
+                return
+            time.sleep(0.5)
+    finally:
+        conn.close()
+    raise RuntimeError('Probing did not start')
+
+
+def generate_load(port: int, seconds: float, clients: int) -> list:
+    """Latencies (ms) of every request sent by `clients` keep-alive clients for `seconds`"""
+    latencies = []
+    deadline = time.monotonic() + seconds
+
+    def client():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        etag, version, own = None, 0, []
+        while time.monotonic() < deadline:
+            for path in PATHS:
+                headers = {'If-None-Match': etag} if path == '/api/devices' and etag else {}
+                start = time.perf_counter()
+                connection.request('GET', path.format(version=version), headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                own.append((time.perf_counter() - start) * 1000)
+                if path == '/api/devices':
+                    etag = response.getheader('ETag') or etag
+                elif path.startswith('/api/changes') and response.status == 200:
+                    version = json.loads(body)['version']
+        latencies.extend(own)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+def summarize(mode: str, phase: str, latencies: list, seconds: float, probes: int) -> dict:
+    return {
+        'mode': mode,
+        'phase': phase,
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'probes_per_second': round(probes / seconds, 1),
+    }
+
+
+def run(mode: str, devices: int, seconds: float, clients: int, api_workers: int) -> list:
+    workdir = tempfile.mkdtemp(prefix='netguard-load-')
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(4096)
+    acceptor = multiprocessing.get_context('fork').Process(target=accept_forever, args=(listener,), daemon=True)
+    acceptor.start()
+
+    port = free_port()
+    make_db(workdir, devices, listener.getsockname()[1])
+    processes = start_servers(mode, workdir, port, api_workers)
+    try:
+        wait_ready(port)
+        results = [summarize(mode, 'idle', generate_load(port, seconds, clients), seconds, 0)]
+
+        enable_monitoring(workdir)
+        wait_probing(workdir, devices)
+        start_ms = int(time.time() * 1000)
+        latencies = generate_load(port, seconds, clients)
+        probes = count_samples(workdir, start_ms, int(time.time() * 1000))
+        results.append(summarize(mode, 'sweeping', latencies, seconds, probes))
+        return results
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(15)
+        acceptor.terminate()
+        listener.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, default=5000)
+    parser.add_argument('--seconds', type=float, default=10, help='length of each measurement')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent keep-alive API clients')
+    parser.add_argument('--api-workers', type=int, default=2, help='gunicorn worker processes in split mode')
+    parser.add_argument('--modes', nargs='+', choices=('single', 'split'), default=['single', 'split'])
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes:
+        results.extend(run(mode, args.devices, args.seconds, args.clients, args.api_workers))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'=' * 86}")
+    print(f"  API latency under load: {args.devices} devices, {args.clients} clients, {args.seconds:g}s per phase")
+    print(f"{'=' * 86}")
+    print(f"{'mode':<8}{'phase':<10}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'probes/s':>12}")
+    for result in results:
+        print(f"{result['mode']:<8}{result['phase']:<10}{result['requests']:>10}{result['requests_per_second']:>10}"
+              f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}{result['probes_per_second']:>12}")
+
+
+if __name__ == '__main__':
+    main()
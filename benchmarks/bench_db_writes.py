@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+NetGuard Sweep Persistence Benchmark
+Compares per-device commits (update_device_status / add_alert / add_fault_log)
+with one batched transaction per sweep (save_sweep_results)
+
+Usage:
+    python benchmarks/bench_db_writes.py [--devices 1000 10000] [--change-rate 0.05] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import database
+import timeseries
+from monitor import SweepBatch, generate_id
+
+# The batched path also appends latency samples; keep that file out of the working tree
+timeseries.store.path = tempfile.mktemp(suffix='.db', prefix='netguard-bench-metrics-')
+
+
+class CommitCounter:
+    """Counts COMMIT statements issued by every connection database.py opens"""
+
+    def __init__(self):
+        self.commits = 0
+        self._connect = sqlite3.connect
+
+    def _trace(self, statement: str):
+        if statement.strip().upper().startswith('COMMIT'):
+            self.commits += 1
+
+    def __enter__(self):
+        def connect(*args, **kwargs):
+            conn = self._connect(*args, **kwargs)
+            conn.set_trace_callback(self._trace)
+            return conn
+
+        database.sqlite3.connect = connect
+        return self
+
+    def __exit__(self, *exc):
+        database.sqlite3.connect = self._connect
+
+
+def make_db(devices: int) -> str:
+    fd, path = tempfile.mkstemp(suffix='.db', prefix='netguard-bench-')
+    os.close(fd)
+    database.DB_PATH = path
+    database.init_db()
+
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute('DELETE FROM devices')
+        conn.executemany('''
+            INSERT INTO devices (id, name, ip, type, status, latency, last_checked, is_monitored, uptime)
+            VALUES (?, ?, ?, 'server', 'online', 1, 0, 1, 0.0)
+        ''', [(f'dev-{i}', f'Device {i}', f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}') for i in range(devices)])
+    conn.close()
+
+    # Reopen pooled connections inside the timed section so commits are traced
+    database.close_connections()
+    return path
+
+
+def make_sweep(devices: int, change_rate: float, seed: int = 1):
+    """Synthetic sweep: every device gets a status update, change_rate of them go offline"""
+    rng = random.Random(seed)
+    results = []
+    for i in range(devices):
+        if rng.random() < change_rate:
+            results.append((f'dev-{i}', 'offline', 0, True))
+        else:
+            results.append((f'dev-{i}', 'online', rng.randint(1, 80), False))
+    return results
+
+
+def make_alert(device_id: str) -> dict:
+    return {
+        'id': generate_id(),
+        'deviceId': device_id,
+        'deviceName': device_id,
+        'deviceIp': '10.0.0.1',
+        'type': 'connectivity',
+        'message': 'Connection lost: Device is unreachable',
+        'timestamp': int(time.time() * 1000),
+        'status': 'active'
+    }
+
+
+def write_per_device(sweep):
+    for device_id, status, latency, changed in sweep:
+        database.update_device_status(device_id, status, latency)
+        if changed:
+            database.add_alert(make_alert(device_id))
+            database.add_fault_log(device_id, device_id, '10.0.0.1', 'connectivity', 'Device went offline')
+
+
+def write_batched(sweep):
+    batch = SweepBatch()
+    for device_id, status, latency, changed in sweep:
+        batch.update_device_status(device_id, status, latency)
+        if changed:
+            batch.add_alert(make_alert(device_id))
+            batch.add_fault_log(device_id, device_id, '10.0.0.1', 'connectivity', 'Device went offline')
+    batch.commit()
+
+
+def run(devices: int, change_rate: float) -> list:
+    results = []
+    sweep = make_sweep(devices, change_rate)
+
+    for name, write in (('per-device commits', write_per_device), ('batched sweep', write_batched)):
+        path = make_db(devices)
+        try:
+            with CommitCounter() as counter:
+                start = time.perf_counter()
+                write(sweep)
+                elapsed = time.perf_counter() - start
+        finally:
+            database.close_connections()
+            database.DB_PATH = 'netguard.db'
+            os.remove(path)
+
+        results.append({
+            'method': name,
+            'devices': devices,
+            'changes': sum(1 for *_, changed in sweep if changed),
+            'commits_per_sweep': counter.commits,
+            'sweep_write_seconds': round(elapsed, 4),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--change-rate', type=float, default=0.05, help='fraction of devices changing status per sweep')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    try:
+        for devices in args.devices:
+            results.extend(run(devices, args.change_rate))
+    finally:
+        timeseries.store.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(timeseries.store.path + suffix):
+                os.remove(timeseries.store.path + suffix)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'=' * 72}")
+    print(f"  Sweep persistence benchmark (change rate {args.change_rate:.0%})")
+    print(f"{'=' * 72}")
+    print(f"{'method':<22}{'devices':>10}{'changes':>10}{'commits':>10}{'write time (s)':>18}")
+    for result in results:
+        print(f"{result['method']:<22}{result['devices']:>10}{result['changes']:>10}"
+              f"{result['commits_per_sweep']:>10}{result['sweep_write_seconds']:>18}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+NetGuard Simulated Fleet Benchmark
+Runs full monitor sweeps (monitor_all_devices) against a simulated fleet
+instead of the network, with API clients polling the dashboard endpoints
+throughout, and measures per fleet size:
+  sweep duration, database write throughput, API latency and peak memory
+Each size runs in a fresh process against temporary databases, so nothing
+needs a network, a running backend or real hosts.
+
+Results are written as JSON (--output) for tracking between releases; pass a
+previous file as --baseline to flag metrics that got worse by more than
+--tolerance (the exit status is 1 when any did).
+
+Usage:
+    python benchmarks/bench_fleet.py [--devices 100 1000 10000 100000] [--sweeps 3] [--seconds 5]
+                                     [--clients 4] [--max-in-flight N]
+                                     [--latency lognormal:20:0.6] [--loss 0.01]
+                                     [--outages random|flap|partition|none] [--outage-fraction 0.01]
+                                     [--delay-scale 0] [--seed 1] [--json] [--output FILE]
+                                     [--baseline FILE] [--tolerance 0.2]
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+
+import database
+import monitor
+import timeseries
+from flask import Flask
+from registry import registry
+from routes import api
+from sla import tracker as sla_tracker
+from werkzeug.serving import make_server
+
+from fleet import DISTRIBUTIONS, OUTAGE_PATTERNS, FleetSimulator, fleet_ips, parse_distribution
+
+# Requests each API client cycles through (the dashboard's polling mix)
+PATHS = ('/api/devices', '/api/alerts?limit=20', '/api/logs?limit=20', '/api/changes?since={version}')
+
+# Metrics compared against a baseline, and whether lower values are better
+TRACKED_METRICS = {
+    'sweep_seconds_mean': True,
+    'sweep_seconds_max': True,
+    'probes_per_second': False,
+    'db_rows_per_second': False,
+    'metrics_rows_per_second': False,
+    'api_p50_ms': True,
+    'api_p99_ms': True,
+    'rss_peak_mb': True,
+}
+
+
+def rss_mb() -> float:
+    """Current resident set size"""
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return round(pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 2)
+
+
+class WriteTimer:
+    """Wraps a write function, adding up the time spent in it and the rows it was given"""
+
+    def __init__(self, write, count_rows):
+        self._write = write
+        self._count_rows = count_rows
+        self.seconds = 0.0
+        self.rows = 0
+
+    def __call__(self, *args):
+        start = time.perf_counter()
+        try:
+            return self._write(*args)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.rows += self._count_rows(*args)
+
+
+class Pollers:
+    """API clients polling the dashboard endpoints over keep-alive connections until stopped"""
+
+    def __init__(self, port: int, clients: int):
+        self._port = port
+        self._stopping = threading.Event()
+        self._threads = [threading.Thread(target=self._client, daemon=True) for _ in range(clients)]
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.errors = 0
+
+    def _client(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self._port, timeout=60)
+        etag, version, own, errors = None, 0, [], 0
+        while not self._stopping.is_set():
+            for path in PATHS:
+                headers = {'If-None-Match': etag} if path == '/api/devices' and etag else {}
+                start = time.perf_counter()
+                connection.request('GET', path.format(version=version), headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+                own.append((time.perf_counter() - start) * 1000)
+                if response.status >= 400:
+                    errors += 1
+                elif path == '/api/devices':
+                    etag = response.getheader('ETag') or etag
+                elif path.startswith('/api/changes'):
+                    version = json.loads(body)['version']
+        with self._lock:
+            self.latencies.extend(own)
+            self.errors += errors
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join()
+
+
+def seed_devices(path: str, ips: list):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute('DELETE FROM devices')
+        conn.executemany('''
+            INSERT INTO devices (id, name, ip, type, status, latency, last_checked, is_monitored, uptime)
+            VALUES (?, ?, ?, 'server', 'online', 1, 0, 1, 100.0)
+        ''', [(f'dev-{index}', f'Device {index}', ip) for index, ip in enumerate(ips)])
+    conn.close()
+
+
+def measure(devices: int, args) -> dict:
+    """One fleet size, in this process (called in the child)"""
+    rss_start = rss_mb()
+    workdir = tempfile.mkdtemp(prefix='netguard-fleet-')
+    database.DB_PATH = os.path.join(workdir, 'netguard.db')
+    timeseries.store.path = os.path.join(workdir, 'netguard_metrics.db')
+
+    try:
+        database.init_db()
+        ips = fleet_ips(devices)
+        seed_devices(database.DB_PATH, ips)
+        registry.load()
+        timeseries.store.open()
+        sla_tracker.load(timeseries.store)
+
+        # Time spent in the two sweep writes: the batched devices / alerts /
+        # fault logs transaction, and the latency history append
+        db_writes = WriteTimer(monitor.save_sweep_results,
+                               lambda persisted, alerts, logs, *_: len(persisted) + len(alerts) + len(logs))
+        metric_writes = WriteTimer(timeseries.store.append, len)
+        monitor.save_sweep_results = db_writes
+        timeseries.store.append = lambda samples: metric_writes(list(samples))
+
+        app = Flask(__name__)
+        app.register_blueprint(api, url_prefix='/api')
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        simulator = FleetSimulator(ips, args.latency, args.loss, args.outages, args.outage_fraction,
+                                   args.outage_sweeps, args.delay_scale, args.seed)
+
+        # First sweep seeds the state machines and caches; not measured
+        simulator.advance()
+        monitor.monitor_all_devices(args.max_in_flight, simulator.probe)
+        db_writes.seconds = db_writes.rows = metric_writes.seconds = metric_writes.rows = 0
+        simulator.probes = 0
+
+        pollers = Pollers(server.server_port, args.clients)
+        pollers.start()
+        durations = []
+        started = time.perf_counter()
+        try:
+            # At least --sweeps sweeps, and enough of them to give the clients --seconds of polling
+            while len(durations) < args.sweeps or time.perf_counter() - started < args.seconds:
+                simulator.advance()
+                start = time.perf_counter()
+                monitor.monitor_all_devices(args.max_in_flight, simulator.probe)
+                durations.append(time.perf_counter() - start)
+        finally:
+            pollers.stop()
+            server.shutdown()
+
+        elapsed = sum(durations)
+        with database.read_connection() as conn:
+            alerts = conn.execute('SELECT COUNT(*) FROM alerts').fetchone()[0]
+            fault_logs = conn.execute('SELECT COUNT(*) FROM fault_logs').fetchone()[0]
+        return {
+            'devices': devices,
+            'sweeps': len(durations),
+            'sweep_seconds_mean': round(elapsed / len(durations), 4),
+            'sweep_seconds_max': round(max(durations), 4),
+            'probes_per_second': round(simulator.probes / elapsed, 1),
+            'db_rows': db_writes.rows,
+            'db_write_seconds': round(db_writes.seconds, 4),
+            'db_rows_per_second': round(db_writes.rows / db_writes.seconds, 1) if db_writes.seconds else 0.0,
+            'metrics_rows': metric_writes.rows,
+            'metrics_rows_per_second': round(metric_writes.rows / metric_writes.seconds, 1)
+            if metric_writes.seconds else 0.0,
+            'alerts_total': alerts,
+            'fault_logs_total': fault_logs,
+            'api_requests': len(pollers.latencies),
+            'api_errors': pollers.errors,
+            'api_p50_ms': percentile(pollers.latencies, 0.50),
+            'api_p95_ms': percentile(pollers.latencies, 0.95),
+            'api_p99_ms': percentile(pollers.latencies, 0.99),
+            'rss_start_mb': rss_start,
+            'rss_end_mb': rss_mb(),
+            # ru_maxrss is in KB on Linux
+            'rss_peak_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+    finally:
+        timeseries.store.close()
+        database.close_connections()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_size(devices: int, args) -> dict:
+    """Measure one fleet size in a fresh interpreter, so module state and peak memory start clean"""
+    fd, output = tempfile.mkstemp(suffix='.json', prefix='netguard-fleet-')
+    os.close(fd)
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--devices', str(devices),
+               '--output', output] + child_arguments(args)
+    try:
+        # The monitor prints every alert; keep the child's stdout out of the report
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        with open(output) as results:
+            return json.load(results)
+    finally:
+        os.remove(output)
+
+
+def child_arguments(args) -> list:
+    return ['--sweeps', str(args.sweeps), '--seconds', str(args.seconds), '--clients', str(args.clients), '--latency', args.latency,
+            '--loss', str(args.loss), '--outages', args.outages, '--outage-fraction', str(args.outage_fraction),
+            '--outage-sweeps', str(args.outage_sweeps), '--delay-scale', str(args.delay_scale),
+            '--seed', str(args.seed)] + (['--max-in-flight', str(args.max_in_flight)] if args.max_in_flight else [])
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """(devices, metric, baseline, current, change) for every tracked metric worse than tolerance"""
+    previous = {result['devices']: result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(result['devices'])
+        if before is None:
+            continue
+        for metric, lower_is_better in TRACKED_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change > tolerance) if lower_is_better else (change < -tolerance):
+                regressions.append((result['devices'], metric, old, new, change))
+    return regressions
+
+
+def print_table(report: dict):
+    config = report['config']
+    print(f"\n{'=' * 100}")
+    print(f"  Simulated fleet: latency {config['latency']}, loss {config['loss']:.1%}, "
+          f"outages {config['outages']} ({config['outage_fraction']:.1%}), {config['clients']} API clients")
+    print(f"{'=' * 100}")
+    print(f"{'devices':>9}{'sweep s':>10}{'max s':>9}{'probes/s':>11}{'db rows/s':>12}{'ts rows/s':>12}"
+          f"{'api p50':>9}{'api p99':>9}{'requests':>10}{'peak MB':>9}")
+    for result in report['results']:
+        print(f"{result['devices']:>9}{result['sweep_seconds_mean']:>10}{result['sweep_seconds_max']:>9}"
+              f"{result['probes_per_second']:>11}{result['db_rows_per_second']:>12}"
+              f"{result['metrics_rows_per_second']:>12}{result['api_p50_ms']:>9}{result['api_p99_ms']:>9}"
+              f"{result['api_requests']:>10}{result['rss_peak_mb']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--devices', type=int, nargs='+', default=[100, 1000, 10000, 100000])
+    parser.add_argument('--sweeps', type=int, default=3, help='minimum measured sweeps per fleet size')
+    parser.add_argument('--seconds', type=float, default=5, help='minimum measured time per fleet size')
+    parser.add_argument('--clients', type=int, default=4, help='concurrent keep-alive API clients')
+    parser.add_argument('--max-in-flight', type=int, help='probe concurrency (default: the monitor\'s)')
+    parser.add_argument('--latency', default='lognormal:20:0.6',
+                        help=f"reply latency in ms: {', '.join(DISTRIBUTIONS)} (e.g. uniform:1:50)")
+    parser.add_argument('--loss', type=float, default=0.01, help='fraction of probes lost')
+    parser.add_argument('--outages', choices=OUTAGE_PATTERNS, default='random')
+    parser.add_argument('--outage-fraction', type=float, default=0.01, help='fraction of devices affected by outages')
+    parser.add_argument('--outage-sweeps', type=int, default=3, help='sweeps an outage lasts')
+    parser.add_argument('--delay-scale', type=float, default=0.0,
+                        help='wait latency x this for each reply (0 measures the monitor alone)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression (0.2 = 20%%)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    try:
+        parse_distribution(args.latency)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.child:
+        result = measure(args.devices[0], args)
+        with open(args.output, 'w') as output:
+            json.dump(result, output)
+        return
+
+    report = {
+        'benchmark': 'fleet',
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items()
+                   if key not in ('json', 'output', 'baseline', 'child', 'devices')},
+        'results': [],
+    }
+    for devices in args.devices:
+        report['results'].append(run_size(devices, args))
+        if not args.json:
+            print(f"[BENCH] {devices} devices done", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(report['results'], json.load(baseline), args.tolerance)
+        for devices, metric, old, new, change in regressions:
+            print(f"[REGRESSION] {devices} devices: {metric} {old} -> {new} ({change:+.0%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+NetGuard ICMP Prober Benchmark
+Compares the subprocess ping_device against the native ICMP prober on localhost,
+and shows that multi-packet bursts run concurrently instead of multiplying sweep time
+
+Usage:
+    python benchmarks/bench_icmp.py [--probes N] [--burst N] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from icmp import IcmpProber
+from monitor import ping_device
+import probe_engine
+import probers
+
+TARGET = '127.0.0.1'
+
+
+def cpu_seconds() -> float:
+    """CPU time used by this process and any children it has reaped"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def measure(name: str, probes: int, run) -> dict:
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    answered = run()
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    return {
+        'name': name,
+        'probes': probes,
+        'answered': answered,
+        'wall_seconds': round(wall, 4),
+        'probes_per_second': round(probes / wall, 1) if wall else None,
+        'cpu_ms_per_probe': round(cpu * 1000 / probes, 4),
+    }
+
+
+def bench_subprocess_serial(probes: int) -> int:
+    return sum(1 for _ in range(probes) if ping_device(TARGET)['status'] != 'offline')
+
+
+def bench_subprocess_concurrent(probes: int) -> int:
+    devices = [{'ip': TARGET}] * probes
+    results = probers.probe_all(devices, probe=probe_engine.ping_device_async)
+    return sum(1 for _, result in results if result['status'] != 'offline')
+
+
+def bench_native(probes: int) -> int:
+    async def run() -> int:
+        prober = IcmpProber.open()
+        if prober is None:
+            raise RuntimeError('ICMP sockets are not permitted for this user')
+        try:
+            semaphore = asyncio.Semaphore(probe_engine.MAX_IN_FLIGHT_PROBES)
+
+            async def one() -> bool:
+                async with semaphore:
+                    return await prober.echo(TARGET, probe_engine.ICMP_TIMEOUT) is not None
+
+            return sum(await asyncio.gather(*(one() for _ in range(probes))))
+        finally:
+            prober.close()
+
+    return asyncio.run(run())
+
+
+def bench_native_burst(probes: int, burst: int) -> int:
+    async def run() -> int:
+        prober = IcmpProber.open()
+        if prober is None:
+            raise RuntimeError('ICMP sockets are not permitted for this user')
+        try:
+            devices = [{'ip': TARGET}] * probes
+            probe = probers.PingProber(probe_engine.make_native_probe(prober, burst)).probe
+            results = await probe_engine.probe_all_async(devices, probe, probe_engine.MAX_IN_FLIGHT_PROBES)
+            return sum(1 for _, result in results if result['status'] != 'offline')
+        finally:
+            prober.close()
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--probes', type=int, default=200, help='probes per method against localhost')
+    parser.add_argument('--burst', type=int, default=5, help='packets per probe for the burst method')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    probe_engine.raise_fd_limit()
+
+    results = []
+    for name, run in (
+        ('ping_device (subprocess, serial)', bench_subprocess_serial),
+        ('ping_device_async (subprocess, concurrent)', bench_subprocess_concurrent),
+        ('IcmpProber (native socket, concurrent)', bench_native),
+        (f'IcmpProber burst of {args.burst} (concurrent)', lambda probes: bench_native_burst(probes, args.burst)),
+    ):
+        try:
+            results.append(measure(name, args.probes, lambda: run(args.probes)))
+        except Exception as e:
+            results.append({'name': name, 'error': str(e)})
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'=' * 78}")
+    print(f"  ICMP probe benchmark: {args.probes} probes to {TARGET}")
+    print(f"{'=' * 78}")
+    print(f"{'method':<44}{'answered':>10}{'probes/s':>12}{'CPU ms/probe':>14}")
+    for result in results:
+        if 'error' in result:
+            print(f"{result['name']:<44}  skipped: {result['error']}")
+        else:
+            print(f"{result['name']:<44}{result['answered']:>10}"
+                  f"{result['probes_per_second']:>12}{result['cpu_ms_per_probe']:>14}")
+
+
+if __name__ == '__main__':
+    main()
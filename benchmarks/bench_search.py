@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+NetGuard Search Benchmark
+Fills a temporary database with synthetic fault logs and alerts (written through
+the full-text index triggers) and times /api/search style queries against it:
+a single IP, a device name, words found in nearly every row, filters and time
+ranges, ranked and newest first
+
+Usage:
+    python benchmarks/bench_search.py [--rows 1000000] [--devices 10000] [--repeat 5] [--db FILE] [--json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+import database
+import search
+
+# (fault type, description, alert type, alert message); {} is filled with a number
+EVENTS = (
+    ('connectivity', 'Device went offline', 'connectivity', 'Connection lost: Device is unreachable'),
+    ('recovery', 'Device back online', None, None),
+    ('latency', 'High latency: {}ms', 'latency', 'High latency detected: {}ms'),
+    ('flapping', 'Device started flapping', 'flapping',
+     'Device is flapping: status alerts suppressed until it stabilizes'),
+    ('flapping', 'Device stopped flapping', None, None),
+    ('connectivity', 'Device went offline (unreachable behind Core Router {})', 'connectivity',
+     'Connection lost: unreachable behind Core Router {}'),
+)
+
+# Rows are spaced this far apart (ms), so 1M fault logs span about 17 days
+ROW_SPACING = 1500
+
+
+def device(i: int):
+    return f'dev-{i}', f'Host {i} rack{i % 50}', f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}'
+
+
+def fill(path: str, rows: int, devices: int, seed: int = 1) -> int:
+    """Write `rows` fault logs and about a quarter as many alerts; returns the first timestamp"""
+    database.DB_PATH = path
+    database.init_db()
+    rng = random.Random(seed)
+    start = int(time.time() * 1000) - rows * ROW_SPACING
+
+    conn = sqlite3.connect(path)
+    batch = 50000
+    with conn:
+        for first in range(0, rows, batch):
+            logs, alerts = [], []
+            for i in range(first, min(rows, first + batch)):
+                device_id, name, ip = device(rng.randrange(devices))
+                fault_type, description, alert_type, message = EVENTS[rng.randrange(len(EVENTS))]
+                number = rng.randrange(150, 900)
+                timestamp = start + i * ROW_SPACING
+                logs.append((device_id, name, ip, fault_type, description.format(number), timestamp))
+                if alert_type and rng.random() < 0.4:
+                    alerts.append((f'a{i}', device_id, name, ip, alert_type, message.format(number), timestamp,
+                                   'resolved'))
+            conn.executemany('''
+                INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', logs)
+            conn.executemany('''
+                INSERT INTO alerts (id, device_id, device_name, device_ip, type, message, timestamp, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', alerts)
+    conn.close()
+    return start
+
+
+def queries(start: int, rows: int):
+    """(label, search() keyword arguments)"""
+    _, name, ip = device(4242)
+    middle = start + rows * ROW_SPACING // 2
+    return (
+        ('one IP', {'query': ip}),
+        ('device name phrase', {'query': f'"{name}"'}),
+        ('IP prefix', {'query': '10.0.16*'}),
+        ('common word', {'query': 'offline'}),
+        ('common word, newest', {'query': 'offline', 'sort': 'newest'}),
+        ('common word, no facets', {'query': 'offline', 'facets': False}),
+        ('two words, one excluded', {'query': 'device -flapping'}),
+        ('word + type + device', {'query': 'latency', 'result_type': 'latency', 'device_id': 'dev-17'}),
+        ('word in a one-day range', {'query': 'unreachable', 'since': middle, 'until': middle + 86400000}),
+        ('no match', {'query': 'nonexistent'}),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='fault logs to generate')
+    parser.add_argument('--devices', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query (the first warms the cache)')
+    parser.add_argument('--db', help='reuse (or create and keep) this database file instead of a temporary one')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    path = args.db or tempfile.mktemp(suffix='.db', prefix='netguard-bench-search-')
+    try:
+        if os.path.exists(path):
+            database.DB_PATH = path
+            with database.read_connection() as conn:
+                start = conn.execute('SELECT MIN(timestamp) FROM fault_logs').fetchone()[0]
+        else:
+            began = time.perf_counter()
+            start = fill(path, args.rows, args.devices)
+            print(f"[BENCH] wrote {args.rows} fault logs in {time.perf_counter() - began:.1f}s", file=sys.stderr)
+
+        results = []
+        for label, kwargs in queries(start, args.rows):
+            timings = []
+            for _ in range(args.repeat):
+                began = time.perf_counter()
+                result = search.search(**kwargs)
+                timings.append((time.perf_counter() - began) * 1000)
+            results.append({
+                'query': label,
+                'total': result['total'],
+                'complete': result['complete'],
+                'p50_ms': round(statistics.median(timings[1:] or timings), 2),
+                'max_ms': round(max(timings), 2),
+            })
+    finally:
+        database.close_connections()
+        database.DB_PATH = 'netguard.db'
+        if not args.db:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"\n{'=' * 84}")
+    print(f"  Search benchmark ({args.rows} fault logs, window {search.SEARCH_WINDOW})")
+    print(f"{'=' * 84}")
+    print(f"{'query':<30}{'total':>10}{'complete':>10}{'p50 ms':>12}{'max ms':>12}")
+    for result in results:
+        print(f"{result['query']:<30}{result['total']:>10}{str(result['complete']):>10}"
+              f"{result['p50_ms']:>12}{result['max_ms']:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""
+Simulated device fleet for the offline benchmarks
+FleetSimulator.probe has the signature of the monitor's ICMP probe (ip -> result),
+so it can be passed to monitor_all_devices / ProbeScheduler in place of the
+network. Latency comes from a configurable distribution, probes are lost at a
+fixed rate, and an outage pattern takes devices down for whole sweeps.
+Everything is drawn from one seeded generator, so runs are repeatable.
+"""
+
+import asyncio
+import math
+import os
+import random
+import sys
+from typing import Callable, Dict, List, Set
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from probe_engine import ICMP_TIMEOUT, OFFLINE, classify_latency
+
+# name -> (parameter names, sampler(rng, *parameters) -> latency in ms)
+DISTRIBUTIONS: Dict[str, tuple] = {
+    'constant': (('ms',), lambda rng, ms: ms),
+    'uniform': (('low', 'high'), lambda rng, low, high: rng.uniform(low, high)),
+    'normal': (('mean', 'stddev'), lambda rng, mean, stddev: rng.gauss(mean, stddev)),
+    # median and shape: most replies near the median, a long slow tail
+    'lognormal': (('median', 'sigma'), lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma)),
+    'pareto': (('scale', 'alpha'), lambda rng, scale, alpha: scale * rng.paretovariate(alpha)),
+}
+
+OUTAGE_PATTERNS = ('none', 'random', 'flap', 'partition')
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    """'lognormal:20:0.6' -> sampler; raises ValueError for unknown names or wrong parameter counts"""
+    name, *values = spec.split(':')
+    if name not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution '{name}' (one of {', '.join(DISTRIBUTIONS)})")
+    parameters, sampler = DISTRIBUTIONS[name]
+    if len(values) != len(parameters):
+        raise ValueError(f"{name} takes {len(parameters)} parameter(s): {name}:{':'.join(parameters)}")
+    numbers = [float(value) for value in values]
+    return lambda rng: sampler(rng, *numbers)
+
+
+class FleetSimulator:
+    """
+    Synthetic replies for a fleet of addresses, advanced one sweep at a time
+
+    Outage patterns (`outage_fraction` of the fleet is affected):
+      random    - each sweep, devices go down with that probability and stay
+                  down for `outage_sweeps` sweeps
+      flap      - that fraction alternates between up and down every sweep
+      partition - one contiguous block (e.g. a subnet behind a failed switch)
+                  is down for `outage_sweeps` sweeps out of every 4 * outage_sweeps
+    """
+
+    def __init__(self, ips: List[str], latency: str = 'lognormal:20:0.6', loss: float = 0.01,
+                 outages: str = 'random', outage_fraction: float = 0.01, outage_sweeps: int = 3,
+                 delay_scale: float = 0.0, seed: int = 1):
+        if outages not in OUTAGE_PATTERNS:
+            raise ValueError(f"Unknown outage pattern '{outages}' (one of {', '.join(OUTAGE_PATTERNS)})")
+        self._sample = parse_distribution(latency)
+        self._rng = random.Random(seed)
+        self.ips = list(ips)
+        self.loss = loss
+        self.outages = outages
+        self.outage_fraction = outage_fraction
+        self.outage_sweeps = max(1, outage_sweeps)
+        # Simulated replies are awaited for latency * delay_scale (0 = answer at once)
+        self.delay_scale = delay_scale
+        self.sweep = 0
+        self._down_until: Dict[str, int] = {}
+        self._flapping: Set[str] = set()
+        self._partition: Set[str] = set()
+        affected = int(len(self.ips) * outage_fraction)
+        if outages == 'flap':
+            self._flapping = set(self._rng.sample(self.ips, affected))
+        elif outages == 'partition':
+            start = self._rng.randrange(len(self.ips) - affected + 1)
+            self._partition = set(self.ips[start:start + affected])
+        self.probes = 0
+
+    def advance(self):
+        """Start the next sweep: roll new random outages"""
+        self.sweep += 1
+        if self.outages == 'random':
+            self._down_until = {ip: until for ip, until in self._down_until.items() if until > self.sweep}
+            for _ in range(int(len(self.ips) * self.outage_fraction)):
+                self._down_until.setdefault(self._rng.choice(self.ips), self.sweep + self.outage_sweeps)
+
+    def is_down(self, ip: str) -> bool:
+        if self.outages == 'random':
+            return ip in self._down_until
+        if self.outages == 'flap':
+            return ip in self._flapping and self.sweep % 2 == 1
+        if self.outages == 'partition':
+            return ip in self._partition and self.sweep % (4 * self.outage_sweeps) < self.outage_sweeps
+        return False
+
+    def reply(self, ip: str) -> Dict:
+        """One probe outcome, without waiting"""
+        self.probes += 1
+        if self.is_down(ip) or self._rng.random() < self.loss:
+            return dict(OFFLINE)
+        return classify_latency(max(1, int(self._sample(self._rng))))
+
+    async def probe(self, ip: str) -> Dict:
+        result = self.reply(ip)
+        if self.delay_scale:
+            delay = result['latency'] / 1000 if result['status'] != 'offline' else ICMP_TIMEOUT
+            await asyncio.sleep(delay * self.delay_scale)
+        else:
+            await asyncio.sleep(0)
+        return result
+
+
+def fleet_ips(count: int) -> List[str]:
+    """`count` distinct addresses in 10.0.0.0/8, contiguous so partitions look like subnets"""
+    return [f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}' for i in range(1, count + 1)]
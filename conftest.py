@@ -0,0 +1,61 @@
+"""
+Shared pytest fixtures
+Every test gets its own databases under tmp_path and fresh process-wide state
+(device registry, state machines, baselines, uptime counters), so the test
+modules can run in any order in one process
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import retention
+import timeseries
+from baseline import baselines
+from device_state import device_states
+from flask import Flask
+from registry import registry
+from routes import api
+from sla import tracker
+
+
+@pytest.fixture(autouse=True)
+def section(request):
+    """Print a header naming the test (its docstring, else its name) ahead of its output"""
+    title = (request.function.__doc__ or request.function.__name__).strip()
+    print(f"\n{'='*60}")
+    print(f"  TEST: {title}")
+    print(f"{'='*60}\n")
+
+
+@pytest.fixture(autouse=True)
+def storage(tmp_path, monkeypatch):
+    """Main and latency history databases (and retention archives) under tmp_path; yields tmp_path"""
+    database.close_connections()
+    timeseries.store.close()
+    monkeypatch.setattr(database, 'DB_PATH', str(tmp_path / 'netguard.db'))
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+
+    # The backend imports these singletons by name, so they are reset in place rather than replaced
+    timeseries.store.__init__(str(tmp_path / 'netguard_metrics.db'))
+    for state in (registry, device_states, baselines, tracker):
+        state.__init__()
+    database.init_db()
+    registry.load()
+
+    yield tmp_path
+
+    timeseries.store.close()
+    database.close_connections()
+
+
+@pytest.fixture
+def client():
+    """Flask test client for the API blueprint"""
+    app = Flask(__name__)
+    app.register_blueprint(api, url_prefix='/api')
+    return app.test_client()
@@ -1,5 +1,22 @@
+import {
+    Device, Alert, ChangeSet, DeviceFilter, DiscoveryJob, DiscoveryRequest, ImportSummary, ProbeType
+} from '../types';
 
-import { Device, Alert } from '../types';
+export type ExportFormat = 'json' | 'ndjson' | 'csv';
+
+const filterQuery = (filter: DeviceFilter): string => {
+    const params = new URLSearchParams();
+    if (filter.id?.length) params.set('id', filter.id.join(','));
+    if (filter.type) params.set('type', filter.type);
+    if (filter.subnet) params.set('subnet', filter.subnet);
+    if (filter.tag) params.set('tag', filter.tag);
+    return params.toString() || 'all=1';
+};
+
+export interface StreamHandlers {
+    onChanges: (changes: ChangeSet) => void;
+    onResync: () => void; // connected, reconnected or fell behind: refetch from the last known version
+}
 
 export const api = {
     getDevices: async (): Promise<Device[]> => {
@@ -23,8 +40,95 @@ export const api = {
         await fetch(`/api/devices/${id}/toggle`, { method: 'PATCH' });
     },
 
+    // Seconds between probes; null restores the default for the device type
+    setProbeInterval: async (id: string, probeInterval: number | null): Promise<void> => {
+        await fetch(`/api/devices/${id}/interval`, {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ probeInterval }),
+        });
+    },
+
+    setProbeSettings: async (id: string, probeType: ProbeType, probePort: number | null = null,
+                             probeTarget: string | null = null): Promise<void> => {
+        await fetch(`/api/devices/${id}/probe`, {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ probeType, probePort, probeTarget }),
+        });
+    },
+
+    // Upsert devices from a JSON, NDJSON or CSV file
+    importDevices: async (file: Blob, format: ExportFormat): Promise<ImportSummary> => {
+        const res = await fetch(`/api/devices/import?format=${format}`, { method: 'POST', body: file });
+        return res.json();
+    },
+
+    exportUrl: (format: ExportFormat, filter: DeviceFilter = {}): string => {
+        const query = new URLSearchParams(filterQuery(filter));
+        query.delete('all');
+        query.set('format', format);
+        return `/api/devices/export?${query}`;
+    },
+
+    // Streamed download of every matching alert or fault log (filters as for the paged lists)
+    historyExportUrl: (kind: 'alerts' | 'logs', format: ExportFormat,
+                       filter: Record<string, string> = {}): string =>
+        `/api/${kind}/export?${new URLSearchParams({ ...filter, format })}`,
+
+    removeDevices: async (filter: DeviceFilter): Promise<number> => {
+        const res = await fetch(`/api/devices?${filterQuery(filter)}`, { method: 'DELETE' });
+        return (await res.json()).deleted;
+    },
+
+    // Omit isMonitored to toggle each matching device
+    setMonitoring: async (filter: DeviceFilter, isMonitored?: boolean): Promise<number> => {
+        const res = await fetch(`/api/devices/monitoring?${filterQuery(filter)}`, {
+            method: 'PATCH',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ isMonitored }),
+        });
+        return (await res.json()).updated;
+    },
+
+    startDiscovery: async (request: DiscoveryRequest): Promise<DiscoveryJob> => {
+        const res = await fetch('/api/discovery', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(request),
+        });
+        if (!res.ok) throw new Error((await res.json()).error);
+        return res.json();
+    },
+
+    getDiscoveryJob: async (id: string): Promise<DiscoveryJob> => {
+        const res = await fetch(`/api/discovery/${id}`);
+        return res.json();
+    },
+
+    cancelDiscovery: async (id: string): Promise<void> => {
+        await fetch(`/api/discovery/${id}/cancel`, { method: 'POST' });
+    },
+
     getAlerts: async (): Promise<Alert[]> => {
         const res = await fetch('/api/alerts');
         return res.json();
+    },
+
+    // Changes after `since`; omit it (or fall too far behind) to get a full snapshot
+    getChanges: async (since?: number): Promise<ChangeSet> => {
+        const res = await fetch(since === undefined ? '/api/changes' : `/api/changes?since=${since}`);
+        return res.json();
+    },
+
+    // Live updates over Server-Sent Events; returns a function that closes the stream
+    subscribe: (handlers: StreamHandlers): (() => void) => {
+        const source = new EventSource('/api/stream');
+        source.addEventListener('hello', () => handlers.onResync());
+        source.addEventListener('resync', () => handlers.onResync());
+        source.addEventListener('changes', (e) => {
+            handlers.onChanges(JSON.parse((e as MessageEvent).data));
+        });
+        return () => source.close();
     }
 };
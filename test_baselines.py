@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+NetGuard Latency Baseline Tests
+Per-device EWMA baselines, slow detection against them, and saving / loading
+them with the latency history, using a simulated ICMP probe against temporary
+databases (no network access or running backend needed; run with pytest)
+"""
+
+import asyncio
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import numpy as np
+import pytest
+import timeseries
+from baseline import BASELINE_MIN_SAMPLES, LatencyBaselines, baselines, save_baselines
+from monitor import monitor_all_devices
+from probe_engine import classify_latency
+from probers import ProberSet
+from registry import registry
+
+# A LAN switch answering in about 1 ms and a long-haul link that always takes about 180 ms
+DEVICES = (
+    ('lan-switch', '10.30.0.1', 'switch', 1.0, 0.3),
+    ('wan-link', '10.30.0.2', 'router', 180.0, 4.0),
+)
+
+class Network:
+    """Simulated ICMP probe: normally distributed latency per address, with `extra` ms added on top"""
+
+    def __init__(self, seed=7):
+        self.random = random.Random(seed)
+        self.latency = {ip: (mean, spread) for _, ip, _, mean, spread in DEVICES}
+        self.extra = {}
+
+    async def probe(self, ip):
+        mean, spread = self.latency[ip]
+        latency = max(1, int(round(self.random.gauss(mean, spread) + self.extra.get(ip, 0))))
+        return {'status': 'online', 'latency': latency}
+
+@pytest.fixture
+def client(client):
+    """API client with only the DEVICES registered"""
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM devices')
+    registry.load()
+    for device_id, ip, device_type, _, _ in DEVICES:
+        response = client.post('/api/devices', json={
+            'id': device_id, 'name': device_id.title(), 'ip': ip, 'type': device_type,
+            'status': 'online', 'latency': 1, 'probeInterval': 1,
+        })
+        assert response.status_code == 201, response.json
+    return client
+
+def test_streaming_statistics():
+    """Streaming Mean and Variance"""
+    tracker = LatencyBaselines(alpha=0.1)
+    values = [10.0, 12.0, 11.0, 15.0, 9.0]
+    # Two devices per batch, one of them twice: updates apply in order
+    tracker.record([('a', 'online', values[0]), ('a', 'online', values[1]), ('b', 'offline', 0)])
+    tracker.record([('a', 'slow', value) for value in values[2:]] + [('b', 'online', 40.0)])
+
+    learned = tracker.export()
+    mean, variance, count = learned['a']
+    print(f"a: mean {mean:.3f} variance {variance:.3f} samples {count}")
+    # While warming up the baseline is the plain mean and population variance
+    assert count == len(values) and abs(mean - np.mean(values)) < 1e-9
+    assert abs(variance - np.var(values)) < 1e-9
+    assert learned['b'] == (40.0, 0.0, 1), "lost probes are not learned"
+    assert tracker.limits('a') is None, "no limits before BASELINE_MIN_SAMPLES answered probes"
+
+    tracker = LatencyBaselines()
+    for _ in range(BASELINE_MIN_SAMPLES):
+        tracker.record([('c', 'online', 11.0)])
+    slow_above, recover_below = tracker.limits('c')
+    print(f"c: slow above {slow_above:.1f} ms, back below {recover_below:.1f} ms")
+    assert 11 < recover_below < slow_above and slow_above >= 11 + 20
+
+    # A spike is clipped at the slow limit, so it barely moves the baseline
+    for _ in range(5):
+        tracker.record([('c', 'online', 5000.0)])
+    mean_after = tracker.export()['c'][0]
+    print(f"c: mean after a 5 s spike {mean_after:.1f} ms")
+    assert mean_after < 11 + 5
+
+def test_slow_is_judged_per_device(client):
+    """Slow Detection Against Each Device's Baseline"""
+    network = Network()
+    ips = {device_id: ip for device_id, ip, _, _, _ in DEVICES}
+
+    # Warm-up: the fixed 150 ms threshold applies, then the WAN link's own baseline takes over
+    for _ in range(BASELINE_MIN_SAMPLES + 10):
+        monitor_all_devices(probe=network.probe)
+    learned = client.get('/api/baselines').json['devices']
+    print(f"Baselines: {learned}")
+    assert all(learned[device_id]['learned'] for device_id in ips)
+    assert registry.get('wan-link')['status'] == 'online', "180 ms is normal for this link"
+    assert learned['lan-switch']['slowAboveMs'] < 50 < learned['wan-link']['slowAboveMs']
+    assert client.get('/api/baselines?device=wan-link').json['devices'].keys() == {'wan-link'}
+
+    # 60 ms is far under the old threshold but far above the switch's normal
+    network.extra[ips['lan-switch']] = 60
+    for _ in range(5):
+        monitor_all_devices(probe=network.probe)
+    assert registry.get('lan-switch')['status'] == 'slow'
+    assert registry.get('wan-link')['status'] == 'online'
+    alerts = client.get('/api/alerts?status=active').json
+    print(f"Active alerts: {[(alert['deviceId'], alert['message']) for alert in alerts]}")
+    assert [alert['deviceId'] for alert in alerts if alert['type'] == 'latency'] == ['lan-switch']
+
+    network.extra.clear()
+    for _ in range(5):
+        monitor_all_devices(probe=network.probe)
+    assert registry.get('lan-switch')['status'] == 'online'
+
+def test_baselines_survive_restart(client):
+    """Persistence"""
+    network = Network(seed=11)
+    for _ in range(BASELINE_MIN_SAMPLES):
+        monitor_all_devices(probe=network.probe)
+    baselines.record([('deleted-device', 'online', 5.0)])
+    save_baselines()
+
+    restarted = LatencyBaselines()
+    restarted.load(timeseries.store)
+    saved, loaded = baselines.export(), restarted.export()
+    print(f"Loaded: {loaded}")
+    assert 'deleted-device' not in loaded, "devices no longer registered are not saved"
+    assert loaded.keys() == {'lan-switch', 'wan-link'}
+    for device_id, values in loaded.items():
+        assert np.allclose(values, saved[device_id])
+        assert restarted.limits(device_id) == baselines.limits(device_id)
+
+    # A worker seeded by the coordinator keeps what it learned itself
+    worker = LatencyBaselines()
+    worker.record([('wan-link', 'online', 90.0)])
+    worker.seed(saved)
+    assert worker.export()['wan-link'] == (90.0, 0.0, 1)
+    assert np.allclose(worker.export()['lan-switch'], saved['lan-switch'])
+
+def test_probe_results_use_the_baseline():
+    """Raw Results Judged Against the Baseline"""
+    # dev-1 normally answers in 1 ms, dev-2 in 180 ms; dev-3 has no baseline yet
+    baselines.record([('dev-1', 'online', 1.0), ('dev-2', 'online', 180.0)] * BASELINE_MIN_SAMPLES)
+    answers = {'10.30.0.1': 60, '10.30.0.2': 190, '10.30.0.3': 160}
+
+    async def probe(ip):
+        return classify_latency(answers[ip]) if ip in answers else {'status': 'offline', 'latency': 0}
+
+    async def run():
+        probers = ProberSet(icmp=probe)
+        try:
+            return await asyncio.gather(*(probers.probe({'id': f'dev-{index}', 'ip': f'10.30.0.{index}'})
+                                          for index in range(1, 5)))
+        finally:
+            probers.close()
+
+    results = asyncio.run(run())
+    print(f"Results: {results}")
+    assert [result['status'] for result in results] == ['slow', 'online', 'slow', 'offline'], \
+        "60 ms is slow for a 1 ms device, 190 ms normal for a 180 ms one; no baseline: the fixed 150 ms"
+    assert [result['latency'] for result in results] == [60, 190, 160, 0]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
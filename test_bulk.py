@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+NetGuard Bulk Device API and Export Tests
+Imports, exports and bulk writes through the Flask test client against a
+temporary database (no running backend needed; run with pytest)
+"""
+
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import pytest
+from registry import registry
+
+DEVICES = 1200
+FAULT_LOGS = 100000
+
+@pytest.fixture
+def client(client):
+    """API client over an empty device table"""
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM devices')
+    registry.load()
+    return client
+
+def inventory_csv():
+    rows = ''.join(
+        f'd{index},Device {index},10.0.{index // 256}.{index % 256},router,true,,lab;rack{index % 3}\n'
+        for index in range(DEVICES)
+    )
+    return 'id,name,ip,type,isMonitored,probePort,tags\n' + rows + 'bad,,10.9.9.9,router,maybe,,\n'
+
+def test_csv_import_and_upsert(client):
+    """CSV Import and NDJSON Upsert"""
+    response = client.post('/api/devices/import', data=inventory_csv(), content_type='text/csv')
+    print(f"CSV import: {response.json['created']} created, {response.json['failed']} failed")
+    assert response.status_code == 200
+    assert response.json['created'] == DEVICES and response.json['failed'] == 1
+    assert response.json['errors'][0]['row'] == DEVICES + 2
+
+    # Runtime state must survive an update that does not mention it
+    database.save_sweep_results([('d1', 'online', 12)], [], [])
+    registry.load()
+    body = '\n'.join([
+        json.dumps({'id': 'd1', 'name': 'Core', 'ip': '10.0.0.1', 'type': 'router', 'probeType': 'tcp', 'probePort': 22}),
+        'not json',
+        json.dumps({'id': 'x1', 'name': 'New', 'ip': '192.168.1.9', 'type': 'server', 'tags': ['edge']}),
+    ])
+    response = client.post('/api/devices/import', data=body, content_type='application/x-ndjson')
+    print(f"NDJSON upsert: {response.json}")
+    assert (response.json['created'], response.json['updated'], response.json['failed']) == (1, 1, 1)
+
+    device = registry.get('d1')
+    assert device['name'] == 'Core' and device['probePort'] == 22
+    assert device['status'] == 'online' and device['tags'] == ['lab', 'rack1']
+    assert registry.get('x1')['tags'] == ['edge']
+
+def test_filtered_bulk_writes(client):
+    """Bulk Delete and Monitoring by Filter"""
+    client.post('/api/devices/import', data=inventory_csv(), content_type='text/csv')
+
+    assert client.delete('/api/devices').status_code == 400
+    assert client.delete('/api/devices?subnet=not-a-subnet').status_code == 400
+
+    response = client.patch('/api/devices/monitoring?subnet=10.0.1.0/24&tag=rack0', json={'isMonitored': False})
+    print(f"Disabled: {response.json}")
+    expected = sum(1 for index in range(256, 512) if index % 3 == 0)
+    assert response.json['updated'] == expected
+    assert len(registry.monitored_devices()) == DEVICES - expected
+
+    response = client.delete('/api/devices?subnet=10.0.4.0/22')
+    print(f"Deleted: {response.json}")
+    assert response.json['deleted'] == DEVICES - 1024
+    assert len(json.loads(client.get('/api/devices').data)) == 1024
+
+    changes = client.get('/api/changes?since=0').json
+    assert len(changes['removed']) == DEVICES - 1024
+
+def test_export_round_trip(client):
+    """Export Formats"""
+    client.post('/api/devices/import', data=inventory_csv(), content_type='text/csv')
+
+    response = client.get('/api/devices/export?format=ndjson&tag=rack2')
+    lines = response.data.decode().splitlines()
+    print(f"NDJSON export of rack2: {len(lines)} devices")
+    assert response.mimetype == 'application/x-ndjson'
+    assert len(lines) == sum(1 for index in range(DEVICES) if index % 3 == 2)
+    assert all(json.loads(line)['tags'] == ['lab', 'rack2'] for line in lines)
+
+    assert len(json.loads(client.get('/api/devices/export').data)) == DEVICES
+    exported = client.get('/api/devices/export?format=csv').data
+    response = client.post('/api/devices/import', data=exported, content_type='text/csv')
+    print(f"CSV re-import: {response.json}")
+    assert response.json['updated'] == DEVICES and response.json['failed'] == 0
+
+def test_log_export_streams(client):
+    """Streaming Fault Log Export"""
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM fault_logs')
+        conn.executemany('''
+            INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [('d1', 'Device 1', '10.0.0.1', 'connectivity', f'Outage {index}', 1_700_000_000_000 + index)
+              for index in range(FAULT_LOGS)])
+
+    for fmt in ('ndjson', 'csv'):
+        tracemalloc.start()
+        response = client.get(f'/api/logs/export?format={fmt}', buffered=False)
+        lines = sum(chunk.count(b'\n') for chunk in response.response)
+        response.close()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{fmt}: {lines} lines, peak {peak / 1e6:.1f} MB")
+        assert lines == FAULT_LOGS + (1 if fmt == 'csv' else 0)
+        # The whole export is over 10 MB; only a page of rows is ever held
+        assert peak < 8e6
+
+    response = client.get('/api/logs/export?format=ndjson&since=1700000000000&until=1700000000010')
+    timestamps = [json.loads(line)['timestamp'] for line in response.data.splitlines()]
+    assert timestamps == sorted(timestamps, reverse=True) and len(timestamps) == 10
+    assert client.get('/api/alerts/export?format=xml').status_code == 400
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+NetGuard Change Feed Tests
+ETags on /api/alerts and /api/devices and the /api/changes delta feed against
+a temporary database (no running backend needed; run with pytest)
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import pytest
+import retention
+
+DAY = 24 * 60 * 60 * 1000
+
+def add_alert(alert_id, timestamp, status='active'):
+    assert database.add_alert({
+        'id': alert_id, 'deviceId': '1', 'deviceName': 'Google DNS', 'deviceIp': '8.8.8.8',
+        'type': 'connectivity', 'message': 'Connection lost', 'timestamp': timestamp, 'status': status,
+    })
+
+def conditional_get(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+def test_alert_etag_follows_writes_and_deletes(client):
+    """Alert ETags and 304s"""
+    now = int(time.time() * 1000)
+    add_alert('old', now - 400 * DAY, status='resolved')
+    add_alert('new', now)
+
+    first = client.get('/api/alerts')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and {alert['id'] for alert in first.json} == {'old', 'new'}
+
+    unchanged = conditional_get(client, '/api/alerts', etag)
+    assert unchanged.status_code == 304 and unchanged.headers['ETag'] == etag and not unchanged.data
+    assert client.get('/api/alerts?status=active').headers['ETag'] != etag, "the query string is part of the tag"
+
+    add_alert('newer', now + 1)
+    changed = conditional_get(client, '/api/alerts', etag)
+    assert changed.status_code == 200 and len(changed.json) == 3
+    etag = changed.headers['ETag']
+
+    # A retention run deleting rows invalidates cached pages too
+    report = retention.run(now)
+    assert report['tables']['alerts']['deleted'] == 1
+    expired = conditional_get(client, '/api/alerts', etag)
+    print(f"After retention: {expired.status_code} {expired.headers['ETag']}")
+    assert expired.status_code == 200
+    assert {alert['id'] for alert in expired.json} == {'new', 'newer'}
+
+    # Deleting nothing leaves the version (and the tag) alone
+    etag = expired.headers['ETag']
+    assert database.delete_rows('alerts', ['missing']) == 0
+    assert conditional_get(client, '/api/alerts', etag).status_code == 304
+
+def test_device_etag(client):
+    """Device List ETag"""
+    first = client.get('/api/devices')
+    etag = first.headers['ETag']
+    assert conditional_get(client, '/api/devices', etag).status_code == 304
+
+    response = client.post('/api/devices', json={'id': 'x', 'name': 'X', 'ip': '10.50.0.1', 'type': 'server'})
+    assert response.status_code == 201
+    changed = conditional_get(client, '/api/devices', etag)
+    assert changed.status_code == 200 and 'x' in {device['id'] for device in changed.json}
+
+def test_changes_feed(client):
+    """Delta Feed"""
+    full = client.get('/api/changes').json
+    assert full['full'] and {device['id'] for device in full['devices']} == {'1', '2', '3'}
+    version = full['version']
+
+    # Nothing changed: an empty delta at the same version
+    assert client.get(f'/api/changes?since={version}').json == {
+        'version': version, 'full': False, 'devices': [], 'alerts': [], 'removed': []}
+
+    add_alert('a1', int(time.time() * 1000))
+    assert client.patch('/api/devices/2/toggle').status_code == 200
+    assert client.delete('/api/devices/3').status_code == 200
+    delta = client.get(f'/api/changes?since={version}').json
+    print(f"Delta: version {delta['version']}, devices {[d['id'] for d in delta['devices']]}, "
+          f"removed {delta['removed']}")
+    assert not delta['full'] and delta['version'] > version
+    assert [alert['id'] for alert in delta['alerts']] == ['a1']
+    assert [(device['id'], device['isMonitored']) for device in delta['devices']] == [('2', False)]
+    assert delta['removed'] == ['3']
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
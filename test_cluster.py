@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+NetGuard Cluster Tests
+Runs a coordinator in this process and several probe workers as separate
+processes on one machine; devices are TCP-probed against a local listener
+(no network access or running backend needed; run with pytest)
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.insert(0, BACKEND)
+
+import database
+import pytest
+from cluster import Coordinator, HashRing
+from registry import registry
+
+DEVICES = 60
+WORKERS = 3
+
+# Workers probe every device about twice a second
+WORKER_ENV = dict(os.environ, NETGUARD_PROBE_INTERVAL='0.5', NETGUARD_MAX_PROBE_INTERVAL='1', PYTHONUNBUFFERED='1')
+
+def wait_until(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.1)
+    return False
+
+def start_listener():
+    """Accepts and closes connections; stands in for the devices"""
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+
+    def serve():
+        while True:
+            try:
+                connection, _ = listener.accept()
+            except OSError:
+                return
+            connection.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    return listener
+
+def setup_devices(port):
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM devices')
+    for index in range(DEVICES):
+        database.add_device({
+            'id': f'dev-{index}', 'name': f'Device {index}', 'ip': '127.0.0.1', 'type': 'server',
+            'status': 'offline', 'lastChecked': 0, 'probeType': 'tcp', 'probePort': port,
+        })
+    registry.load()
+
+def start_worker(coordinator, name, cwd):
+    return subprocess.Popen(
+        [sys.executable, os.path.join(BACKEND, 'worker.py'), '--id', name,
+         '--coordinator', f'127.0.0.1:{coordinator.port}'],
+        env=WORKER_ENV, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+def checked_since(timestamp):
+    return {device['id'] for device in registry.monitored_devices() if device['lastChecked'] > timestamp}
+
+def test_hash_ring_moves_few_keys():
+    """Consistent Hash Ring"""
+    keys = [f'dev-{index}' for index in range(10000)]
+    ring = HashRing(['w1', 'w2', 'w3'])
+    before = {key: ring.owner(key) for key in keys}
+    shares = Counter(before.values())
+    print(f"Shares with 3 workers: {dict(shares)}")
+    assert all(2000 < count < 4700 for count in shares.values())
+
+    ring.add('w4')
+    moved = [key for key in keys if ring.owner(key) != before[key]]
+    print(f"Moved on join: {len(moved)}")
+    assert all(ring.owner(key) == 'w4' for key in moved)
+    assert len(moved) < len(keys) / 2
+
+    ring.remove('w4')
+    assert all(ring.owner(key) == before[key] for key in keys)
+    assert HashRing().owner('dev-1') is None
+
+def test_workers_share_devices_and_rebalance(storage):
+    """Sharded Workers"""
+    listener = start_listener()
+    setup_devices(listener.getsockname()[1])
+    coordinator = Coordinator()
+    coordinator.start('127.0.0.1', 0)
+    workers = [start_worker(coordinator, f'worker-{index}', storage) for index in range(WORKERS)]
+    try:
+        started = int(time.time() * 1000)
+        assert wait_until(lambda: len(coordinator.members) == WORKERS), coordinator.members
+        assert wait_until(lambda: len(checked_since(started)) == DEVICES), len(checked_since(started))
+        stats = coordinator.worker_stats()
+        print(f"Workers: {stats}")
+        assert sum(worker['devices'] for worker in stats.values()) == DEVICES
+        assert all(worker['devices'] > 0 and worker['results'] > 0 for worker in stats.values())
+
+        # A worker leaves: its devices move to the others and keep being probed
+        workers[0].terminate()
+        workers[0].wait(10)
+        assert wait_until(lambda: len(coordinator.members) == WORKERS - 1), coordinator.members
+        rebalanced = int(time.time() * 1000)
+        assert wait_until(lambda: len(checked_since(rebalanced)) == DEVICES), len(checked_since(rebalanced))
+        stats = coordinator.worker_stats()
+        print(f"After worker-0 left: {stats}")
+        assert sum(worker['devices'] for worker in stats.values()) == DEVICES
+
+        # A worker joins again and takes over part of the fleet
+        workers[0] = start_worker(coordinator, 'worker-0', storage)
+        assert wait_until(lambda: len(coordinator.members) == WORKERS), coordinator.members
+        assert wait_until(lambda: coordinator.worker_stats().get('worker-0', {}).get('results', 0) > 0)
+        print(f"After worker-0 rejoined: {coordinator.worker_stats()}, dropped: {coordinator.dropped_results}")
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait(10)
+        coordinator.stop()
+        listener.close()
+
+def test_workers_hold_back_unreachable_devices(storage):
+    """Topology Across Workers"""
+    listener = start_listener()
+    closed = socket.socket()
+    closed.bind(('127.0.0.1', 0))
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM devices')
+    # The router's port refuses connections; the hosts behind it still answer, so
+    # only the topology keeps their probes back
+    database.add_device({
+        'id': 'router', 'name': 'Router', 'ip': '127.0.0.1', 'type': 'router', 'status': 'online',
+        'lastChecked': 0, 'probeType': 'tcp', 'probePort': closed.getsockname()[1],
+    })
+    hosts = [f'host-{index}' for index in range(12)]
+    for host_id in hosts:
+        database.add_device({
+            'id': host_id, 'name': host_id, 'ip': '127.0.0.1', 'type': 'server', 'status': 'online',
+            'lastChecked': 0, 'probeType': 'tcp', 'probePort': listener.getsockname()[1], 'parentId': 'router',
+        })
+    registry.load()
+
+    coordinator = Coordinator()
+    coordinator.start('127.0.0.1', 0)
+    workers = [start_worker(coordinator, f'worker-{index}', storage) for index in range(2)]
+    try:
+        started = int(time.time() * 1000)
+        assert wait_until(lambda: len(checked_since(started)) == len(hosts) + 1)
+        assert wait_until(lambda: registry.get('router')['status'] == 'offline')
+
+        # Results already in flight land first; after that the hosts wait out the unreachable interval
+        time.sleep(2)
+        quiet = int(time.time() * 1000)
+        time.sleep(3)
+        probed = checked_since(quiet)
+        print(f"Checked with the router down: {sorted(probed)}")
+        assert 'router' in probed and not probed & set(hosts)
+    finally:
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait(10)
+        coordinator.stop()
+        listener.close()
+        closed.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
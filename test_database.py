@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+NetGuard Database Tests
+The database layer against a temporary database: the connection pool, the
+batched sweep transaction, schema migrations and keyset pagination (no running
+backend needed; run with pytest)
+"""
+
+import os
+import sqlite3
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import pytest
+
+def add_devices(count):
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM devices')
+    for index in range(count):
+        assert database.add_device({
+            'id': f'dev-{index}', 'name': f'Device {index}', 'ip': f'10.40.0.{index}', 'type': 'server',
+            'status': 'online', 'latency': 3, 'lastChecked': 0,
+        })
+
+def alert(alert_id, device_id, alert_type='connectivity'):
+    return {'id': alert_id, 'deviceId': device_id, 'deviceName': device_id, 'deviceIp': '10.40.0.1',
+            'type': alert_type, 'message': 'Connection lost', 'timestamp': 1000, 'status': 'active'}
+
+def table(sql, *params):
+    with database.read_connection() as conn:
+        return [tuple(row) for row in conn.execute(sql, params)]
+
+def test_sweep_is_one_transaction():
+    """Batched Sweep Transaction"""
+    add_devices(3)
+    version = database.get_data_version()
+
+    saved = database.save_sweep_results(
+        [('dev-0', 'offline', 0), ('dev-1', 'slow', 300), ('dev-2', 'online', 3)],
+        [alert('a0', 'dev-0'), alert('a1', 'dev-1', 'latency')],
+        [('dev-0', 'dev-0', '10.40.0.0', 'connectivity', 'Device went offline')],
+        timestamp=5000,
+    )
+    assert saved == version + 1, "the whole sweep shares one change version"
+    assert table('SELECT id, status, latency, last_checked FROM devices ORDER BY id') == [
+        ('dev-0', 'offline', 0, 5000), ('dev-1', 'slow', 300, 5000), ('dev-2', 'online', 3, 5000)]
+    # Only rows that moved are stamped, so dev-2 is not reported as changed
+    assert table('SELECT id FROM devices WHERE version = ? ORDER BY id', saved) == [('dev-0',), ('dev-1',)]
+    assert table('SELECT id FROM alerts WHERE version = ? ORDER BY id', saved) == [('a0',), ('a1',)]
+    assert table('SELECT timestamp FROM fault_logs') == [(5000,)]
+
+    # Resolutions ride along in the next sweep
+    saved = database.save_sweep_results([('dev-0', 'online', 4)], [], [], timestamp=6000,
+                                         resolutions=[('dev-0', ('connectivity',))])
+    assert table("SELECT id, status, resolved_at FROM alerts WHERE id = 'a0'") == [('a0', 'resolved', 6000)]
+
+    # A sweep that changes nothing a client can see hands its version back
+    assert database.save_sweep_results([('dev-2', 'online', 3)], [], [], timestamp=7000) is None
+    assert database.get_data_version() == saved
+
+    # One failing write (a duplicate alert id) rolls the whole sweep back
+    with pytest.raises(Exception):
+        database.save_sweep_results([('dev-2', 'offline', 0)], [alert('a1', 'dev-2')],
+                                    [('dev-2', 'dev-2', '10.40.0.2', 'connectivity', 'Device went offline')],
+                                    timestamp=8000)
+    assert table("SELECT status FROM devices WHERE id = 'dev-2'") == [('online',)]
+    assert len(table('SELECT id FROM fault_logs')) == 1
+    assert database.get_data_version() == saved
+
+def test_connection_pool(storage):
+    """Single Writer, Pooled Readers"""
+    pool = database.ConnectionPool(str(storage / 'pool.db'), size=2)
+    try:
+        with pool.writer() as conn:
+            conn.execute('CREATE TABLE items (value INTEGER)')
+
+        # Readers see the last committed state while a write is open (WAL)
+        with pool.writer() as conn:
+            conn.execute('INSERT INTO items VALUES (1)')
+            with pool.reader() as reader:
+                assert reader.execute('SELECT count(*) FROM items').fetchone()[0] == 0
+
+            # A nested writer joins the outer transaction
+            with pool.writer() as nested:
+                assert nested is conn
+                nested.execute('INSERT INTO items VALUES (2)')
+        with pool.reader() as reader:
+            assert reader.execute('SELECT count(*) FROM items').fetchone()[0] == 2
+
+        # An error rolls the transaction back
+        with pytest.raises(ZeroDivisionError):
+            with pool.writer() as conn:
+                conn.execute('INSERT INTO items VALUES (3)')
+                1 / 0
+        with pool.reader() as reader:
+            assert reader.execute('SELECT count(*) FROM items').fetchone()[0] == 2
+
+        # At most `size` read connections: a third reader waits for one to be returned
+        first = pool._acquire_reader()
+        second = pool._acquire_reader()
+        assert first is not second
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool._acquire_reader()))
+        waiter.start()
+        waiter.join(0.2)
+        assert waiter.is_alive() and not got
+        with pool._lock:
+            assert pool._created == 2
+        pool._idle.put(second)
+        waiter.join(5)
+        assert got == [second], "the returned connection is handed over, not a new one"
+        pool._idle.put(first)
+        pool._idle.put(second)
+    finally:
+        pool.close()
+
+# The schema before migrations existed (user_version 0), with a row in each table
+BASELINE_SCHEMA = '''
+    CREATE TABLE devices (
+        id TEXT PRIMARY KEY, name TEXT NOT NULL, ip TEXT NOT NULL, type TEXT NOT NULL,
+        status TEXT DEFAULT 'offline', latency INTEGER DEFAULT 0, last_checked INTEGER,
+        is_monitored INTEGER DEFAULT 1, uptime REAL DEFAULT 0.0
+    );
+    CREATE TABLE alerts (
+        id TEXT PRIMARY KEY, device_id TEXT, device_name TEXT, device_ip TEXT, type TEXT, message TEXT,
+        timestamp INTEGER, status TEXT DEFAULT 'active', FOREIGN KEY (device_id) REFERENCES devices (id)
+    );
+    CREATE TABLE fault_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, device_id TEXT, device_name TEXT, device_ip TEXT,
+        fault_type TEXT, description TEXT, timestamp INTEGER, FOREIGN KEY (device_id) REFERENCES devices (id)
+    );
+    INSERT INTO devices VALUES ('old', 'Old Router', '10.41.0.1', 'router', 'online', 4, 1000, 1, 99.5);
+    INSERT INTO alerts VALUES ('a-old', 'old', 'Old Router', '10.41.0.1', 'connectivity', 'Connection lost',
+                               1000, 'active');
+    INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+    VALUES ('old', 'Old Router', '10.41.0.1', 'connectivity', 'Device went offline', 1000);
+'''
+
+def test_migrations_upgrade_a_baseline_database(storage, monkeypatch):
+    """Migrations From a Baseline Database"""
+    path = str(storage / 'baseline.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.close()
+    database.close_connections()
+    monkeypatch.setattr(database, 'DB_PATH', path)
+
+    database.init_db()
+    with database.read_connection() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == len(database.MIGRATIONS)
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_alerts_timestamp', 'idx_fault_logs_device_timestamp', 'idx_devices_version'} <= indexes
+
+    # Existing rows survive and read back with the new columns' defaults
+    devices = database.get_all_devices()
+    assert [(device['id'], device['uptime'], device['parent_id']) for device in devices] == [('old', 99.5, None)]
+    alerts, _ = database.get_alerts_page()
+    assert [(alert['id'], alert['status'], alert['root_cause_id']) for alert in alerts] == [('a-old', 'active', None)]
+    assert database.search_table('fault_logs', '"offline"')['total'] == 1, "existing rows are indexed for search"
+
+    # Running it again changes nothing
+    version = database.get_data_version()
+    database.init_db()
+    assert database.get_data_version() == version and len(database.get_all_devices()) == 1
+
+def add_alert_rows(rows):
+    """(id, timestamp) alerts"""
+    with database.write_transaction() as conn:
+        conn.executemany('''
+            INSERT INTO alerts (id, device_id, device_name, device_ip, type, message, timestamp, status)
+            VALUES (?, 'dev', 'Device', '10.40.0.1', 'connectivity', 'Connection lost', ?, 'active')
+        ''', rows)
+
+def test_keyset_pages_with_shared_timestamps():
+    """Keyset Pagination Over Shared Timestamps"""
+    # 250 alerts over only four timestamps
+    add_alert_rows([(f'a{index:03d}', 1000 * (index % 4)) for index in range(250)])
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page, cursor = database.get_alerts_page(limit=30, cursor=cursor)
+        seen.extend(alert['id'] for alert in page)
+        pages += 1
+        if pages == 2:
+            # Rows written between pages do not shift the later ones: a newer row is not
+            # reached, an older one is
+            add_alert_rows([('late-new', 9000), ('late-old', 500)])
+        if cursor is None:
+            break
+
+    print(f"{len(seen)} alerts in {pages} pages")
+    with database.read_connection() as conn:
+        order = [row[0] for row in conn.execute('SELECT id FROM alerts ORDER BY timestamp DESC, id DESC')]
+    assert len(seen) == len(set(seen)), "no alert on two pages"
+    assert seen == [alert_id for alert_id in order if alert_id != 'late-new']
+    assert pages == 9
+
+    streamed = [alert['id'] for alert in database.iter_alerts(page_size=7)]
+    assert streamed == order
+    assert [alert['id'] for alert in database.iter_alerts(since=1000, until=2000, page_size=7)] == \
+        [f'a{index:03d}' for index in reversed(range(250)) if index % 4 == 1]
+
+    with pytest.raises(ValueError):
+        database.get_alerts_page(cursor='not a cursor')
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+NetGuard Device State Tests
+The per-device state machine fed verdict sequences: N-of-M confirmation,
+slow hysteresis and flap detection, and the alerts the monitor raises,
+suppresses and resolves from them against a temporary database (no running
+backend needed; run with pytest)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import device_state
+import probe_scheduler
+import pytest
+from device_state import DeviceStateMachine, device_states
+from monitor import record_results
+from probe_scheduler import ProbeScheduler
+from registry import registry
+
+LOST = {'status': 'offline', 'latency': 0}
+
+def answered(latency=3):
+    return {'status': 'online', 'latency': latency}
+
+def statuses(machine, results):
+    """Confirmed status after each result"""
+    return [machine.observe(result).status for result in results]
+
+def test_changes_need_n_of_m_confirmations():
+    """N-of-M Confirmation"""
+    machine = DeviceStateMachine('online', 3)
+    # Offline once OFFLINE_CONFIRM of the last CONFIRM_WINDOW probes were lost, not on the first loss
+    verdicts = [machine.observe(result) for result in (LOST, answered(), LOST, answered(), LOST)]
+    assert [verdict.status for verdict in verdicts] == ['online'] * 4 + ['offline']
+    assert [verdict.pending for verdict in verdicts] == [True, False, True, False, False]
+
+    # A single answer does not bring it back; RECOVER_CONFIRM in a row do
+    verdicts = [machine.observe(result) for result in (answered(), LOST, answered(), answered())]
+    assert [verdict.status for verdict in verdicts] == ['offline', 'offline', 'offline', 'online']
+    assert verdicts[-1].previous == 'offline'
+
+    # The window restarts on a transition: earlier losses do not count towards the next one
+    assert statuses(machine, [LOST, LOST, answered(), LOST]) == ['online', 'online', 'online', 'offline']
+
+def test_slow_hysteresis():
+    """Slow Hysteresis"""
+    assert (device_state.SLOW_EXIT_MS, device_state.FIXED_LIMITS[0]) == (120, 150)
+    machine = DeviceStateMachine('online', 3)
+    assert statuses(machine, [answered(160), answered(140), answered(170), answered(180)]) == \
+        ['online', 'online', 'online', 'slow']
+
+    # Between the exit and entry limits nothing toggles, however long it lasts
+    in_band = [machine.observe(answered(latency)) for latency in (130, 145, 121, 149, 135, 130, 140)]
+    assert {verdict.status for verdict in in_band} == {'slow'}
+    assert {verdict.raw for verdict in in_band} == {'online'}, "each probe alone is under the entry limit"
+
+    assert statuses(machine, [answered(110), answered(100), answered(119)]) == ['slow', 'slow', 'online']
+    assert set(statuses(machine, [answered(latency) for latency in (130, 149, 145, 140, 135)])) == {'online'}
+
+    # A device with a latency baseline is judged against its own limits
+    assert machine.observe(answered(60), limits=(50, 40)).raw == 'slow'
+
+def add_host():
+    assert database.add_device({'id': 'host', 'name': 'Host', 'ip': '10.80.0.1', 'type': 'server',
+                                'status': 'online', 'latency': 3, 'lastChecked': 0})
+    registry.load()
+
+def feed(device_id, results):
+    """Probe results through the state machine and the monitor's batch, like a sweep"""
+    for result in results:
+        device = registry.get(device_id)
+        record_results([(device, result, device_states.observe(device, result))])
+
+def alerts(device_id):
+    with database.read_connection() as conn:
+        return [tuple(row) for row in conn.execute(
+            'SELECT type, status FROM alerts WHERE device_id = ? ORDER BY rowid', (device_id,))]
+
+def fault_types(device_id):
+    with database.read_connection() as conn:
+        return [row[0] for row in conn.execute(
+            'SELECT fault_type FROM fault_logs WHERE device_id = ? ORDER BY id', (device_id,))]
+
+def test_alerts_resolve_on_recovery():
+    """Alerts Resolve on Recovery"""
+    add_host()
+    feed('host', [LOST] * 3)
+    assert registry.get('host')['status'] == 'offline'
+    assert alerts('host') == [('connectivity', 'active')]
+
+    feed('host', [answered(), answered()])
+    assert registry.get('host')['status'] == 'online'
+    assert alerts('host') == [('connectivity', 'resolved')]
+    assert fault_types('host') == ['connectivity', 'recovery']
+
+    feed('host', [answered(200)] * 3)
+    assert alerts('host')[-1] == ('latency', 'active')
+    feed('host', [answered(20)] * 3)
+    assert alerts('host') == [('connectivity', 'resolved'), ('latency', 'resolved')]
+
+def test_flapping_suppresses_alerts():
+    """Flapping Devices Have Their Alerts Suppressed"""
+    add_host()
+    # Three losses then two answers: every cycle goes offline and back
+    cycle = [LOST] * 3 + [answered()] * 2
+    feed('host', cycle * 4)
+    assert alerts('host') == [('connectivity', 'resolved')] * 4
+    assert fault_types('host').count('flapping') == 0
+
+    # The next result completes FLAP_HISTORY; from then on outages are logged but not alerted
+    feed('host', cycle * 4)
+    print(f"Alerts: {alerts('host')}")
+    assert alerts('host') == [('connectivity', 'resolved')] * 4 + [('flapping', 'active')]
+    assert fault_types('host').count('connectivity') == 8 and fault_types('host').count('recovery') == 8
+
+    # It settles offline: once the flapping ends the held-back alert is raised
+    feed('host', [LOST] * 3)
+    assert registry.get('host')['status'] == 'offline' and alerts('host')[-1] == ('flapping', 'active')
+    feed('host', [LOST] * 10)
+    assert alerts('host')[-2:] == [('flapping', 'resolved'), ('connectivity', 'active')]
+    assert fault_types('host')[-2:] == ['connectivity', 'flapping'] and fault_types('host').count('flapping') == 2
+
+class Source:
+    """A device list that changes without a new revision, as between two reconciles"""
+
+    revision = 1
+
+    def __init__(self, devices):
+        self.devices = {device['id']: device for device in devices}
+
+    def monitored_devices(self):
+        return list(self.devices.values())
+
+    def get(self, device_id):
+        return self.devices.get(device_id)
+
+    def root_cause(self, device_id):
+        return None
+
+    def descendants(self, device_id):
+        return []
+
+def test_removed_devices_are_forgotten(monkeypatch):
+    """State of Removed Devices Is Forgotten"""
+    add_host()
+    device = registry.get('host')
+    device_states.observe(device, LOST)
+    device_states.observe(device, LOST)
+
+    source = Source([device])
+    scheduler = ProbeScheduler(source=source, sink=lambda results: None)
+    scheduler._reconcile()
+    # Removed after its timer was set: the timer finds it gone
+    del source.devices['host']
+
+    class Later:
+        @staticmethod
+        def monotonic():
+            return 10 ** 9
+
+    monkeypatch.setattr(probe_scheduler, 'time', Later)
+
+    async def dispatch():
+        scheduler._dispatch(asyncio.Semaphore(1), None, set())
+
+    asyncio.run(dispatch())
+    assert scheduler.scheduled_count == 0
+    assert 'host' not in device_states._machines
+
+    # Re-added, it starts from a clean window instead of two stale losses
+    assert device_states.observe(device, LOST).status == 'online'
+    assert device_states.observe(device, LOST).status == 'online'
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
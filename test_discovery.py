@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+NetGuard Discovery Tests
+Sweeps loopback ranges with TCP probes against local listeners through the
+Flask test client (no network access or running backend needed; run with
+pytest, which gives every test its own temporary databases)
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import pytest
+from discovery import DiscoveryRunner
+
+PORT = 18022
+LIVE_HOSTS = ('127.0.1.5', '127.0.1.77', '127.0.1.200')
+
+def start_listeners():
+    """Accept and close connections on a few loopback addresses; they stand in for live hosts"""
+    listeners = []
+    for ip in LIVE_HOSTS:
+        listener = socket.socket()
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((ip, PORT))
+        listener.listen(64)
+        listeners.append(listener)
+
+        def serve(listener=listener):
+            while True:
+                try:
+                    connection, _ = listener.accept()
+                except OSError:
+                    return
+                connection.close()
+
+        threading.Thread(target=serve, daemon=True).start()
+    return listeners
+
+def run_queued(runner):
+    runner.poll()
+    while runner.busy:
+        time.sleep(0.1)
+
+def test_discovery_registers_live_hosts(client):
+    """Discover a /22"""
+    listeners = start_listeners()
+    runner = DiscoveryRunner()
+    try:
+        assert client.post('/api/discovery', json={'cidr': '10.0.0.0/8'}).status_code == 400
+        assert client.post('/api/discovery', json={'cidr': 'nope'}).status_code == 400
+
+        response = client.post('/api/discovery', json={
+            'cidr': '127.0.0.0/22', 'probeType': 'tcp', 'probePort': PORT, 'rate': 5000,
+            'tags': ['lab'], 'resolveNames': False,
+        })
+        assert response.status_code == 202 and response.json['status'] == 'queued'
+        job_id = response.json['id']
+        run_queued(runner)
+
+        job = client.get(f'/api/discovery/{job_id}').json
+        print(f"Job: {job['status']}, {job['probed']} probed, {job['found']} found at {job['probesPerSecond']}/s")
+        assert job['status'] == 'completed' and job['progress'] == 100.0
+        assert (job['total'], job['probed'], job['found'], job['added']) == (1022, 1022, 3, 3)
+
+        devices = {device['ip']: device for device in json.loads(client.get('/api/devices').data)}
+        for ip in LIVE_HOSTS:
+            assert devices[ip]['status'] == 'online'
+            assert devices[ip]['probeType'] == 'tcp' and devices[ip]['probePort'] == PORT
+            assert devices[ip]['tags'] == ['lab', 'discovered']
+
+        # Known hosts are not probed again
+        job_id = client.post('/api/discovery', json={
+            'cidr': '127.0.1.0/24', 'probeType': 'tcp', 'probePort': PORT, 'resolveNames': False,
+        }).json['id']
+        run_queued(runner)
+        job = client.get(f'/api/discovery/{job_id}').json
+        assert (job['skipped'], job['found'], job['added']) == (3, 0, 0)
+    finally:
+        for listener in listeners:
+            listener.close()
+
+def test_discovery_cancel(client):
+    """Cancel Discovery"""
+    runner = DiscoveryRunner()
+
+    queued = client.post('/api/discovery', json={'cidr': '127.0.3.0/30'}).json['id']
+    assert client.post(f'/api/discovery/{queued}/cancel').json['status'] == 'cancelled'
+    assert client.post('/api/discovery/missing/cancel').status_code == 404
+
+    job_id = client.post('/api/discovery', json={
+        'cidr': '127.0.2.0/24', 'probeType': 'tcp', 'probePort': PORT, 'rate': 50, 'resolveNames': False,
+    }).json['id']
+    runner.poll()
+    time.sleep(1.5)
+    client.post(f'/api/discovery/{job_id}/cancel')
+    started = time.monotonic()
+    while runner.busy:
+        time.sleep(0.1)
+    job = client.get(f'/api/discovery/{job_id}').json
+    print(f"Cancelled after {job['probed']} of {job['total']} probes")
+    assert job['status'] == 'cancelled' and job['probed'] < job['total']
+    assert time.monotonic() - started < 5
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+NetGuard Metrics Tests
+Prometheus exposition, hot-path instrumentation (sweeps, probes, database,
+API routes) and structured log output against a temporary database (no
+running backend needed; run with pytest)
+"""
+
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import metrics
+import monitor
+import pytest
+from log import JsonFormatter, TextFormatter
+
+def sample(text, name, **labels):
+    """Value of one series in rendered metrics (None when absent)"""
+    for line in text.splitlines():
+        series, _, value = line.rpartition(' ')
+        if series.split('{')[0] != name:
+            continue
+        found = dict(re.findall(r'(\w+)="([^"]*)"', series))
+        if found == {key: str(value) for key, value in labels.items()}:
+            return float(value)
+    return None
+
+async def answer(ip):
+    """Stand-in for the ICMP probe: every device answers in 12 ms"""
+    return {'status': 'online', 'latency': 12}
+
+def test_exposition_format():
+    """Exposition Format"""
+    registry_ = metrics.Registry()
+    metrics.REGISTRY, saved = registry_, metrics.REGISTRY
+    try:
+        counter = metrics.Counter('test_events_total', 'Events', ['kind'])
+        histogram = metrics.Histogram('test_seconds', 'Durations', buckets=(0.1, 1))
+    finally:
+        metrics.REGISTRY = saved
+    counter.labels('a "quoted"\nkind').inc(2)
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value)
+
+    text = registry_.render()
+    print(text)
+    assert '# TYPE test_events_total counter' in text
+    assert 'test_events_total{kind="a \\"quoted\\"\\nkind"} 2' in text
+    assert sample(text, 'test_seconds_bucket', le='0.1') == 1
+    assert sample(text, 'test_seconds_bucket', le='1') == 3, "buckets are cumulative"
+    assert sample(text, 'test_seconds_bucket', le='+Inf') == 4
+    assert sample(text, 'test_seconds_count') == 4
+    assert sample(text, 'test_seconds_sum') == 4.05
+
+def test_hot_path_instrumentation(client):
+    """Hot-Path Instrumentation"""
+    before = metrics.render()
+    monitor.monitor_all_devices(probe=answer)
+
+    assert client.get('/api/devices').status_code == 200
+    assert client.get('/api/alerts?limit=5').status_code == 200
+
+    after = metrics.render()
+    sweeps = sample(after, 'netguard_sweep_duration_seconds_count') - \
+        (sample(before, 'netguard_sweep_duration_seconds_count') or 0)
+    probes = sample(after, 'netguard_probe_results_total', probe_type='icmp', status='online')
+    print(f"Sweeps {sweeps:.0f}, online ICMP probes {probes:.0f}")
+    assert sweeps == 1
+    assert probes >= 1, "the seeded ICMP device was probed"
+    assert sample(after, 'netguard_probes_in_flight') == 0
+    assert sample(after, 'netguard_probe_rtt_seconds_bucket', probe_type='icmp', le='0.025') >= 1
+    assert sample(after, 'netguard_db_operation_seconds_count', operation='get_all_devices') >= 1
+    requests = {'method': 'GET', 'route': '/api/alerts', 'status': '200'}
+    alert_requests = sample(after, 'netguard_http_request_duration_seconds_count', **requests) - \
+        (sample(before, 'netguard_http_request_duration_seconds_count', **requests) or 0)
+    assert alert_requests == 1, "labelled by route template"
+
+def test_metrics_server():
+    """Standalone /metrics Server"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = metrics.serve(port, '127.0.0.1')
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            body = response.read().decode()
+            assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+        print(f"Served {len(body.splitlines())} lines on port {port}")
+        assert '# TYPE netguard_sweep_overruns_total counter' in body
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert metrics.serve(0) is None, "port 0 disables the server"
+
+def test_log_formats():
+    """Structured Log Formats"""
+    record = logging.LogRecord('netguard.monitor', logging.WARNING, __file__, 1, 'Device offline', (), None)
+    record.device = 'Router'
+    record.ip = '10.0.0.1'
+
+    line = TextFormatter().format(record)
+    print(line)
+    assert line.endswith('WARNING monitor: Device offline device=Router ip=10.0.0.1')
+
+    entry = json.loads(JsonFormatter().format(record))
+    print(entry)
+    assert entry['level'] == 'warning' and entry['logger'] == 'monitor'
+    assert entry['msg'] == 'Device offline' and entry['ip'] == '10.0.0.1'
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+NetGuard Probe Engine Tests
+The bounded-concurrency sweep engine with a simulated probe, the ICMP
+prober's fallback to forked ping and the burst summary statistics (no network
+access or running backend needed; run with pytest)
+"""
+
+import asyncio
+import os
+import socket
+import statistics
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import icmp
+import probe_engine
+import pytest
+from probe_engine import parse_burst_output, probe_all_async, summarize_burst
+
+def test_in_flight_limit():
+    """Bounded Concurrency"""
+    in_flight = peak = 0
+
+    async def probe(device):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        if device['ip'].endswith('.13'):
+            raise OSError('Network is unreachable')
+        return {'status': 'online', 'latency': 1}
+
+    devices = [{'id': f'dev-{index}', 'ip': f'10.0.0.{index}'} for index in range(100)]
+    results = asyncio.run(probe_all_async(devices, probe, max_in_flight=8))
+    print(f"Peak in flight: {peak}")
+    assert peak == 8, "never more than max_in_flight, and the limit is used"
+    assert [device for device, _ in results] == devices, "results come back in device order"
+
+    # A probe that raises reports its device offline instead of failing the sweep
+    statuses = {device['id']: result['status'] for device, result in results}
+    assert statuses['dev-13'] == 'offline'
+    assert sum(status == 'online' for status in statuses.values()) == 99
+
+def test_icmp_falls_back_without_add_reader(monkeypatch):
+    """Ping Fallback on Loops Without add_reader"""
+    sockets = []
+
+    def open_socket():
+        sockets.append(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+        return sockets[-1], False
+
+    async def run():
+        loop = asyncio.get_running_loop()
+
+        def add_reader(*args):
+            raise NotImplementedError
+
+        # What the Proactor loop (the default on Windows) does
+        monkeypatch.setattr(loop, 'add_reader', add_reader)
+        return icmp.IcmpProber.open(), probe_engine.open_default_probe()
+
+    monkeypatch.setattr(icmp, 'open_icmp_socket', open_socket)
+    monkeypatch.setattr(probe_engine, 'NATIVE_ICMP', True)
+    prober, (probe, default_prober) = asyncio.run(run())
+    assert prober is None and default_prober is None
+    assert probe is probe_engine.ping_device_async
+    assert all(sock.fileno() == -1 for sock in sockets), "the unused ICMP sockets are closed"
+
+def test_burst_summary():
+    """Burst Loss, Jitter and Percentiles"""
+    result = summarize_burst([10.0, None, 30.0, 20.0, None])
+    print(f"Burst summary: {result}")
+    assert result == {'status': 'online', 'latency': 20, 'loss': 40.0, 'min': 10.0, 'avg': 20.0, 'max': 30.0,
+                      'mdev': 8.165, 'p95': 30.0}
+    # mdev is the population standard deviation of the answered packets, as ping reports it
+    rtts = [0.4, 1.2, 0.9, 5.7, 0.8, 0.5]
+    assert summarize_burst(rtts)['mdev'] == round(statistics.pstdev(rtts), 3)
+
+    # Nearest-rank p95: the 19th of 20 sorted replies, the largest of 19
+    assert summarize_burst([float(rtt) for rtt in range(20, 0, -1)])['p95'] == 19.0
+    assert summarize_burst([float(rtt) for rtt in range(1, 20)])['p95'] == 19.0
+    assert summarize_burst([5.5]) == {'status': 'online', 'latency': 6, 'loss': 0.0, 'min': 5.5, 'avg': 5.5,
+                                      'max': 5.5, 'mdev': 0.0, 'p95': 5.5}
+
+    assert summarize_burst([None, 12.0, None])['loss'] == 66.7
+    assert summarize_burst([None] * 4) == {'status': 'offline', 'latency': 0, 'loss': 100.0}
+
+def test_burst_slow_statistic(monkeypatch):
+    """Slow Statistic"""
+    rtts = [20.0] * 18 + [400.0, 400.0]
+    assert summarize_burst(rtts)['status'] == 'online', "the average (58 ms) is under the threshold"
+    monkeypatch.setattr(probe_engine, 'SLOW_STATISTIC', 'p95')
+    assert summarize_burst(rtts)['status'] == 'slow' and summarize_burst(rtts)['latency'] == 400
+
+@pytest.mark.skipif(probe_engine.IS_WINDOWS, reason='Linux ping output')
+def test_parse_burst_output():
+    """Burst Ping Output"""
+    output = '\n'.join(f'64 bytes from 10.0.0.1: icmp_seq={seq} ttl=64 time={rtt} ms'
+                       for seq, rtt in ((1, 1.25), (2, 1.75), (4, 3.0)))
+    result = parse_burst_output(output, 4)
+    assert (result['loss'], result['min'], result['max'], result['avg']) == (25.0, 1.25, 3.0, 2.0)
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
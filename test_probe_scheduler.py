@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+NetGuard Probe Scheduler Tests
+The adaptive scheduler driven step by step on a fake clock with a simulated
+probe: per-device intervals, backoff while healthy, fast retries on a
+suspected change, jitter and reconciling after the device list changes (no
+network access or running backend needed; run with pytest)
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import probe_scheduler
+import pytest
+from device_state import device_states
+from probe_scheduler import ProbeScheduler
+from registry import registry
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+class Midpoint:
+    """random stand-in: no jitter, and first probes half an interval in"""
+
+    @staticmethod
+    def uniform(low, high):
+        return (low + high) / 2
+
+class FakeProbers:
+    """Answers every probe at once; a device is down during its (start, end) clock ranges"""
+
+    def __init__(self, clock, down=None):
+        self.clock = clock
+        self.down = down or {}
+        self.calls = []
+
+    async def probe(self, device):
+        self.calls.append((device['id'], self.clock.now))
+        if any(start <= self.clock.now < end for start, end in self.down.get(device['id'], ())):
+            return {'status': 'offline', 'latency': 0}
+        return {'status': 'online', 'latency': 3}
+
+    def times(self, device_id):
+        return [now for called, now in self.calls if called == device_id]
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(probe_scheduler, 'time', clock)
+    monkeypatch.setattr(probe_scheduler, 'random', Midpoint)
+    return clock
+
+def add_devices(*devices):
+    """(id, type, probeInterval) devices, replacing the seeded ones"""
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM devices')
+    for index, (device_id, device_type, interval) in enumerate(devices):
+        assert database.add_device({
+            'id': device_id, 'name': device_id, 'ip': f'10.70.0.{index + 1}', 'type': device_type,
+            'status': 'online', 'latency': 3, 'lastChecked': 0, 'probeInterval': interval,
+        })
+    registry.load()
+
+def run(scheduler, clock, probers, until):
+    """Advance the clock from one due probe to the next until `until`, like the scheduler's loop"""
+    async def main():
+        semaphore = asyncio.Semaphore(8)
+        tasks = set()
+        while True:
+            if registry.revision != scheduler._revision:
+                scheduler._reconcile()
+            if not scheduler._heap or scheduler._heap[0][0] > until:
+                break
+            clock.now = max(clock.now, scheduler._heap[0][0])
+            scheduler._dispatch(semaphore, probers, tasks)
+            await asyncio.gather(*tasks)
+        clock.now = until
+    asyncio.run(main())
+
+def test_intervals_backoff_and_retries(clock):
+    """Intervals, Backoff and Fast Retries"""
+    add_devices(('srv', 'server', None), ('ws', 'workstation', None), ('fixed', 'server', 2))
+    probers = FakeProbers(clock, down={'srv': [(60, 90)]})
+    scheduler = ProbeScheduler(sink=lambda results: None)
+    run(scheduler, clock, probers, until=101)
+
+    for device_id in ('srv', 'ws', 'fixed'):
+        print(f"{device_id}: {probers.times(device_id)}")
+    # Type defaults (5 s, 15 s for workstations) or the device's own interval; after
+    # BACKOFF_AFTER unchanged results each interval doubles, up to MAX_INTERVAL
+    assert probers.times('ws') == [7.5, 22.5, 37.5, 52.5, 82.5]
+    assert probers.times('fixed') == [1, 3, 5, 7, 11, 19, 35, 65, 95]
+
+    # srv goes down at 60: the first loss is retried a second later until the outage is
+    # confirmed, then it is probed at its base interval; recovery is confirmed the same way
+    assert probers.times('srv') == [2.5, 7.5, 12.5, 17.5, 27.5, 47.5,
+                                    77.5, 78.5, 79.5, 84.5, 89.5, 94.5, 95.5, 100.5]
+    assert registry.get('srv')['status'] == 'online'
+    assert len(scheduler._pending) == len(probers.calls), "every result is queued for the sink"
+
+def test_fast_retries_are_capped(clock, monkeypatch):
+    """Fast Retries Are Capped"""
+    monkeypatch.setattr(probe_scheduler, 'FAST_RETRIES', 1)
+    add_devices(('srv', 'server', None))
+    probers = FakeProbers(clock, down={'srv': [(10, 100)]})
+    run(ProbeScheduler(sink=lambda results: None), clock, probers, until=30)
+
+    # One quick retry, then the unconfirmed loss waits for the next regular probe
+    assert probers.times('srv') == [2.5, 7.5, 12.5, 13.5, 18.5, 23.5, 28.5]
+
+def test_jitter():
+    """Jitter"""
+    delays = [probe_scheduler.jittered(10) for _ in range(1000)]
+    assert all(10 * (1 - probe_scheduler.JITTER) <= delay <= 10 * (1 + probe_scheduler.JITTER) for delay in delays)
+    assert max(delays) - min(delays) > 10 * probe_scheduler.JITTER, "spread over the range"
+
+def test_reconcile_after_reconfiguration(clock):
+    """Reconcile After Devices Change"""
+    add_devices(('a', 'server', 4), ('b', 'server', 4))
+    probers = FakeProbers(clock)
+    scheduler = ProbeScheduler(sink=lambda results: None)
+    run(scheduler, clock, probers, until=10)
+    assert scheduler.scheduled_count == 2 and device_states._machines.keys() == {'a', 'b'}
+
+    # Another writer removes a, stops monitoring b and adds c
+    assert database.delete_device('a') and database.toggle_monitoring('b')
+    assert database.add_device({'id': 'c', 'name': 'c', 'ip': '10.70.0.9', 'type': 'server', 'status': 'online',
+                                'latency': 3, 'probeInterval': 6})
+    registry.sync()
+    run(scheduler, clock, probers, until=30)
+    assert [now for _, now in probers.calls if now > 10] == [13, 19, 25]
+    assert probers.times('c') == [13, 19, 25], "the new device starts half an interval after it appears"
+    assert scheduler.scheduled_count == 1
+    assert device_states._machines.keys() == {'c'}, "state of the removed devices is forgotten"
+
+    # Monitoring b again schedules it afresh
+    assert database.toggle_monitoring('b')
+    registry.sync()
+    run(scheduler, clock, probers, until=40)
+    assert [now for now in probers.times('b') if now > 30] == [32, 36, 40]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+NetGuard Prober Tests
+Runs the TCP, HTTP and DNS probers against stand-in servers on 127.0.0.1
+(no network access or running backend needed; run with pytest)
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import pytest
+from probers import (
+    PROBERS, DnsProber, HttpProber, Prober, ProberSet, TcpProber, build_dns_query, http_target, parse_dns_reply,
+    probe_all, register_prober
+)
+
+LOCALHOST = '127.0.0.1'
+
+def free_port():
+    """A local TCP/UDP port nothing is listening on"""
+    with socket.socket() as sock:
+        sock.bind((LOCALHOST, 0))
+        return sock.getsockname()[1]
+
+def device(probe_type, port=None, target=None, ip=LOCALHOST):
+    return {'id': probe_type, 'ip': ip, 'probeType': probe_type, 'probePort': port, 'probeTarget': target}
+
+async def start_http_server(status=200, body=b'ok', close=False):
+    """Minimal keep-alive HTTP server; returns (server, port, stats)"""
+    stats = {'connections': 0, 'requests': 0, 'paths': []}
+
+    async def handle(reader, writer):
+        stats['connections'] += 1
+        try:
+            while True:
+                request = await reader.readuntil(b'\r\n\r\n')
+                stats['requests'] += 1
+                stats['paths'].append(request.split(b' ')[1].decode())
+                headers = f'HTTP/1.1 {status} Status\r\nContent-Length: {len(body)}\r\n'
+                if close:
+                    headers += 'Connection: close\r\n'
+                writer.write(headers.encode() + b'\r\n' + body)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, LOCALHOST, 0)
+    return server, server.sockets[0].getsockname()[1], stats
+
+class DnsStandIn(asyncio.DatagramProtocol):
+    """Answers every query with an empty response carrying `rcode`"""
+
+    def __init__(self, rcode=0):
+        self.rcode = rcode
+        self.names = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        query_id, = struct.unpack('!H', data[:2])
+        labels, position = [], 12
+        while data[position]:
+            labels.append(data[position + 1:position + 1 + data[position]].decode())
+            position += 1 + data[position]
+        self.names.append('.'.join(labels))
+        header = struct.pack('!HHHHHH', query_id, 0x8180 | self.rcode, 1, 0, 0, 0)
+        self.transport.sendto(header + data[12:], addr)
+
+async def start_dns_server(rcode=0):
+    transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+        lambda: DnsStandIn(rcode), local_addr=(LOCALHOST, 0)
+    )
+    return transport, transport.get_extra_info('sockname')[1], protocol
+
+def test_tcp_probe():
+    """TCP Connect Probe"""
+    async def run():
+        server = await asyncio.start_server(lambda reader, writer: writer.close(), LOCALHOST, 0)
+        port = server.sockets[0].getsockname()[1]
+        prober = TcpProber()
+        try:
+            return await prober.probe(device('tcp', port)), await prober.probe(device('tcp', free_port()))
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    up, down = asyncio.run(run())
+    print(f"Listening port: {up}, closed port: {down}")
+    assert up['status'] == 'online'
+    assert down['status'] == 'offline'
+
+def test_http_probe_reuses_connection():
+    """HTTP Probe (keep-alive)"""
+    async def run():
+        server, port, stats = await start_http_server()
+        prober = HttpProber()
+        try:
+            results = [await prober.probe(device('http', port, '/health')) for _ in range(3)]
+        finally:
+            prober.close()
+            server.close()
+        return results, stats
+
+    results, stats = asyncio.run(run())
+    print(f"Results: {results}, server stats: {stats}")
+    assert all(result['status'] == 'online' and result['httpStatus'] == 200 for result in results)
+    assert stats['requests'] == 3
+    assert stats['connections'] == 1
+    assert stats['paths'] == ['/health'] * 3
+
+def test_http_probe_reconnects_when_closed():
+    """HTTP Probe (Connection: close)"""
+    async def run():
+        server, port, stats = await start_http_server(close=True)
+        prober = HttpProber()
+        try:
+            results = [await prober.probe(device('http', port)) for _ in range(2)]
+        finally:
+            prober.close()
+            server.close()
+        return results, stats
+
+    results, stats = asyncio.run(run())
+    print(f"Results: {results}, server stats: {stats}")
+    assert all(result['status'] == 'online' for result in results)
+    assert stats['connections'] == 2
+
+def test_http_probe_server_error():
+    """HTTP Probe (failures)"""
+    async def run():
+        server, port, _ = await start_http_server(status=503)
+        prober = HttpProber()
+        try:
+            return await prober.probe(device('http', port)), await prober.probe(device('http', free_port()))
+        finally:
+            prober.close()
+            server.close()
+
+    error, refused = asyncio.run(run())
+    print(f"503 response: {error}, closed port: {refused}")
+    assert error == {'status': 'offline', 'latency': 0, 'httpStatus': 503}
+    assert refused == {'status': 'offline', 'latency': 0}
+
+def test_http_target():
+    """HTTP Target Parsing"""
+    assert http_target(device('http')) == (False, LOCALHOST, 80, '/')
+    assert http_target(device('http', 8080, 'status')) == (False, f'{LOCALHOST}:8080', 8080, '/status')
+    assert http_target(device('http', None, 'https://example.com/health?full=1')) == (
+        True, 'example.com', 443, '/health?full=1'
+    )
+    print("✅ Targets parsed")
+
+def test_dns_probe():
+    """DNS Query Probe"""
+    async def run():
+        transport, port, protocol = await start_dns_server()
+        refusing, refusing_port, _ = await start_dns_server(rcode=5)
+        prober = DnsProber()
+        try:
+            results = await asyncio.gather(
+                prober.probe(device('dns', port, 'netguard.test')),
+                prober.probe(device('dns', port)),
+                prober.probe(device('dns', refusing_port)),
+            )
+        finally:
+            prober.close()
+            transport.close()
+            refusing.close()
+        return results, protocol.names
+
+    (answered, default_name, refused), names = asyncio.run(run())
+    print(f"Answered: {answered}, REFUSED: {refused}, queried: {names}")
+    assert answered['status'] == 'online' and answered['dnsRcode'] == 0
+    assert default_name['status'] == 'online'
+    assert refused == {'status': 'offline', 'latency': 0, 'dnsRcode': 5}
+    assert sorted(names) == sorted(['netguard.test', 'example.com'])
+
+def test_dns_probe_timeout():
+    """DNS Probe (no answer)"""
+    async def run():
+        # A bound UDP socket that never answers
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as silent:
+            silent.bind((LOCALHOST, 0))
+            prober = DnsProber()
+            try:
+                return await prober.probe(device('dns', silent.getsockname()[1]))
+            finally:
+                prober.close()
+
+    result = asyncio.run(run())
+    print(f"Result: {result}")
+    assert result == {'status': 'offline', 'latency': 0}
+
+def test_dns_packets():
+    """DNS Packet Encoding"""
+    query = build_dns_query(0x1234, 'example.com')
+    assert query[:2] == b'\x12\x34'
+    assert b'\x07example\x03com\x00' in query
+    assert parse_dns_reply(query) is None  # a query, not a response
+    assert parse_dns_reply(b'\x12\x34\x81\x83' + bytes(8)) == (0x1234, 3)
+    print("✅ Packets encoded")
+
+def test_probe_all_uses_device_probe_type():
+    """Sweep With Mixed Probe Types"""
+    async def icmp(ip):
+        return {'status': 'online', 'latency': 7}
+
+    async def run():
+        http_server, http_port, _ = await start_http_server()
+        dns_transport, dns_port, _ = await start_dns_server()
+        devices = [device('icmp'), device('tcp', http_port), device('http', http_port), device('dns', dns_port)]
+        probers = ProberSet(icmp=icmp)
+        try:
+            return await asyncio.gather(*(probers.probe(d) for d in devices))
+        finally:
+            probers.close()
+            http_server.close()
+            dns_transport.close()
+
+    results = asyncio.run(run())
+    print(f"Results: {results}")
+    assert [result['status'] for result in results] == ['online'] * 4
+    assert results[0]['latency'] == 7
+    assert results[2]['httpStatus'] == 200
+    assert results[3]['dnsRcode'] == 0
+
+    # Unknown probe types report the device offline instead of failing the sweep
+    (_, result), = probe_all([device('snmp')])
+    assert result['status'] == 'offline'
+
+def test_custom_probe_type(monkeypatch):
+    """Registering a Probe Type"""
+    class Incomplete(Prober):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+    class Fixed(Prober):
+        async def probe(self, device):
+            return {'status': 'slow', 'latency': 300}
+
+    monkeypatch.setitem(PROBERS, 'fixed', None)
+    register_prober('fixed', Fixed)
+    (_, result), = probe_all([{'id': 'x', 'ip': '127.0.0.1', 'probeType': 'fixed'}])
+    assert result == {'status': 'slow', 'latency': 300}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
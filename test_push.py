@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+NetGuard Push Tests
+The Server-Sent Events hub on a local port: fan-out of committed changes to
+every stream and the resync sent to a client that stops reading (no running
+backend needed; run with pytest)
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import push
+import pytest
+from push import BroadcastHub
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class Stream:
+    """A raw connection to the hub, read one event at a time"""
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=5)
+        self.sock.sendall(f'GET {push.STREAM_PATH} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        self.buffer = b''
+        headers = self._read(b'\r\n\r\n')
+        assert headers.startswith(b'HTTP/1.1 200 OK') and b'text/event-stream' in headers
+
+    def _read(self, separator):
+        while separator not in self.buffer:
+            chunk = self.sock.recv(65536)
+            assert chunk, "the hub closed the stream"
+            self.buffer += chunk
+        block, self.buffer = self.buffer.split(separator, 1)
+        return block
+
+    def event(self):
+        block = self._read(b'\n\n')
+        fields = dict(line.split(': ', 1) for line in block.decode().split('\n'))
+        return fields['event'], json.loads(fields['data'])
+
+    def close(self):
+        self.sock.close()
+
+def on_hub_loop(hub, function):
+    """Run function on the hub's loop after everything already scheduled there"""
+    async def call():
+        return function()
+    return asyncio.run_coroutine_threadsafe(call(), hub._loop).result(5)
+
+def add_alert(alert_id):
+    assert database.add_alert({
+        'id': alert_id, 'deviceId': '1', 'deviceName': 'Google DNS', 'deviceIp': '8.8.8.8',
+        'type': 'connectivity', 'message': 'Connection lost', 'timestamp': 1000, 'status': 'active',
+    })
+
+def test_changes_fan_out_and_slow_clients_resync():
+    """Fan-out and Backpressure"""
+    hub = BroadcastHub()
+    port = free_port()
+    hub.start('127.0.0.1', port)
+    streams = []
+    try:
+        for _ in range(2):
+            streams.append(Stream(port))
+        version = database.get_data_version()
+        for stream in streams:
+            assert stream.event() == ('hello', {'version': version})
+        assert hub.client_count == 2
+
+        # One query, pushed to every stream
+        add_alert('a1')
+        hub.publish_changes()
+        for stream in streams:
+            event, data = stream.event()
+            assert event == 'changes' and data['since'] == version and data['version'] > version
+            assert [alert['id'] for alert in data['alerts']] == ['a1']
+
+        # Nothing new: nothing is pushed
+        hub.publish_changes()
+
+        # A client that stops reading overflows its queue, loses the backlog and gets one
+        # resync instead; the streams that keep reading get every event, in order
+        slow = push.Client()
+        on_hub_loop(hub, lambda: hub._clients.add(slow))
+        batch = push.CLIENT_QUEUE_SIZE // 4
+        for start in range(0, push.CLIENT_QUEUE_SIZE + batch, batch):
+            ticks = [{'index': index} for index in range(start, start + batch)]
+            for tick in ticks:
+                hub.publish('tick', tick)
+            for stream in streams:
+                assert [stream.event() for _ in ticks] == [('tick', tick) for tick in ticks]
+
+        queued = on_hub_loop(hub, lambda: [slow.queue.get_nowait() for _ in range(slow.queue.qsize())])
+        print(f"Slow client holds {len(queued)} event(s), lagging={slow.lagging}")
+        assert queued == [push.encode_event('resync', {})] and slow.lagging
+        hub.publish('tick', {'index': -1})
+        assert on_hub_loop(hub, slow.queue.qsize) == 0, "nothing is queued until the client catches up"
+        for stream in streams:
+            assert stream.event() == ('tick', {'index': -1})
+
+    finally:
+        # The hub thread is a daemon with no stop, as in the backend; its streams end here
+        for stream in streams:
+            stream.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
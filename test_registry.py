@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+NetGuard Registry Tests
+The in-memory device registry against a temporary database: the cached
+snapshot and its ETag, merging rows committed by other writers, skipping the
+process's own sweeps and the full /api/changes snapshot (no running backend
+needed; run with pytest)
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import pytest
+from monitor import monitor_all_devices
+from registry import registry
+
+def add_devices(*device_ids):
+    for index, device_id in enumerate(device_ids):
+        assert database.add_device({
+            'id': device_id, 'name': device_id.title(), 'ip': f'10.30.0.{index + 1}', 'type': 'server',
+            'status': 'online', 'latency': 3, 'lastChecked': 0,
+        })
+    registry.load()
+
+def external(sql, *params):
+    """A write by another process, stamped with the next change version"""
+    with database.write_transaction() as conn:
+        conn.execute(sql, (database._next_version(conn), *params))
+
+def test_sync_merges_changed_rows():
+    """Sync Merges Changed Rows"""
+    add_devices('host-a', 'host-b')
+    down = {'10.30.0.1'}
+
+    async def probe(ip):
+        return {'status': 'offline', 'latency': 0} if ip in down else {'status': 'online', 'latency': 3}
+
+    registry.apply_probe_stats([('host-a', {'loss': 0.0, 'avg': 3.0})])
+    revision = registry.revision
+
+    # The sweep's own write is skipped rather than read back
+    for _ in range(3):
+        monitor_all_devices(probe=probe)
+    assert registry.get('host-a')['status'] == 'offline'
+    assert registry.db_version == database.get_data_version()
+    registry.sync()
+    assert registry.revision == revision and registry.get('host-a')['probeStats'] == {'loss': 0.0, 'avg': 3.0}
+
+    # Status from another writer is merged in; probe stats stay and nothing is reconfigured
+    external("UPDATE devices SET version = ?, status = 'online', latency = 4 WHERE id = ?", 'host-a')
+    registry.sync()
+    host = registry.get('host-a')
+    assert (host['status'], host['latency'], host['probeStats']) == ('online', 4, {'loss': 0.0, 'avg': 3.0})
+    assert registry.revision == revision
+
+    external("UPDATE devices SET version = ?, name = 'Host A' WHERE id = ?", 'host-a')
+    registry.sync()
+    assert registry.get('host-a')['name'] == 'Host A' and 'probeStats' in registry.get('host-a')
+    assert registry.revision == revision + 1
+
+    external("UPDATE devices SET version = ?, probe_type = 'tcp' WHERE id = ?", 'host-a')
+    registry.sync()
+    assert 'probeStats' not in registry.get('host-a'), "stats of the old probe type are dropped"
+    assert registry.revision == revision + 2
+
+def test_snapshot_is_cached_until_a_change():
+    """Snapshot and ETag Invalidation"""
+    snapshot, etag = registry.snapshot()
+    assert registry.snapshot()[0] is snapshot, "served from the cache while nothing changes"
+    assert [device['id'] for device in json.loads(snapshot)] == ['1', '2', '3']
+
+    # A status update re-serializes without counting as a reconfiguration
+    revision = registry.revision
+    registry.apply_status([('1', 'offline', 0)], timestamp=5000)
+    changed, changed_etag = registry.snapshot()
+    assert changed_etag != etag and json.loads(changed)[0]['status'] == 'offline'
+    assert registry.revision == revision
+
+    # The tag is a content hash: the same state gives the same tag
+    registry.apply_status([('1', 'offline', 0)], timestamp=5000)
+    assert registry.snapshot() == (changed, changed_etag)
+    registry.load()
+    assert registry.snapshot()[1] != changed_etag, "the database never saw the offline status"
+
+def test_sync_adds_and_removes_devices():
+    """Sync Picks Up Added and Removed Devices"""
+    add_devices('host-a')
+    revision = registry.revision
+
+    # Written by another process: the registry only learns of them through sync
+    assert database.add_device({'id': 'host-b', 'name': 'Host B', 'ip': '10.30.0.9', 'type': 'server'})
+    assert database.delete_device('1')
+    assert registry.get('host-b') is None and registry.get('1') is not None
+    registry.sync()
+    assert registry.get('host-b')['name'] == 'Host B' and registry.get('1') is None
+    assert registry.db_version == database.get_data_version()
+    assert registry.revision == revision + 1, "one reconfiguration per sync"
+    assert [device['id'] for device in json.loads(registry.snapshot()[0])] == ['2', '3', 'host-a', 'host-b']
+
+def test_apply_status_skips_only_the_next_version():
+    """Own Sweeps Are Skipped, Other Writes Are Not"""
+    add_devices('host-a')
+
+    # The sweep saved directly after the last version read: nothing in between to sync
+    saved = database.save_sweep_results([('host-a', 'offline', 0)], [], [], timestamp=5000)
+    assert saved == registry.db_version + 1
+    registry.apply_status([('host-a', 'offline', 0)], timestamp=5000, version=saved)
+    assert registry.db_version == saved
+
+    # Another writer committed first, so the next sweep's version leaves a gap and is not skipped
+    external("UPDATE devices SET version = ?, name = 'Renamed' WHERE id = ?", 'host-a')
+    gap = database.save_sweep_results([('host-a', 'online', 3)], [], [], timestamp=6000)
+    registry.apply_status([('host-a', 'online', 3)], timestamp=6000, version=gap)
+    assert registry.db_version == saved
+    registry.sync()
+    host = registry.get('host-a')
+    assert (host['name'], host['status']) == ('Renamed', 'online')
+    assert registry.db_version == gap
+
+def test_full_changes_come_from_the_registry(client):
+    """Full /api/changes Snapshot"""
+    registry.apply_probe_stats([('1', {'loss': 0.0, 'avg': 3.0})])
+    version = registry.db_version
+
+    # Committed by another writer but not yet folded into the registry
+    external("UPDATE devices SET version = ?, name = 'Renamed' WHERE id = ?", '2')
+    full = client.get('/api/changes').json
+    assert full['full'] and full['removed'] == [] and full['alerts'] == []
+    assert full['devices'] == json.loads(registry.snapshot()[0])
+    assert full['devices'][0]['probeStats'] == {'loss': 0.0, 'avg': 3.0}, "in-memory fields are included"
+
+    # The snapshot's own version is reported, so the unsynced write arrives as a delta
+    assert full['version'] == version
+    delta = client.get(f"/api/changes?since={full['version']}").json
+    assert [(device['id'], device['name']) for device in delta['devices']] == [('2', 'Renamed')]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
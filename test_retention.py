@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+NetGuard Retention Tests
+Expiry, archiving and incremental vacuum of alerts and fault logs against a
+temporary database (no running backend needed; run with pytest)
+"""
+
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import pytest
+import retention
+
+DAY = 24 * 60 * 60 * 1000
+ALERTS = 20000
+FAULT_LOGS = 30000
+
+def seed(now):
+    """Alerts and fault logs spread evenly over the last 400 days"""
+    step = 400 * DAY // FAULT_LOGS
+    with database.write_transaction() as conn:
+        conn.executemany('''
+            INSERT INTO alerts (id, device_id, device_name, device_ip, type, message, timestamp, status, resolved_at)
+            VALUES (?, '1', 'Google DNS', '8.8.8.8', 'offline', ?, ?, ?, ?)
+        ''', [(f'a{index}', 'x' * 200, now - 400 * DAY + index * (400 * DAY // ALERTS),
+               'active' if index % 10 == 0 else 'resolved', now - 400 * DAY + index * (400 * DAY // ALERTS) + 1000)
+              for index in range(ALERTS)])
+        conn.executemany('''
+            INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+            VALUES (?, 'Device', '10.0.0.1', ?, ?, ?)
+        ''', [('1', 'connectivity' if index % 2 else 'latency', 'y' * 200, now - 400 * DAY + index * step)
+              for index in range(FAULT_LOGS)])
+        # Device 2's only transition is long expired, yet it is still its state at the cutoff
+        conn.execute('''
+            INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+            VALUES ('2', 'Device 2', '10.0.0.2', 'connectivity', 'down', ?)
+        ''', (now - 300 * DAY,))
+
+def test_expiry_and_archive():
+    """Expiry and Archive"""
+    now = int(time.time() * 1000)
+    seed(now)
+    report = retention.run(now)
+    assert report['error'] is None, report['error']
+
+    limits = retention.cutoffs(now)
+    with database.read_connection() as conn:
+        expired_alerts = conn.execute(
+            "SELECT COUNT(*) FROM alerts WHERE status = 'resolved' AND resolved_at < ?", (limits['alerts'],)
+        ).fetchone()[0]
+        active = conn.execute("SELECT COUNT(*) FROM alerts WHERE status = 'active'").fetchone()[0]
+        old_logs = conn.execute(
+            'SELECT device_id FROM fault_logs WHERE timestamp < ? ORDER BY device_id', (limits['fault_logs'],)
+        ).fetchall()
+
+    alerts, logs = report['tables']['alerts'], report['tables']['fault_logs']
+    print(f"Deleted {alerts['deleted']} alerts and {logs['deleted']} fault logs")
+    assert expired_alerts == 0
+    assert active == ALERTS // 10, "active alerts never expire"
+    assert [row[0] for row in old_logs] == ['1', '2'], "each device keeps its last transition before the cutoff"
+
+    for table in (alerts, logs):
+        with gzip.open(table['archive'], 'rt') as archive:
+            rows = [json.loads(line) for line in archive]
+        print(f"{os.path.basename(table['archive'])}: {len(rows)} rows, {os.path.getsize(table['archive'])} bytes")
+        assert len(rows) == table['deleted'] > 0
+        assert all(row['timestamp'] < table['cutoff'] for row in rows)
+
+def test_vacuum_reclaims_space():
+    """Incremental Vacuum"""
+    now = int(time.time() * 1000)
+    seed(now)
+    report = retention.run(now)
+    main = report['databases']['main']
+    print(f"Pages {main['pagesBefore']} -> {main['pagesAfter']}, reclaimed {main['reclaimedBytes']} bytes")
+    assert main['reclaimedBytes'] > 0
+    assert main['freePages'] == 0
+
+    # A second pass finds nothing left to do
+    report = retention.run(now)
+    assert all(table['deleted'] == 0 and table['archive'] is None for table in report['tables'].values())
+
+def test_retention_api(client):
+    """Retention API"""
+    retention.run(int(time.time() * 1000))
+    response = client.get('/api/retention?limit=1')
+    assert response.status_code == 200
+    print(f"Policy: {response.json['policy']}")
+    assert response.json['policy']['faultLogRetentionDays'] == retention.FAULT_LOG_RETENTION_DAYS
+    assert len(response.json['runs']) == 1
+    assert set(response.json['runs'][0]) >= {'startedAt', 'finishedAt', 'tables', 'databases', 'error'}
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+NetGuard Search Tests
+Full-text index upkeep, query syntax, filters, facets and the ranking window of
+/api/search against a temporary database (no running backend needed; run
+with pytest)
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import pytest
+import retention
+import search
+
+DAY = 24 * 60 * 60 * 1000
+# 2024-03-01 00:00 UTC
+START = 1709251200000
+
+def add_log(device_id, name, ip, fault_type, description, timestamp):
+    with database.write_transaction() as conn:
+        conn.execute('''
+            INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (device_id, name, ip, fault_type, description, timestamp))
+
+def add_alert(alert_id, device_id, name, ip, alert_type, message, timestamp):
+    assert database.add_alert({
+        'id': alert_id, 'deviceId': device_id, 'deviceName': name, 'deviceIp': ip,
+        'type': alert_type, 'message': message, 'timestamp': timestamp,
+    })
+
+def seed():
+    """Two devices, a week of fault logs and a few alerts"""
+    add_log('core', 'core.router.lan', '10.0.3.7', 'connectivity', 'Device went offline', START)
+    add_log('core', 'core.router.lan', '10.0.3.7', 'recovery', 'Device back online', START + 1000)
+    add_log('core', 'core.router.lan', '10.0.3.7', 'latency', 'High latency: 300ms', START + DAY)
+    add_log('web', 'Web Server', '10.0.30.2', 'connectivity', 'Device went offline', START + 2 * DAY)
+    add_log('web', 'Web Server', '10.0.30.2', 'flapping', 'Device started flapping', START + 3 * DAY)
+    add_log('web', 'Web Server', '10.0.30.2', 'latency', 'Latency high again: 250ms', START + 6 * DAY)
+    add_alert('a1', 'core', 'core.router.lan', '10.0.3.7', 'connectivity',
+              'Connection lost: Device is unreachable', START)
+    add_alert('a2', 'web', 'Web Server', '10.0.30.2', 'latency', 'High latency detected: 250ms <script>',
+              START + 6 * DAY)
+
+def found(client, query, **params):
+    response = client.get('/api/search', query_string={'q': query, **params})
+    assert response.status_code == 200, response.json
+    return response.json
+
+def texts(result):
+    """(source, message or description, device) of each result, in order"""
+    return [(hit['source'], hit['item'].get('message', hit['item'].get('description')), hit['item']['deviceId'])
+            for hit in result['results']]
+
+def integrity_check():
+    with database.write_transaction() as conn:
+        for _, index, _, _, _ in database.SEARCH_INDEXES:
+            conn.execute(f"INSERT INTO {index} ({index}) VALUES ('integrity-check')")
+
+def test_index_follows_writes(client):
+    """Index Backfill and Triggers"""
+    seed()
+
+    # Rows written before the migration are indexed when it runs
+    with database.write_transaction() as conn:
+        for table, index, _, _, _ in database.SEARCH_INDEXES:
+            for trigger in ('insert', 'delete', 'update'):
+                conn.execute(f'DROP TRIGGER {index}_{trigger}')
+            conn.execute(f'DROP TABLE {index}')
+        conn.execute(f'PRAGMA user_version = {len(database.MIGRATIONS) - 1}')
+    database.init_db()
+    result = found(client, 'offline')
+    print(f"offline after backfill: {texts(result)}")
+    assert result['total'] == 2 and result['totalExact'] and result['complete']
+
+    add_log('web', 'Web Server', '10.0.30.2', 'connectivity', 'Device went offline again', START + 7 * DAY)
+    assert found(client, 'offline')['total'] == 3
+
+    with database.write_transaction() as conn:
+        conn.execute("UPDATE alerts SET message = 'Connection restored', status = 'resolved' WHERE id = 'a1'")
+    assert found(client, 'unreachable')['total'] == 0
+    assert texts(found(client, 'restored')) == [('alerts', 'Connection restored', 'core')]
+
+    database.delete_rows('alerts', ['a2'])
+    assert found(client, 'latency', source='alerts')['total'] == 0
+    integrity_check()
+
+def test_query_syntax(client):
+    """Query Syntax"""
+    seed()
+
+    assert search.match_expression('device offline') == '"device" AND "offline"'
+    assert search.match_expression('"back online" -flapping') == '("back online") NOT ("flapping")'
+    assert search.match_expression('10.0.3* OR') == '"10.0.3"* AND "OR"'
+    assert search.match_expression('NEAR(a b)') == '"NEAR(a" AND "b)"'
+
+    # An IP is one token: it does not match another address sharing its numbers
+    assert {hit['item']['deviceId'] for hit in found(client, '10.0.3.7')['results']} == {'core'}
+    assert found(client, '10.0.3.7')['total'] == 4
+    assert found(client, '10.0.3*')['total'] == 8, "prefix covers 10.0.3.7 and 10.0.30.2"
+    assert found(client, 'core.router.lan')['total'] == 4
+
+    phrase = found(client, '"high latency"')
+    print(f'"high latency": {texts(phrase)}')
+    assert sorted(texts(phrase)) == [('alerts', 'High latency detected: 250ms <script>', 'web'),
+                                     ('logs', 'High latency: 300ms', 'core')]
+    assert found(client, 'latency high')['total'] == 3, "words match in any order"
+    assert found(client, 'device -flapping', source='logs')['total'] == 3
+    assert found(client, 'Réseau')['total'] == 0
+    assert found(client, 'LATENCY')['total'] == found(client, 'latency')['total']
+
+    for query in ('', '!!!', '-offline', '""'):
+        response = client.get('/api/search', query_string={'q': query})
+        assert response.status_code == 400, (query, response.json)
+    for params in ({'sort': 'oldest'}, {'source': 'devices'}):
+        assert client.get('/api/search', query_string={'q': 'offline', **params}).status_code == 400
+
+def test_filters_and_facets(client):
+    """Filters, Facets and Snippets"""
+    seed()
+
+    result = found(client, 'latency')
+    print(f"latency facets: {result['facets']}")
+    assert result['total'] == 3
+    assert result['facets']['source'] == {'alerts': 1, 'logs': 2}
+    assert result['facets']['type'] == {'latency': 3}
+    assert result['facets']['device'] == [
+        {'deviceId': 'web', 'deviceName': 'Web Server', 'count': 2},
+        {'deviceId': 'core', 'deviceName': 'core.router.lan', 'count': 1},
+    ]
+    assert result['facets']['day'] == {'2024-03-07': 2, '2024-03-02': 1}
+    assert all(hit['score'] >= 0 for hit in result['results'])
+
+    web = found(client, 'latency', source='logs', device='web')
+    assert texts(web) == [('logs', 'Latency high again: 250ms', 'web')]
+    assert found(client, 'latency', source='alerts,logs')['total'] == 3
+    assert texts(found(client, 'device', type='flapping')) == [('logs', 'Device started flapping', 'web')]
+    window = found(client, 'device', since=START + DAY, until=START + 3 * DAY, source='logs')
+    assert texts(window) == [('logs', 'Device went offline', 'web')]
+    assert found(client, 'offline', since=START + 7 * DAY)['total'] == 0
+
+    newest = found(client, 'device', sort='newest', source='logs')
+    timestamps = [hit['item']['timestamp'] for hit in newest['results']]
+    assert timestamps == sorted(timestamps, reverse=True) and len(timestamps) == 4
+    assert texts(found(client, 'device', sort='newest', source='logs', limit=1, offset=1)) == [
+        ('logs', 'Device went offline', 'web')]
+    assert 'facets' not in found(client, 'device', facets='false')
+
+    alert = found(client, 'detected')['results'][0]
+    print(f"Snippet: {alert['snippet']}")
+    assert alert['snippet'] == 'High latency <mark>detected</mark>: 250ms &lt;script&gt;'
+    assert alert['item']['deviceIp'] == '10.0.30.2' and alert['item']['status'] == 'active'
+    assert found(client, '10.0.3.7', source='logs')['results'][0]['snippet'] == '<mark>10.0.3.7</mark>'
+
+def test_rows_written_out_of_time_order(client):
+    """Rows Written Out of Time Order"""
+    seed()
+    # Imported late, so its rowid is the highest while its timestamp is the oldest
+    add_log('core', 'core.router.lan', '10.0.3.7', 'connectivity', 'Device went offline (imported)', START - DAY)
+
+    old = found(client, 'offline', since=START - DAY, until=START, source='logs')
+    assert texts(old) == [('logs', 'Device went offline (imported)', 'core')]
+    assert found(client, 'offline', since=START, source='logs')['total'] == 2
+    assert found(client, 'offline', until=START + DAY, source='logs', device='core')['total'] == 2
+
+    newest = found(client, 'offline', sort='newest', source='logs', limit=1)
+    assert texts(newest) == [('logs', 'Device went offline', 'web')], "newest by timestamp, not by rowid"
+
+def test_window_and_count_limit(client, monkeypatch):
+    """Ranking Window and Count Limit"""
+    for i in range(30):
+        add_log(f'dev-{i % 3}', f'Host {i % 3}', f'10.1.0.{i % 3}', 'connectivity', 'Device went offline',
+                START + i * DAY)
+
+    monkeypatch.setattr(search, 'SEARCH_WINDOW', 10)
+    monkeypatch.setattr(search, 'SEARCH_COUNT_LIMIT', 25)
+    result = found(client, 'offline', source='logs', limit=10)
+    print(f"total {result['total']} exact {result['totalExact']} complete {result['complete']}")
+    assert result['total'] == 25 and not result['totalExact'] and not result['complete']
+    # Ranking and every facet cover the newest 10 matches
+    newest = sorted(hit['item']['timestamp'] for hit in result['results'])
+    assert newest == [START + i * DAY for i in range(20, 30)]
+    assert sum(result['facets']['day'].values()) == 10
+    assert result['facets']['source'] == {'logs': 10}
+    assert sum(result['facets']['type'].values()) == sum(d['count'] for d in result['facets']['device']) == 10
+    assert min(result['facets']['day']) == '2024-03-21'
+
+    device = found(client, 'offline', source='logs', device='dev-1', limit=10)
+    assert device['total'] == 10 and device['complete']
+    latest = found(client, 'offline', source='logs', device='dev-1', sort='newest', limit=1)['results']
+    assert [hit['item']['timestamp'] for hit in latest] == [START + 28 * DAY]
+
+    response = client.get('/api/search', query_string={'q': 'offline', 'offset': 5, 'limit': 10})
+    assert response.status_code == 400
+
+def test_rebuild_after_vacuum(client):
+    """Rebuild After Full Vacuum"""
+    seed()
+    # Leave a gap in the alert rowids that VACUUM closes
+    add_alert('a0', 'core', 'core.router.lan', '10.0.3.7', 'timeout', 'Probe timed out', START)
+    database.delete_rows('alerts', ['a1'])
+    retention.convert(database.get_pool())
+
+    integrity_check()
+    result = found(client, 'latency detected')
+    print(f"After vacuum: {texts(result)}")
+    assert texts(result) == [('alerts', 'High latency detected: 250ms <script>', 'web')]
+    assert texts(found(client, 'timed')) == [('alerts', 'Probe timed out', 'core')]
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+NetGuard SLA Tests
+The rolling uptime counters and the availability computed from outages in
+fault_logs, against a temporary database with fixed timestamps (no running
+backend needed; run with pytest)
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import numpy as np
+import pytest
+from sla import UNMEASURED, CounterRing, SlaTracker, tracker
+from timeseries import DAY, HOUR, MINUTE
+
+# Half a minute into an hour
+NOW = 20000 * DAY + 30_000
+
+def fault(device_id, fault_type, timestamp):
+    with database.write_transaction() as conn:
+        conn.execute('''
+            INSERT INTO fault_logs (device_id, device_name, device_ip, fault_type, description, timestamp)
+            VALUES (?, ?, '10.60.0.1', ?, 'Device went offline', ?)
+        ''', (device_id, device_id, fault_type, timestamp))
+
+def test_counter_ring():
+    """Counter Ring Slots"""
+    ring = CounterRing(MINUTE, 60)
+    ring.resize(2)
+    start = 1000 * HOUR
+    ring.add(np.array([start, start + MINUTE, start + MINUTE]), np.array([0, 0, 1]),
+             np.array([1, 1, 2]), np.array([0, 1, 0]))
+
+    probes, lost = ring.window(start + MINUTE, MINUTE)
+    assert (probes.tolist(), lost.tolist()) == ([1, 2], [1, 0]), "only the current slot"
+    probes, lost = ring.window(start + MINUTE, HOUR)
+    assert (probes.tolist(), lost.tolist()) == ([2, 2], [1, 0])
+
+    # An hour on, the first slot has been reused and the second is the oldest left
+    probes, lost = ring.window(start + HOUR, HOUR)
+    assert (probes.tolist(), lost.tolist()) == ([1, 2], [1, 0])
+
+    # Counts older than the ring are dropped; growing keeps the existing counts
+    ring.add(np.array([start]), np.array([0]), np.array([5]), np.array([5]))
+    ring.resize(3)
+    probes, _ = ring.window(start + HOUR, HOUR)
+    assert probes.tolist() == [1, 2, 0]
+
+def test_uptime_and_availability():
+    """Uptime and Availability Windows"""
+    sla = SlaTracker()
+    # One sweep a minute for two hours, the newest in the current minute; 'a' loses every
+    # tenth probe, 'b' only appeared half an hour ago
+    for age in reversed(range(120)):
+        outcomes = [('a', 'offline' if age % 10 == 0 else 'online')]
+        if age < 30:
+            outcomes.append(('b', 'online'))
+        sla.record(NOW - age * MINUTE, outcomes)
+
+    # 'a': a 10 minute outage, then one still open; 'b': one that began before it was first seen;
+    # 'c': never probed, down for an hour until two hours ago
+    fault('a', 'connectivity', NOW - 30 * MINUTE)
+    fault('a', 'recovery', NOW - 20 * MINUTE)
+    fault('a', 'connectivity', NOW - 5 * MINUTE)
+    fault('b', 'connectivity', NOW - 40 * MINUTE)
+    fault('b', 'recovery', NOW - 25 * MINUTE)
+    fault('c', 'connectivity', NOW - 3 * HOUR)
+    fault('c', 'latency', NOW - 2 * HOUR)
+
+    result = sla.compute(['a', 'b', 'c'], now=NOW, windows=['1h', '24h'])
+    print(f"SLA: {result}")
+    assert result['a']['1h'] == {'uptime': 90.0, 'availability': 75.0, 'probes': 60, 'lost': 6,
+                                 'downtimeSeconds': 900.0, 'outages': 2}
+    # The hourly ring holds all two hours; 'a' is measured from its first probe
+    assert result['a']['24h']['probes'] == 120 and result['a']['24h']['uptime'] == 90.0
+    assert result['a']['24h']['availability'] == pytest.approx(100 * (1 - 15 / 119), abs=1e-3)
+
+    # Downtime before the first probe does not count
+    assert (result['b']['1h']['probes'], result['b']['1h']['uptime']) == (30, 100.0)
+    assert result['b']['1h']['downtimeSeconds'] == 240.0
+    assert result['b']['1h']['availability'] == pytest.approx(100 * (1 - 4 / 29), abs=1e-3)
+
+    # Availability without probes comes from the outages alone
+    assert result['c']['1h'] == UNMEASURED
+    assert result['c']['24h']['uptime'] is None and result['c']['24h']['downtimeSeconds'] == 3600.0
+    assert result['c']['24h']['availability'] == pytest.approx(100 * 23 / 24, abs=1e-3)
+
+def test_unknown_devices_are_not_tracked(client):
+    """Unknown Devices Are Reported, Not Tracked"""
+    tracker.record(int(time.time() * 1000), [('1', 'online')])
+    rows = len(tracker._rows)
+
+    response = client.get('/api/sla?device=ghost-1,ghost-2&device=1&window=1h')
+    assert response.status_code == 200
+    devices = response.json['devices']
+    assert devices['ghost-1'] == devices['ghost-2'] == {'1h': UNMEASURED}
+    assert devices['1']['1h']['probes'] == 1
+    assert len(tracker._rows) == rows, "ids from the query string do not allocate rows"
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+NetGuard Time Series Tests
+The probe history store on a temporary database with a fixed clock: rollups
+across bucket boundaries, the open buckets rebuilt after a restart and
+retention per resolution (no running backend needed; run with pytest)
+"""
+
+import os
+import sys
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import pytest
+import timeseries
+from timeseries import DAY, HOUR, MINUTE, TimeSeriesStore
+
+# A day boundary, so the 1m, 1h and 1d buckets all start here
+T0 = 19675 * DAY
+SECOND = 1000
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Settable 'now' (ms) for the store's datetime.now()"""
+    now = {'ms': T0}
+
+    class FixedDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.fromtimestamp(now['ms'] / 1000, tz)
+
+    monkeypatch.setattr(timeseries, 'datetime', FixedDatetime)
+    return now
+
+def rollups(store, resolution):
+    """(bucket, count, lost, min, avg, max, p95) rows of one resolution, oldest first"""
+    with store.pool.reader() as conn:
+        return [tuple(row) for row in conn.execute('''
+            SELECT bucket, count, lost, rtt_min, rtt_avg, rtt_max, rtt_p95 FROM rollups
+            WHERE resolution = ? ORDER BY bucket
+        ''', (timeseries.RESOLUTIONS[resolution],))]
+
+def sample(ts, rtt):
+    return ('dev', ts, 'offline' if rtt is None else 'online', rtt)
+
+def test_rollups_survive_a_restart(storage, clock):
+    """Rollups, Restart and Retention"""
+    path = str(storage / 'history.db')
+    clock['ms'] = T0 + HOUR + 30 * SECOND
+    store = TimeSeriesStore(path)
+    try:
+        store.append([sample(T0, 10), sample(T0 + 10 * SECOND, 20), sample(T0 + 20 * SECOND, None)])
+        store.append([sample(T0 + MINUTE, 30), sample(T0 + MINUTE + 10 * SECOND, 40)])
+        store.append([sample(T0 + HOUR + 5 * SECOND, 50), sample(T0 + HOUR + 10 * SECOND, None)])
+
+        # Minute buckets are written as later samples close them; the first hour is still open
+        assert rollups(store, '1m') == [(T0, 3, 1, 10, 15, 20, 20), (T0 + MINUTE, 2, 0, 30, 35, 40, 40)]
+        assert rollups(store, '1h') == []
+
+        # Closing flushes: the first hour is finished, the rest saved as partial rows
+        store.close()
+        store = TimeSeriesStore(path)
+        assert rollups(store, '1h') == [(T0, 5, 1, 10, 25, 40, 40)]
+        assert rollups(store, '1m')[-1] == (T0 + HOUR, 2, 1, 50, 50, 50, 50)
+        assert rollups(store, '1d') == [(T0, 5, 1, 10, 25, 40, 40)]
+
+        # The reopened store carries on with the open buckets instead of starting them over
+        store.append([sample(T0 + HOUR + 50 * SECOND, 70)])
+        store.append([sample(T0 + HOUR + MINUTE + SECOND, 80)])
+        assert rollups(store, '1m')[-1] == (T0 + HOUR, 3, 1, 50, 60, 70, 70), "rebuilt from the raw samples"
+        store.flush(now=T0 + DAY)
+
+        hours = rollups(store, '1h')
+        assert hours[1][:3] == (T0 + HOUR, 4, 1) and hours[1][3:] == (50, pytest.approx(200 / 3), 80, 80)
+        days = rollups(store, '1d')
+        print(f"Day rollup: {days}")
+        # Both hours in one day row: the restored partial row is not counted twice
+        assert len(days) == 1 and days[0][:3] == (T0, 9, 2)
+        assert days[0][3:] == (10, pytest.approx(300 / 7), 80, 80)
+
+        points = store.query(['dev', 'other'], T0, T0 + DAY, '1h')
+        assert points['series']['other'] == []
+        assert [(point['t'], point['lossPct']) for point in points['series']['dev']] == \
+            [(T0, 20.0), (T0 + HOUR, 25.0)]
+
+        # Each resolution is pruned on its own horizon
+        assert store.prune(now=T0 + 7 * HOUR) == 9 + 2, "every raw sample and the minutes of the first hour"
+        assert store.query(['dev'], T0, T0 + DAY, 'raw')['series']['dev'] == []
+        assert [row[0] for row in rollups(store, '1m')] == [T0 + HOUR, T0 + HOUR + MINUTE]
+        assert store.prune(now=T0 + 36 * DAY) == 2 + 2
+        assert (rollups(store, '1m'), rollups(store, '1h'), len(rollups(store, '1d'))) == ([], [], 1)
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
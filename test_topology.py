@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+NetGuard Topology Tests
+Parent links, root-cause folding of alerts and probe suppression behind an
+offline parent, using a simulated ICMP probe against a temporary database
+(no network access or running backend needed; run with pytest)
+"""
+
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import database
+import probe_scheduler
+import pytest
+from monitor import monitor_all_devices
+from probe_scheduler import ProbeScheduler
+from registry import registry
+
+# router -> switch -> two hosts, plus a host straight behind the router
+TOPOLOGY = (
+    ('router', None, '10.20.0.1', 'router'),
+    ('switch', 'router', '10.20.0.2', 'switch'),
+    ('host-a', 'switch', '10.20.0.3', 'server'),
+    ('host-b', 'switch', '10.20.0.4', 'server'),
+    ('host-c', 'router', '10.20.0.5', 'server'),
+)
+
+class Network:
+    """Simulated ICMP probe: addresses in `down` time out, the rest answer in 3 ms"""
+
+    def __init__(self):
+        self.down = set()
+        self.probes = Counter()
+
+    async def probe(self, ip):
+        self.probes[ip] += 1
+        if ip in self.down:
+            return {'status': 'offline', 'latency': 0}
+        return {'status': 'online', 'latency': 3}
+
+@pytest.fixture
+def client(client):
+    """API client with only the TOPOLOGY devices registered"""
+    with database.write_transaction() as conn:
+        conn.execute('DELETE FROM devices')
+    registry.load()
+    for device_id, parent_id, ip, device_type in TOPOLOGY:
+        response = client.post('/api/devices', json={
+            'id': device_id, 'name': device_id.title(), 'ip': ip, 'type': device_type,
+            'status': 'online', 'latency': 3, 'probeInterval': 1, 'parentId': parent_id,
+        })
+        assert response.status_code == 201, response.json
+    return client
+
+def test_parent_validation(client):
+    """Parent Links"""
+    assert registry.ancestors('host-a') == ['switch', 'router']
+    assert sorted(registry.descendants('router')) == ['host-a', 'host-b', 'host-c', 'switch']
+
+    for parent_id, expected in (('host-a', 'upstream'), ('missing', 'not found'), ('router', 'own parent')):
+        response = client.patch('/api/devices/router/parent', json={'parentId': parent_id})
+        print(f"router -> {parent_id}: {response.json['error']}")
+        assert response.status_code == 400 and expected in response.json['error']
+
+    assert client.patch('/api/devices/host-c/parent', json={'parentId': 'switch'}).status_code == 200
+    assert registry.get('host-c')['parentId'] == 'switch'
+    assert database.get_devices({'ids': ['host-c']})[0]['parent_id'] == 'switch'
+    assert client.patch('/api/devices/host-c/parent', json={'parentId': None}).status_code == 200
+    devices = {device['id']: device for device in client.get('/api/devices').json}
+    assert devices['host-c']['parentId'] is None and devices['host-a']['parentId'] == 'switch'
+
+def test_outage_folds_into_root_cause(client):
+    """Root-Cause Folding and Sweep Suppression"""
+    network = Network()
+    ips = {device_id: ip for device_id, _, ip, _ in TOPOLOGY}
+
+    # host-a fails on its own first, then the router takes everything down
+    network.down = {ips['host-a']}
+    for _ in range(3):
+        monitor_all_devices(probe=network.probe)
+    network.down = set(ips.values())
+    for _ in range(3):
+        monitor_all_devices(probe=network.probe)
+    assert all(registry.get(device_id)['status'] == 'offline' for device_id in ips)
+
+    alerts = {alert['deviceId']: alert for alert in client.get('/api/alerts?status=active').json}
+    root = alerts['router']
+    print(f"Root alert {root['id']}; folded: {sorted(a['deviceId'] for a in alerts.values() if 'rootCauseId' in a)}")
+    assert 'rootCauseId' not in root
+    assert all(alerts[device_id].get('rootCauseId') == root['id'] for device_id in ips if device_id != 'router'), \
+        "downstream alerts, including the one raised before the router failed, link to the router's"
+
+    incidents = client.get('/api/incidents').json
+    assert len(incidents) == 1 and incidents[0]['deviceId'] == 'router'
+    assert incidents[0]['alert']['id'] == root['id']
+    assert sorted(device['id'] for device in incidents[0]['affected']) == ['host-a', 'host-b', 'host-c', 'switch']
+
+    # While the router is down the devices behind it are not probed
+    network.probes.clear()
+    for _ in range(5):
+        monitor_all_devices(probe=network.probe)
+    print(f"Probes during the outage: {dict(network.probes)}")
+    assert network.probes[ips['router']] == 5
+    assert all(network.probes[ips[device_id]] == 0 for device_id in ('switch', 'host-a', 'host-b', 'host-c'))
+
+    # Once the router is back its subtree is probed again and recovers level by level
+    network.down = set()
+    for _ in range(6):
+        monitor_all_devices(probe=network.probe)
+    assert all(registry.get(device_id)['status'] == 'online' for device_id in ips)
+    assert client.get('/api/incidents').json == []
+
+def test_scheduler_slows_unreachable_devices(client, monkeypatch):
+    """Scheduler Suppression"""
+    network = Network()
+    ips = {device_id: ip for device_id, _, ip, _ in TOPOLOGY}
+    monkeypatch.setattr(probe_scheduler, 'UNREACHABLE_PROBE_INTERVAL', 30)
+    scheduler = ProbeScheduler(probe=network.probe)
+    try:
+        network.down = {ips['router']}
+        scheduler.start()
+        deadline = time.monotonic() + 15
+        while registry.get('router')['status'] != 'offline' and time.monotonic() < deadline:
+            time.sleep(0.1)
+        assert registry.get('router')['status'] == 'offline'
+
+        # Let probes already in flight finish, then count probes over a few intervals
+        time.sleep(1.5)
+        network.probes.clear()
+        time.sleep(4)
+        print(f"Probes with the router down: {dict(network.probes)}")
+        assert network.probes[ips['router']] >= 3
+        assert all(network.probes[ips[device_id]] == 0 for device_id in ('switch', 'host-a', 'host-b', 'host-c'))
+
+        # The router's recovery wakes the devices behind it at once
+        network.probes.clear()
+        network.down = set()
+        time.sleep(4)
+        print(f"Probes after recovery: {dict(network.probes)}")
+        assert all(network.probes[ips[device_id]] >= 1 for device_id in ('switch', 'host-a', 'host-b', 'host-c'))
+    finally:
+        scheduler.stop()
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-v', '-s']))
@@ -10,6 +10,71 @@ export interface Device {
   lastChecked: number; // timestamp
   isMonitored: boolean;
   uptime: number; // percentage
+  probeInterval?: number | null; // seconds; null = default for the device type
+  probeType?: ProbeType; // default 'icmp'
+  probePort?: number | null; // tcp / http / dns port; null = default for the probe type
+  probeTarget?: string | null; // http path or URL, or dns name to query
+  probeStats?: ProbeStats; // present for burst, http and dns probes
+  tags?: string[];
+  parentId?: string | null; // upstream router / switch this device is reached through
+}
+
+// Filters shared by the bulk device endpoints; every given filter must match
+export interface DeviceFilter {
+  id?: string[];
+  type?: Device['type'];
+  subnet?: string; // CIDR
+  tag?: string;
+}
+
+export interface DiscoveryJob {
+  id: string;
+  cidr: string;
+  status: 'queued' | 'running' | 'completed' | 'cancelled' | 'failed';
+  total: number; // addresses in the range
+  probed: number;
+  found: number; // addresses that answered
+  added: number; // new devices registered
+  skipped: number; // addresses already registered as devices
+  progress: number; // percent
+  probesPerSecond: number;
+  cancelRequested: boolean;
+  error: string | null;
+  createdAt: number;
+  startedAt: number | null;
+  finishedAt: number | null;
+}
+
+export interface DiscoveryRequest {
+  cidr: string;
+  probeType?: ProbeType;
+  probePort?: number;
+  rate?: number; // probes per second
+  maxInFlight?: number;
+  deviceType?: Device['type'];
+  tags?: string[];
+  isMonitored?: boolean;
+  resolveNames?: boolean;
+}
+
+export interface ImportSummary {
+  created: number;
+  updated: number;
+  failed: number;
+  errors: { row: number; error: string }[]; // first 100 rejected rows
+}
+
+export type ProbeType = 'icmp' | 'tcp' | 'http' | 'dns';
+
+export interface ProbeStats {
+  loss?: number; // percent of the burst lost
+  min?: number; // RTT figures in ms, absent when every packet was lost
+  avg?: number;
+  max?: number;
+  mdev?: number; // jitter
+  p95?: number;
+  httpStatus?: number; // http probes
+  dnsRcode?: number; // dns probes (0 = NOERROR, 3 = NXDOMAIN)
 }
 
 export interface Alert {
@@ -17,11 +82,76 @@ export interface Alert {
   deviceId: string;
   deviceName: string;
   deviceIp: string;
-  type: 'timeout' | 'latency' | 'connectivity';
+  type: 'timeout' | 'latency' | 'connectivity' | 'flapping';
   message: string;
   timestamp: number;
   status: 'active' | 'resolved';
   resolvedAt?: number;
+  rootCauseId?: string; // alert of the upstream device whose outage made this one unreachable
+}
+
+// An outage grouped by root cause (GET /api/incidents)
+export interface Incident {
+  deviceId: string; // the offline device that is not behind another offline device
+  deviceName: string;
+  deviceIp: string;
+  alert: Alert | null; // its active connectivity alert
+  affected: Pick<Device, 'id' | 'name' | 'ip' | 'status'>[]; // devices unreachable behind it
+}
+
+// A device's learned latency baseline (GET /api/baselines)
+export interface LatencyBaseline {
+  meanMs: number | null;
+  stddevMs: number | null;
+  samples: number; // answered probes learned from
+  learned: boolean; // false while warming up (the fixed 150 ms threshold applies)
+  slowAboveMs: number | null;
+  recoverBelowMs: number | null;
+}
+
+export interface FaultLog {
+  id: number;
+  deviceId: string;
+  deviceName: string;
+  deviceIp: string;
+  faultType: string;
+  description: string;
+  timestamp: number;
+}
+
+// GET /api/search
+export interface SearchResult {
+  source: 'alerts' | 'logs';
+  score: number; // bm25, higher is a better match
+  snippet: string; // HTML-escaped, matches wrapped in <mark>
+  item: Alert | FaultLog;
+}
+
+export interface SearchResponse {
+  query: string;
+  sort: 'relevance' | 'newest';
+  total: number;
+  totalExact: boolean; // false once the count limit is reached
+  window: number; // most recently written matches per source that ranking and facets cover
+  complete: boolean; // every match fit in the window
+  results: SearchResult[];
+  facets?: {
+    // All counted over the window, so they add up to total only when complete
+    source: Partial<Record<SearchResult['source'], number>>;
+    type: Record<string, number>;
+    device: { deviceId: string; deviceName: string; count: number }[];
+    day: Record<string, number>; // YYYY-MM-DD (UTC)
+  };
+  tookMs: number;
+}
+
+export interface ChangeSet {
+  version: number;
+  full: boolean; // true when devices/alerts are a complete snapshot
+  devices: Device[];
+  alerts: Alert[];
+  removed: string[]; // ids of deleted devices
+  since?: number; // base version of a pushed change set
 }
 
 export interface NetworkStats {
@@ -9,6 +9,11 @@ export default defineConfig(({ mode }) => {
       port: 3000,
       host: '0.0.0.0',
       proxy: {
+        // Server-Sent Events are served by the backend's stream hub
+        '/api/stream': {
+          target: 'http://localhost:5001',
+          changeOrigin: true
+        },
         '/api': {
           target: 'http://localhost:5000',
           changeOrigin: true